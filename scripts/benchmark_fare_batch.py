@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Consistencia y throughput del cálculo de tarifas por lotes
+
+1. Consistencia: compara, para una muestra de eventos, la tarifa del handler
+   de calculate_toll_fare (evento por evento, con el toll_data que arma
+   resolve_user) contra calculate_fares_batch, y el camino NumPy contra el de
+   Python puro.
+2. Throughput: mide calculate_fares_batch con 1M y 10M de filas.
+
+Usa la tabla de tarifas que viaja en la Layer (fare_rates.json, sin peaje_id:
+las filas salen del catálogo de peajes de data/peajes.json) y la repite con una
+franja de hora pico, para ejercitar todas las dimensiones de la matriz.
+
+Uso:
+    python scripts/benchmark_fare_batch.py --sizes 1000000 10000000 --sample 20000
+"""
+
+import argparse
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import Backend, load_function, seed_tolls  # noqa: E402
+import fare_engine  # noqa: E402
+from fare_engine import FareRatesLoader, load_default_rates  # noqa: E402
+
+np = fare_engine.np
+
+
+def peak_rates():
+    """Tabla de la Layer con una franja de hora pico."""
+    rates = load_default_rates()
+    rates['version'] = 'benchmark-hora-pico'
+    rates['time_bands'] = [{'name': 'hora_pico', 'multiplier': '1.25', 'hours': [6, 7, 8, 17, 18, 19]}]
+    return rates
+
+
+def generate_columns(count, peaje_ids, seed):
+    """Columnas aleatorias: peaje_id (incluye uno desconocido), modalidad y epoch de noviembre 2025."""
+    start_epoch = int(datetime(2025, 11, 1, tzinfo=timezone.utc).timestamp())
+    if np is not None:
+        rng = np.random.default_rng(seed)
+        ids = np.array(peaje_ids, dtype=object)[rng.integers(0, len(peaje_ids), count)]
+        return ids, rng.integers(1, 4, count), start_epoch + rng.integers(0, 30 * 86400, count)
+    rnd = random.Random(seed)
+    return ([rnd.choice(peaje_ids) for _ in range(count)],
+            [rnd.randint(1, 3) for _ in range(count)],
+            [start_epoch + rnd.randrange(30 * 86400) for _ in range(count)])
+
+
+def check_consistency(app, resolve, peaje_ids, sample, seed):
+    ids, modalidades, epochs = generate_columns(sample, peaje_ids, seed)
+    with contextlib.redirect_stdout(io.StringIO()):
+        batch = app.calculate_fares_batch(ids, modalidades, epochs)
+
+    start = time.perf_counter()
+    handler_cents = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for peaje_id, modalidad, epoch in zip(ids, modalidades, epochs):
+            timestamp = datetime.fromtimestamp(int(epoch), timezone.utc).isoformat().replace('+00:00', 'Z')
+            toll_data = resolve.build_step_function_input(
+                {'placa': 'P-000FARE', 'peaje_id': str(peaje_id), 'timestamp': timestamp}, None
+            )['toll_data']
+            event = {'user_data': {'modalidad': int(modalidad)}, 'toll_data': toll_data}
+            handler_cents.append(app.lambda_handler(event, None)['fare_calculation']['final_fare_cents'])
+    handler_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for a, b in zip(handler_cents, batch) if a != int(b))
+
+    engine = app.fare_rates.get()
+    rows = engine.encode_tolls(ids, app.toll_catalog.plazas())
+    python_cents = engine._calculate_batch_python([int(r) for r in rows], [int(m) for m in modalidades],
+                                                  [int(e) for e in epochs])
+    path_mismatches = sum(1 for a, b in zip(python_cents, batch) if a != int(b))
+
+    print(f"🔍 Consistencia ({sample:,} eventos, tarifas {engine.version})")
+    print(f"   - Handler vs lote:        {mismatches} diferencias")
+    print(f"   - Python puro vs lote:    {path_mismatches} diferencias")
+    print(f"   - Handler por evento:     {sample / handler_seconds:,.0f} eventos/s")
+    return mismatches + path_mismatches
+
+
+def measure_throughput(app, peaje_ids, size, seed):
+    ids, modalidades, epochs = generate_columns(size, peaje_ids, seed)
+    engine = app.fare_rates.get()
+
+    start = time.perf_counter()
+    rows = engine.encode_tolls(ids, app.toll_catalog.plazas())
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cents = engine.calculate_batch(rows, modalidades, epochs)
+    calc_seconds = time.perf_counter() - start
+
+    total = sum(int(c) for c in cents[:1000])
+    print(f"⚡ {size:,} filas ({'NumPy' if np is not None else 'Python puro'})")
+    print(f"   - Codificar peaje_id:     {encode_seconds:.2f}s")
+    print(f"   - Calcular tarifas:       {calc_seconds:.2f}s ({size / calc_seconds:,.0f} filas/s)")
+    print(f"   - Total:                  {size / (encode_seconds + calc_seconds):,.0f} filas/s "
+          f"(control: {total})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Consistencia y throughput de tarifas por lotes')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--sample', type=int, default=20000, help='Eventos para la prueba de consistencia')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    backend = Backend(0.0)
+    seed_tolls(backend.tables['TOLLS_TABLE_NAME'], os.path.join(ROOT, 'data', 'peajes.json'))
+    app = load_function('calculate_toll_fare')
+    resolve = load_function('resolve_user')
+    backend.wire('calculate', app)
+    backend.wire('resolve', resolve)
+    with contextlib.redirect_stdout(io.StringIO()):
+        peaje_ids = sorted(app.toll_catalog.plazas()) + ['PEAJE_DESCONOCIDO']
+
+    # Tabla de la Layer tal cual y con hora pico
+    mismatches = check_consistency(app, resolve, peaje_ids, args.sample, args.seed)
+    app.fare_rates = FareRatesLoader(None, None, '', 60, default_rates=peak_rates())
+    mismatches += check_consistency(app, resolve, peaje_ids, args.sample, args.seed)
+    if mismatches:
+        print("❌ Los resultados no coinciden")
+        sys.exit(1)
+
+    for size in args.sizes:
+        measure_throughput(app, peaje_ids, size, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del motor de tarifas (src/shared/fare_engine.py)
+
+Compara el cálculo original de calculate_toll_fare (Decimal * multiplicador +
+quantize por evento) contra la consulta a la matriz precalculada, y verifica
+que ambos den exactamente la misma tarifa.
+
+Uso:
+    python scripts/benchmark_fare_engine.py --events 500000
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+
+from fare_engine import FareEngine, load_default_rates  # noqa: E402
+
+# Implementación original de calculate_toll_fare
+TOLL_BASE_RATES = {
+    'carretera_norte': Decimal('15.00'),
+    'carretera_sur': Decimal('12.00'),
+    'autopista_palín': Decimal('10.00'),
+    'anillo_periferico': Decimal('8.00'),
+    'default': Decimal('10.00')
+}
+
+MODALITY_MULTIPLIERS = {
+    1: Decimal('1.50'),
+    2: Decimal('1.20'),
+    3: Decimal('1.00')
+}
+
+
+def legacy_fare(nombre_peaje: str, modalidad: int) -> Decimal:
+    base_fare = TOLL_BASE_RATES.get(nombre_peaje.lower().replace(' ', '_'), TOLL_BASE_RATES['default'])
+    multiplier = MODALITY_MULTIPLIERS.get(modalidad, Decimal('1.50'))
+    return (base_fare * multiplier).quantize(Decimal('0.01'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Microbenchmark del motor de tarifas')
+    parser.add_argument('--events', type=int, default=500000, help='Eventos simulados (default: 500000)')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    names = ['carretera_norte', 'Carretera Sur', 'autopista_palín', 'anillo_periferico', 'Desconocido']
+    events = [(random.choice(names), random.choice((1, 2, 3, 4))) for _ in range(args.events)]
+
+    start = time.perf_counter()
+    engine = FareEngine(load_default_rates())
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    legacy = [legacy_fare(name, modalidad) for name, modalidad in events]
+    legacy_seconds = time.perf_counter() - start
+
+    # Por evento: resolución de la fila por nombre + índice en la matriz
+    start = time.perf_counter()
+    matrix = [engine.fare_cents(engine.resolve_row(None, None, (name,)), modalidad) for name, modalidad in events]
+    engine_seconds = time.perf_counter() - start
+
+    # Solo el índice en la matriz (fila ya resuelta, p.ej. por peaje_id)
+    rows = [engine.resolve_row(None, None, (name,)) for name, _ in events]
+    start = time.perf_counter()
+    for row, (_, modalidad) in zip(rows, events):
+        engine.fare_cents(row, modalidad)
+    lookup_seconds = time.perf_counter() - start
+
+    mismatches = sum(1 for old, cents in zip(legacy, matrix) if int(old * 100) != cents)
+
+    print("📊 Motor de tarifas")
+    print(f"   - Versión de tarifas:     {engine.version} ({len(engine.cells)} celdas)")
+    print(f"   - Construcción matriz:    {build_seconds * 1e3:.2f} ms")
+    print(f"   - Decimal por evento:     {legacy_seconds / args.events * 1e6:.3f} µs/evento")
+    print(f"   - Matriz (nombre + idx):  {engine_seconds / args.events * 1e6:.3f} µs/evento "
+          f"({legacy_seconds / engine_seconds:.1f}x)")
+    print(f"   - Matriz (solo índice):   {lookup_seconds / args.events * 1e6:.3f} µs/evento "
+          f"({legacy_seconds / lookup_seconds:.1f}x)")
+    print(f"   - Diferencias:            {mismatches}")
+
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
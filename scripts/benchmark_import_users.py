@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Benchmark de la importación de usuarios (src/import_users) con archivos grandes
+
+Genera CSVs con scripts/generate_test_csv.py (1M y 10M filas por defecto) y
+corre cada importación en un proceso aparte para medir su memoria pico (RSS):
+  - streaming: download_csv_from_s3 -> parse_csv -> import_users_to_dynamodb
+    (el pipeline que corre cada segmento)
+  - legacy: body.read().decode() + StringIO + lista completa de usuarios antes
+    de escribir (implementación anterior). Se omite por encima de
+    --legacy-max-rows porque no cabe en memoria.
+
+S3 es el stand-in local (scripts/local_aws) y DynamoDB un sumidero que cuenta
+los BatchWriteItem que hace import_users_to_dynamodb.
+
+Uso:
+    python scripts/benchmark_import_users.py --sizes 1000000 10000000
+"""
+
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import resource
+import subprocess
+import sys
+import threading
+import time
+import types
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BUCKET = 'guatepass-bench'
+
+
+def _load_app():
+    sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+    sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+    sys.path.insert(0, os.path.dirname(__file__))
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('USERS_TABLE_NAME', 'GuatepassUsers-bench')
+    # El sumidero no tiene límite de capacidad: se mide el pipeline sin control de ritmo
+    os.environ.setdefault('IMPORT_WRITE_CAPACITY_SHARE', '0')
+    import app
+    return app
+
+
+class CountingTable:
+    """Sumidero de escrituras: recibe los BatchWriteItem (table.meta.client) y solo los cuenta."""
+
+    def __init__(self, name):
+        self.name = name
+        self.meta = types.SimpleNamespace(client=self)
+        self.batch_calls = 0
+        self.items = 0
+        self._lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        with self._lock:
+            self.batch_calls += 1
+            self.items += len(RequestItems[self.name])
+        return {'UnprocessedItems': {}}
+
+
+def legacy_import(app, bucket, key):
+    """Pipeline anterior: todo el archivo y todos los usuarios en memoria antes de escribir."""
+    body = app.s3_client.get_object(Bucket=bucket, Key=key)['Body']
+    csv_content = body.read().decode('utf-8')
+    users = []
+    for row_number, row in enumerate(csv.DictReader(io.StringIO(csv_content)), start=2):
+        try:
+            users.append(app.parse_user_row(row, row_number))
+        except Exception:
+            continue
+    entries = [entry for user in users for entry in app.user_entries(user)]
+    stats = app.import_users_to_dynamodb(users)
+    stats['registry_entries'] = len(entries)
+    return stats
+
+
+def streaming_import(app, bucket, key):
+    with app.RegistryEntrySpool() as registry_entries:
+        users = registry_entries.track(app.parse_csv(app.download_csv_from_s3(bucket, key)))
+        stats = app.import_users_to_dynamodb(users)
+        stats['registry_entries'] = len(registry_entries)
+    return stats
+
+
+def run_worker(mode, s3_root, key):
+    """Proceso hijo: una importación, imprime el resultado en JSON en la última línea."""
+    app = _load_app()
+    from local_aws import LocalS3
+
+    app.s3_client = LocalS3(s3_root)
+    app.users_table = CountingTable(app.USERS_TABLE_NAME)
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stats = (streaming_import if mode == 'streaming' else legacy_import)(app, BUCKET, key)
+    elapsed = time.perf_counter() - start
+
+    stats.update({
+        'seconds': elapsed,
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        'baseline_rss_mb': baseline_kb / 1024,
+        'batch_calls': app.users_table.batch_calls,
+        'items_written': app.users_table.items
+    })
+    print(json.dumps(stats))
+
+
+def ensure_csv(s3_root, rows):
+    sys.path.insert(0, os.path.dirname(__file__))
+    from generate_test_csv import generate_csv
+
+    key = f"clientes_bench_{rows}.csv"
+    path = os.path.join(s3_root, BUCKET, key)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        generate_csv(rows, path)
+    return key, os.path.getsize(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de import_users en streaming')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--modes', nargs='+', choices=['streaming', 'legacy'], default=['streaming', 'legacy'])
+    parser.add_argument('--legacy-max-rows', type=int, default=1000000,
+                        help='No correr legacy por encima de estas filas (default: 1M)')
+    parser.add_argument('--s3-root', default='/tmp/guatepass-bench-s3', help='Directorio del S3 local')
+    parser.add_argument('--worker', nargs=2, metavar=('MODE', 'KEY'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.worker[0], args.s3_root, args.worker[1])
+        return
+
+    results = []
+    for rows in args.sizes:
+        key, size = ensure_csv(args.s3_root, rows)
+        for mode in args.modes:
+            if mode == 'legacy' and rows > args.legacy_max_rows:
+                print(f"⏭️  legacy con {rows:,} filas omitido (--legacy-max-rows {args.legacy_max_rows:,})")
+                continue
+            print(f"⏱️  {mode} con {rows:,} filas ({size / 1024 / 1024:,.0f} MB)...")
+            output = subprocess.run(
+                [sys.executable, __file__, '--s3-root', args.s3_root, '--worker', mode, key],
+                check=True, capture_output=True, text=True
+            ).stdout
+            stats = json.loads(output.strip().splitlines()[-1])
+            results.append((rows, mode, size, stats))
+
+    print("\n📊 Resultados:")
+    print(f"   {'filas':>12} {'modo':<10} {'MB csv':>8} {'seg':>8} {'filas/s':>10} "
+          f"{'RSS pico MB':>12} {'escritos':>12} {'batches':>10}")
+    for rows, mode, size, stats in results:
+        print(f"   {rows:>12,} {mode:<10} {size / 1024 / 1024:>8,.0f} {stats['seconds']:>8.1f} "
+              f"{stats['total'] / stats['seconds']:>10,.0f} {stats['peak_rss_mb']:>12,.0f} "
+              f"{stats['items_written']:>12,} {stats['batch_calls']:>10,}")
+
+
+if __name__ == "__main__":
+    main()
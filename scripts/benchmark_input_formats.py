@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Benchmark de los formatos de entrada de la importación (src/import_users/input_formats.py)
+
+Genera un registro de usuarios y lo guarda en el S3 local (scripts/local_aws)
+como CSV plano, CSV gzip, CSV zstd y Parquet (columnas tipadas, saldo
+decimal(12,2), row groups de 128k filas). Para cada formato lee todos los
+usuarios con read_users_from_s3 en un proceso aparte y reporta bytes del
+objeto, tiempo de lectura y parseo, usuarios/s y RSS pico. Además verifica que
+todos los formatos produzcan exactamente los mismos items que el CSV plano.
+
+Uso:
+    python scripts/benchmark_input_formats.py --rows 1000000
+"""
+
+import argparse
+import contextlib
+import csv
+import gzip
+import hashlib
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BUCKET = 'guatepass-formats'
+FORMATS = ('csv', 'csv.gz', 'csv.zst', 'parquet')
+
+
+def _load_app():
+    sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+    sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+    sys.path.insert(0, os.path.dirname(__file__))
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ.setdefault('USERS_TABLE_NAME', 'GuatepassUsers-bench')
+    import app
+    return app
+
+
+def write_registry(directory, rows, seed):
+    """Escribe clientes_formats.<formato> para cada formato y retorna sus llaves."""
+    sys.path.insert(0, os.path.dirname(__file__))
+    from generate_test_csv import generate_user
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+    import pyarrow.parquet as pq
+    import zstandard
+
+    os.makedirs(directory, exist_ok=True)
+    csv_path = os.path.join(directory, 'clientes_formats.csv')
+    random.seed(seed)
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        writer = None
+        for index in range(rows):
+            row = {**generate_user(index), 'placa': f"F-{index:07d}"}
+            if writer is None:
+                writer = csv.DictWriter(f, fieldnames=list(row))
+                writer.writeheader()
+            writer.writerow(row)
+
+    with open(csv_path, 'rb') as source, gzip.open(csv_path + '.gz', 'wb', compresslevel=6) as target:
+        for chunk in iter(lambda: source.read(1 << 20), b''):
+            target.write(chunk)
+    with open(csv_path, 'rb') as source, open(csv_path + '.zst', 'wb') as target:
+        zstandard.ZstdCompressor(level=3).copy_stream(source, target)
+
+    text_columns = ('placa', 'nombre', 'email', 'telefono', 'tipo_usuario', 'tag_id')
+    table = pacsv.read_csv(csv_path, convert_options=pacsv.ConvertOptions(
+        column_types={**{name: pa.string() for name in text_columns},
+                      'tiene_tag': pa.bool_(), 'saldo_disponible': pa.decimal128(12, 2)},
+        strings_can_be_null=True
+    ))
+    pq.write_table(table, os.path.join(directory, 'clientes_formats.parquet'),
+                   row_group_size=128 * 1024, compression='zstd')
+    return {fmt: f"clientes_formats.{fmt}" for fmt in FORMATS}
+
+
+def run_worker(s3_root, key):
+    """Proceso hijo: lee todos los usuarios del objeto e imprime el resultado en JSON."""
+    app = _load_app()
+    from local_aws import LocalS3
+
+    app.s3_client = LocalS3(s3_root)
+    users = 0
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for _user in app.read_users_from_s3(BUCKET, key):
+            users += 1
+    elapsed = time.perf_counter() - start
+    get_requests = app.s3_client.operation_counts.get('GetObject', 0)
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    # Segunda lectura (fuera del tiempo medido) para comparar los items con los del CSV
+    digest = hashlib.blake2b(digest_size=16)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for user in app.read_users_from_s3(BUCKET, key):
+            digest.update(json.dumps(user, sort_keys=True, default=str).encode('utf-8'))
+    print(json.dumps({
+        'users': users,
+        'seconds': elapsed,
+        'digest': digest.hexdigest(),
+        'peak_rss_mb': peak_rss_mb,
+        'get_requests': get_requests
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de formatos de entrada de import_users')
+    parser.add_argument('--rows', type=int, default=1000000, help='Usuarios del registro (default: 1M)')
+    parser.add_argument('--seed', type=int, default=16)
+    parser.add_argument('--s3-root', default='/tmp/guatepass-formats-s3', help='Directorio del S3 local')
+    parser.add_argument('--worker', metavar='KEY', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.s3_root, args.worker)
+        return
+
+    directory = os.path.join(args.s3_root, BUCKET)
+    print(f"📦 Generando {args.rows:,} usuarios en {len(FORMATS)} formatos...")
+    keys = write_registry(directory, args.rows, args.seed)
+
+    results = {}
+    for fmt, key in keys.items():
+        output = subprocess.run(
+            [sys.executable, __file__, '--s3-root', args.s3_root, '--worker', key],
+            check=True, capture_output=True, text=True
+        ).stdout
+        results[fmt] = json.loads(output.strip().splitlines()[-1])
+        results[fmt]['bytes'] = os.path.getsize(os.path.join(directory, key))
+
+    base = results['csv']
+    print(f"\n{'formato':<9} {'MB':>8} {'% del csv':>10} {'seg':>7} {'usuarios/s':>11} {'RSS pico MB':>12} "
+          f"{'GETs':>6} {'= csv':>6}")
+    for fmt, r in results.items():
+        print(f"{fmt:<9} {r['bytes'] / 1024 / 1024:>8,.1f} {r['bytes'] / base['bytes']:>10.1%} {r['seconds']:>7.2f} "
+              f"{r['users'] / r['seconds']:>11,.0f} {r['peak_rss_mb']:>12,.0f} {r['get_requests']:>6} "
+              f"{'sí' if r['digest'] == base['digest'] and r['users'] == base['users'] else 'NO':>6}")
+
+    if any(r['digest'] != base['digest'] for r in results.values()):
+        print("\n❌ Algún formato produjo items distintos al CSV plano")
+        sys.exit(1)
+    print(f"\n✅ Los {len(FORMATS)} formatos producen los mismos {base['users']:,} usuarios")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Benchmark del filtro Bloom de usuarios registrados (src/shared/registry_filter.py)
+
+Simula el tráfico de resolve_user y cuenta cuántas lecturas a DynamoDB
+(get_item por placa + query a TagIndex) se hacen con y sin el filtro.
+
+Uso:
+    python scripts/benchmark_registry_filter.py --users 100000 --events 200000 --unregistered 0.7
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+
+from registry_filter import BloomFilter, placa_entry, tag_entry  # noqa: E402
+from generate_test_csv import generate_placa, generate_tag_id  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del filtro Bloom de registrados')
+    parser.add_argument('--users', type=int, default=100000, help='Usuarios registrados (default: 100000)')
+    parser.add_argument('--events', type=int, default=200000, help='Eventos de peaje simulados (default: 200000)')
+    parser.add_argument('--unregistered', type=float, default=0.7,
+                        help='Fracción de eventos con placa no registrada (default: 0.7)')
+    parser.add_argument('--tag-rate', type=float, default=0.3,
+                        help='Fracción de eventos que reportan tag_id (default: 0.3)')
+    parser.add_argument('--fp-rate', type=float, default=0.01, help='Tasa objetivo de falsos positivos')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+
+    # Construcción del filtro (placas registradas + 30% con tag)
+    start = time.perf_counter()
+    bloom = BloomFilter.for_capacity(args.users * 2, args.fp_rate)
+    registered = set()
+    tags = set()
+    for i in range(args.users):
+        placa = generate_placa(i)
+        registered.add(placa)
+        bloom.add(placa_entry(placa))
+        if i % 10 < 3:
+            tags.add(generate_tag_id(i))
+            bloom.add(tag_entry(generate_tag_id(i)))
+    build_seconds = time.perf_counter() - start
+
+    # Tráfico: las placas no registradas usan un prefijo distinto (C-) para no
+    # colisionar con las generadas por generate_placa
+    reads_without = 0
+    reads_with = 0
+    false_positives = 0
+    negatives = 0
+
+    start = time.perf_counter()
+    for _ in range(args.events):
+        if random.random() < args.unregistered:
+            index = args.users + random.randrange(args.users * 10)
+            placa = f"C-{index:08d}"
+        else:
+            index = random.randrange(args.users)
+            placa = generate_placa(index)
+        tag_id = generate_tag_id(index) if random.random() < args.tag_rate else None
+
+        is_registered = placa in registered
+        # Sin filtro: get_item siempre, y query por tag si la placa no existe
+        reads_without += 1
+        if not is_registered and tag_id:
+            reads_without += 1
+
+        # Con filtro: solo se consulta lo que el filtro no descarta
+        if placa_entry(placa) in bloom:
+            reads_with += 1
+            if not is_registered:
+                false_positives += 1
+        if not is_registered:
+            negatives += 1
+            if tag_id and tag_entry(tag_id) in bloom:
+                reads_with += 1
+    lookup_seconds = time.perf_counter() - start
+
+    saved = reads_without - reads_with
+    print("📊 Filtro Bloom de registrados")
+    print(f"   - Usuarios registrados:   {args.users:,} (+{len(tags):,} tags)")
+    print(f"   - Tamaño del blob:        {len(bloom.to_bytes()) / 1024:,.1f} KiB "
+          f"({bloom.num_bits:,} bits, {bloom.num_hashes} hashes)")
+    print(f"   - Construcción:           {build_seconds:.2f}s")
+    print(f"   - Lookups:                {lookup_seconds / args.events * 1e6:.2f} µs/evento")
+    print(f"   - Falsos positivos:       {false_positives / max(negatives, 1) * 100:.3f}% "
+          f"(objetivo {args.fp_rate * 100:.1f}%)")
+    print(f"   - Lecturas DynamoDB sin filtro: {reads_without:,}")
+    print(f"   - Lecturas DynamoDB con filtro: {reads_with:,}")
+    print(f"   - Reducción de lecturas:  {saved / reads_without * 100:.1f}%")
+
+
+if __name__ == "__main__":
+    main()
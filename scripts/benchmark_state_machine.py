@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Benchmark y prueba de regresión de la máquina de estados process_toll
+
+Corre src/stepfunctions/process_toll.asl.json con el ejecutor local
+(scripts/local_aws/asl.py) y los handlers reales sobre el stand-in de
+DynamoDB, muchas ejecuciones a la vez en un pool de --workers hilos.
+
+Las entradas son las que produce resolve_user para pasos por peaje de un
+registro generado (generate_test_csv.generate_user): registrados con y sin
+tag, placas no registradas y saldos que se agotan. Con --fail-rate una
+fracción de las invocaciones falla en el primer intento con
+Lambda.ServiceException, para ejercitar los Retry de la definición. Con
+--timeout-rate una fracción de las invocaciones de las tareas idempotentes
+(RecordTransaction, UpdateBalance, GenerateInvoice) corre el handler y falla
+después con States.Timeout, como una respuesta que la Step Function no
+recibió: el reintento debe retornar el resultado guardado en la tabla de
+idempotencia sin volver a cobrar ni facturar.
+
+Reporta ejecuciones/s y, por estado, visitas, p50/p95/p99 y tamaño del
+payload de salida. Verifica:
+  1. todas las ejecuciones terminan en el estado esperado según la modalidad
+     y el resultado del cobro (CashPaymentRequired, InsufficientBalance,
+     ProcessingSuccess), sin errores
+  2. una transacción y una factura por ejecución
+  3. por placa, saldo_inicial - saldo_final == suma de los cobros aplicados
+  4. con --fail-rate / --timeout-rate, cada falla inyectada se reintentó una vez
+  5. si RecordTransaction agota sus reintentos, la ejecución termina en
+     ProcessingFailed sin débito ni factura (van después de RecordTransaction)
+  6. si UpdateBalance agota sus reintentos, la transacción queda registrada y
+     la ejecución termina en ProcessingFailed sin factura (GenerateInvoice va
+     después de UpdateBalance)
+
+Uso:
+    python scripts/benchmark_state_machine.py --executions 20000 --workers 8
+    python scripts/benchmark_state_machine.py --executions 5000 --fail-rate 0.1 --latency-ms 2
+    python scripts/benchmark_state_machine.py --executions 5000 --timeout-rate 0.2
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import (STATE_MACHINE_FILE, STATE_MACHINE_TASKS, Backend, load_function,  # noqa: E402
+                         seed_tolls, seed_users)
+from generate_state_machine import IDEMPOTENT_STAGES  # noqa: E402
+from generate_test_csv import generate_placa, generate_tag_id, has_tag, load_plazas  # noqa: E402
+from local_aws import decimal_to_int  # noqa: E402
+from local_aws.asl import LocalExecutor, LocalStateMachine, StatesError  # noqa: E402
+from money import BALANCE_FIELD  # noqa: E402
+
+EXPECTED_FINAL_STATES = {
+    'Usuario no registrado - Pago en efectivo': 'CashPaymentRequired',
+    'Saldo insuficiente': 'InsufficientBalance',
+}
+
+
+def build_inputs(backend, count, users, seed, peajes_file, first=0):
+    """Entradas de la máquina de estados como las arma resolve_user (pasos first, first + 1, ...)."""
+    resolve = load_function('resolve_user')
+    backend.wire('resolve', resolve)
+    resolve.STATE_MACHINE_ARN = None  # Solo resuelve el perfil y retorna el input
+    plazas, _ = load_plazas(peajes_file)
+
+    rnd = random.Random(seed)
+    start = 1762160400  # 2025-11-03T09:00:00Z
+    inputs = []
+    for n in range(first, first + count):
+        index = rnd.randrange(int(users * 1.1))  # ~9% de placas fuera del registro
+        tag_id = generate_tag_id(index) if index < users and has_tag(index, seed) else None
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(start + n * 7))
+        detail = {
+            'event_id': f"evt-{n:08d}",
+            'placa': generate_placa(index),
+            'peaje_id': rnd.choice(plazas),
+            'tag_id': tag_id,
+            'timestamp': timestamp
+        }
+        inputs.append(resolve.lambda_handler({'detail': detail}, None))
+    return inputs
+
+
+class FaultInjector:
+    """
+    Falla el primer intento de una fracción de las invocaciones: antes del
+    handler (Lambda.ServiceException) o, en las tareas idempotentes, después de
+    que el handler escribió (States.Timeout).
+    """
+
+    def __init__(self, rate, seed, timeout_rate=0.0):
+        self.rate = rate
+        self.timeout_rate = timeout_rate
+        self.random = random.Random(seed)
+        self.failed = set()
+        self.retried = 0
+        self.timed_out = 0
+        self._lock = threading.Lock()
+
+    def wrap(self, stage, handler, idempotent=False):
+        def invoke(event, context):
+            # La entrada recortada de cada tarea es única por ejecución y se repite igual en el reintento
+            key = (stage, json.dumps(event, sort_keys=True))
+            timeout = False
+            with self._lock:
+                if key in self.failed:
+                    self.retried += 1
+                elif self.random.random() < self.rate:
+                    self.failed.add(key)
+                    raise StatesError('Lambda.ServiceException', 'Falla simulada del servicio Lambda')
+                elif idempotent and self.timeout_rate and self.random.random() < self.timeout_rate:
+                    self.failed.add(key)
+                    self.timed_out += 1
+                    timeout = True
+            result = handler(event, context)
+            if timeout:
+                raise StatesError('States.Timeout', 'Timeout simulado después de que la tarea escribió')
+            return result
+        return invoke
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de la máquina de estados process_toll')
+    parser.add_argument('--executions', type=int, default=20000, help='Ejecuciones (default: 20k)')
+    parser.add_argument('--users', type=int, default=5000, help='Usuarios del registro (default: 5k)')
+    parser.add_argument('--workers', type=int, default=8, help='Hilos del pool (default: 8)')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latencia simulada por llamada a DynamoDB')
+    parser.add_argument('--fail-rate', type=float, default=0.0, help='Fracción de invocaciones que fallan una vez')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='Fracción de invocaciones de tareas idempotentes que escriben y fallan por timeout')
+    parser.add_argument('--seed', type=int, default=20)
+    parser.add_argument('--peajes-file', default=os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json'))
+    parser.add_argument('--output', help='Archivo JSON con el resumen por estado')
+    args = parser.parse_args()
+
+    backend = Backend(0.0)
+    users_table = backend.tables['USERS_TABLE_NAME']
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seed_tolls(backend.tables['TOLLS_TABLE_NAME'], args.peajes_file)
+        seed_users(users_table, None, args.users, args.seed)
+        inputs = build_inputs(backend, args.executions, args.users, args.seed, args.peajes_file)
+    initial = {item['placa']: decimal_to_int(item[BALANCE_FIELD]) for item in users_table.all_items()}
+
+    injector = FaultInjector(args.fail_rate, args.seed, args.timeout_rate)
+    functions = {}
+    for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+        handler = load_function(function)
+        backend.wire(stage, handler)
+        functions[substitution] = injector.wrap(stage, handler.lambda_handler, function in IDEMPOTENT_STAGES)
+    machine = LocalStateMachine.from_file(STATE_MACHINE_FILE, functions, retry_interval_scale=0)
+    executor = LocalExecutor(machine, workers=args.workers)
+
+    for table in backend.tables.values():
+        table.latency_seconds = args.latency_ms / 1000
+    backend.reset_counts()
+    print(f"🚦 {args.executions:,} ejecuciones, {args.workers} hilos, {args.users:,} usuarios"
+          f"{f', fallas inyectadas {args.fail_rate:.0%}' if args.fail_rate else ''}"
+          f"{f', timeouts inyectados {args.timeout_rate:.0%}' if args.timeout_rate else ''}...")
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        executions = executor.run(inputs)
+    elapsed = time.perf_counter() - start
+
+    summary = executor.summary()
+    print(f"\n⏱️  {elapsed:.1f}s, {len(executions) / elapsed:,.0f} ejecuciones/s")
+    print(f"{'estado':<22} {'visitas':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'bytes p50':>10} {'bytes max':>10}")
+    for name, stats in summary['states'].items():
+        print(f"{name:<22} {stats['count']:>8,} {stats['p50_ms']:>8.3f} {stats['p95_ms']:>8.3f} {stats['p99_ms']:>8.3f} "
+              f"{stats['output_bytes_p50']:>10,} {stats['output_bytes_max']:>10,}")
+    print(f"🏁 {summary['final_states']}")
+
+    print("\nVerificaciones")
+    failures = []
+    unexpected = []
+    charged = defaultdict(int)
+    for execution in executions:
+        balance = (execution.output or {}).get('balance_update', {})
+        expected = EXPECTED_FINAL_STATES.get(balance.get('message'), 'ProcessingSuccess')
+        if execution.status != 'SUCCEEDED' or execution.final_state != expected:
+            unexpected.append((execution.final_state, execution.error, balance.get('message')))
+        # Cada ejecución cobra una vez; idempotent_replay solo indica que la respuesta vino de un reintento
+        if balance.get('updated'):
+            charged[execution.output['user_data']['placa']] += balance['amount_charged_cents']
+    check(not unexpected and not summary['errors'],
+          f"{len(executions):,} ejecuciones en el estado final esperado (inesperadas: {unexpected[:3]}, "
+          f"errores: {summary['errors']})" if unexpected or summary['errors'] else
+          f"{len(executions):,} ejecuciones en el estado final esperado", failures)
+
+    transactions = len(backend.tables['TRANSACTIONS_TABLE_NAME'])
+    invoices = len(backend.tables['INVOICES_TABLE_NAME'])
+    check(transactions == invoices == len(executions),
+          f"{transactions:,} transacciones y {invoices:,} facturas", failures)
+
+    final = {item['placa']: decimal_to_int(item[BALANCE_FIELD]) for item in users_table.all_items()}
+    mismatched = [placa for placa in initial if initial[placa] - final[placa] != charged.get(placa, 0)]
+    check(not mismatched, f"saldos conservados en {len(initial):,} placas "
+          f"({sum(charged.values()) / 100:,.2f} GTQ cobrados)", failures)
+
+    if args.fail_rate or args.timeout_rate:
+        retried = sum(record.attempts - 1 for execution in executions for record in execution.history
+                      if record.attempts > 1)
+        check(retried == len(injector.failed) == injector.retried,
+              f"{len(injector.failed):,} fallas inyectadas ({injector.timed_out:,} timeouts después de escribir), "
+              f"{retried:,} reintentos", failures)
+
+    # Tarea caída: pasos nuevos (otra hora, otro transaction_id) que no deben cobrar ni facturar
+    probes_count = min(200, args.executions)
+    for offset, (down_function, down_state) in enumerate((('record_transaction', 'RecordTransaction'),
+                                                          ('update_balance', 'UpdateBalance'))):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            probes = build_inputs(backend, probes_count, args.users, args.seed + 1 + offset, args.peajes_file,
+                                  first=args.executions + offset * probes_count)
+
+        def task_down(event, context, down_state=down_state):
+            raise StatesError('Lambda.ServiceException', f"{down_state} caído (simulado)")
+
+        down_functions = dict(functions)
+        for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+            if function == down_function:
+                down_functions[substitution] = task_down
+        recorded_before = len(backend.tables['TRANSACTIONS_TABLE_NAME'])
+        down = LocalExecutor(LocalStateMachine.from_file(STATE_MACHINE_FILE, down_functions,
+                                                         retry_interval_scale=0), workers=args.workers)
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            failed_probes = [execution for execution in down.run(probes)
+                             if execution.final_state == 'ProcessingFailed']
+        after = {item['placa']: decimal_to_int(item[BALANCE_FIELD]) for item in users_table.all_items()}
+        recorded = len(backend.tables['TRANSACTIONS_TABLE_NAME']) - recorded_before
+        expected_recorded = 0 if down_function == 'record_transaction' else probes_count
+        check(len(failed_probes) == probes_count and after == final and recorded == expected_recorded
+              and len(backend.tables['INVOICES_TABLE_NAME']) == invoices,
+              f"{down_state} caído: {len(failed_probes)} de {probes_count} en ProcessingFailed, "
+              f"{recorded} transacciones, {sum(final[placa] - after[placa] for placa in final) / 100:,.2f} "
+              f"GTQ debitados, {len(backend.tables['INVOICES_TABLE_NAME']) - invoices} facturas", failures)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'executions': len(executions), 'seconds': round(elapsed, 3),
+                       'executions_per_second': round(len(executions) / elapsed, 1), **summary}, f, indent=2)
+        print(f"✅ Resumen: {args.output}")
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Máquina de estados verificada")
+
+
+if __name__ == "__main__":
+    main()
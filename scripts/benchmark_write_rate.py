@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Benchmark del control de ritmo de la importación (src/import_users/write_rate.py)
+
+Importa usuarios con import_users_to_dynamodb contra una tabla local con
+capacidad de escritura limitada (scripts/local_aws, write_capacity), que
+rechaza lo que exceda con ProvisionedThroughputExceededException o
+UnprocessedItems. Al mismo tiempo un hilo simula el tráfico en vivo de
+Step Functions (cobros con UpdateItem a ritmo constante) y cuenta cuántos
+reciben throttling.
+
+Modos:
+  - sin-control: los hilos escritores solo reintentan con backoff
+  - aimd-100: controlador con techo = 100% de la capacidad
+  - aimd-50:  controlador con techo = 50% (IMPORT_WRITE_CAPACITY_SHARE=0.5)
+
+--declared-capacity simula un IMPORT_TABLE_WRITE_UNITS mayor que la capacidad
+real: el controlador la descubre por el throttling y retrocede.
+
+Uso:
+    python scripts/benchmark_write_rate.py --rows 60000 --capacity 2000 --live-rate 100
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import sys
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['USERS_TABLE_NAME'] = 'GuatepassUsers-local'
+
+import app  # noqa: E402
+from generate_test_csv import generate_user  # noqa: E402
+from local_aws import LocalTable  # noqa: E402
+
+MODES = {'sin-control': 0.0, 'aimd-100': 1.0, 'aimd-50': 0.5}
+
+
+class LiveTraffic(threading.Thread):
+    """Cobros de peaje a ritmo constante (sin reintentos: un throttling es un cobro demorado)."""
+
+    def __init__(self, table, rate):
+        super().__init__(daemon=True)
+        self.table = table
+        self.interval = 1.0 / rate
+        self.attempts = 0
+        self.throttled = 0
+        self._done = threading.Event()
+
+    def run(self):
+        next_at = time.monotonic()
+        while not self._done.is_set():
+            self.attempts += 1
+            try:
+                self.table.update_item(
+                    Key={'placa': f"LIVE-{self.attempts % 500:03d}"},
+                    UpdateExpression='ADD cobros :uno',
+                    ExpressionAttributeValues={':uno': 1}
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ProvisionedThroughputExceededException':
+                    raise
+                self.throttled += 1
+            next_at += self.interval
+            self._done.wait(max(0.0, next_at - time.monotonic()))
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def users(rows, seed):
+    random.seed(seed)
+    for index in range(rows):
+        row = {**generate_user(index), 'placa': f"W-{index:07d}"}
+        yield app.parse_user_row(row, index + 2)
+
+
+def run_mode(mode, args):
+    table = LocalTable(app.USERS_TABLE_NAME, 'placa', latency_seconds=args.latency_ms / 1000,
+                       write_capacity=args.capacity)
+    app.users_table = table
+    app.IMPORT_TABLE_WRITE_UNITS = args.declared_capacity or args.capacity
+    app.IMPORT_WRITE_CAPACITY_SHARE = MODES[mode]
+
+    live = LiveTraffic(table, args.live_rate)
+    live.start()
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stats = app.import_users_to_dynamodb(users(args.rows, args.seed), writer_threads=args.threads)
+    elapsed = time.perf_counter() - start
+    live.stop()
+
+    metrics = stats.get('write_rate', {})
+    return {
+        'mode': mode,
+        'seconds': elapsed,
+        'rows_per_second': stats['total'] / elapsed,
+        'errors': stats['errors'],
+        'retries': stats['retries'],
+        'import_throttled': table.throttled_counts.get('BatchWriteItem', 0),
+        'decreases': metrics.get('decreases', 0),
+        'final_rate': metrics.get('final_rate'),
+        'live_attempts': live.attempts,
+        'live_throttled': live.throttled
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del control de ritmo de escritura')
+    parser.add_argument('--rows', type=int, default=60000, help='Usuarios a importar por modo (default: 60k)')
+    parser.add_argument('--capacity', type=float, default=2000, help='Capacidad de la tabla en WCU/s (default: 2000)')
+    parser.add_argument('--declared-capacity', type=float, default=None,
+                        help='IMPORT_TABLE_WRITE_UNITS que ve la importación (default: --capacity)')
+    parser.add_argument('--live-rate', type=float, default=100, help='Cobros en vivo por segundo (default: 100)')
+    parser.add_argument('--threads', type=int, default=8, help='Hilos escritores (default: 8)')
+    parser.add_argument('--latency-ms', type=float, default=2.0, help='Latencia por operación (default: 2)')
+    parser.add_argument('--modes', nargs='+', choices=list(MODES), default=list(MODES))
+    parser.add_argument('--seed', type=int, default=15)
+    args = parser.parse_args()
+
+    print(f"📦 {args.rows:,} usuarios por modo, tabla de {args.capacity:,.0f} WCU/s "
+          f"(declarada {args.declared_capacity or args.capacity:,.0f}), "
+          f"{args.live_rate:,.0f} cobros en vivo/s, {args.threads} hilos")
+    results = [run_mode(mode, args) for mode in args.modes]
+
+    print(f"\n{'modo':<12} {'seg':>7} {'filas/s':>9} {'items throttled':>16} {'reintentos':>11} "
+          f"{'bajadas':>8} {'ritmo final':>12} {'cobros en vivo throttled':>25} {'errores':>8}")
+    for r in results:
+        live = f"{r['live_throttled']:,}/{r['live_attempts']:,} ({r['live_throttled'] / max(r['live_attempts'], 1):.1%})"
+        final_rate = f"{r['final_rate']:,.0f}" if r['final_rate'] is not None else '-'
+        print(f"{r['mode']:<12} {r['seconds']:>7.1f} {r['rows_per_second']:>9,.0f} {r['import_throttled']:>16,} "
+              f"{r['retries']:>11,} {r['decreases']:>8,} {final_rate:>12} {live:>25} {r['errors']:>8,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+Verificación del modo por lotes (resolve_user.batch_handler + process_toll_batch)
+
+Corre los mismos pasos por el pipeline por evento (process_toll, Standard) y
+por el modo por lotes (mensajes de SQS -> batch_handler -> ejecución síncrona
+de process_toll_batch con el ejecutor ASL local), cada uno en su backend:
+
+  1. paridad: mismos saldos finales, mismas transacciones y facturas y los
+     mismos resultados por paso (ProcessingSuccess, InsufficientBalance,
+     CashPaymentRequired)
+  2. lecturas: los usuarios del lote se leen con BatchGetItem (ningún
+     get_item por paso)
+  3. aislamiento: un paso cuyo UpdateBalance falla queda solo él en
+     batchItemFailures; al reentregarlo se cobra una vez, y al reentregar el
+     lote completo las transacciones ya registradas no se reescriben
+  4. un event_id repetido en el lote se procesa una vez y un mensaje
+     inválido se reporta sin afectar al resto
+  5. si falla el lote completo (CalculateFares) se reportan todos sus mensajes
+     y no queda nada escrito
+
+Uso:
+    python scripts/check_batch_pipeline.py --passes 300 --batch-size 100
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import random
+import sys
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import (BATCH_STATE_MACHINE_ARN, BATCH_STATE_MACHINE_FILE, ITEM_FINAL_STATES,  # noqa: E402
+                         STATE_MACHINE_FILE, STATE_MACHINE_TASKS, Backend, load_function, seed_tolls)
+from local_aws import decimal_to_int  # noqa: E402
+from local_aws.asl import LocalStateMachine, StatesError  # noqa: E402
+from money import BALANCE_FIELD  # noqa: E402
+
+PEAJES = ('PEAJE001', 'PEAJE002', 'PEAJE003')
+# Campos que cambian entre dos corridas equivalentes
+INVOICE_VOLATILE = {'invoice_id', 'invoice_number', 'fecha_emision', 'created_at'}
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+class Faults:
+    """Fallas controladas por la prueba: placas cuyo UpdateBalance falla y lote completo."""
+
+    def __init__(self):
+        self.balance_placas = set()
+        self.calculate = False
+
+    def wrap(self, stage, handler):
+        def invoke(event, context):
+            if stage == 'balance' and event['user_data']['placa'] in self.balance_placas:
+                raise StatesError('Lambda.Unknown', 'Falla simulada de UpdateBalance')
+            if stage == 'calculate' and self.calculate:
+                raise StatesError('Lambda.Unknown', 'Falla simulada de CalculateFares')
+            return handler(event, context)
+        return invoke
+
+
+def build_backend(peajes_file, users, faults=None):
+    """Backend con el registro de la prueba y las dos máquinas de estados sobre él."""
+    backend = Backend(0.0)
+    seed_tolls(backend.tables['TOLLS_TABLE_NAME'], peajes_file)
+    for user in users:
+        backend.tables['USERS_TABLE_NAME'].put_item(Item=dict(user))
+    resolve = load_function('resolve_user')
+    backend.wire('resolve', resolve)
+    functions = {}
+    for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+        handler = load_function(function)
+        backend.wire(stage, handler)
+        functions[substitution] = faults.wrap(stage, handler.lambda_handler) if faults else handler.lambda_handler
+    standard = LocalStateMachine.from_file(STATE_MACHINE_FILE, functions, retry_interval_scale=0)
+    batch = LocalStateMachine.from_file(BATCH_STATE_MACHINE_FILE, functions, retry_interval_scale=0)
+    backend.stepfunctions.register(BATCH_STATE_MACHINE_ARN, batch)
+    return backend, resolve, standard
+
+
+def build_registry(count, rnd):
+    """Usuarios con y sin tag y saldos que alcanzan para pocos pasos."""
+    users = []
+    for n in range(count):
+        placa = f"P-{n:03d}BAT"
+        user = {'placa': placa, 'nombre': f"Usuario {n}", 'email': f"u{n}@correo.gt",
+                'tiene_tag': n % 3 != 0, BALANCE_FIELD: rnd.choice((0, 1500, 4000, 20000))}
+        if user['tiene_tag']:
+            user['tag_id'] = f"TAG-{placa}"
+        users.append(user)
+    return users
+
+
+def build_passes(count, users, rnd):
+    """Detalles de TollDetected; ~10% de placas fuera del registro."""
+    passes = []
+    for n in range(count):
+        if rnd.random() < 0.1:
+            placa, tag_id = f"P-{n:03d}UNK", None
+        else:
+            user = rnd.choice(users)
+            placa, tag_id = user['placa'], user.get('tag_id')
+        passes.append({'event_id': f"evt-{n:05d}", 'placa': placa, 'peaje_id': rnd.choice(PEAJES), 'tag_id': tag_id,
+                       'timestamp': f"2025-11-03T{8 + n // 3600:02d}:{n // 60 % 60:02d}:{n % 60:02d}Z"})
+    return passes
+
+
+def sqs_event(details, prefix='msg'):
+    return {'Records': [{'messageId': f"{prefix}-{detail['event_id']}",
+                         'body': json.dumps({'detail-type': 'TollDetected', 'detail': detail})}
+                        for detail in details]}
+
+
+def failed_ids(response):
+    return {failure['itemIdentifier'] for failure in response['batchItemFailures']}
+
+
+def snapshot(backend):
+    balances = {item['placa']: int(item[BALANCE_FIELD]) for item in backend.tables['USERS_TABLE_NAME'].all_items()}
+    transactions = {item['transaction_id']: item['final_fare_cents']
+                    for item in decimal_to_int(backend.tables['TRANSACTIONS_TABLE_NAME'].all_items())}
+    invoices = sorted(json.dumps({k: v for k, v in item.items() if k not in INVOICE_VOLATILE}, sort_keys=True)
+                      for item in decimal_to_int(backend.tables['INVOICES_TABLE_NAME'].all_items()))
+    return balances, transactions, invoices
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación del modo por lotes')
+    parser.add_argument('--passes', type=int, default=300, help='Pasos por peaje de la prueba de paridad')
+    parser.add_argument('--users', type=int, default=40, help='Usuarios del registro de la prueba')
+    parser.add_argument('--batch-size', type=int, default=100, help='Mensajes por lote de SQS')
+    parser.add_argument('--seed', type=int, default=22)
+    parser.add_argument('--peajes-file', default=os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json'))
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    users = build_registry(args.users, rnd)
+    passes = build_passes(args.passes, users, rnd)
+    failures = []
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        # Por evento: resolve_user.lambda_handler + process_toll (Standard)
+        standard_backend, resolve, standard = build_backend(args.peajes_file, users)
+        standard_outcomes = {}
+        for detail in passes:
+            resolve.lambda_handler({'detail': detail}, None)
+            _, _, execution_input = standard_backend.stepfunctions.started.get_nowait()
+            standard_outcomes[detail['event_id']] = standard.execute(execution_input).final_state
+
+        # Por lotes: mensajes de SQS + batch_handler + process_toll_batch (Express)
+        batch_backend, batch_resolve, _ = build_backend(args.peajes_file, users)
+        batch_outcomes = {}
+        responses = []
+        machine = batch_backend.stepfunctions.machines[BATCH_STATE_MACHINE_ARN]
+        recording = machine.execute
+
+        def record_outcomes(execution_input):
+            execution = recording(execution_input)
+            for result in (execution.output or {}).get('results', []):
+                message = (result.get('balance_update') or {}).get('message')
+                batch_outcomes[result['event_id']] = ('ItemFailed' if result['status'] == 'failed'
+                                                      else ITEM_FINAL_STATES.get(message, 'ProcessingSuccess'))
+            return execution
+
+        machine.execute = record_outcomes
+        for start in range(0, len(passes), args.batch_size):
+            responses.append(batch_resolve.batch_handler(sqs_event(passes[start:start + args.batch_size]), None))
+
+    print("\n1. Paridad con el pipeline por evento")
+    check(all(not failed_ids(response) for response in responses), "ningún mensaje para reintentar", failures)
+    check(batch_outcomes == standard_outcomes,
+          f"mismo resultado por paso: {dict(sorted(Counter(batch_outcomes.values()).items()))}", failures)
+    standard_state, batch_state = snapshot(standard_backend), snapshot(batch_backend)
+    check(standard_state[0] == batch_state[0], f"mismos saldos en {len(standard_state[0])} placas", failures)
+    check(standard_state[1] == batch_state[1], f"mismas {len(batch_state[1])} transacciones y tarifas", failures)
+    check(standard_state[2] == batch_state[2], f"mismas {len(batch_state[2])} facturas", failures)
+
+    print("\n2. Lecturas del registro")
+    users_counts = batch_backend.tables['USERS_TABLE_NAME'].operation_counts
+    batches = -(-len(passes) // args.batch_size)
+    check(users_counts.get('GetItem', 0) == 0 and 0 < users_counts.get('BatchGetItem', 0) <= batches,
+          f"{users_counts.get('BatchGetItem', 0)} BatchGetItem para {batches} lotes, "
+          f"{users_counts.get('GetItem', 0)} GetItem", failures)
+
+    print("\n3. Aislamiento de un paso que falla")
+    faults = Faults()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        backend, resolve, _ = build_backend(args.peajes_file, users, faults)
+        registered = [user for user in users if user[BALANCE_FIELD] >= 20000]
+        details = [{'event_id': f"iso-{n}", 'placa': user['placa'], 'peaje_id': 'PEAJE001',
+                    'tag_id': user.get('tag_id'), 'timestamp': f"2025-11-04T10:00:{n:02d}Z"}
+                   for n, user in enumerate(registered[:10])]
+        broken = details[3]
+        faults.balance_placas.add(broken['placa'])
+        first = failed_ids(resolve.batch_handler(sqs_event(details), None))
+        faults.balance_placas.clear()
+        # Estado de las transacciones antes de la reentrega (una ya liquidada por otro camino)
+        transactions = backend.tables['TRANSACTIONS_TABLE_NAME']
+        settled = next(item for item in transactions.all_items() if item['placa'] == details[0]['placa'])
+        transactions.put_item(Item={**settled, 'payment_status': 'completed'})
+        recorded = {item['transaction_id']: item for item in transactions.all_items()}
+        retry = failed_ids(resolve.batch_handler(sqs_event([broken]), None))
+        redelivered = failed_ids(resolve.batch_handler(sqs_event(details), None))
+    balance = int(backend.tables['USERS_TABLE_NAME'].get_item(Key={'placa': broken['placa']})['Item'][BALANCE_FIELD])
+    charged = len(backend.tables['INVOICES_TABLE_NAME'])
+    fare = next(int(item['final_fare_cents']) for item in backend.tables['TRANSACTIONS_TABLE_NAME'].all_items()
+                if item['placa'] == broken['placa'])
+    check(first == {f"msg-{broken['event_id']}"}, f"solo el paso roto para reintentar ({sorted(first)})", failures)
+    check(not retry and balance == 20000 - fare and charged == len(details),
+          f"reentregado y cobrado una vez (saldo {balance}, {charged} facturas)", failures)
+    kept = {item['transaction_id']: item for item in transactions.all_items()} == recorded
+    check(not redelivered and kept, "lote reentregado completo: transacciones sin reescribir "
+          "(created_at y payment_status se conservan)", failures)
+
+    print("\n4. Duplicados y mensajes inválidos")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        backend, resolve, _ = build_backend(args.peajes_file, users)
+        detail = dict(details[0], event_id='dup-1')
+        event = sqs_event([detail])
+        event['Records'].append({'messageId': 'msg-dup-1-again', 'body': event['Records'][0]['body']})
+        event['Records'].append({'messageId': 'msg-invalid', 'body': '{no es json'})
+        failed = failed_ids(resolve.batch_handler(event, None))
+    check(failed == {'msg-invalid'} and len(backend.tables['TRANSACTIONS_TABLE_NAME']) == 1
+          and len(backend.tables['INVOICES_TABLE_NAME']) == 1,
+          f"un cobro para el event_id repetido, inválido reportado ({sorted(failed)})", failures)
+
+    print("\n5. Falla del lote completo")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        faults = Faults()
+        backend, resolve, _ = build_backend(args.peajes_file, users, faults)
+        faults.calculate = True
+        failed = failed_ids(resolve.batch_handler(sqs_event(details), None))
+    written = len(backend.tables['TRANSACTIONS_TABLE_NAME']) + len(backend.tables['INVOICES_TABLE_NAME'])
+    check(len(failed) == len(details) and written == 0,
+          f"{len(failed)} mensajes para reintentar, {written} escrituras", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Modo por lotes verificado")
+
+
+if __name__ == "__main__":
+    main()
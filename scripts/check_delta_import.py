@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Verificación de la importación delta de usuarios (src/import_users/delta.py)
+
+Corre run_delta_import contra los stand-ins locales (scripts/local_aws) en
+varias fases y verifica el resultado en la tabla:
+
+  1. base: tabla vacía, sin manifiesto -> todas las filas son nuevas
+  2. cobros: se descuenta saldo a una parte de los usuarios (como los peajes)
+     y algunos quedan con el saldo legado saldo_disponible
+  3. delta: CSV con ~1% de filas cambiadas, 0.5% nuevas y 0.5% eliminadas;
+     las escrituras deben coincidir con los cambios y ningún saldo cobrado
+     puede volver al valor del CSV. Una primera corrida con fallas simuladas
+     no debe publicar el manifiesto.
+  4. sin cambios: el mismo archivo otra vez -> cero escrituras
+  5. reactivación: vuelven las placas eliminadas, con su saldo intacto
+  6. overwrite-balance=true (metadata S3): todos los saldos toman el del CSV
+
+Uso:
+    python scripts/check_delta_import.py --rows 200000
+"""
+
+import argparse
+import contextlib
+import csv
+import os
+import random
+import shutil
+import sys
+import time
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BUCKET = 'guatepass-delta-local'
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['USERS_TABLE_NAME'] = 'GuatepassUsers-local'
+os.environ['DATA_BUCKET_NAME'] = BUCKET
+os.environ['IMPORT_DELTA_SHARDS'] = '16'
+
+import app  # noqa: E402
+from local_aws import LocalS3, LocalTable  # noqa: E402
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, balance_cents, format_amount, parse_amount  # noqa: E402
+
+
+class FlakyTable:
+    """Proxy de LocalTable cuyo update_item falla `failures` veces (error no reintentable)."""
+
+    def __init__(self, table, failures):
+        self._table = table
+        self.failures = failures
+
+    def update_item(self, **kwargs):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'Falla simulada'}}, 'UpdateItem')
+        return self._table.update_item(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._table, name)
+
+
+def write_rows(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def upload(s3, path, key, metadata=None):
+    s3.upload_file(path, BUCKET, key, ExtraArgs={'Metadata': metadata} if metadata else None)
+
+
+def run_import(key, label):
+    """Importación como la del handler (modo y overwrite desde la metadata del objeto)."""
+    mode, overwrite_balance = app.import_options(BUCKET, key)
+    assert mode == 'delta', mode
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(open(os.devnull, 'w')):
+        stats = app.run_delta_import(BUCKET, key, overwrite_balance)
+    elapsed = time.perf_counter() - start
+    print(f"   {label:<24} {stats['total']:>9,} filas  nuevas {stats['new']:>7,}  cambiadas {stats['changed']:>6,}  "
+          f"reactivadas {stats['reactivated']:>5,}  bajas {stats['removed']:>5,}  solo saldo {stats['balance_only']:>7,}  "
+          f"escrituras {stats['writes']:>7,} ({stats['write_fraction']:.2%})  errores {stats['errors']}  {elapsed:.1f}s")
+    return stats
+
+
+def manifest_generation(s3):
+    manifest = app.delta.FingerprintManifest(s3, BUCKET, app.IMPORT_DELTA_PREFIX, app.IMPORT_DELTA_DATASET,
+                                             app.IMPORT_DELTA_SHARDS)
+    return manifest.previous_generation
+
+
+def items_by_placa(table):
+    return {item['placa']: item for item in table.all_items()}
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación de la importación delta')
+    parser.add_argument('--rows', type=int, default=200000, help='Filas del CSV base (default: 200k)')
+    parser.add_argument('--change-rate', type=float, default=0.01, help='Fracción de filas cambiadas')
+    parser.add_argument('--new-rate', type=float, default=0.005, help='Fracción de filas nuevas')
+    parser.add_argument('--remove-rate', type=float, default=0.005, help='Fracción de filas eliminadas')
+    parser.add_argument('--debit-rate', type=float, default=0.2, help='Fracción de usuarios con cobros')
+    parser.add_argument('--seed', type=int, default=14)
+    parser.add_argument('--s3-root', default='/tmp/guatepass-delta-s3', help='Directorio del S3 local')
+    args = parser.parse_args()
+
+    from generate_test_csv import generate_user
+
+    rnd = random.Random(args.seed)
+    shutil.rmtree(args.s3_root, ignore_errors=True)
+    os.makedirs(args.s3_root)
+    s3 = LocalS3(args.s3_root)
+    table = LocalTable(app.USERS_TABLE_NAME, 'placa', page_size=10000)
+    app.s3_client = s3
+    app.users_table = table
+    failures = []
+
+    random.seed(args.seed)
+    base_rows = [{**generate_user(index), 'placa': f"D-{index:07d}"} for index in range(args.rows)]
+    base_path = os.path.join(args.s3_root, 'base.csv')
+    write_rows(base_path, base_rows)
+
+    print("\n1) Importación base")
+    upload(s3, base_path, 'clientes_base.csv')
+    stats = run_import('clientes_base.csv', 'base')
+    check(stats['new'] == len(base_rows) and stats['errors'] == 0,
+          f"{len(base_rows):,} usuarios nuevos sin errores", failures)
+    check(len(table) == len(base_rows), "la tabla tiene todas las filas", failures)
+
+    print("\n2) Cobros de peaje sobre la tabla")
+    placas = [row['placa'].upper() for row in base_rows]
+    debited = rnd.sample(placas, int(len(placas) * args.debit_rate))
+    for placa in debited:
+        table.update_item(Key={'placa': placa}, UpdateExpression=f'SET {BALANCE_FIELD} = {BALANCE_FIELD} - :monto',
+                          ExpressionAttributeValues={':monto': 1500})
+    legacy = debited[:max(1, len(debited) // 100)]
+    for placa in legacy:
+        cents = int(table.get_item(Key={'placa': placa})['Item'][BALANCE_FIELD])
+        table.update_item(Key={'placa': placa},
+                          UpdateExpression=f'SET {LEGACY_BALANCE_FIELD} = :q REMOVE {BALANCE_FIELD}',
+                          ExpressionAttributeValues={':q': format_amount(cents)})
+    balances_before = {placa: balance_cents(item) for placa, item in items_by_placa(table).items()}
+    print(f"   {len(debited):,} usuarios con cobros, {len(legacy):,} con saldo legado")
+
+    print("\n3) Delta con cambios, altas y bajas")
+    rows = [dict(row) for row in base_rows]
+    rnd.shuffle(rows)
+    n_removed = int(len(rows) * args.remove_rate)
+    removed = {row['placa'].upper() for row in rows[:n_removed]}
+    rows = rows[n_removed:]
+    n_changed = int(len(rows) * args.change_rate)
+    changed_rows = rows[:n_changed]
+    # Priorizar usuarios con cobros y saldo legado entre los cambiados
+    legacy_rows = [row for row in rows if row['placa'].upper() in set(legacy)]
+    for row in changed_rows + legacy_rows:
+        row['email'] = f"actualizado.{row['placa'].lower()}@email.com"
+        row['tipo_usuario'] = 'registrado'
+    changed = {row['placa'].upper() for row in changed_rows + legacy_rows}
+    new_rows = []
+    for n in range(int(len(base_rows) * args.new_rate)):
+        new_rows.append({**base_rows[0], 'placa': f"N-{n:06d}DLT", 'nombre': f"Nuevo {n}",
+                         'saldo_disponible': '75.25', 'tag_id': ''})
+    rows.extend(new_rows)
+    delta_path = os.path.join(args.s3_root, 'delta.csv')
+    write_rows(delta_path, rows)
+    upload(s3, delta_path, 'clientes_delta.csv')
+
+    generation = manifest_generation(s3)
+    app.users_table = FlakyTable(table, failures=5)
+    stats = run_import('clientes_delta.csv', 'delta con fallas')
+    app.users_table = table
+    check(stats['errors'] == 5 and manifest_generation(s3) == generation,
+          "con escrituras fallidas el manifiesto no avanza", failures)
+
+    counts_before = dict(table.operation_counts)
+    stats = run_import('clientes_delta.csv', 'delta')
+    operations = {op: table.operation_counts.get(op, 0) - counts_before.get(op, 0) for op in table.operation_counts}
+    expected_writes = len(changed) + len(new_rows) + len(removed)
+    check(stats['errors'] == 0 and manifest_generation(s3) != generation, "manifiesto publicado", failures)
+    check(stats['changed'] == len(changed) and stats['new'] == len(new_rows) and stats['removed'] == len(removed),
+          f"cambios detectados: {len(changed):,} cambiados, {len(new_rows):,} nuevos, {len(removed):,} bajas", failures)
+    check(stats['writes'] == expected_writes,
+          f"{stats['writes']:,} escrituras para {expected_writes:,} cambios "
+          f"(UpdateItem {operations.get('UpdateItem', 0):,}, BatchWriteItem {operations.get('BatchWriteItem', 0):,})",
+          failures)
+
+    items = items_by_placa(table)
+    check(all(balance_cents(items[placa]) == balances_before[placa] for placa in balances_before),
+          "ningún saldo existente cambió (cobros y saldos legados preservados)", failures)
+    check(all(LEGACY_BALANCE_FIELD not in items[placa] for placa in legacy if placa in changed),
+          "saldos legados de usuarios cambiados migrados a saldo_cents", failures)
+    check(all(items[placa]['email'].startswith('actualizado.') for placa in changed), "perfiles actualizados", failures)
+    check(all(items[placa].get('estado') == app.delta.REMOVED_STATE and 'fecha_baja' in items[placa]
+              for placa in removed), "bajas marcadas como eliminado con fecha_baja", failures)
+    check(all(items[row['placa']][BALANCE_FIELD] == parse_amount(row['saldo_disponible']) for row in new_rows),
+          "usuarios nuevos con el saldo del CSV", failures)
+
+    print("\n4) Mismo archivo otra vez")
+    upload(s3, delta_path, 'clientes_delta_repetido.csv')
+    stats = run_import('clientes_delta_repetido.csv', 'sin cambios')
+    check(stats['writes'] == 0, "cero escrituras", failures)
+
+    print("\n5) Reactivación de bajas")
+    returning = [row for row in base_rows if row['placa'].upper() in removed]
+    write_rows(delta_path, rows + returning)
+    upload(s3, delta_path, 'clientes_reactivados.csv')
+    stats = run_import('clientes_reactivados.csv', 'reactivación')
+    items = items_by_placa(table)
+    check(stats['reactivated'] == len(removed) and stats['writes'] == len(removed),
+          f"{len(removed):,} usuarios reactivados", failures)
+    check(all(items[placa].get('estado') == 'activo' and 'fecha_baja' not in items[placa]
+              and balance_cents(items[placa]) == balances_before[placa] for placa in removed),
+          "reactivados activos y con su saldo anterior", failures)
+
+    print("\n6) overwrite-balance=true en la metadata del objeto")
+    upload(s3, delta_path, 'clientes_saldos.csv', metadata={'overwrite-balance': 'true'})
+    stats = run_import('clientes_saldos.csv', 'sobrescribir saldos')
+    items = items_by_placa(table)
+    final_rows = rows + returning
+    check(stats['balance_only'] + stats['changed'] + stats['reactivated'] == len(final_rows) - stats['new'],
+          "todas las filas existentes reciben el saldo del CSV", failures)
+    check(all(balance_cents(items[row['placa'].upper()]) == parse_amount(row['saldo_disponible'])
+              for row in final_rows), "saldos iguales al CSV", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Importación delta verificada")
+
+
+if __name__ == "__main__":
+    main()
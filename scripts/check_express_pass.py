@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+"""
+Verificación del camino express de resolve_user (src/shared/express_pass.py)
+
+Corre resolve_user con EXPRESS_PASS_ENABLED contra los stand-ins locales y
+procesa con el ejecutor ASL local las ejecuciones que caen en la Step Function:
+
+  1. paridad: un paso express y el mismo paso por la Step Function cobran lo
+     mismo y escriben la misma transacción y la misma factura (salvo IDs,
+     fechas y payment_status)
+  2. atomicidad: cada paso express tiene su cobro, su transacción y su
+     factura, y ningún cobro queda sin transacción
+  3. reintento: repetir el mismo evento después del commit no vuelve a cobrar
+     ni crea otra factura (idempotent_replay)
+  4. fallback: saldo insuficiente, modalidad 1 y 2 y saldo legado siguen por la
+     Step Function y terminan como antes
+  5. concurrencia: --passes pasos simultáneos de una placa con saldo para la
+     mitad: se cobran exactamente los que alcanzan, el resto cae a la Step
+     Function como InsufficientBalance y el saldo nunca queda negativo
+  6. debited_txns lleno: se recorta y el cobro express se aplica
+
+Uso:
+    python scripts/check_express_pass.py --passes 40
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import (STATE_MACHINE_FILE, STATE_MACHINE_TASKS, Backend, load_function,  # noqa: E402
+                         seed_tolls)
+from local_aws import decimal_to_int  # noqa: E402
+from local_aws.asl import LocalStateMachine  # noqa: E402
+from balance_ledger import DEBITED_TXNS_FIELD, MAX_TRACKED_TXNS, PRUNE_BATCH  # noqa: E402
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD  # noqa: E402
+
+PEAJE_ID = 'PEAJE001'
+# Campos que cambian entre dos pasos equivalentes (o que solo tiene el camino express)
+TRANSACTION_VOLATILE = {'transaction_id', 'placa', 'tag_id', 'payment_status', 'invoice_id', 'pipeline', 'created_at'}
+INVOICE_VOLATILE = {'invoice_id', 'invoice_number', 'placa', 'contribuyente', 'transaction_id',
+                    'fecha_emision', 'created_at'}
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+class Pipeline:
+    """resolve_user (con o sin express) y la Step Function local sobre el mismo backend."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.resolve = load_function('resolve_user')
+        backend.wire('resolve', self.resolve)
+        functions = {}
+        for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+            handler = load_function(function)
+            backend.wire(stage, handler)
+            functions[substitution] = handler.lambda_handler
+        self.machine = LocalStateMachine.from_file(STATE_MACHINE_FILE, functions, retry_interval_scale=0)
+
+    def pass_toll(self, placa, tag_id, timestamp, express=True):
+        """Un paso por peaje; retorna (pipeline, estado final o None)."""
+        self.resolve.EXPRESS_PASS_ENABLED = express
+        detail = {'event_id': f"evt-{placa}-{timestamp}", 'placa': placa, 'peaje_id': PEAJE_ID,
+                  'tag_id': tag_id, 'timestamp': timestamp}
+        result = self.resolve.lambda_handler({'detail': detail}, None)
+        if result.get('pipeline') == 'express':
+            return 'express', None
+        _, _, execution_input = self.backend.stepfunctions.started.get_nowait()
+        return 'stepfunctions', self.machine.execute(execution_input).final_state
+
+
+def timestamp(n):
+    return f"2025-11-03T{9 + n // 3600:02d}:{n // 60 % 60:02d}:{n % 60:02d}Z"
+
+
+def add_user(table, placa, saldo_cents, tag=True, **extra):
+    item = {'placa': placa, 'nombre': f"Usuario {placa}", 'email': f"{placa.lower()}@correo.gt",
+            'tiene_tag': tag, BALANCE_FIELD: saldo_cents, **extra}
+    if tag:
+        item['tag_id'] = f"TAG-{placa}"
+    table.put_item(Item=item)
+
+
+def strip(item, volatile):
+    return {k: v for k, v in decimal_to_int(item).items() if k not in volatile}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación del camino express de resolve_user')
+    parser.add_argument('--passes', type=int, default=40, help='Pasos simultáneos de una misma placa')
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--peajes-file', default=os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json'))
+    args = parser.parse_args()
+
+    backend = Backend(0.0, express=True)
+    users = backend.tables['USERS_TABLE_NAME']
+    transactions = backend.tables['TRANSACTIONS_TABLE_NAME']
+    invoices = backend.tables['INVOICES_TABLE_NAME']
+    failures = []
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seed_tolls(backend.tables['TOLLS_TABLE_NAME'], args.peajes_file)
+        pipeline = Pipeline(backend)
+        add_user(users, 'P-100EXP', 100000)
+        add_user(users, 'P-200SFN', 100000)
+        express = pipeline.pass_toll('P-100EXP', 'TAG-P-100EXP', timestamp(0))
+        state_machine = pipeline.pass_toll('P-200SFN', 'TAG-P-200SFN', timestamp(0), express=False)
+
+    print("\n1. Paridad con la Step Function")
+    check(express == ('express', None) and state_machine == ('stepfunctions', 'ProcessingSuccess'),
+          f"camino express {express}, Step Function {state_machine}", failures)
+    by_placa = {item['placa']: item for item in transactions.all_items()}
+    fare = int(by_placa['P-200SFN']['final_fare_cents'])
+    invoice_by_placa = {item['placa']: item for item in invoices.all_items()}
+    check(strip(by_placa['P-100EXP'], TRANSACTION_VOLATILE) == strip(by_placa['P-200SFN'], TRANSACTION_VOLATILE),
+          "misma transacción", failures)
+    check(strip(invoice_by_placa['P-100EXP'], INVOICE_VOLATILE) == strip(invoice_by_placa['P-200SFN'], INVOICE_VOLATILE),
+          "misma factura", failures)
+    balances = {item['placa']: int(item[BALANCE_FIELD]) for item in users.all_items()}
+    check(balances['P-100EXP'] == balances['P-200SFN'] == 100000 - fare,
+          f"mismo cobro ({fare} centavos)", failures)
+    check(by_placa['P-100EXP']['payment_status'] == 'completed'
+          and by_placa['P-100EXP']['invoice_id'] == invoice_by_placa['P-100EXP']['invoice_id'],
+          "transacción express completada y ligada a su factura", failures)
+
+    print("\n3. Reintento después del commit")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        replay = pipeline.pass_toll('P-100EXP', 'TAG-P-100EXP', timestamp(0))
+    balance = int(users.get_item(Key={'placa': 'P-100EXP'})['Item'][BALANCE_FIELD])
+    check(replay == ('express', None) and balance == 100000 - fare and len(invoices) == 2,
+          "sin segundo cobro ni segunda factura", failures)
+
+    print("\n4. Fallback a la Step Function")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        add_user(users, 'P-300LOW', fare - 1)
+        add_user(users, 'P-400NOTAG', 100000, tag=False)
+        users.put_item(Item={'placa': 'P-500LEG', 'tiene_tag': True, 'tag_id': 'TAG-P-500LEG',
+                             LEGACY_BALANCE_FIELD: 1000})
+        results = {
+            'saldo insuficiente': pipeline.pass_toll('P-300LOW', 'TAG-P-300LOW', timestamp(1)),
+            'modalidad 2': pipeline.pass_toll('P-400NOTAG', None, timestamp(1)),
+            'modalidad 1': pipeline.pass_toll('P-999NOREG', None, timestamp(1)),
+            'saldo legado': pipeline.pass_toll('P-500LEG', 'TAG-P-500LEG', timestamp(1)),
+        }
+    expected = {
+        'saldo insuficiente': ('stepfunctions', 'InsufficientBalance'),
+        'modalidad 2': ('stepfunctions', 'ProcessingSuccess'),
+        'modalidad 1': ('stepfunctions', 'CashPaymentRequired'),
+        'saldo legado': ('stepfunctions', 'ProcessingSuccess'),
+    }
+    for case, outcome in results.items():
+        check(outcome == expected[case], f"{case}: {outcome}", failures)
+
+    print(f"\n5. {args.passes} pasos simultáneos de una placa")
+    affordable = args.passes // 2
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        add_user(users, 'P-600RUSH', affordable * fare)
+        with ThreadPoolExecutor(args.workers) as pool:
+            outcomes = list(pool.map(lambda n: pipeline.pass_toll('P-600RUSH', 'TAG-P-600RUSH', timestamp(100 + n)),
+                                     range(args.passes)))
+    charged = sum(1 for outcome in outcomes if outcome == ('express', None))
+    rejected = sum(1 for outcome in outcomes if outcome == ('stepfunctions', 'InsufficientBalance'))
+    balance = int(users.get_item(Key={'placa': 'P-600RUSH'})['Item'][BALANCE_FIELD])
+    check(charged == affordable and rejected == args.passes - affordable and balance == 0,
+          f"{charged} cobrados, {rejected} sin saldo, saldo final {balance}", failures)
+
+    print("\n6. debited_txns lleno")
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        tracked = [f"TXN-OLD-{n}" for n in range(MAX_TRACKED_TXNS + PRUNE_BATCH + 1)]
+        add_user(users, 'P-700FULL', 100000, **{DEBITED_TXNS_FIELD: tracked})
+        outcome = pipeline.pass_toll('P-700FULL', 'TAG-P-700FULL', timestamp(2))
+    item = users.get_item(Key={'placa': 'P-700FULL'})['Item']
+    check(outcome == ('express', None) and len(item[DEBITED_TXNS_FIELD]) == len(tracked) - PRUNE_BATCH + 1,
+          f"{outcome}, {len(item[DEBITED_TXNS_FIELD])} cobros recordados", failures)
+
+    print("\n2. Atomicidad")
+    debited = {txn for item in users.all_items() for txn in item.get(DEBITED_TXNS_FIELD, [])
+               if not txn.startswith('TXN-OLD-')}
+    recorded = {item['transaction_id'] for item in transactions.all_items() if item.get('modalidad') != 1}
+    invoiced = {item['transaction_id'] for item in invoices.all_items() if item.get('modalidad') != 1}
+    express_txns = {item['transaction_id'] for item in transactions.all_items() if item.get('pipeline') == 'express'}
+    check(express_txns <= debited and express_txns <= invoiced,
+          f"{len(express_txns)} pasos express con cobro y factura", failures)
+    check(debited <= recorded, f"{len(debited)} cobros, todos con transacción", failures)
+    check(backend.db.operation_counts.get('TransactWriteItems', 0) > 0, "cobros vía TransactWriteItems", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Camino express verificado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Verificación de la validación de la importación (src/import_users/validation.py)
+
+Genera un CSV de usuarios con problemas conocidos en posiciones aleatorias:
+placas repetidas (una de ellas 3 veces), tag_id compartidos entre placas
+distintas y filas mal formadas (sin placa, saldo inválido, columnas de más y
+de menos). Corre las importaciones contra los stand-ins locales
+(scripts/local_aws) y verifica:
+
+  1. full segmentada: el reporte de rechazos tiene exactamente las filas y
+     motivos esperados y ninguna placa en conflicto llega a DynamoDB
+     (las filas que entran a los escritores son solo las válidas)
+  2. reanudar: volver a correr el coordinador reutiliza la validación
+  3. csv.gz (un solo stream): el mismo resultado en la tabla
+  4. delta sobre una importación previa limpia: las placas en conflicto no se
+     escriben ni se dan de baja, conservan el item anterior
+
+También mide el costo de la pasada de validación contra una lectura sin validar.
+
+Uso:
+    python scripts/check_import_validation.py --rows 200000
+"""
+
+import argparse
+import contextlib
+import csv
+import gzip
+import os
+import random
+import shutil
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BUCKET = 'guatepass-validation-local'
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['USERS_TABLE_NAME'] = 'GuatepassUsers-local'
+os.environ['DATA_BUCKET_NAME'] = BUCKET
+os.environ['IMPORT_DELTA_SHARDS'] = '16'
+os.environ['IMPORT_WRITE_CAPACITY_SHARE'] = '0'
+
+import app  # noqa: E402
+from local_aws import LocalS3, LocalTable  # noqa: E402
+from validation import (BAD_COLUMNS, DUPLICATE_PLACA, INVALID_BALANCE, MISSING_PLACA,  # noqa: E402
+                        TAG_CONFLICT)
+
+
+def build_rows(count, rnd, args):
+    """Filas del CSV (listas) y lo que la validación debe encontrar."""
+    from generate_test_csv import generate_user
+
+    random.seed(args.seed)
+    users = [{**generate_user(index), 'placa': f"V-{index:07d}"} for index in range(count)]
+    fields = list(users[0])
+    rows = [[user[field] for field in fields] for user in users]
+    placa_col, tag_col = fields.index('placa'), fields.index('tag_id')
+    saldo_col = fields.index('saldo_disponible')
+
+    duplicated = rnd.sample(range(count), args.duplicates)
+    taken = set(duplicated)
+    with_tag = [i for i, row in enumerate(rows) if row[tag_col] and i not in taken]
+    tag_sources = rnd.sample(with_tag, args.tag_conflicts)
+    taken.update(tag_sources)
+    tag_targets = rnd.sample([i for i in range(count) if i not in taken], args.tag_conflicts)
+
+    extra = []
+    for n, i in enumerate(duplicated):
+        for _ in range(2 if n == 0 else 1):
+            copy = list(rows[i])
+            copy[fields.index('nombre')] = 'Otro Nombre'
+            extra.append((DUPLICATE_PLACA, copy))
+    duplicated_placas = {rows[i][placa_col] for i in duplicated}
+    for source, target in zip(tag_sources, tag_targets):
+        rows[target][tag_col] = rows[source][tag_col]
+        rows[target][fields.index('tiene_tag')] = 'true'
+    conflict_placas = {rows[i][placa_col] for i in tag_sources + tag_targets}
+
+    malformed = []
+    for n in range(args.malformed):
+        row = list(rows[rnd.randrange(count)])
+        kind = (MISSING_PLACA, INVALID_BALANCE, BAD_COLUMNS, BAD_COLUMNS)[n % 4]
+        row[placa_col] = '' if kind == MISSING_PLACA else f"M-{n:06d}"
+        if kind == INVALID_BALANCE:
+            row[saldo_col] = 'cien'
+        elif kind == BAD_COLUMNS:
+            row = row + ['columna extra'] if n % 8 == 2 else row[:3]
+        malformed.append((kind, row))
+
+    # Intercalar las filas extra en posiciones aleatorias
+    entries = [(None, row) for row in rows]
+    for entry in extra + malformed:
+        entries.insert(rnd.randrange(len(entries) + 1), entry)
+
+    expected_report = set()
+    for row_number, (kind, row) in enumerate(entries, start=2):
+        if kind in (MISSING_PLACA, INVALID_BALANCE, BAD_COLUMNS):
+            expected_report.add((row_number, kind))
+        elif row[placa_col] in duplicated_placas:
+            expected_report.add((row_number, DUPLICATE_PLACA))
+        elif row[placa_col] in conflict_placas:
+            expected_report.add((row_number, TAG_CONFLICT))
+    return fields, [row for _, row in entries], duplicated_placas | conflict_placas, expected_report
+
+
+def write_csv(path, fields, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(fields)
+        writer.writerows(rows)
+
+
+def report_entries(s3, summary):
+    body = s3.get_object(Bucket=BUCKET, Key=summary['report_key'])['Body'].read().decode('utf-8')
+    return {(int(row['fila']), row['motivo']) for row in csv.DictReader(body.splitlines())}
+
+
+def quiet(fn, *args, **kwargs):
+    start = time.perf_counter()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación de la validación de importaciones')
+    parser.add_argument('--rows', type=int, default=200000, help='Filas válidas del CSV (default: 200k)')
+    parser.add_argument('--duplicates', type=int, default=150, help='Placas repetidas')
+    parser.add_argument('--tag-conflicts', type=int, default=100, help='tag_id compartidos')
+    parser.add_argument('--malformed', type=int, default=80, help='Filas mal formadas')
+    parser.add_argument('--seed', type=int, default=17)
+    parser.add_argument('--s3-root', default='/tmp/guatepass-validation-s3', help='Directorio del S3 local')
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    shutil.rmtree(args.s3_root, ignore_errors=True)
+    os.makedirs(os.path.join(args.s3_root, BUCKET))
+    s3 = LocalS3(args.s3_root)
+    app.s3_client = s3
+    app.IMPORT_SEGMENT_BYTES = 4 * 1024 * 1024
+    failures = []
+
+    fields, rows, rejected, expected_report = build_rows(args.rows, rnd, args)
+    placa_col = fields.index('placa')
+    valid_rows = [row for row in rows if len(row) == len(fields) and row[placa_col]
+                  and row[fields.index('saldo_disponible')] != 'cien']
+    expected_placas = {row[placa_col] for row in valid_rows} - rejected
+    expected_written = sum(1 for row in valid_rows if row[placa_col] not in rejected)
+    path = os.path.join(args.s3_root, 'clientes_validacion.csv')
+    write_csv(path, fields, rows)
+    s3.upload_file(path, BUCKET, 'clientes_validacion.csv', ExtraArgs={'Metadata': {'import-mode': 'full'}})
+    print(f"📦 {len(rows):,} filas: {len(rejected):,} placas en conflicto, {args.malformed} mal formadas")
+
+    print("\n1) Importación full segmentada")
+    table = LocalTable(app.USERS_TABLE_NAME, 'placa', page_size=10000)
+    app.users_table = table
+    stats, elapsed = quiet(app.coordinate_import, BUCKET, 'clientes_validacion.csv')
+    summary = stats['validation']
+    print(f"   {stats['segments']} segmentos, {stats['total']:,} filas a escritores, {stats['rejected']:,} saltadas, "
+          f"{elapsed:.1f}s; motivos {summary['reasons']}")
+    check(report_entries(s3, summary) == expected_report,
+          f"reporte con las {len(expected_report):,} filas y motivos esperados", failures)
+    check(summary['rejected_placas'] == len(rejected), f"{len(rejected):,} placas rechazadas", failures)
+    check(set(item['placa'] for item in table.all_items()) == expected_placas,
+          "la tabla tiene solo las placas válidas sin conflicto", failures)
+    check(stats['total'] == expected_written and stats['success'] == expected_written,
+          f"solo {expected_written:,} filas consumen escrituras", failures)
+
+    print("\n2) Reanudar con el mismo objeto")
+    created_at = summary['created_at']
+    stats, _ = quiet(app.coordinate_import, BUCKET, 'clientes_validacion.csv')
+    check(stats['validation']['created_at'] == created_at and stats['processed'] == 0,
+          "validación reutilizada, sin segmentos pendientes", failures)
+
+    print("\n3) Mismo archivo como csv.gz (un solo stream)")
+    with open(path, 'rb') as source, gzip.open(path + '.gz', 'wb') as target:
+        shutil.copyfileobj(source, target)
+    s3.upload_file(path + '.gz', BUCKET, 'clientes_validacion.csv.gz')
+    table = LocalTable(app.USERS_TABLE_NAME, 'placa', page_size=10000)
+    app.users_table = table
+    stats, elapsed = quiet(app.coordinate_import, BUCKET, 'clientes_validacion.csv.gz')
+    check(report_entries(s3, stats['validation']) == expected_report, "mismo reporte", failures)
+    check(set(item['placa'] for item in table.all_items()) == expected_placas
+          and stats['total'] == expected_written, f"misma tabla ({elapsed:.1f}s)", failures)
+
+    print("\n4) Delta sobre una importación previa limpia")
+    clean = [{field: value for field, value in zip(fields, row)} for row in valid_rows]
+    seen = set()
+    clean = [row for row in clean if not (row['placa'] in seen or seen.add(row['placa']))]
+    for row in clean:
+        row['tag_id'], row['tiene_tag'] = '', 'false'
+    clean_path = os.path.join(args.s3_root, 'clientes_limpio.csv')
+    write_csv(clean_path, fields, [[row[field] for field in fields] for row in clean])
+    s3.upload_file(clean_path, BUCKET, 'clientes_limpio.csv')
+    table = LocalTable(app.USERS_TABLE_NAME, 'placa', page_size=10000)
+    app.users_table = table
+    quiet(app.run_delta_import, BUCKET, 'clientes_limpio.csv')
+    before = {item['placa']: dict(item) for item in table.all_items()}
+
+    s3.upload_file(path, BUCKET, 'clientes_validacion_delta.csv')
+    stats, elapsed = quiet(app.run_delta_import, BUCKET, 'clientes_validacion_delta.csv')
+    after = {item['placa']: item for item in table.all_items()}
+    check(all(after[placa] == before[placa] for placa in rejected if placa in before),
+          f"{sum(1 for placa in rejected if placa in before):,} placas en conflicto sin escribir ni dar de baja",
+          failures)
+    check(stats['rejected'] == sum(1 for row in valid_rows if row[placa_col] in rejected) and stats['removed'] == 0,
+          f"{stats['rejected']:,} filas rechazadas, 0 bajas, {stats['writes']:,} escrituras ({elapsed:.1f}s)", failures)
+    check(report_entries(s3, stats['validation']) == expected_report, "mismo reporte", failures)
+
+    print("\n5) Costo de la validación")
+    _, plain = quiet(lambda: sum(1 for _ in app.read_users_from_s3(BUCKET, 'clientes_validacion.csv')))
+
+    def validated():
+        with app.validation.ImportValidator() as validator:
+            for _ in app.read_users_from_s3(BUCKET, 'clientes_validacion.csv', validator):
+                pass
+            validator.finish()
+
+    _, checked = quiet(validated)
+    print(f"   lectura {plain:.2f}s, lectura + validación {checked:.2f}s "
+          f"(+{(checked - plain) / plain:.0%}, {len(rows) / checked:,.0f} filas/s)")
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Validación verificada")
+
+
+if __name__ == "__main__":
+    main()
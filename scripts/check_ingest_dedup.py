@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Verificación de la supresión de duplicados de ingest_toll (src/ingest_toll/dedup.py)
+
+Corre dos "contenedores" de ingest_toll (cada uno con su ventana en memoria)
+contra el mismo stand-in de la tabla de idempotencia y de EventBridge:
+
+  1. duplicado entre contenedores dentro de la ventana, también cuando las dos
+     detecciones caen en buckets de tiempo vecinos
+  2. detecciones a window_seconds o más se aceptan las dos
+  3. si put_events falla (excepción o entries fallidas, por evento y por lote)
+     el reclamo se libera: el reintento de la cámara se acepta y se publica
+  4. un duplicado de un evento ya publicado se sigue descartando
+
+Uso:
+    python scripts/check_ingest_dedup.py
+"""
+
+import contextlib
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import BATCH_RESOURCE, Backend, load_function  # noqa: E402
+
+PEAJE_ID = 'PEAJE001'
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def timestamp(seconds):
+    """Hora de la detección: 2025-11-03T09:00:00Z + seconds (múltiplos de 0.5)."""
+    whole, half = divmod(int(seconds * 10), 10)
+    minutes, secs = divmod(whole, 60)
+    return f"2025-11-03T09:{minutes:02d}:{secs:02d}.{half}Z"
+
+
+def request(placa, seconds):
+    return {'body': json.dumps({'placa': placa, 'peaje_id': PEAJE_ID, 'timestamp': timestamp(seconds)})}
+
+
+def status(response):
+    body = json.loads(response['body'])
+    if response['statusCode'] != 200:
+        return 'failed'
+    return 'duplicate' if body.get('duplicate') else 'accepted'
+
+
+def main():
+    backend = Backend(0.0)
+    containers = [load_function('ingest_toll') for _ in range(2)]
+    for container in containers:
+        backend.wire('ingest', container)
+    window = containers[0].DEDUP_WINDOW_SECONDS
+    failures = []
+
+    def send(container, placa, seconds):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return status(containers[container].lambda_handler(request(placa, seconds), None))
+
+    print(f"\n1. Duplicados entre contenedores (ventana {window}s)")
+    same_bucket = (send(0, 'P-100DUP', 2), send(1, 'P-100DUP', 5))
+    check(same_bucket == ('accepted', 'duplicate'), f"mismo bucket: {same_bucket}", failures)
+    edge = window * 2 - 0.5
+    straddle = (send(0, 'P-200DUP', edge), send(1, 'P-200DUP', edge + 1))
+    check(straddle == ('accepted', 'duplicate'),
+          f"buckets vecinos ({edge}s y {edge + 1}s): {straddle}", failures)
+    backwards = (send(0, 'P-300DUP', edge + 1), send(1, 'P-300DUP', edge))
+    check(backwards == ('accepted', 'duplicate'), f"buckets vecinos, en orden inverso: {backwards}", failures)
+
+    print("\n2. Fuera de la ventana")
+    apart = (send(0, 'P-400DUP', 3), send(1, 'P-400DUP', 3 + window))
+    check(apart == ('accepted', 'accepted'), f"{window}s de diferencia: {apart}", failures)
+
+    print("\n3. Falla al publicar")
+    backend.events.failure_rate = 1.0
+    failed = send(0, 'P-500DUP', 4)
+    backend.events.failure_rate = 0.0
+    retried = (send(0, 'P-500DUP', 4), send(1, 'P-500DUP', 4))
+    check(failed == 'failed' and retried == ('accepted', 'duplicate'),
+          f"put_events falla -> {failed}; reintento {retried}", failures)
+
+    containers[1].eventbridge = None  # put_events lanza AttributeError
+    raised = send(1, 'P-600DUP', 4)
+    containers[1].eventbridge = backend.events
+    retried = send(1, 'P-600DUP', 4)
+    check(raised == 'failed' and retried == 'accepted', f"excepción -> {raised}; reintento {retried}", failures)
+
+    batch = {'resource': BATCH_RESOURCE, 'body': json.dumps({'events': [
+        {'placa': f"P-{n}00LOT", 'peaje_id': PEAJE_ID, 'timestamp': timestamp(6)} for n in range(1, 4)
+    ]})}
+    backend.events.failure_rate = 1.0
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        first = json.loads(containers[0].lambda_handler(dict(batch), None)['body'])
+        backend.events.failure_rate = 0.0
+        second = json.loads(containers[1].lambda_handler(dict(batch), None)['body'])
+    check(first['failed'] == 3 and second['accepted'] == 3,
+          f"lote: {first['failed']} fallidos, reintento {second['accepted']} aceptados", failures)
+
+    print("\n4. Duplicado de un evento publicado")
+    check(send(0, 'P-500DUP', 6) == 'duplicate', "se descarta", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Supresión de duplicados verificada")
+
+
+if __name__ == "__main__":
+    main()
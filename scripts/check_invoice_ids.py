@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Prueba de unicidad del generador de invoice_id (src/shared/invoice_ids.py)
+
+Genera millones de IDs en varios procesos (como contenedores Lambda
+distintos), cada uno con varios hilos. Después verifica que:
+  - no haya ningún invoice_id repetido entre todos los procesos e hilos
+  - cada hilo reciba IDs en orden estrictamente creciente
+  - el instante embebido en cada ID corresponda a la ejecución
+
+Uso:
+    python scripts/check_invoice_ids.py --processes 8 --threads 8 --per-thread 50000
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from multiprocessing import get_context
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+
+from invoice_ids import generate_invoice_id, invoice_timestamp  # noqa: E402
+
+
+def _thread_ids(count):
+    ids = [generate_invoice_id() for _ in range(count)]
+    ordered = all(a < b for a, b in zip(ids, ids[1:]))
+    return ids, ordered
+
+
+def _process_ids(args):
+    threads, per_thread = args
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(_thread_ids, [per_thread] * threads))
+    elapsed = time.perf_counter() - start
+    ids = [invoice_id for thread_ids, _ in results for invoice_id in thread_ids]
+    unordered_threads = sum(1 for _, ordered in results if not ordered)
+    return ids, unordered_threads, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de unicidad de invoice_id')
+    parser.add_argument('--processes', type=int, default=8, help='Procesos (default: 8)')
+    parser.add_argument('--threads', type=int, default=8, help='Hilos por proceso (default: 8)')
+    parser.add_argument('--per-thread', type=int, default=50000, help='IDs por hilo (default: 50000)')
+    parser.add_argument('--start-method', choices=['fork', 'spawn'], default='fork' if os.name == 'posix' else 'spawn',
+                        help='fork reutiliza el estado del padre (ejercita el reseed tras fork)')
+    args = parser.parse_args()
+
+    total = args.processes * args.threads * args.per_thread
+    print(f"🔢 Generando {total:,} invoice_id: {args.processes} procesos × {args.threads} hilos "
+          f"× {args.per_thread:,} ({args.start_method})")
+
+    # El padre genera un ID antes del fork para que los hijos hereden su estado
+    generate_invoice_id()
+    started_at = datetime.now(timezone.utc)
+    start = time.perf_counter()
+    with get_context(args.start_method).Pool(args.processes) as pool:
+        results = pool.map(_process_ids, [(args.threads, args.per_thread)] * args.processes)
+    elapsed = time.perf_counter() - start
+    finished_at = datetime.now(timezone.utc)
+
+    all_ids = [invoice_id for ids, _, _ in results for invoice_id in ids]
+    unique = len(set(all_ids))
+    unordered = sum(u for _, u, _ in results)
+    per_process_rate = sum(len(ids) / t for ids, _, t in results) / len(results)
+
+    # El milisegundo lógico puede adelantarse al reloj si se agota la secuencia
+    tolerance = timedelta(seconds=1)
+    out_of_range = sum(
+        1 for invoice_id in (min(all_ids), max(all_ids))
+        if not started_at - tolerance <= invoice_timestamp(invoice_id) <= finished_at + tolerance
+    )
+
+    print("\n📊 Resultado:")
+    print(f"   - IDs generados:            {len(all_ids):,}")
+    print(f"   - IDs únicos:               {unique:,}")
+    print(f"   - Duplicados:               {len(all_ids) - unique:,}")
+    print(f"   - Hilos fuera de orden:     {unordered}")
+    print(f"   - Timestamps fuera de rango: {out_of_range}")
+    print(f"   - Tiempo total:             {elapsed:.2f}s ({len(all_ids) / elapsed:,.0f} IDs/s)")
+    print(f"   - Por proceso:              {per_process_rate:,.0f} IDs/s")
+    print(f"   - Ejemplo:                  {all_ids[0]}")
+
+    if unique != len(all_ids) or unordered or out_of_range:
+        print("\n❌ El generador produjo IDs repetidos o fuera de orden")
+        sys.exit(1)
+    print("\n✅ Todos los invoice_id son únicos y ordenados por hilo")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Verificación de la frescura del filtro Bloom en resolve_user (src/shared/registry_filter.py)
+
+Un contenedor de resolve_user con el filtro ya cargado (refresh de 60s) resuelve
+pasos mientras otro proceso registra usuarios (create_tag / import_users llaman
+register_entries) contra el mismo stand-in de S3:
+
+  1. un usuario registrado después de la carga del filtro y antes del paso se
+     encuentra (el "no" del filtro viejo no es definitivo), por placa, por tag
+     y en el camino por lotes
+  2. una placa no registrada en un paso anterior a la última revisión del
+     filtro se descarta sin head_object ni get_item
+  3. entre revisiones (recheck_seconds) un "no" se confirma en DynamoDB; pasado
+     el intervalo, un solo head_object vuelve a hacer definitivo el "no"
+
+Uso:
+    python scripts/check_registry_filter_freshness.py
+"""
+
+import contextlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import Backend, load_function  # noqa: E402
+from local_aws import LocalS3  # noqa: E402
+from money import BALANCE_FIELD  # noqa: E402
+from registry_filter import (  # noqa: E402
+    BloomFilter, RegistryFilterLoader, placa_entry, register_entries, save_filter, tag_entry
+)
+
+BUCKET = 'guatepass-data'
+KEY = 'registry/registered-users.bloom'
+RECHECK_SECONDS = 0.2
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def main():
+    root = tempfile.mkdtemp(prefix='registry-filter-')
+    try:
+        run(LocalS3(root))
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+def run(s3):
+    backend = Backend(0.0)
+    users = backend.tables['USERS_TABLE_NAME']
+    resolve = load_function('resolve_user')
+    backend.wire('resolve', resolve)
+    resolve.registry_filter = RegistryFilterLoader(s3, BUCKET, KEY, 60, RECHECK_SECONDS)
+    failures = []
+
+    def register(placa, tag_id=None):
+        item = {'placa': placa, 'nombre': 'Registro Reciente', BALANCE_FIELD: 10000}
+        entries = [placa_entry(placa)]
+        if tag_id:
+            item['tag_id'] = tag_id
+            entries.append(tag_entry(tag_id))
+        users.put_item(Item=item)
+        register_entries(s3, users, BUCKET, KEY, entries)
+
+    def counts():
+        return s3.operation_counts.get('HeadObject', 0), users.operation_counts.get('GetItem', 0)
+
+    def find(placa, tag_id=None, received_at=None):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return resolve.find_user(placa, tag_id, time.time() if received_at is None else received_at)
+
+    bloom = BloomFilter.for_capacity(10000)
+    bloom.add(placa_entry('P-100OLD'))
+    save_filter(s3, BUCKET, KEY, bloom)
+    users.put_item(Item={'placa': 'P-100OLD', 'nombre': 'Registro Viejo', BALANCE_FIELD: 10000})
+    check(find('P-100OLD') is not None, "filtro cargado en el contenedor", failures)
+
+    print("\n1. Registro posterior a la carga del filtro")
+    time.sleep(RECHECK_SECONDS)
+    register('P-200NEW')
+    user = find('P-200NEW')
+    check(user is not None and user['placa'] == 'P-200NEW', "por placa: encontrado", failures)
+
+    time.sleep(RECHECK_SECONDS)
+    register('P-300TAG', 'TAG-300NEW')
+    user = find('P-300XXX', 'TAG-300NEW')
+    check(user is not None and user['placa'] == 'P-300TAG', "por tag_id: encontrado", failures)
+
+    time.sleep(RECHECK_SECONDS)
+    register('P-400LOT')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        found = resolve.find_users([('P-400LOT', None), ('P-400NOP', None)], time.time())
+    check(found['P-400LOT'] is not None and found['P-400NOP'] is None,
+          "por lote: encontrado", failures)
+
+    print("\n2. Paso anterior a la última revisión")
+    before = counts()
+    missing = find('P-500NOP', received_at=time.time() - 5)
+    check(missing is None and counts() == before, f"descartado sin lecturas ({counts()[0] - before[0]} "
+          f"head_object, {counts()[1] - before[1]} get_item)", failures)
+
+    print("\n3. Intervalo entre revisiones")
+    find('P-600NOP')  # revisa el ETag
+    before = counts()
+    find('P-610NOP')
+    after = counts()
+    check(after[0] == before[0] and after[1] == before[1] + 1,
+          "dentro del intervalo: get_item, sin head_object", failures)
+    time.sleep(RECHECK_SECONDS)
+    received_at = time.time()
+    find('P-620NOP', received_at=received_at)
+    after_recheck = counts()
+    find('P-630NOP', received_at=received_at)
+    check(after_recheck == (after[0] + 1, after[1]) and counts() == after_recheck,
+          "pasado el intervalo: un head_object y descarte sin get_item", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Frescura del filtro de registrados verificada")
+
+
+if __name__ == "__main__":
+    main()
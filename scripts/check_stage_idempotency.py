@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Verificación del registro de idempotencia de las tareas (src/shared/idempotency.py)
+
+Invoca RecordTransaction, UpdateBalance y GenerateInvoice con la entrada del
+contrato 2 contra los stand-ins locales, como los reintentos de la Step Function:
+
+  1. reintento después de completar: la misma respuesta (mismo invoice_id,
+     mismos saldos) sin otra factura ni otro cobro
+  2. intento en curso: con el reclamo vigente de otro intento la tarea falla
+     con StageInProgressError y no escribe
+  3. lease vencido: un reclamo abandonado se retoma y la tarea escribe una vez
+  4. falla del efecto: el reclamo se libera y el reintento escribe
+  5. registro vencido (expires_at pasado, el TTL de DynamoDB borra con atraso)
+     no bloquea la tarea
+  6. concurrencia: --attempts intentos simultáneos del mismo paso emiten una
+     sola factura; los demás retornan esa factura o StageInProgressError
+  7. resultado sin guardar: si complete() falla en todos sus intentos la tarea
+     responde igual; al vencer el lease el reintento repite los efectos sin
+     otra factura (mismo invoice_id) ni otro cobro
+
+Uso:
+    python scripts/check_stage_idempotency.py --attempts 20
+"""
+
+import argparse
+import contextlib
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from load_replay import STATE_MACHINE_TASKS, Backend, load_function  # noqa: E402
+import idempotency  # noqa: E402
+import state_contract  # noqa: E402
+from money import BALANCE_FIELD  # noqa: E402
+
+PLACA = 'P-300IDM'
+INITIAL_BALANCE = 100000
+FARE = 1500
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+def document(event_id, minute=0):
+    """Documento de process_toll después de CalculateTollFare."""
+    return {
+        'event_id': event_id,
+        'user_data': {'placa': PLACA, 'modalidad': 2, 'is_registered': True, 'has_tag': False,
+                      'nombre': 'Prueba Idempotencia', 'email': 'idempotencia@example.com'},
+        'toll_data': {'peaje_id': 'PEAJE001', 'nombre_peaje': 'Carretera Norte', 'lane_id': 'LANE-01',
+                      'tag_id': None, 'timestamp': f"2025-11-03T09:{minute:02d}:00Z"},
+        'fare_calculation': {'modality': 2, 'base_fare_cents': FARE, 'final_fare_cents': FARE, 'currency': 'GTQ'}
+    }
+
+
+class UnsavedResults:
+    """Tabla de idempotencia que rechaza guardar resultados (el put de status completed)."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def put_item(self, **kwargs):
+        if kwargs['Item']['status'] == idempotency.STATUS_COMPLETED:
+            raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'Falla simulada'}}, 'PutItem')
+        return self.table.put_item(**kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.table, name)
+
+
+class FlakyTable:
+    """Tabla cuyo siguiente put_item falla (después de que la tarea reclamó el paso)."""
+
+    def __init__(self, table):
+        self.table = table
+        self.failures = 1
+
+    def put_item(self, **kwargs):
+        if self.failures:
+            self.failures -= 1
+            raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException',
+                                         'Message': 'Falla simulada'}}, 'PutItem')
+        return self.table.put_item(**kwargs)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación de la idempotencia de las tareas de process_toll')
+    parser.add_argument('--attempts', type=int, default=20, help='Intentos simultáneos del mismo paso')
+    args = parser.parse_args()
+
+    backend = Backend(0.0)
+    users = backend.tables['USERS_TABLE_NAME']
+    transactions = backend.tables['TRANSACTIONS_TABLE_NAME']
+    invoices = backend.tables['INVOICES_TABLE_NAME']
+    records = backend.tables['IDEMPOTENCY_TABLE_NAME']
+    users.put_item(Item={'placa': PLACA, 'nombre': 'Prueba Idempotencia', BALANCE_FIELD: INITIAL_BALANCE})
+    handlers = {}
+    for stage, function, _, _ in STATE_MACHINE_TASKS:
+        if function in ('record_transaction', 'update_balance', 'generate_invoice'):
+            handlers[function] = load_function(function)
+            backend.wire(stage, handlers[function])
+    failures = []
+
+    def invoke(function, doc):
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            return handlers[function].lambda_handler(state_contract.task_input(function, doc), None)
+
+    def balance():
+        return int(users.get_item(Key={'placa': PLACA})['Item'][BALANCE_FIELD])
+
+    def invoices_of(event_doc):
+        transaction_id = state_contract.transaction_id(event_doc)
+        return [item for item in invoices.all_items() if item['transaction_id'] == transaction_id]
+
+    print("\n1. Reintento después de completar")
+    doc = document('evt-retry', 0)
+    first = {function: invoke(function, doc) for function in handlers}
+    second = {function: invoke(function, doc) for function in handlers}
+    check(second['generate_invoice'] == first['generate_invoice'] and len(invoices_of(doc)) == 1,
+          f"misma factura {first['generate_invoice']['invoice_id']}, 1 en la tabla", failures)
+    check(second['record_transaction'] == first['record_transaction'] and len(transactions) == 1,
+          "misma transacción", failures)
+    replay = second['update_balance']
+    check(replay.get('idempotent_replay') and replay['new_balance_cents'] == first['update_balance']['new_balance_cents']
+          and balance() == INITIAL_BALANCE - FARE,
+          f"un cobro, mismos saldos en la respuesta (saldo {balance()})", failures)
+
+    print("\n2. Intento en curso")
+    doc = document('evt-busy', 1)
+    key = idempotency.stage_key('evt-busy', 'generate_invoice')
+    idempotency.claim(records, key, 3600, 30)
+    try:
+        invoke('generate_invoice', doc)
+        busy = None
+    except idempotency.StageInProgressError as e:
+        busy = e
+    check(busy is not None and not invoices_of(doc), "StageInProgressError, sin factura", failures)
+
+    print("\n3. Lease vencido")
+    now = int(time.time())
+    records.put_item(Item={'idempotency_key': key, 'status': idempotency.STATUS_IN_PROGRESS,
+                           'lease_expires_at': now - 1, 'expires_at': now + 3600})
+    result = invoke('generate_invoice', doc)
+    stored = records.get_item(Key={'idempotency_key': key})['Item']
+    check(len(invoices_of(doc)) == 1 and stored['status'] == idempotency.STATUS_COMPLETED,
+          f"reclamo retomado, factura {result['invoice_id']}", failures)
+
+    print("\n4. Falla del efecto")
+    doc = document('evt-flaky', 2)
+    key = idempotency.stage_key('evt-flaky', 'generate_invoice')
+    handlers['generate_invoice'].invoices_table = FlakyTable(invoices)
+    try:
+        invoke('generate_invoice', doc)
+        failed = False
+    except ClientError:
+        failed = True
+    released = 'Item' not in records.get_item(Key={'idempotency_key': key})
+    invoke('generate_invoice', doc)
+    handlers['generate_invoice'].invoices_table = invoices
+    check(failed and released and len(invoices_of(doc)) == 1,
+          "reclamo liberado, el reintento emite una factura", failures)
+
+    print("\n5. Registro vencido")
+    doc = document('evt-expired', 3)
+    key = idempotency.stage_key('evt-expired', 'record_transaction')
+    records.put_item(Item={'idempotency_key': key, 'status': idempotency.STATUS_COMPLETED,
+                           'result': '{"transaction_id":"TXN-VENCIDA"}', 'expires_at': int(time.time()) - 1})
+    result = invoke('record_transaction', doc)
+    check(result['transaction_id'] == state_contract.transaction_id(doc),
+          "no se retorna el resultado vencido", failures)
+
+    print("\n6. Concurrencia")
+    doc = document('evt-race', 4)
+
+    def attempt(_):
+        try:
+            return invoke('generate_invoice', doc)['invoice_id']
+        except idempotency.StageInProgressError:
+            return None
+
+    # Latencia en la escritura de la factura: los intentos se encuentran con el reclamo vigente
+    invoices.latency_seconds = 0.05
+    with ThreadPoolExecutor(max_workers=args.attempts) as pool:
+        results = list(pool.map(attempt, range(args.attempts)))
+    invoices.latency_seconds = 0.0
+    issued = invoices_of(doc)
+    answered = {invoice_id for invoice_id in results if invoice_id is not None}
+    check(len(issued) == 1 and answered == {issued[0]['invoice_id']},
+          f"{args.attempts} intentos, 1 factura ({results.count(None)} en curso)", failures)
+
+    print("\n7. Resultado sin guardar")
+    doc = document('evt-unsaved', 5)
+    idempotency.COMPLETE_BACKOFF_SECONDS = 0
+    for handler in handlers.values():
+        handler.idempotency_table = UnsavedResults(records)
+    first = {function: invoke(function, doc) for function in handlers}
+    for handler in handlers.values():
+        handler.idempotency_table = records
+    keys = [idempotency.stage_key('evt-unsaved', function) for function in handlers]
+    stuck = all(records.get_item(Key={'idempotency_key': key})['Item']['status'] == idempotency.STATUS_IN_PROGRESS
+                for key in keys)
+    check(stuck and len(invoices_of(doc)) == 1, "la tarea responde, el reclamo queda in_progress", failures)
+
+    # Vence el lease: el reintento retoma el reclamo y repite los efectos
+    for key in keys:
+        records.update_item(Key={'idempotency_key': key}, UpdateExpression='SET lease_expires_at = :past',
+                            ExpressionAttributeValues={':past': int(time.time()) - 1})
+    charged_before = balance()
+    second = {function: invoke(function, doc) for function in handlers}
+    completed = all(records.get_item(Key={'idempotency_key': key})['Item']['status'] == idempotency.STATUS_COMPLETED
+                    for key in keys)
+    check(second['generate_invoice']['invoice_id'] == first['generate_invoice']['invoice_id']
+          and len(invoices_of(doc)) == 1 and completed,
+          f"misma factura {first['generate_invoice']['invoice_id']}, 1 en la tabla", failures)
+    check(balance() == charged_before and second['record_transaction'] == first['record_transaction'],
+          f"sin otro cobro (saldo {balance()}), misma transacción", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Idempotencia de las tareas verificada")
+
+
+if __name__ == "__main__":
+    main()
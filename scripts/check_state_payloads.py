@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Verificación del contrato de estado de process_toll (src/shared/state_contract.py)
+
+Corre process_toll.asl.json con el ejecutor local y los handlers reales sobre
+los stand-ins y mide, por tarea, el JSON que recibe la Lambda y el que
+retorna, además del documento de la ejecución después de cada estado:
+
+  1. definiciones: process_toll.asl.json es el que genera
+     scripts/generate_state_machine.py, en process_toll y en el Map de
+     process_toll_batch cada tarea tiene los Parameters y el ResultPath que
+     declara STAGES, y process_toll no tiene estados Pass fuera de los
+     Handle*Error
+  2. modalidades 1, 2 y 3 y saldo insuficiente terminan en su estado final
+  3. presupuesto: la entrada y el resultado de cada tarea y el documento de
+     cada transición quedan bajo TASK_INPUT_BUDGET_BYTES,
+     TASK_OUTPUT_BUDGET_BYTES y STATE_BUDGET_BYTES
+  4. deltas: cada tarea retorna solo su slot y el documento final lo tiene tal
+     cual; la factura lleva la hora del paso (toll_data.timestamp) como
+     fecha_emision aunque GenerateInvoice no recibe transaction
+  5. crecimiento: con --growth-kb de campos nuevos en user_data y en un slot
+     nuevo del documento, ninguna tarea los recibe
+  6. contrato 1: sin contract_version los handlers retornan el documento
+     completo; una versión desconocida falla
+
+Uso:
+    python scripts/check_state_payloads.py
+    python scripts/check_state_payloads.py --growth-kb 64
+"""
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from load_replay import (BATCH_STATE_MACHINE_FILE, STATE_MACHINE_FILE, STATE_MACHINE_TASKS, Backend,  # noqa: E402
+                         load_function, seed_tolls)
+from generate_state_machine import build_definition  # noqa: E402
+from local_aws.asl import PAYLOAD_LIMIT_BYTES, LocalStateMachine  # noqa: E402
+from money import BALANCE_FIELD  # noqa: E402
+import state_contract  # noqa: E402
+
+# Presupuesto por transición (el límite de Step Functions es 256 KB)
+TASK_INPUT_BUDGET_BYTES = 1024
+TASK_OUTPUT_BUDGET_BYTES = 1024
+STATE_BUDGET_BYTES = 4 * 1024
+
+PEAJE_ID = 'PEAJE001'
+PASS_TIMESTAMP = '2025-11-03T09:00:00Z'
+# Etapa de load_replay -> tarea de state_contract.STAGES
+CONTRACT_STAGES = {
+    'calculate': 'calculate_fare',
+    'record': 'record_transaction',
+    'balance': 'update_balance',
+    'invoice': 'generate_invoice',
+    'notify': 'notify_user',
+}
+SCENARIOS = (
+    # (placa, tag_id, saldo en centavos o None si no está registrada, estado final esperado)
+    ('P-100TAG', 'TAG-P-100TAG', 100000, 'ProcessingSuccess'),
+    ('P-200NOTAG', None, 100000, 'ProcessingSuccess'),
+    ('P-300LOW', 'TAG-P-300LOW', 1, 'InsufficientBalance'),
+    ('P-999NOREG', None, None, 'CashPaymentRequired'),
+)
+
+
+def check(condition, message, failures):
+    print(f"   {'✅' if condition else '❌'} {message}")
+    if not condition:
+        failures.append(message)
+
+
+class TaskRecorder:
+    """Guarda lo que recibe y retorna cada handler de la Step Function."""
+
+    def __init__(self):
+        self.calls = []
+
+    def wrap(self, stage, handler):
+        def invoke(event, context):
+            result = handler(event, context)
+            self.calls.append((stage, event, result))
+            return result
+        return invoke
+
+    def take(self):
+        calls, self.calls = self.calls, []
+        return calls
+
+
+def all_states(states):
+    """Estados de la definición, incluidos los de las ramas de los Parallel."""
+    result = {}
+    for name, state in states.items():
+        result[name] = state
+        for branch in state.get('Branches', []):
+            result.update(all_states(branch['States']))
+    return result
+
+
+def check_definitions(failures):
+    with open(STATE_MACHINE_FILE, encoding='utf-8') as f:
+        definition = json.load(f)
+    with open(BATCH_STATE_MACHINE_FILE, encoding='utf-8') as f:
+        batch = json.load(f)['States']['ProcessItems']['ItemProcessor']['States']
+    standard = all_states(definition['States'])
+
+    check(definition == build_definition(), "process_toll.asl.json generado desde STAGES", failures)
+
+    for label, states, stages in (('process_toll', standard, state_contract.STAGES),
+                                  ('process_toll_batch (Map)', batch,
+                                   {k: v for k, v in state_contract.STAGES.items() if v.state in batch})):
+        mismatched = [
+            spec.state for stage, spec in stages.items()
+            if spec.state not in states
+            or states[spec.state].get('Parameters') != state_contract.parameters(stage)
+            or states[spec.state].get('ResultPath') != f"$.{spec.output}"
+        ]
+        check(not mismatched, f"{label}: {len(stages)} tareas según STAGES"
+              + (f" (distintas: {mismatched})" if mismatched else ''), failures)
+
+    merges = [name for name, state in standard.items()
+              if state['Type'] == 'Pass' and state.get('Next') != 'ProcessingFailed']
+    check(not merges, "process_toll sin estados Pass de merge"
+          + (f" (quedan: {merges})" if merges else ''), failures)
+
+
+def run(pipeline, machine, recorder, placa, tag_id, timestamp, extra=None):
+    """Un paso: entrada de resolve_user (con extra agregado) y la ejecución local."""
+    detail = {'event_id': f"evt-{placa}-{timestamp}", 'placa': placa, 'peaje_id': PEAJE_ID,
+              'tag_id': tag_id, 'timestamp': timestamp}
+    execution_input = pipeline.lambda_handler({'detail': detail}, None)
+    for slot, fields in (extra or {}).items():
+        execution_input[slot] = {**execution_input.get(slot, {}), **fields} if isinstance(fields, dict) else fields
+    execution = machine.execute(execution_input)
+    return execution, recorder.take()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verificación del contrato de estado de process_toll')
+    parser.add_argument('--growth-kb', type=int, default=16, help='Campos agregados al documento en la prueba 5')
+    parser.add_argument('--peajes-file', default=os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json'))
+    args = parser.parse_args()
+
+    backend = Backend(0.0)
+    users = backend.tables['USERS_TABLE_NAME']
+    recorder = TaskRecorder()
+    handlers = {}
+    functions = {}
+    failures = []
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        seed_tolls(backend.tables['TOLLS_TABLE_NAME'], args.peajes_file)
+        resolve = load_function('resolve_user')
+        backend.wire('resolve', resolve)
+        resolve.STATE_MACHINE_ARN = None  # Solo resuelve el perfil y retorna el input
+        for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+            handler = load_function(function)
+            backend.wire(stage, handler)
+            handlers[stage] = handler.lambda_handler
+            functions[substitution] = recorder.wrap(stage, handler.lambda_handler)
+        machine = LocalStateMachine.from_file(STATE_MACHINE_FILE, functions, retry_interval_scale=0)
+
+        for placa, tag_id, saldo_cents, _ in SCENARIOS:
+            if saldo_cents is not None:
+                item = {'placa': placa, 'nombre': f"Usuario {placa}", 'email': f"{placa.lower()}@correo.gt",
+                        'tiene_tag': tag_id is not None, BALANCE_FIELD: saldo_cents}
+                if tag_id:
+                    item['tag_id'] = tag_id
+                users.put_item(Item=item)
+
+        results = [(scenario, *run(resolve, machine, recorder, scenario[0], scenario[1], PASS_TIMESTAMP))
+                   for scenario in SCENARIOS]
+
+    print("\n1. Definiciones")
+    check_definitions(failures)
+
+    print("\n2. Estados finales")
+    for (placa, _, _, expected), execution, _ in results:
+        check(execution.final_state == expected, f"{placa}: {execution.final_state}", failures)
+
+    print("\n3. Presupuesto por transición")
+    task_inputs, task_outputs, documents = defaultdict(list), defaultdict(list), defaultdict(list)
+    state_bytes = []
+    for _, execution, calls in results:
+        for stage, event, result in calls:
+            task_inputs[stage].append(state_contract.payload_bytes(event))
+            task_outputs[stage].append(state_contract.payload_bytes(result))
+        for record in execution.history:
+            state_bytes.append(record.output_bytes)
+            if record.name in {task[3] for task in STATE_MACHINE_TASKS}:
+                documents[record.name].append(record.input_bytes)
+
+    print(f"   {'tarea':<20}{'entrada':>9}{'resultado':>11}{'documento':>11}")
+    for stage, _, _, state in STATE_MACHINE_TASKS:
+        print(f"   {state:<20}{max(task_inputs[stage]):>9,}{max(task_outputs[stage]):>11,}"
+              f"{max(documents[state]):>11,}")
+    print("   (máximos en bytes; documento = el de la ejecución al llegar a la tarea, lo que recibía con el contrato 1)")
+    check(max(max(sizes) for sizes in task_inputs.values()) <= TASK_INPUT_BUDGET_BYTES,
+          f"entradas de tareas <= {TASK_INPUT_BUDGET_BYTES:,} bytes", failures)
+    check(max(max(sizes) for sizes in task_outputs.values()) <= TASK_OUTPUT_BUDGET_BYTES,
+          f"resultados de tareas <= {TASK_OUTPUT_BUDGET_BYTES:,} bytes", failures)
+    check(max(state_bytes) <= STATE_BUDGET_BYTES,
+          f"documento en cada transición <= {STATE_BUDGET_BYTES:,} bytes (máximo {max(state_bytes):,})", failures)
+
+    print("\n4. Deltas")
+    leaked = sorted({stage for _, _, calls in results for stage, _, result in calls
+                     if not isinstance(result, dict) or 'user_data' in result})
+    check(not leaked, "cada tarea retorna solo su resultado" + (f" (no: {leaked})" if leaked else ''), failures)
+    placed = all(
+        execution.output[state_contract.STAGES[CONTRACT_STAGES[stage]].output] == result
+        for _, execution, calls in results for stage, _, result in calls
+    )
+    check(placed, "el documento final tiene cada resultado en su slot", failures)
+    emitted = {item.get('fecha_emision') for item in backend.tables['INVOICES_TABLE_NAME'].all_items()}
+    check(emitted == {PASS_TIMESTAMP}, f"fecha_emision de las facturas = hora del paso ({sorted(emitted)})",
+          failures)
+
+    print(f"\n5. Crecimiento del documento (+{args.growth_kb} KB)")
+    filler = 'x' * 1024
+    extra = {
+        'user_data': {f"preferencia_{n}": filler for n in range(args.growth_kb // 2)},
+        'auditoria': {f"registro_{n}": filler for n in range(args.growth_kb - args.growth_kb // 2)},
+    }
+    placa, tag_id, _, _ = SCENARIOS[0]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        grown, grown_calls = run(resolve, machine, recorder, placa, tag_id, '2025-11-03T10:00:00Z', extra)
+    received = [stage for stage, event, _ in grown_calls
+                if 'preferencia_' in state_contract.dumps(event) or 'auditoria' in event]
+    check(not received and len(grown_calls) == len(STATE_MACHINE_TASKS),
+          f"ninguna de las {len(grown_calls)} tareas recibe los campos agregados"
+          + (f" (sí: {received})" if received else ''), failures)
+    check(max(state_contract.payload_bytes(event) for _, event, _ in grown_calls) <= TASK_INPUT_BUDGET_BYTES,
+          f"entradas de tareas <= {TASK_INPUT_BUDGET_BYTES:,} bytes", failures)
+    largest = max(record.output_bytes for record in grown.history)
+    check(grown.final_state == 'ProcessingSuccess' and largest <= PAYLOAD_LIMIT_BYTES,
+          f"{grown.final_state}, documento de {largest:,} bytes", failures)
+
+    print("\n6. Contrato 1")
+    _, execution, calls = results[0]
+    document = {key: value for key, value in execution.output.items() if key != 'fare_calculation'}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        legacy = handlers['calculate'](document, None)
+        try:
+            handlers['calculate']({**calls[0][1], state_contract.VERSION_FIELD: state_contract.CONTRACT_VERSION + 1},
+                                  None)
+            rejected = False
+        except ValueError:
+            rejected = True
+    check(set(legacy) == set(document) | {'fare_calculation'} and legacy['fare_calculation'] == calls[0][2],
+          "sin contract_version retorna el documento con fare_calculation", failures)
+    check(rejected, f"contract_version {state_contract.CONTRACT_VERSION + 1} se rechaza", failures)
+
+    if failures:
+        print(f"\n❌ {len(failures)} verificaciones fallaron")
+        sys.exit(1)
+    print("\n✅ Contrato de estado verificado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Genera src/stepfunctions/process_toll.asl.json a partir de las dependencias
+declaradas en src/shared/state_contract.py
+
+Cada tarea de STAGES depende de las tareas cuyo output lee. Las tareas de un
+mismo nivel (state_contract.levels()) no dependen entre sí y van en un
+Parallel, una rama por tarea; un nivel con una sola tarea es un Task directo.
+Con los `after` de STAGES hoy cada nivel tiene una sola tarea:
+
+    CalculateTollFare
+      -> RecordTransaction
+      -> UpdateBalance
+      -> GenerateInvoice
+      -> NotifyUser
+      -> CheckFinalStatus -> InsufficientBalance | CashPaymentRequired | ProcessingSuccess
+
+Cada rama retorna el documento con su resultado en su slot; el ResultSelector
+del Parallel arma el documento de nuevo con los slots de la entrada
+(INPUT_SLOTS) y los outputs de las tareas ya corridas, tomando cada output de
+la rama que lo produjo. Otros campos de la entrada de la ejecución (p. ej.
+original_event) no pasan del primer Parallel.
+
+Las tareas de IDEMPOTENT_STAGES corren su efecto una vez por event_id
+(shared/idempotency.py): tienen TimeoutSeconds corto y se reintentan también
+ante States.Timeout y StageInProgressError (el intento anterior sigue
+corriendo), sin riesgo de cobrar o facturar dos veces.
+
+Un error en una tarea (después de sus Retry) va a su Handle*Error y a
+ProcessingFailed; en un Parallel el Catch es del Parallel completo. Las tareas
+de OPTIONAL_STAGES (NotifyUser) no detienen el paso: el error queda en su
+ResultPath y la ejecución sigue.
+
+Uso:
+    python scripts/generate_state_machine.py            # reescribe process_toll.asl.json
+    python scripts/generate_state_machine.py --check    # falla si el archivo no está al día
+"""
+
+import argparse
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+
+import state_contract  # noqa: E402
+from state_contract import STAGES  # noqa: E402
+
+STATE_MACHINE_FILE = os.path.join(os.path.dirname(__file__), '..', 'src', 'stepfunctions', 'process_toll.asl.json')
+
+COMMENT = ("Orquestación del procesamiento de transacciones de peaje "
+           "(generada por scripts/generate_state_machine.py desde state_contract.STAGES)")
+# Slots de la entrada de la ejecución (resolve_user) que siguen en el documento
+INPUT_SLOTS = ('event_id', 'user_data', 'toll_data')
+RETRY = [
+    {
+        'ErrorEquals': [
+            'Lambda.ServiceException',
+            'Lambda.AWSLambdaException',
+            'Lambda.SdkClientException'
+        ],
+        'IntervalSeconds': 2,
+        'MaxAttempts': 3,
+        'BackoffRate': 2
+    }
+]
+# Tareas con registro de idempotencia por (event_id, tarea): timeout corto y
+# reintento ante timeout. El backoff (1+2+4+8+16+32 = 63 s) cubre STAGE_LEASE_SECONDS
+# (60 s, mayor que el timeout de 30 s de la Lambda) para retomar un intento que murió.
+IDEMPOTENT_STAGES = ('record_transaction', 'update_balance', 'generate_invoice')
+TASK_TIMEOUT_SECONDS = 10
+IDEMPOTENT_RETRY = {
+    'ErrorEquals': ['States.Timeout', 'StageInProgressError'],
+    'IntervalSeconds': 1,
+    'MaxAttempts': 6,
+    'BackoffRate': 2
+}
+COMMENTS = {
+    'update_balance': 'Débito condicional, idempotente por transaction_id',
+    'generate_invoice': 'Genera factura simulada según modalidad',
+    'notify_user': 'Envía notificaciones por email según modalidad',
+}
+# Tareas cuyo error no detiene el paso -> ResultPath del error
+OPTIONAL_STAGES = {'notify_user': '$.notification_error'}
+# Estado Pass de error de cada tarea (el stage queda en la salida de ProcessingFailed)
+ERROR_HANDLERS = {
+    'calculate_fare': 'HandleCalculateError',
+    'record_transaction': 'HandleRecordError',
+    'update_balance': 'HandleBalanceError',
+    'generate_invoice': 'HandleInvoiceError',
+}
+# Nombre del Parallel de cada nivel con más de una tarea (Level<n>Parallel si no está)
+PARALLEL_NAMES = {}
+# Estado final según balance_update.message (Default: ProcessingSuccess)
+OUTCOMES = (
+    ('Saldo insuficiente', 'InsufficientBalance',
+     'Transacción registrada pero saldo insuficiente - Requiere recarga'),
+    ('Usuario no registrado - Pago en efectivo', 'CashPaymentRequired',
+     'Usuario no registrado - Pago en efectivo requerido'),
+)
+CHECK_FINAL_STATUS = 'CheckFinalStatus'
+PROCESSING_FAILED = 'ProcessingFailed'
+
+
+def snake_case(name):
+    return ''.join(f"_{char.lower()}" if char.isupper() and index else char.lower()
+                   for index, char in enumerate(name))
+
+
+def task_state(stage, next_name, handler):
+    """Task de una tarea: Parameters y ResultPath según STAGES."""
+    spec = STAGES[stage]
+    state = {'Type': 'Task', 'Resource': f"${{{spec.state}FunctionArn}}"}
+    if stage in COMMENTS:
+        state['Comment'] = COMMENTS[stage]
+    state['Parameters'] = state_contract.parameters(stage)
+    state['ResultPath'] = f"$.{spec.output}"
+    if stage in IDEMPOTENT_STAGES:
+        state['TimeoutSeconds'] = TASK_TIMEOUT_SECONDS
+    if next_name is None:
+        state['End'] = True
+    else:
+        state['Next'] = next_name
+    state['Retry'] = RETRY + [IDEMPOTENT_RETRY] if stage in IDEMPOTENT_STAGES else RETRY
+    if stage in OPTIONAL_STAGES:
+        state['Catch'] = [{'ErrorEquals': ['States.ALL'], 'Next': handler, 'ResultPath': OPTIONAL_STAGES[stage],
+                           'Comment': 'No fallar si falla esta tarea'}]
+    elif handler is not None:
+        state['Catch'] = [{'ErrorEquals': ['States.ALL'], 'Next': handler, 'ResultPath': '$.error'}]
+    return state
+
+
+def branch(stage):
+    """Rama de un Parallel con una sola tarea (una tarea opcional termina igual si falla)."""
+    state_name = STAGES[stage].state
+    states = {}
+    if stage in OPTIONAL_STAGES:
+        skipped = f"{state_name}Skipped"
+        states[state_name] = task_state(stage, None, skipped)
+        states[skipped] = {'Type': 'Pass', 'End': True}
+    else:
+        states[state_name] = task_state(stage, None, None)
+    return {'StartAt': state_name, 'States': states}
+
+
+def error_handler(stage_label):
+    return {
+        'Type': 'Pass',
+        'Parameters': {
+            'status': 'error',
+            'stage': stage_label,
+            'error.$': '$.error',
+            'input.$': '$'
+        },
+        'Next': PROCESSING_FAILED
+    }
+
+
+def build_definition():
+    """Definición ASL de process_toll (dict, en el orden en que se escribe)."""
+    levels = state_contract.levels()
+    names = []
+    for index, level in enumerate(levels):
+        if len(level) == 1:
+            names.append(STAGES[level[0]].state)
+        else:
+            names.append(PARALLEL_NAMES.get(tuple(level), f"Level{index + 1}Parallel"))
+
+    states = {}
+    handlers = {}
+    available = list(INPUT_SLOTS)
+    for index, level in enumerate(levels):
+        name = names[index]
+        next_name = names[index + 1] if index + 1 < len(names) else CHECK_FINAL_STATUS
+        if len(level) == 1:
+            stage = level[0]
+            if stage in OPTIONAL_STAGES:
+                handler = next_name
+            else:
+                handler = ERROR_HANDLERS.get(stage, f"Handle{name}Error")
+                handlers[handler] = stage
+            states[name] = task_state(stage, next_name, handler)
+        else:
+            handler = f"Handle{name}Error"
+            handlers[handler] = snake_case(name)
+            selector = {f"{slot}.$": f"$[0].{slot}" for slot in available}
+            for position, stage in enumerate(level):
+                output = STAGES[stage].output
+                selector[f"{output}.$"] = f"$[{position}].{output}"
+            states[name] = {
+                'Type': 'Parallel',
+                'Comment': f"{', '.join(STAGES[stage].state for stage in level)} a la vez "
+                           f"(no dependen entre sí)",
+                'Branches': [branch(stage) for stage in level],
+                'ResultSelector': selector,
+                'ResultPath': '$',
+                'Next': next_name,
+                'Catch': [{'ErrorEquals': ['States.ALL'], 'Next': handler, 'ResultPath': '$.error'}]
+            }
+        available.extend(STAGES[stage].output for stage in level)
+
+    states[CHECK_FINAL_STATUS] = {
+        'Type': 'Choice',
+        'Comment': 'Determina el estado final de la transacción',
+        'Choices': [
+            {'Variable': '$.balance_update.message', 'StringEquals': message, 'Next': outcome}
+            for message, outcome, _ in OUTCOMES
+        ],
+        'Default': 'ProcessingSuccess'
+    }
+    for _, outcome, comment in OUTCOMES:
+        states[outcome] = {'Type': 'Succeed', 'Comment': comment}
+    states['ProcessingSuccess'] = {'Type': 'Succeed', 'Comment': 'Transacción procesada y pagada exitosamente'}
+    for handler, stage_label in handlers.items():
+        states[handler] = error_handler(stage_label)
+    states[PROCESSING_FAILED] = {'Type': 'Fail', 'Comment': 'Error procesando la transacción'}
+
+    return {'Comment': COMMENT, 'StartAt': names[0], 'States': states}
+
+
+def render(definition):
+    return json.dumps(definition, indent=2, ensure_ascii=False) + '\n'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera process_toll.asl.json desde state_contract.STAGES')
+    parser.add_argument('--check', action='store_true', help='Solo verificar que el archivo esté al día')
+    parser.add_argument('--output', default=STATE_MACHINE_FILE)
+    args = parser.parse_args()
+
+    text = render(build_definition())
+    for number, level in enumerate(state_contract.levels(), 1):
+        print(f"   nivel {number}: {', '.join(STAGES[stage].state for stage in level)}")
+
+    if args.check:
+        with open(args.output, encoding='utf-8') as f:
+            current = f.read()
+        if current != text:
+            print(f"❌ {os.path.relpath(args.output)} no coincide con state_contract.STAGES "
+                  f"(correr scripts/generate_state_machine.py)")
+            sys.exit(1)
+        print(f"✅ {os.path.relpath(args.output)} al día")
+        return
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        f.write(text)
+    print(f"✅ {os.path.relpath(args.output)}")
+
+
+if __name__ == "__main__":
+    main()
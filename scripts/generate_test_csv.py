@@ -2,12 +2,43 @@
 """
 Script para generar archivos CSV de prueba con usuarios aleatorios
 Útil para testing de escalabilidad y performance
+
+Registro de usuarios (CSV, o .csv.gz si el nombre lo indica):
+  - placas únicas: generate_placa es biyectiva en 6 prefijos x 17,576,000
+    combinaciones (hasta ~105M usuarios)
+  - cada usuario es una función pura de (seed, índice): el archivo es el mismo
+    con cualquier número de procesos y el tráfico sabe qué usuario tiene tag
+  - distribuciones: 72% registrados, 40% de ellos con tag; saldo log-normal
+    (mediana Q150, mayor para usuarios con tag), 6% en cero, tope Q5,000
+  - se genera por bloques de filas en varios procesos y se escribe en orden
+
+Tráfico de peajes (NDJSON, un evento del webhook por línea, en orden de tiempo):
+  - curva horaria con horas pico (6-9 y 17-20) en días hábiles y tráfico más
+    plano y bajo en fines de semana
+  - mezcla por peaje (PLAZA_WEIGHTS sobre data/peajes.json)
+  - commuters: una parte de los usuarios pasa cada día hábil por el mismo
+    peaje a la misma hora (±10 min), ida y vuelta
+  - placas no registradas (fuera del registro) y lecturas de tag que fallan
+
+Uso:
+    python scripts/generate_test_csv.py --users 100
+    python scripts/generate_test_csv.py --users 20000000 --output data/clientes_20m.csv.gz --workers 8 --yes
+    python scripts/generate_test_csv.py --users 1000000 --events 5000000 --days 7 --events-only
 """
 
-import csv
-import random
 import argparse
-from typing import List, Dict
+import gzip
+import hashlib
+import json
+import math
+import os
+import random
+import struct
+import sys
+from datetime import datetime, timedelta
+from multiprocessing import Pool
+from statistics import NormalDist
+from typing import Dict, Iterator, List, Tuple
 
 # Datos de ejemplo para generación aleatoria
 NOMBRES = [
@@ -24,13 +55,61 @@ APELLIDOS = [
     "Mendoza", "Vargas", "Romero", "Herrera", "Medina", "Silva", "Ortiz"
 ]
 
+FIELDNAMES = [
+    'placa', 'nombre', 'email', 'telefono',
+    'tipo_usuario', 'tiene_tag', 'tag_id', 'saldo_disponible'
+]
+
+# Placas: prefijo + 3 dígitos + 3 letras. Dentro de cada prefijo el índice se
+# permuta (multiplicador coprimo con el tamaño del bloque) para que placas
+# consecutivas no compartan shard ni prefijo de llave
+PLATE_PREFIXES = ('P', 'C', 'M', 'A', 'O', 'U')
+PLATE_BLOCK = 1000 * 26 ** 3
+PLATE_MULTIPLIER = 7919
+MAX_USERS = len(PLATE_PREFIXES) * PLATE_BLOCK
+
+REGISTERED_RATE = 0.72
+TAG_RATE = 0.40
+ZERO_BALANCE_RATE = 0.06
+BALANCE_MEDIAN = 150.0
+BALANCE_SIGMA = 0.9
+TAG_BALANCE_FACTOR = 1.6
+BALANCE_CAP = 5000.0
+
+# Tráfico
+DEFAULT_PEAJES_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json')
+PLAZA_WEIGHTS = {
+    'PEAJE_ZONA10': 0.34,
+    'PEAJE_CALZADA_SUR': 0.22,
+    'PEAJE001': 0.18,
+    'PEAJE002': 0.14,
+    'PEAJE_CARRETERA_SALVADOR': 0.12,
+}
+WEEKDAY_CURVE = [0.3, 0.2, 0.15, 0.2, 0.6, 2.0, 5.5, 8.0, 6.5, 4.0, 3.5, 3.6,
+                 3.8, 3.7, 3.6, 4.0, 5.0, 7.5, 8.0, 5.5, 3.5, 2.2, 1.2, 0.6]
+WEEKEND_CURVE = [0.5, 0.4, 0.3, 0.3, 0.4, 0.8, 1.5, 2.5, 3.5, 4.5, 5.0, 5.2,
+                 5.0, 4.8, 4.6, 4.4, 4.2, 4.0, 3.6, 3.0, 2.4, 1.8, 1.2, 0.8]
+WEEKEND_VOLUME = 0.6
+COMMUTER_MORNING_HOURS = (6, 7, 8)
+COMMUTER_EVENING_HOURS = (17, 18, 19)
+COMMUTER_TRIP_RATE = 0.85
+COMMUTER_JITTER_MINUTES = 10
+MAX_COMMUTER_SHARE_OF_USERS = 0.3
+TAG_READ_RATE = 0.97
+COMMUTER_MULTIPLIER = 2654435761
+
+_NORMAL = NormalDist()
+
 
 def generate_placa(index: int) -> str:
-    """Genera una placa única"""
-    letter = chr(65 + (index // 1000) % 26)  # A-Z
-    number = index % 1000
-    suffix = ["ABC", "DEF", "GHI", "JKL", "MNO", "PQR", "STU", "VWX", "YZA", "BCD"][index % 10]
-    return f"P-{number:03d}{suffix}"
+    """Genera una placa única (biyectiva para 0 <= index < MAX_USERS)"""
+    if not 0 <= index < MAX_USERS:
+        raise ValueError(f"Índice de placa fuera de rango: {index} (máximo {MAX_USERS - 1})")
+    block, offset = divmod(index, PLATE_BLOCK)
+    scrambled = offset * PLATE_MULTIPLIER % PLATE_BLOCK
+    letters, number = divmod(scrambled, 1000)
+    suffix = ''.join(chr(65 + letters // 26 ** power % 26) for power in (2, 1, 0))
+    return f"{PLATE_PREFIXES[block]}-{number:03d}{suffix}"
 
 
 def generate_email(nombre: str, apellido: str, index: int) -> str:
@@ -48,76 +127,263 @@ def generate_tag_id(index: int) -> str:
     return f"TAG-{index:06d}"
 
 
-def generate_user(index: int) -> Dict[str, str]:
-    """Genera un usuario aleatorio"""
-    nombre = random.choice(NOMBRES)
-    apellido = random.choice(APELLIDOS)
-    placa = generate_placa(index)
-    
-    # 70% registrados, 30% no registrados
-    es_registrado = random.random() < 0.7
-    tipo_usuario = "registrado" if es_registrado else "no_registrado"
-    
+def _draws(seed: int, index: int, salt: str = 'u') -> Tuple[float, ...]:
+    """8 uniformes en [0, 1) que dependen solo de (seed, salt, index)."""
+    digest = hashlib.blake2b(f"{seed}:{salt}:{index}".encode(), digest_size=32).digest()
+    return tuple(value / 4294967296.0 for value in struct.unpack('<8I', digest))
+
+
+def has_tag(index: int, seed: int = 0) -> bool:
+    """Si el usuario `index` del registro generado con `seed` tiene tag."""
+    draws = _draws(seed, index)
+    return draws[2] < REGISTERED_RATE and draws[4] < TAG_RATE
+
+
+def generate_user(index: int, seed: int = 0) -> Dict[str, str]:
+    """Genera un usuario aleatorio (el mismo para el mismo índice y seed)"""
+    u = _draws(seed, index)
+    nombre = NOMBRES[int(u[0] * len(NOMBRES))]
+    apellido = APELLIDOS[int(u[1] * len(APELLIDOS))]
+    es_registrado = u[2] < REGISTERED_RATE
+    tiene_tag = es_registrado and u[4] < TAG_RATE
+
     # Email y teléfono solo para registrados (a veces uno solo)
+    email = telefono = ""
     if es_registrado:
-        tiene_email = random.random() < 0.9
-        tiene_telefono = random.random() < 0.8
-        email = generate_email(nombre, apellido, index) if tiene_email else ""
-        telefono = generate_telefono() if tiene_telefono else ""
-    else:
-        email = ""
-        telefono = ""
-    
-    # 30% de registrados tienen tag
-    tiene_tag = es_registrado and random.random() < 0.3
-    tag_id = generate_tag_id(index) if tiene_tag else ""
-    
-    # Saldo entre 0 y 500 para registrados
-    if es_registrado:
-        saldo = round(random.uniform(0, 500), 2)
-    else:
-        saldo = 0.00
-    
+        if u[3] < 0.9:
+            email = generate_email(nombre, apellido, index)
+        if u[3] * 7 % 1 < 0.8:
+            telefono = f"502{20000000 + int(u[7] * 80000000)}"
+
+    # Saldo log-normal para registrados; los usuarios con tag recargan más
+    saldo = 0.0
+    if es_registrado and u[6] >= ZERO_BALANCE_RATE:
+        z = _NORMAL.inv_cdf(min(max(u[5], 1e-9), 1 - 1e-9))
+        median = BALANCE_MEDIAN * (TAG_BALANCE_FACTOR if tiene_tag else 1.0)
+        saldo = min(BALANCE_CAP, median * math.exp(BALANCE_SIGMA * z))
+
     return {
-        'placa': placa,
+        'placa': generate_placa(index),
         'nombre': f"{nombre} {apellido}",
         'email': email,
         'telefono': telefono,
-        'tipo_usuario': tipo_usuario,
+        'tipo_usuario': "registrado" if es_registrado else "no_registrado",
         'tiene_tag': str(tiene_tag).lower(),
-        'tag_id': tag_id,
+        'tag_id': generate_tag_id(index) if tiene_tag else "",
         'saldo_disponible': f"{saldo:.2f}"
     }
 
 
-def generate_csv(num_users: int, output_file: str):
-    """Genera un archivo CSV con usuarios aleatorios"""
+def _open_output(path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    return open(path, 'w', newline='', encoding='utf-8')
+
+
+def _chunks(total: int, size: int) -> List[Tuple[int, int]]:
+    return [(start, min(start + size, total)) for start in range(0, total, size)]
+
+
+def _render_users(task: Tuple[int, int, int]) -> Tuple[str, int, int]:
+    """Filas [start, end) como texto CSV (los campos generados no llevan comas ni comillas)."""
+    start, end, seed = task
+    lines = []
+    registrados = con_tag = 0
+    for index in range(start, end):
+        user = generate_user(index, seed)
+        lines.append(','.join(user[field] for field in FIELDNAMES))
+        registrados += user['tipo_usuario'] == 'registrado'
+        con_tag += user['tiene_tag'] == 'true'
+    return '\n'.join(lines) + '\n', registrados, con_tag
+
+
+def generate_csv(num_users: int, output_file: str, workers: int = 1, chunk_rows: int = 100000, seed: int = 0):
+    """Genera un archivo CSV con usuarios aleatorios (por bloques, sin cargar todo en memoria)"""
+    if num_users > MAX_USERS:
+        raise ValueError(f"Máximo {MAX_USERS:,} usuarios con placas únicas")
     print(f"📝 Generando {num_users} usuarios...")
-    
-    users = [generate_user(i) for i in range(num_users)]
-    
-    fieldnames = [
-        'placa', 'nombre', 'email', 'telefono',
-        'tipo_usuario', 'tiene_tag', 'tag_id', 'saldo_disponible'
-    ]
-    
-    with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-        writer.writeheader()
-        writer.writerows(users)
-    
+
+    registrados = 0
+    con_tag = 0
+    tasks = [(start, end, seed) for start, end in _chunks(num_users, chunk_rows)]
+    with _open_output(output_file) as csvfile:
+        csvfile.write(','.join(FIELDNAMES) + '\n')
+        for text, chunk_registrados, chunk_con_tag in _map_ordered(_render_users, tasks, workers):
+            csvfile.write(text)
+            registrados += chunk_registrados
+            con_tag += chunk_con_tag
+
     print(f"✅ Archivo generado: {output_file}")
     print(f"📊 Total de usuarios: {num_users}")
-    
+
     # Estadísticas
-    registrados = sum(1 for u in users if u['tipo_usuario'] == 'registrado')
-    con_tag = sum(1 for u in users if u['tiene_tag'] == 'true')
-    
     print(f"   - Registrados: {registrados} ({registrados/num_users*100:.1f}%)")
     print(f"   - Con Tag: {con_tag} ({con_tag/num_users*100:.1f}%)")
     print(f"   - No registrados: {num_users - registrados}")
 
 
+def _map_ordered(fn, tasks, workers: int) -> Iterator:
+    """Resultados de fn(task) en el orden de las tareas, con `workers` procesos."""
+    if workers <= 1 or len(tasks) <= 1:
+        yield from map(fn, tasks)
+        return
+    with Pool(workers) as pool:
+        yield from pool.imap(fn, tasks)
+
+
+# ---------- Tráfico de peajes ----------
+
+def load_plazas(peajes_file: str = DEFAULT_PEAJES_FILE) -> Tuple[List[str], List[float]]:
+    """IDs de peaje del catálogo y su peso en el tráfico (PLAZA_WEIGHTS, 1.0 si no está)."""
+    with open(peajes_file, encoding='utf-8') as f:
+        ids = [peaje['peaje_id'] for peaje in json.load(f)]
+    weights = [PLAZA_WEIGHTS.get(peaje_id, 1.0 / len(ids)) for peaje_id in ids]
+    total = sum(weights)
+    return ids, [weight / total for weight in weights]
+
+
+def _pick(cumulative: List[float], u: float) -> int:
+    for index, bound in enumerate(cumulative):
+        if u < bound:
+            return index
+    return len(cumulative) - 1
+
+
+def _cumulative(weights: List[float]) -> List[float]:
+    total = 0.0
+    result = []
+    for weight in weights:
+        total += weight
+        result.append(total)
+    result[-1] = 1.0
+    return result
+
+
+def plan_traffic(num_events: int, num_users: int, days: int, start: datetime,
+                 commuter_share: float) -> Dict[str, object]:
+    """
+    Reparte los eventos: cuántos commuters hay (para que generen ~commuter_share
+    de los eventos) y cuántos eventos de fondo van en cada hora.
+    """
+    weekdays = sum(1 for day in range(days) if (start + timedelta(days=day)).weekday() < 5)
+    trips_per_commuter = 2 * COMMUTER_TRIP_RATE * weekdays
+    commuters = 0
+    if trips_per_commuter:
+        commuters = min(int(num_events * commuter_share / trips_per_commuter),
+                        int(num_users * MAX_COMMUTER_SHARE_OF_USERS))
+    background = max(0, num_events - round(commuters * trips_per_commuter))
+
+    intensity = []
+    for day in range(days):
+        weekend = (start + timedelta(days=day)).weekday() >= 5
+        curve = WEEKEND_CURVE if weekend else WEEKDAY_CURVE
+        scale = WEEKEND_VOLUME if weekend else 1.0
+        intensity.extend(weight * scale for weight in curve)
+    total = sum(intensity)
+
+    # Redondeo por mayor residuo: la suma es exactamente `background`
+    exact = [background * weight / total for weight in intensity]
+    counts = [int(value) for value in exact]
+    for hour in sorted(range(len(exact)), key=lambda h: counts[h] - exact[h])[:background - sum(counts)]:
+        counts[hour] += 1
+    return {'commuters': commuters, 'background': counts}
+
+
+def _commuters_at(hour: int, commuters: int) -> Iterator[Tuple[int, int]]:
+    """(commuter, 0=ida|1=vuelta) que pasan en esta hora: ida en k % 3, vuelta en (k // 3) % 3."""
+    if hour in COMMUTER_MORNING_HOURS:
+        for k in range(COMMUTER_MORNING_HOURS.index(hour), commuters, 3):
+            yield k, 0
+    elif hour in COMMUTER_EVENING_HOURS:
+        slot = COMMUTER_EVENING_HOURS.index(hour)
+        for base in range(3 * slot, commuters, 9):
+            for k in range(base, min(base + 3, commuters)):
+                yield k, 1
+
+
+def _commuter_user(k: int, num_users: int) -> int:
+    # Permutación de los índices del registro: los commuters no son los primeros usuarios
+    return k * COMMUTER_MULTIPLIER % num_users
+
+
+def _event(placa: str, peaje_id: str, tag_id, when: datetime) -> str:
+    return json.dumps({
+        'placa': placa,
+        'peaje_id': peaje_id,
+        'tag_id': tag_id,
+        'timestamp': when.strftime('%Y-%m-%dT%H:%M:%SZ')
+    }, separators=(',', ':'))
+
+
+def _render_hour(task: Tuple) -> str:
+    """Eventos de una hora (commuters + fondo), ordenados por timestamp, como NDJSON."""
+    hour_index, hour_start, background, commuters, num_users, unregistered, seed, plazas, cumulative = task
+    rng = random.Random(f"{seed}:h:{hour_index}")
+    events: List[Tuple[datetime, str]] = []
+
+    def add(index: int, registered: bool, plaza: int, second: int) -> None:
+        tag_id = None
+        if registered and has_tag(index, seed) and rng.random() < TAG_READ_RATE:
+            tag_id = generate_tag_id(index)
+        when = hour_start + timedelta(seconds=second)
+        events.append((when, _event(generate_placa(index), plazas[plaza], tag_id, when)))
+
+    # Commuters: cada uno tiene su peaje, su hora de ida y de vuelta y un minuto base
+    if hour_start.weekday() < 5:
+        for k, leg in _commuters_at(hour_start.hour, commuters):
+            if rng.random() >= COMMUTER_TRIP_RATE:
+                continue
+            u = _draws(seed, k, 'c')
+            minute = int(u[leg] * 60) + rng.randint(-COMMUTER_JITTER_MINUTES, COMMUTER_JITTER_MINUTES)
+            second = min(max(minute, 0), 59) * 60 + rng.randrange(60)
+            add(_commuter_user(k, num_users), True, _pick(cumulative, u[2]), second)
+
+    # Tráfico de fondo: cualquier usuario, o placas que no están en el registro
+    for _ in range(background):
+        if rng.random() < unregistered and num_users < MAX_USERS:
+            index = num_users + rng.randrange(min(num_users * 10, MAX_USERS - num_users))
+            registered = False
+        else:
+            index = rng.randrange(num_users)
+            registered = True
+        add(index, registered, _pick(cumulative, rng.random()), rng.randrange(3600))
+
+    events.sort(key=lambda event: event[0])
+    return ''.join(line + '\n' for _, line in events)
+
+
+def generate_events(num_events: int, num_users: int, output_file: str, days: int = 7,
+                    start: datetime = datetime(2025, 11, 3), commuter_share: float = 0.5,
+                    unregistered: float = 0.08, workers: int = 1, seed: int = 0,
+                    peajes_file: str = DEFAULT_PEAJES_FILE):
+    """Genera eventos de peaje (NDJSON) para los usuarios de generate_csv(num_users, seed=seed)"""
+    plazas, weights = load_plazas(peajes_file)
+    plan = plan_traffic(num_events, num_users, days, start, commuter_share)
+    print(f"🚗 Generando ~{num_events:,} eventos en {days} días, {plan['commuters']:,} commuters, "
+          f"{len(plazas)} peajes...")
+
+    cumulative = _cumulative(weights)
+    tasks = [
+        (hour_index, start + timedelta(hours=hour_index), background, plan['commuters'], num_users,
+         unregistered, seed, plazas, cumulative)
+        for hour_index, background in enumerate(plan['background'])
+    ]
+    written = 0
+    with _open_output(output_file) as f:
+        for text in _map_ordered(_render_hour, tasks, workers):
+            f.write(text)
+            written += text.count('\n')
+
+    print(f"✅ Archivo generado: {output_file}")
+    print(f"📊 Total de eventos: {written}")
+    commuter_events = written - sum(plan['background'])
+    print(f"   - De commuters: {commuter_events} ({commuter_events / max(written, 1) * 100:.1f}%)")
+    print("   - Peso por peaje: " + ', '.join(f"{p} {w:.0%}" for p, w in zip(plazas, weights)))
+
+
 def main():
     parser = argparse.ArgumentParser(
         description='Genera archivos CSV de prueba para GUATEPASS'
@@ -132,26 +398,49 @@ def main():
         '--output',
         type=str,
         default='data/clientes_test.csv',
-        help='Archivo de salida (default: data/clientes_test.csv)'
+        help='Archivo de salida (default: data/clientes_test.csv; .csv.gz para comprimir)'
     )
-    
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help='Procesos generadores (default: CPUs)')
+    parser.add_argument('--chunk-rows', type=int, default=100000, help='Filas por bloque (default: 100k)')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla (mismo archivo para la misma semilla)')
+    parser.add_argument('--events', type=int, default=0, help='Eventos de peaje a generar (default: 0)')
+    parser.add_argument('--events-output', type=str, default='data/eventos_test.ndjson',
+                        help='Archivo NDJSON de eventos (default: data/eventos_test.ndjson)')
+    parser.add_argument('--events-only', action='store_true', help='Solo generar eventos (registro ya generado)')
+    parser.add_argument('--days', type=int, default=7, help='Días de tráfico (default: 7)')
+    parser.add_argument('--start', type=str, default='2025-11-03', help='Primer día del tráfico (YYYY-MM-DD)')
+    parser.add_argument('--commuter-share', type=float, default=0.5,
+                        help='Fracción de eventos de commuters (default: 0.5)')
+    parser.add_argument('--unregistered', type=float, default=0.08,
+                        help='Fracción del tráfico de fondo con placas no registradas (default: 0.08)')
+    parser.add_argument('--yes', action='store_true', help='No pedir confirmación para archivos grandes')
+
     args = parser.parse_args()
-    
+
     # Validaciones
     if args.users < 1:
         print("❌ Error: El número de usuarios debe ser mayor a 0")
         return
-    
-    if args.users > 100000:
-        print("⚠️  Advertencia: Generar más de 100,000 usuarios puede tomar tiempo")
+
+    if args.users > MAX_USERS:
+        print(f"❌ Error: Máximo {MAX_USERS:,} usuarios con placas únicas")
+        return
+
+    if args.users + args.events > 10000000 and not args.yes and sys.stdin.isatty():
+        print("⚠️  Advertencia: Generar más de 10,000,000 filas puede tomar tiempo y espacio en disco")
         confirm = input("¿Deseas continuar? (s/n): ")
         if confirm.lower() != 's':
             print("Operación cancelada")
             return
-    
-    generate_csv(args.users, args.output)
+
+    if not args.events_only:
+        generate_csv(args.users, args.output, args.workers, args.chunk_rows, args.seed)
+    if args.events:
+        generate_events(args.events, args.users, args.events_output, args.days,
+                        datetime.strptime(args.start, '%Y-%m-%d'), args.commuter_share,
+                        args.unregistered, args.workers, args.seed)
 
 
 if __name__ == "__main__":
     main()
-
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+Importación segmentada y reanudable en procesos locales
+
+Corre el mismo coordinador/worker de src/import_users (segments.py) con un
+proceso por segmento en lugar de invocaciones Lambda. S3 es el stand-in local
+(scripts/local_aws) y DynamoDB un sumidero con latencia por BatchWriteItem y
+una fracción de UnprocessedItems, para ejercitar el pool de escritores y los
+reintentos.
+
+    # Primera corrida, con dos segmentos que fallan a la mitad
+    python scripts/import_users_segmented.py --rows 1000000 --fail-segments 2 5
+
+    # Segunda corrida: solo procesa los segmentos sin checkpoint
+    python scripts/import_users_segmented.py --rows 1000000
+
+Al completar todos los segmentos verifica que la suma de filas de los
+checkpoints coincida con las filas del CSV. --compare-single mide además la
+importación anterior (un solo stream, un lote a la vez) con la misma latencia.
+"""
+
+import argparse
+import contextlib
+import os
+import random
+import shutil
+import sys
+import threading
+import time
+import types
+from concurrent.futures import ProcessPoolExecutor
+
+from botocore.exceptions import ClientError
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+BUCKET = 'guatepass-import-local'
+CHECKPOINT_PREFIX = 'imports/checkpoints'
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'import_users'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from local_aws import LocalS3  # noqa: E402
+
+_app = None
+
+
+class LatencyTable:
+    """
+    Sumidero de escrituras con latencia por BatchWriteItem y una fracción de
+    items devueltos en UnprocessedItems. Con fail_after_calls simula un worker
+    que se cae a mitad del segmento.
+    """
+
+    def __init__(self, name, latency_seconds, unprocessed_rate, fail_after_calls=None, seed=0):
+        self.name = name
+        self.meta = types.SimpleNamespace(client=self)
+        self.latency_seconds = latency_seconds
+        self.unprocessed_rate = unprocessed_rate
+        self.fail_after_calls = fail_after_calls
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def batch_write_item(self, RequestItems):
+        with self._lock:
+            self.calls += 1
+            if self.fail_after_calls is not None and self.calls > self.fail_after_calls:
+                raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': 'Falla simulada'}},
+                                  'BatchWriteItem')
+            unprocessed = [r for r in RequestItems[self.name] if self._random.random() < self.unprocessed_rate]
+        time.sleep(self.latency_seconds)
+        return {'UnprocessedItems': {self.name: unprocessed} if unprocessed else {}}
+
+    def scan(self, **_):
+        return {'Items': []}
+
+
+def configure(args):
+    """Importa app con la configuración de la corrida (en el padre y en cada proceso)."""
+    global _app
+    os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+    os.environ['USERS_TABLE_NAME'] = 'GuatepassUsers-local'
+    os.environ['DATA_BUCKET_NAME'] = BUCKET
+    os.environ['IMPORT_FANOUT'] = 'inline'
+    os.environ['IMPORT_SEGMENT_BYTES'] = str(int(args.segment_mb * 1024 * 1024))
+    os.environ['IMPORT_WRITER_THREADS'] = str(args.threads)
+    os.environ['IMPORT_CHECKPOINT_PREFIX'] = CHECKPOINT_PREFIX
+    # Los UnprocessedItems del sumidero son aleatorios, no de capacidad: sin control de ritmo
+    # (scripts/benchmark_write_rate.py lo mide contra una tabla con throttling)
+    os.environ.setdefault('IMPORT_WRITE_CAPACITY_SHARE', '0')
+    import app
+    app.s3_client = LocalS3(args.s3_root)
+    app.users_table = LatencyTable(app.USERS_TABLE_NAME, args.latency_ms / 1000, args.unprocessed_rate)
+    _app = app
+    return app
+
+
+def run_segment_process(task):
+    """Worker en un proceso: importa un segmento (puede fallar a propósito)."""
+    manifest, index, fail, args = task
+    app = _app or configure(args)
+    app.users_table = LatencyTable(app.USERS_TABLE_NAME, args.latency_ms / 1000, args.unprocessed_rate,
+                                   fail_after_calls=200 if fail else None, seed=index)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stats = app.run_segment(manifest, index, BUCKET)
+    stats['batch_calls'] = app.users_table.calls
+    return stats
+
+
+def ensure_csv(s3_root, rows):
+    from generate_test_csv import generate_csv
+
+    key = f"clientes_segmented_{rows}.csv"
+    path = os.path.join(s3_root, BUCKET, key)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with contextlib.redirect_stdout(sys.stderr):
+            generate_csv(rows, path)
+    return key, path
+
+
+def count_data_rows(path):
+    with open(path, 'rb') as f:
+        return sum(chunk.count(b'\n') for chunk in iter(lambda: f.read(1 << 20), b'')) - 1
+
+
+def compare_single(app, key, args):
+    """Importación anterior: un stream y un lote a la vez (un solo escritor)."""
+    app.users_table = LatencyTable(app.USERS_TABLE_NAME, args.latency_ms / 1000, args.unprocessed_rate)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        stats = app.import_users_to_dynamodb(app.parse_csv(app.download_csv_from_s3(BUCKET, key)),
+                                             writer_threads=1)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Importación segmentada y reanudable (local)')
+    parser.add_argument('--rows', type=int, default=1000000, help='Filas del CSV generado (default: 1M)')
+    parser.add_argument('--segment-mb', type=float, default=8, help='Tamaño de segmento en MB (default: 8)')
+    parser.add_argument('--processes', type=int, default=4, help='Procesos en paralelo (default: 4)')
+    parser.add_argument('--threads', type=int, default=8, help='Hilos escritores por proceso (default: 8)')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Latencia por BatchWriteItem (default: 5)')
+    parser.add_argument('--unprocessed-rate', type=float, default=0.01,
+                        help='Fracción de items devueltos en UnprocessedItems (default: 0.01)')
+    parser.add_argument('--fail-segments', type=int, nargs='*', default=[],
+                        help='Segmentos que fallan a la mitad en esta corrida')
+    parser.add_argument('--reset', action='store_true', help='Borrar checkpoints y empezar de cero')
+    parser.add_argument('--compare-single', action='store_true', help='Medir también la importación anterior')
+    parser.add_argument('--s3-root', default='/tmp/guatepass-import-s3', help='Directorio del S3 local')
+    args = parser.parse_args()
+
+    app = configure(args)
+    key, path = ensure_csv(args.s3_root, args.rows)
+    if args.reset:
+        shutil.rmtree(os.path.join(args.s3_root, BUCKET, *CHECKPOINT_PREFIX.split('/')), ignore_errors=True)
+
+    s3 = app.s3_client
+    with contextlib.redirect_stdout(sys.stderr):
+        manifest = app.segments.prepare_manifest(s3, BUCKET, BUCKET, key, app.IMPORT_SEGMENT_BYTES, CHECKPOINT_PREFIX)
+    pending = app.segments.pending_segments(s3, BUCKET, manifest, CHECKPOINT_PREFIX)
+    print(f"📦 s3://{BUCKET}/{key}: {len(manifest['segments'])} segmentos, {len(pending)} pendientes "
+          f"({args.processes} procesos × {args.threads} hilos, {args.latency_ms} ms por BatchWriteItem)")
+
+    fail = set(args.fail_segments)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.processes) as executor:
+        results = list(executor.map(run_segment_process,
+                                    [(manifest, index, index in fail, args) for index in pending]))
+    elapsed = time.perf_counter() - start
+
+    print(f"\n{'seg':>5} {'filas':>10} {'filas/s':>9} {'reintentos':>10} {'unprocessed':>11} "
+          f"{'errores':>8} {'checkpoint':>10}")
+    for stats in results:
+        print(f"{stats['segment']:>5} {stats['total']:>10,} {stats['rows_per_second']:>9,} "
+              f"{stats['retries']:>10,} {stats['unprocessed']:>11,} {stats['errors']:>8,} "
+              f"{'sí' if stats['errors'] == 0 else 'no':>10}")
+
+    rows_this_run = sum(stats['total'] for stats in results)
+    print(f"\n⏱️  {rows_this_run:,} filas en {elapsed:.1f}s ({rows_this_run / elapsed if elapsed else 0:,.0f} filas/s)")
+
+    completed = app.segments.completed_segments(s3, BUCKET, manifest, CHECKPOINT_PREFIX)
+    missing = len(manifest['segments']) - len(completed)
+    if missing:
+        print(f"\n⚠️  {missing} segmentos sin checkpoint: vuelve a ejecutar el comando para reanudar")
+        sys.exit(1)
+
+    imported = sum(checkpoint['success'] for checkpoint in completed.values())
+    expected = count_data_rows(path)
+    print(f"\n✅ Importación completa: {imported:,} filas en checkpoints, {expected:,} en el CSV")
+
+    if args.compare_single:
+        stats = compare_single(app, key, args)
+        print(f"📊 Importación anterior (1 stream, 1 escritor): {stats['seconds']:.1f}s "
+              f"({stats['rows_per_second']:,} filas/s)")
+
+    if imported != expected:
+        print("❌ Las filas importadas no coinciden con el CSV")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
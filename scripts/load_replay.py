@@ -0,0 +1,756 @@
+#!/usr/bin/env python3
+"""
+Replay de carga del pipeline de peajes con latencias de punta a punta
+
+Reproduce un stream NDJSON de eventos de peaje (scripts/generate_test_csv.py
+--events) contra los handlers reales, con los stand-ins locales de DynamoDB,
+EventBridge y Step Functions (scripts/local_aws):
+
+    ingest_toll -> EventBridge -> resolve_user -> StartExecution ->
+    calculate -> record -> balance -> invoice -> notify
+
+Cada etapa corre en su propio pool de --concurrency hilos y cada hilo tiene
+su propia copia del módulo del handler (como un contenedor Lambda: caches,
+ventana de dedup y cliente propios). Entre etapas los eventos pasan por las
+colas de EventBridge y Step Functions, así que la espera en cola forma parte
+de la latencia de punta a punta. Las ejecuciones corren la definición real
+(src/stepfunctions/process_toll.asl.json) con el ejecutor local de
+scripts/local_aws/asl.py, así que Retry, Catch y los Choice son los mismos que
+en AWS.
+
+Con --express resolve_user cobra los pasos con tag y saldo suficiente con el
+camino express (src/shared/express_pass.py, una TransactWriteItems) y solo el
+resto inicia la Step Function; end_to_end_tag mide los pasos con tag por
+cualquiera de los dos caminos.
+
+Con --sqs-batch N se replica el modo por lotes (TollProcessingMode = batch):
+un hilo agrupa los eventos de EventBridge como el event source mapping de SQS
+(hasta N mensajes o --batch-window-ms desde el primero) y cada lote va a
+resolve_user.batch_handler, que lo procesa con ejecuciones síncronas de
+src/stepfunctions/process_toll_batch.asl.json (Express, Map sobre los pasos).
+Los mensajes de batchItemFailures se reentregan hasta SQS_MAX_RECEIVES veces.
+En este modo la etapa resolve incluye la ejecución del lote, calculate y
+record miden una invocación por lote y eventbridge_wait incluye la espera de
+la ventana.
+
+Con --invoke-latency-ms cada tarea de la Step Function espera ese tiempo antes
+de correr su handler (overhead de invocar una Lambda); así se ve cuánto pesan
+los saltos del camino crítico (las ramas de un Parallel esperan a la vez).
+
+Con --rate los eventos se envían según un calendario fijo (i / rate); la
+latencia desde el calendario incluye el tiempo que un evento esperó para ser
+enviado si el pipeline se atrasa. Sin --rate se envían lo más rápido posible.
+
+Reporta en JSON (stdout o --output):
+  - p50/p95/p99/max por etapa, espera en cada cola y de punta a punta
+    (desde received_at de enrich_toll_event y desde el calendario)
+  - throughput de ejecuciones completadas
+  - llamadas al backend por evento (DynamoDB por tabla y operación,
+    PutEvents, StartExecution)
+  - estados finales de la máquina de estados (Express para el camino
+    express) y errores por etapa
+
+Uso:
+    python scripts/generate_test_csv.py --users 200000 --events 100000 --seed 3 --yes
+    python scripts/load_replay.py --events data/eventos_test.ndjson --users 200000 --seed 3 \\
+        --rate 500 --concurrency 8 --latency-ms 2 --output replay.json
+    python scripts/load_replay.py --events data/eventos_test.ndjson --users 200000 --seed 3 \\
+        --rate 500 --concurrency 8 --latency-ms 2 --express --label express --output replay-express.json
+    python scripts/load_replay.py --events data/eventos_test.ndjson --users 200000 --seed 3 \\
+        --rate 500 --concurrency 8 --latency-ms 2 --sqs-batch 100 --label batch --output replay-batch.json
+"""
+
+import argparse
+import contextlib
+import gzip
+import importlib.util
+import json
+import math
+import os
+import queue
+import sys
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timezone
+from itertools import islice
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+STATE_MACHINE_ARN = 'arn:aws:states:us-east-1:000000000000:stateMachine:guatepass-process-toll-local'
+BATCH_STATE_MACHINE_ARN = 'arn:aws:states:us-east-1:000000000000:stateMachine:guatepass-process-toll-batch-local'
+SQS_MAX_RECEIVES = 5  # maxReceiveCount de la RedrivePolicy de TollBatchQueue
+BATCH_RESOURCE = '/webhook/toll/batch'
+
+TABLES = {
+    'USERS_TABLE_NAME': ('GuatepassUsers-local', 'placa', None, {'TagIndex': ('tag_id', None)}),
+    'TOLLS_TABLE_NAME': ('GuatepassTolls-local', 'peaje_id', None, None),
+    'TRANSACTIONS_TABLE_NAME': ('GuatepassTransactions-local', 'transaction_id', None,
+                                {'PlacaTimestampIndex': ('placa', 'timestamp')}),
+    'INVOICES_TABLE_NAME': ('GuatepassInvoices-local', 'invoice_id', None,
+                            {'PlacaCreatedIndex': ('placa', 'created_at')}),
+    'IDEMPOTENCY_TABLE_NAME': ('GuatepassIdempotency-local', 'idempotency_key', None, None),
+}
+
+sys.path.insert(0, os.path.join(ROOT, 'src', 'shared'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+os.environ['EVENT_BUS_NAME'] = 'guatepass-events-local'
+os.environ['ENVIRONMENT'] = 'local'
+os.environ.pop('DATA_BUCKET_NAME', None)  # Sin filtro Bloom ni snapshot; tarifas de la Layer
+for _variable, (_name, *_) in TABLES.items():
+    os.environ[_variable] = _name
+
+from local_aws import LocalDynamoDB, LocalEventBridge, LocalStepFunctions  # noqa: E402
+from local_aws.asl import LocalStateMachine  # noqa: E402
+from money import parse_amount  # noqa: E402
+
+# Etapas del pipeline: (etapa, función en src/)
+INGEST = ('ingest', 'ingest_toll')
+RESOLVE = ('resolve', 'resolve_user')
+# Tareas de process_toll.asl.json: (etapa, función en src/, sustitución ${...}, estado)
+STATE_MACHINE_FILE = os.path.join(ROOT, 'src', 'stepfunctions', 'process_toll.asl.json')
+STATE_MACHINE_TASKS = (
+    ('calculate', 'calculate_toll_fare', 'CalculateTollFareFunctionArn', 'CalculateTollFare'),
+    ('record', 'record_transaction', 'RecordTransactionFunctionArn', 'RecordTransaction'),
+    ('balance', 'update_balance', 'UpdateBalanceFunctionArn', 'UpdateBalance'),
+    ('invoice', 'generate_invoice', 'GenerateInvoiceFunctionArn', 'GenerateInvoice'),
+    ('notify', 'notify_user', 'NotifyUserFunctionArn', 'NotifyUser'),
+)
+TASK_STAGES = {state: stage for stage, _, _, state in STATE_MACHINE_TASKS}
+# process_toll_batch.asl.json: mismas funciones; las tareas del Map se llaman igual que en process_toll
+BATCH_STATE_MACHINE_FILE = os.path.join(ROOT, 'src', 'stepfunctions', 'process_toll_batch.asl.json')
+BATCH_TASK_STAGES = {**TASK_STAGES, 'CalculateFares': 'calculate', 'RecordTransactions': 'record'}
+# Estado final equivalente de process_toll para un paso del lote (por balance_update.message)
+ITEM_FINAL_STATES = {
+    'Usuario no registrado - Pago en efectivo': 'CashPaymentRequired',
+    'Saldo insuficiente': 'InsufficientBalance',
+}
+STAGES = ('ingest', 'resolve') + tuple(task[0] for task in STATE_MACHINE_TASKS)
+
+_instances = 0
+_instances_lock = threading.Lock()
+
+
+def load_function(function: str):
+    """Carga una copia nueva de src/<function>/app.py (un "contenedor")."""
+    global _instances
+    directory = os.path.join(ROOT, 'src', function)
+    if directory not in sys.path:
+        sys.path.insert(0, directory)
+    with _instances_lock:
+        _instances += 1
+        name = f"{function}_app_{_instances}"
+    spec = importlib.util.spec_from_file_location(name, os.path.join(directory, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class Backend:
+    """Stand-ins compartidos por todas las copias de los handlers."""
+
+    def __init__(self, latency_seconds: float, express: bool = False):
+        self.express = express
+        self.db = LocalDynamoDB(latency_seconds=latency_seconds)
+        self.tables = {
+            variable: self.db.create_table(name, hash_key, range_key, indexes)
+            for variable, (name, hash_key, range_key, indexes) in TABLES.items()
+        }
+        self.events = LocalEventBridge(latency_seconds=latency_seconds)
+        self.stepfunctions = LocalStepFunctions(latency_seconds=latency_seconds)
+
+    def wire(self, stage: str, module) -> None:
+        """Reemplaza los clientes y tablas de boto3 del módulo por los stand-ins."""
+        tables = self.tables
+        if stage == 'ingest':
+            module.eventbridge = self.events
+            module.idempotency_table = tables['IDEMPOTENCY_TABLE_NAME']
+        elif stage == 'resolve':
+            module.dynamodb = self.db
+            module.users_table = tables['USERS_TABLE_NAME']
+            module.stepfunctions = self.stepfunctions
+            module.STATE_MACHINE_ARN = STATE_MACHINE_ARN
+            module.BATCH_STATE_MACHINE_ARN = BATCH_STATE_MACHINE_ARN
+            module.toll_catalog.tolls_table = tables['TOLLS_TABLE_NAME']
+            module.EXPRESS_PASS_ENABLED = self.express
+            module.express_pass.users_table = tables['USERS_TABLE_NAME']
+            module.express_pass.transactions_table = tables['TRANSACTIONS_TABLE_NAME']
+            module.express_pass.invoices_table = tables['INVOICES_TABLE_NAME']
+        elif stage == 'calculate':
+            module.toll_catalog.tolls_table = tables['TOLLS_TABLE_NAME']
+        elif stage == 'record':
+            module.transactions_table = tables['TRANSACTIONS_TABLE_NAME']
+            module.idempotency_table = tables['IDEMPOTENCY_TABLE_NAME']
+        elif stage == 'balance':
+            module.users_table = tables['USERS_TABLE_NAME']
+            module.idempotency_table = tables['IDEMPOTENCY_TABLE_NAME']
+        elif stage == 'invoice':
+            module.invoices_table = tables['INVOICES_TABLE_NAME']
+            module.idempotency_table = tables['IDEMPOTENCY_TABLE_NAME']
+
+    def reset_counts(self) -> None:
+        for client in (self.db, *self.tables.values(), self.events, self.stepfunctions):
+            client.operation_counts.clear()
+
+    def call_counts(self):
+        counts = {}
+        for table in self.tables.values():
+            for operation, count in table.operation_counts.items():
+                counts[f"dynamodb:{table.name}:{operation}"] = count
+        for operation, count in self.db.operation_counts.items():
+            counts[f"dynamodb:{operation}"] = count
+        for operation, count in self.events.operation_counts.items():
+            counts[f"events:{operation}"] = count
+        for operation, count in self.stepfunctions.operation_counts.items():
+            counts[f"states:{operation}"] = count
+        return dict(sorted(counts.items()))
+
+
+# ---------- datos de la prueba ----------
+
+def seed_tolls(table, peajes_file: str) -> int:
+    """Catálogo de peajes como scripts/seed_tolls.py (tarifas en centavos + item de versión)."""
+    with open(peajes_file, encoding='utf-8') as f:
+        peajes = json.load(f)
+    for peaje in peajes:
+        item = dict(peaje)
+        if item.get('tarifa_base') is not None:
+            item['tarifa_base_cents'] = parse_amount(item.pop('tarifa_base'))
+        table.put_item(Item=item)
+    table.put_item(Item={'peaje_id': '__catalog__', 'version': 1})
+    return len(peajes)
+
+
+def seed_users(table, users_csv: str, users: int, seed: int) -> int:
+    """
+    Registro de usuarios con las reglas de import_users (parse_user_row):
+    desde un CSV o generado con generate_test_csv.generate_user (mismo --seed
+    que el NDJSON, así las placas de los eventos existen).
+    """
+    import_users = load_function('import_users')
+    if users_csv:
+        opener = gzip.open if users_csv.endswith('.gz') else open
+        with opener(users_csv, 'rt', encoding='utf-8', newline='') as f:
+            items = list(import_users.parse_csv(f))
+    else:
+        from generate_test_csv import generate_user
+        items = [import_users.parse_user_row(generate_user(index, seed), index + 2) for index in range(users)]
+
+    for start in range(0, len(items), 25):
+        table.batch_write_item(RequestItems={
+            table.name: [{'PutRequest': {'Item': item}} for item in items[start:start + 25]]
+        })
+    return len(items)
+
+
+def read_events(path: str, limit: int):
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as f:
+        lines = (line for line in f if line.strip())
+        for line in islice(lines, limit or None):
+            yield json.loads(line)
+
+
+# ---------- métricas ----------
+
+class Recorder:
+    """Muestras de latencia (segundos) por nombre y contadores; thread-safe."""
+
+    def __init__(self):
+        self.samples = defaultdict(list)
+        self.counts = defaultdict(int)
+        self.errors = defaultdict(dict)
+        self.scheduled = {}
+        self._lock = threading.Lock()
+
+    def sample(self, name: str, seconds: float) -> None:
+        self.samples[name].append(seconds)  # list.append es atómico
+
+    def count(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self.counts[name] += amount
+
+    def error(self, stage: str, message: str) -> None:
+        message = message[:200]
+        with self._lock:
+            self.counts[f"errors.{stage}"] += 1
+            self.errors[stage][message] = self.errors[stage].get(message, 0) + 1
+
+
+def percentiles(samples):
+    """Percentiles por rango más cercano, en milisegundos."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, math.ceil(p / 100 * len(ordered)) - 1))] * 1000
+
+    return {
+        'count': len(ordered),
+        'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3),
+        'p50_ms': round(rank(50), 3),
+        'p95_ms': round(rank(95), 3),
+        'p99_ms': round(rank(99), 3),
+        'max_ms': round(ordered[-1] * 1000, 3)
+    }
+
+
+def size_percentiles(samples):
+    """Percentiles del mayor payload (bytes) de cada ejecución."""
+    if not samples:
+        return {'count': 0}
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'p50': ordered[(len(ordered) - 1) // 2],
+        'p99': ordered[min(len(ordered) - 1, math.ceil(0.99 * len(ordered)) - 1)],
+        'max': ordered[-1]
+    }
+
+
+def epoch_of(iso_timestamp: str) -> float:
+    """received_at ('2025-11-07T14:30:00.123456Z', UTC) a epoch."""
+    parsed = datetime.fromisoformat(iso_timestamp.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+# ---------- etapas ----------
+
+def consume(source: 'queue.Queue', done: threading.Event, handle) -> None:
+    """Procesa elementos de la cola hasta que la etapa anterior terminó y la cola quedó vacía."""
+    while True:
+        try:
+            item = source.get(timeout=0.05)
+        except queue.Empty:
+            if done.is_set() and source.empty():
+                return
+            continue
+        handle(item)
+
+
+def ingest_worker(backend: Backend, recorder: Recorder, ready: threading.Barrier, requests: 'queue.Queue',
+                  done: threading.Event) -> None:
+    handler = load_function(INGEST[1])
+    backend.wire('ingest', handler)
+    ready.wait()
+
+    def handle(request):
+        scheduled_at, events = request
+        recorder.sample('schedule_lag', max(0.0, time.time() - scheduled_at))
+        if len(events) == 1:
+            api_event = {'resource': '/webhook/toll', 'body': json.dumps(events[0])}
+        else:
+            api_event = {'resource': BATCH_RESOURCE, 'body': json.dumps({'events': events})}
+
+        start = time.perf_counter()
+        try:
+            response = handler.lambda_handler(api_event, None)
+        except Exception as e:  # lambda_handler ya convierte sus errores en 500
+            recorder.error('ingest', f"{type(e).__name__}: {e}")
+            return
+        finally:
+            recorder.sample('ingest', time.perf_counter() - start)
+
+        for result in ingest_results(response):
+            recorder.count(f"ingest.{result['status']}")
+            if result['status'] == 'accepted':
+                recorder.scheduled[result['event_id']] = scheduled_at
+
+    consume(requests, done, handle)
+
+
+def ingest_results(response):
+    """Estado por evento de la respuesta de ingest_toll (endpoint simple o de lotes)."""
+    body = json.loads(response['body'])
+    if 'results' in body:
+        return body['results']
+    if body.get('duplicate'):
+        return [{'status': 'duplicate'}]
+    if response['statusCode'] == 200:
+        return [{'status': 'accepted', 'event_id': body['event_id']}]
+    return [{'status': 'rejected' if response['statusCode'] == 400 else 'failed'}]
+
+
+def resolve_worker(backend: Backend, recorder: Recorder, ready: threading.Barrier, done: threading.Event) -> None:
+    handler = load_function(RESOLVE[1])
+    backend.wire('resolve', handler)
+    ready.wait()
+
+    def handle(delivery):
+        published_at, event = delivery
+        recorder.sample('eventbridge_wait', time.monotonic() - published_at)
+        start = time.perf_counter()
+        try:
+            result = handler.lambda_handler(event, None)
+        except Exception as e:
+            recorder.error('resolve', f"{type(e).__name__}: {e}")
+            recorder.count('executions.not_started')
+            return
+        finally:
+            recorder.sample('resolve', time.perf_counter() - start)
+        if result.get('pipeline') == 'express':
+            recorder.count('executions.Express')
+            record_completion(event['detail'], result['modalidad'], recorder)
+
+    consume(backend.events.delivered, done, handle)
+
+
+def execution_worker(backend: Backend, recorder: Recorder, ready: threading.Barrier, done: threading.Event,
+                     invoke_latency: float) -> None:
+    functions = {}
+    for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+        handler = load_function(function)
+        backend.wire(stage, handler)
+        functions[substitution] = handler.lambda_handler
+    machine = LocalStateMachine.from_file(STATE_MACHINE_FILE, functions, retry_interval_scale=0,
+                                          invoke_latency_seconds=invoke_latency)
+    ready.wait()
+
+    def handle(started):
+        started_at, _, execution_input = started
+        recorder.sample('stepfunctions_wait', time.monotonic() - started_at)
+        execution = machine.execute(execution_input)
+        record_execution(execution, recorder)
+        record_completion(execution_input.get('original_event', {}),
+                          execution_input.get('user_data', {}).get('modalidad'), recorder)
+
+    consume(backend.stepfunctions.started, done, handle)
+
+
+def record_completion(original, modalidad, recorder: Recorder) -> None:
+    """Latencia de punta a punta de un paso terminado (Step Function o camino express)."""
+    finished = time.time()
+    if original.get('received_at'):
+        recorder.sample('end_to_end', finished - epoch_of(original['received_at']))
+        if modalidad == 3:
+            recorder.sample('end_to_end_tag', finished - epoch_of(original['received_at']))
+    scheduled_at = recorder.scheduled.pop(original.get('event_id'), None)
+    if scheduled_at is not None:
+        recorder.sample('end_to_end_from_schedule', finished - scheduled_at)
+
+
+def record_execution(execution, recorder: Recorder) -> None:
+    """Tiempos de las tareas, tamaño máximo del payload, estado final y errores de una ejecución."""
+    recorder.count(f"executions.{execution.final_state}")
+    for record in execution.history:
+        stage = TASK_STAGES.get(record.name)
+        if stage is not None:
+            recorder.sample(stage, record.seconds)
+        if record.error:
+            recorder.error(stage or record.name, record.error)
+    recorder.sample('payload_bytes', max(record.output_bytes for record in execution.history))
+
+
+class BatchMachine:
+    """process_toll_batch registrada en el stand-in de Step Functions (start_sync_execution)."""
+
+    def __init__(self, backend: Backend, recorder: Recorder, map_workers: int, invoke_latency: float):
+        functions = {}
+        for stage, function, substitution, _ in STATE_MACHINE_TASKS:
+            handler = load_function(function)
+            backend.wire(stage, handler)
+            functions[substitution] = handler.lambda_handler
+        self.machine = LocalStateMachine.from_file(BATCH_STATE_MACHINE_FILE, functions, retry_interval_scale=0,
+                                                   map_workers=map_workers, invoke_latency_seconds=invoke_latency)
+        self.recorder = recorder
+        self.results = {}  # message_id -> resultado del paso en el Map
+        backend.stepfunctions.register(BATCH_STATE_MACHINE_ARN, self)
+
+    def execute(self, execution_input):
+        execution = self.machine.execute(execution_input)
+        recorder = self.recorder
+        recorder.count('batches')
+        recorder.sample('batch_items', len(execution_input['items']))
+        for record in execution.history:
+            stage = BATCH_TASK_STAGES.get(record.name)
+            if stage is not None:
+                recorder.sample(stage, record.seconds)
+            if record.error:
+                recorder.error(stage or record.name, record.error)
+        recorder.sample('payload_bytes', max(record.output_bytes for record in execution.history))
+        if execution.status != 'SUCCEEDED':
+            recorder.error('batch', f"{execution.error}: {execution.cause}")
+            return execution
+        for result in execution.output['results']:
+            if result['status'] == 'failed':
+                recorder.count('batch.items_failed')
+            else:
+                message = result['balance_update'].get('message')
+                recorder.count(f"executions.{ITEM_FINAL_STATES.get(message, 'ProcessingSuccess')}")
+            self.results[result['message_id']] = result
+        return execution
+
+
+def batch_collector(backend: Backend, batches: 'queue.Queue', batch_size: int, window: float,
+                    done: threading.Event) -> None:
+    """Como el event source mapping de SQS: lotes de hasta batch_size mensajes o window segundos."""
+    source = backend.events.delivered
+    while True:
+        try:
+            first = source.get(timeout=0.05)
+        except queue.Empty:
+            if done.is_set() and source.empty():
+                return
+            continue
+        batch = [first]
+        deadline = time.monotonic() + window
+        while len(batch) < batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(source.get(timeout=remaining))
+            except queue.Empty:
+                break
+        batches.put(batch)
+
+
+def resolve_batch_worker(backend: Backend, recorder: Recorder, ready: threading.Barrier, batches: 'queue.Queue',
+                         done: threading.Event, machine: BatchMachine) -> None:
+    handler = load_function(RESOLVE[1])
+    backend.wire('resolve', handler)
+    ready.wait()
+
+    def handle(deliveries):
+        now = time.monotonic()
+        pending = []
+        for published_at, event in deliveries:
+            recorder.sample('eventbridge_wait', now - published_at)
+            pending.append((str(uuid.uuid4()), event))
+
+        for receive in range(1, SQS_MAX_RECEIVES + 1):
+            sqs_event = {'Records': [{'messageId': message_id, 'body': json.dumps(event),
+                                      'attributes': {'ApproximateReceiveCount': str(receive)}}
+                                     for message_id, event in pending]}
+            start = time.perf_counter()
+            try:
+                response = handler.batch_handler(sqs_event, None)
+                failed = {failure['itemIdentifier'] for failure in response['batchItemFailures']}
+            except Exception as e:
+                recorder.error('resolve', f"{type(e).__name__}: {e}")
+                failed = {message_id for message_id, _ in pending}
+            finally:
+                recorder.sample('resolve', time.perf_counter() - start)
+            for message_id, event in pending:
+                result = machine.results.pop(message_id, None) or {}
+                if message_id not in failed:
+                    record_completion(event['detail'], result.get('modalidad'), recorder)
+            pending = [(message_id, event) for message_id, event in pending if message_id in failed]
+            if not pending:
+                return
+            recorder.count('sqs.redelivered', len(pending))
+        recorder.count('sqs.dead_letter', len(pending))
+
+    consume(batches, done, handle)
+
+
+def dispatch(events, requests: 'queue.Queue', rate: float, batch_size: int, recorder: Recorder) -> int:
+    """Encola los requests según el calendario (o lo más rápido posible si rate es 0)."""
+    sent = 0
+    start = time.time()
+    batch = []
+    for event in events:
+        batch.append(event)
+        if len(batch) < batch_size:
+            continue
+        scheduled_at = start + sent / rate if rate else time.time()
+        delay = scheduled_at - time.time()
+        if delay > 0:
+            time.sleep(delay)
+        requests.put((scheduled_at, batch))
+        sent += len(batch)
+        batch = []
+    if batch:
+        requests.put((start + sent / rate if rate else time.time(), batch))
+        sent += len(batch)
+    recorder.count('sent', sent)
+    return sent
+
+
+def run_stage(target, workers: int, *args):
+    threads = [threading.Thread(target=target, args=args, daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def replay(args, backend: Backend, recorder: Recorder):
+    requests = queue.Queue(maxsize=args.concurrency * 4)
+    ingest_done, resolve_done, executions_done = threading.Event(), threading.Event(), threading.Event()
+
+    # Los hilos cargan sus handlers antes de empezar a medir
+    if args.sqs_batch:
+        # Modo por lotes: colector (SQS) -> resolve_user.batch_handler -> Express síncrona
+        machine = BatchMachine(backend, recorder, args.map_workers, args.invoke_latency_ms / 1000)
+        batches = queue.Queue()
+        ready = threading.Barrier(2 * args.concurrency + 1)
+        ingest = run_stage(ingest_worker, args.concurrency, backend, recorder, ready, requests, ingest_done)
+        resolve = run_stage(batch_collector, 1, backend, batches, args.sqs_batch, args.batch_window_ms / 1000,
+                            resolve_done)
+        executions = run_stage(resolve_batch_worker, args.concurrency, backend, recorder, ready, batches,
+                               executions_done, machine)
+    else:
+        ready = threading.Barrier(3 * args.concurrency + 1)
+        ingest = run_stage(ingest_worker, args.concurrency, backend, recorder, ready, requests, ingest_done)
+        resolve = run_stage(resolve_worker, args.concurrency, backend, recorder, ready, resolve_done)
+        executions = run_stage(execution_worker, args.concurrency, backend, recorder, ready, executions_done,
+                               args.invoke_latency_ms / 1000)
+    ready.wait()
+
+    backend.reset_counts()
+    start = time.perf_counter()
+    sent = dispatch(read_events(args.events, args.limit), requests, args.rate, args.ingest_batch, recorder)
+    dispatched = time.perf_counter() - start
+
+    for threads, done in ((ingest, ingest_done), (resolve, resolve_done), (executions, executions_done)):
+        done.set()
+        for thread in threads:
+            thread.join()
+    return sent, dispatched, time.perf_counter() - start
+
+
+def build_report(args, sent, dispatched, elapsed, backend: Backend, recorder: Recorder):
+    counts = dict(recorder.counts)
+    completed = sum(value for key, value in counts.items()
+                    if key.startswith('executions.') and key != 'executions.not_started')
+    calls = backend.call_counts()
+    total_calls = sum(calls.values())
+    return {
+        'label': args.label,
+        'config': {
+            'events_file': args.events,
+            'rate': args.rate or None,
+            'concurrency': args.concurrency,
+            'ingest_batch': args.ingest_batch,
+            'backend_latency_ms': args.latency_ms,
+            'invoke_latency_ms': args.invoke_latency_ms,
+            'express': args.express,
+            'sqs_batch': args.sqs_batch or None,
+            'batch_window_ms': args.batch_window_ms if args.sqs_batch else None,
+            'registry_users': recorder.counts.get('registry_users', 0)
+        },
+        'events': {
+            'sent': sent,
+            'accepted': counts.get('ingest.accepted', 0),
+            'duplicates': counts.get('ingest.duplicate', 0),
+            'rejected': counts.get('ingest.rejected', 0),
+            'failed': counts.get('ingest.failed', 0),
+            'executions_completed': completed
+        },
+        'duration_seconds': round(elapsed, 3),
+        'dispatch_seconds': round(dispatched, 3),
+        'offered_rate': round(sent / dispatched, 1) if dispatched else None,
+        'throughput_per_second': round(completed / elapsed, 1) if elapsed else None,
+        'latency': {
+            'stages': {stage: percentiles(recorder.samples[stage]) for stage in STAGES},
+            'queues': {name: percentiles(recorder.samples[name])
+                       for name in ('schedule_lag', 'eventbridge_wait', 'stepfunctions_wait')},
+            'end_to_end': percentiles(recorder.samples['end_to_end']),
+            'end_to_end_tag': percentiles(recorder.samples['end_to_end_tag']),
+            'end_to_end_from_schedule': percentiles(recorder.samples['end_to_end_from_schedule'])
+        },
+        'payload_bytes': size_percentiles(recorder.samples['payload_bytes']),
+        'batches': {
+            'executions': counts.get('batches', 0),
+            'items': size_percentiles(recorder.samples['batch_items']),
+            'items_failed': counts.get('batch.items_failed', 0),
+            'redelivered': counts.get('sqs.redelivered', 0),
+            'dead_letter': counts.get('sqs.dead_letter', 0)
+        } if args.sqs_batch else None,
+        'backend_calls': {
+            'total': total_calls,
+            'per_event': round(total_calls / sent, 3) if sent else None,
+            'per_event_by_call': {name: round(count / sent, 3) for name, count in calls.items()} if sent else {},
+            'by_call': calls
+        },
+        'final_states': {key.split('.', 1)[1]: value for key, value in sorted(counts.items())
+                         if key.startswith('executions.')},
+        'errors': {stage: dict(messages) for stage, messages in recorder.errors.items()}
+    }
+
+
+def print_summary(report, stream) -> None:
+    print(f"\n📊 {report['events']['sent']:,} eventos, {report['events']['executions_completed']:,} ejecuciones "
+          f"en {report['duration_seconds']:.1f}s ({report['throughput_per_second']:,.0f}/s)", file=stream)
+    print(f"{'etapa':<26} {'n':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}", file=stream)
+    latency = report['latency']
+    rows = [*latency['stages'].items(), *latency['queues'].items(),
+            ('end_to_end', latency['end_to_end']), ('end_to_end_tag', latency['end_to_end_tag']),
+            ('end_to_end_from_schedule', latency['end_to_end_from_schedule'])]
+    for name, stats in rows:
+        if stats['count']:
+            print(f"{name:<26} {stats['count']:>8,} {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+                  f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}", file=stream)
+    print(f"🔌 {report['backend_calls']['per_event']} llamadas al backend por evento", file=stream)
+    if report['batches']:
+        batches = report['batches']
+        print(f"📦 {batches['executions']:,} lotes (p50 {batches['items'].get('p50', 0)} pasos), "
+              f"{batches['redelivered']:,} reentregas, {batches['dead_letter']:,} a la DLQ", file=stream)
+    print(f"🏁 Estados finales: {report['final_states']}", file=stream)
+    if report['errors']:
+        print(f"⚠️  Errores: {report['errors']}", file=stream)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay de carga del pipeline de peajes')
+    parser.add_argument('--events', required=True, help='NDJSON de eventos (.ndjson o .ndjson.gz)')
+    parser.add_argument('--users', type=int, default=0,
+                        help='Usuarios del registro generado con generate_user (mismo --seed del NDJSON)')
+    parser.add_argument('--users-csv', help='CSV de usuarios a cargar en lugar de generarlos')
+    parser.add_argument('--seed', type=int, default=0, help='Semilla del registro generado')
+    parser.add_argument('--peajes-file', default=os.path.join(ROOT, 'data', 'peajes.json'))
+    parser.add_argument('--limit', type=int, default=0, help='Máximo de eventos a enviar (default: todos)')
+    parser.add_argument('--rate', type=float, default=0, help='Eventos por segundo (default: lo más rápido posible)')
+    parser.add_argument('--concurrency', type=int, default=4, help='Hilos (contenedores) por etapa (default: 4)')
+    parser.add_argument('--ingest-batch', type=int, default=1,
+                        help=f'Eventos por request; >1 usa {BATCH_RESOURCE} (default: 1)')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='Latencia simulada por llamada al backend')
+    parser.add_argument('--invoke-latency-ms', type=float, default=0.0,
+                        help='Latencia simulada por invocación de Lambda desde la Step Function')
+    parser.add_argument('--express', action='store_true',
+                        help='Camino express de resolve_user para pasos con tag (EXPRESS_PASS_ENABLED)')
+    parser.add_argument('--sqs-batch', type=int, default=0,
+                        help='Modo por lotes: mensajes por lote de SQS (BatchSize; default: 0 = por evento)')
+    parser.add_argument('--batch-window-ms', type=float, default=1000,
+                        help='Ventana del lote (MaximumBatchingWindowInSeconds; default: 1000)')
+    parser.add_argument('--map-workers', type=int, default=8,
+                        help='Hilos por estado Map en el modo por lotes (default: 8)')
+    parser.add_argument('--label', default='', help='Etiqueta de la corrida en el JSON')
+    parser.add_argument('--output', help='Archivo JSON del reporte (default: stdout)')
+    args = parser.parse_args()
+
+    if args.rate < 0 or args.concurrency < 1 or args.ingest_batch < 1 or args.invoke_latency_ms < 0:
+        parser.error('--rate >= 0, --concurrency >= 1, --ingest-batch >= 1 y --invoke-latency-ms >= 0')
+    if args.sqs_batch < 0 or args.sqs_batch > 10000 or args.map_workers < 1:
+        parser.error('--sqs-batch entre 0 y 10000 y --map-workers >= 1')
+
+    backend = Backend(args.latency_ms / 1000, args.express)
+    recorder = Recorder()
+    plazas = seed_tolls(backend.tables['TOLLS_TABLE_NAME'], args.peajes_file)
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        users = seed_users(backend.tables['USERS_TABLE_NAME'], args.users_csv, args.users, args.seed)
+    recorder.counts['registry_users'] = users
+    print(f"📦 {users:,} usuarios y {plazas} peajes cargados; enviando {args.events}"
+          f"{f' a {args.rate:,.0f} eventos/s' if args.rate else ''}...", file=sys.stderr)
+
+    # Los handlers imprimen cada evento (y los correos simulados): se descarta su salida
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        sent, dispatched, elapsed = replay(args, backend, recorder)
+
+    report = build_report(args, sent, dispatched, elapsed, backend, recorder)
+    print_summary(report, sys.stderr)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Reporte: {args.output}", file=sys.stderr)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
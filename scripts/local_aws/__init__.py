@@ -0,0 +1,14 @@
+"""
+Stand-ins locales de servicios AWS para pruebas de carga y concurrencia
+
+Permiten ejercitar los módulos de src/ (que reciben tablas/clientes como
+parámetro) sin una cuenta de AWS; asl.py ejecuta las definiciones de
+src/stepfunctions con handlers locales. No reemplazan las pruebas contra AWS
+real.
+"""
+
+from .asl import LocalExecutor, LocalStateMachine, StatesError  # noqa: F401
+from .dynamodb import LocalDynamoDB, LocalTable, decimal_to_int  # noqa: F401
+from .eventbridge import LocalEventBridge  # noqa: F401
+from .s3 import LocalS3  # noqa: F401
+from .stepfunctions import LocalStepFunctions  # noqa: F401
@@ -0,0 +1,646 @@
+"""
+Ejecutor local de máquinas de estados (Amazon States Language)
+
+Interpreta en el mismo proceso los estados que usan
+src/stepfunctions/process_toll.asl.json y process_toll_batch.asl.json e invoca
+los handlers de Python directamente, sin desplegar:
+
+    Task     arn:aws:states:::lambda:invoke (Parameters, ResultSelector,
+             ResultPath, Retry, Catch); el resultado es {StatusCode, Payload}.
+             Con el ARN de la función como Resource, Parameters es el evento
+             y el resultado es lo que retorna el handler
+    Pass     Parameters / Result, ResultPath
+    Choice   Choices (String*, Numeric*, Boolean*, Is*, And/Or/Not y sus
+             variantes *Path) y Default
+    Map      INLINE: ItemsPath, ItemProcessor (o Iterator), ItemSelector (o
+             Parameters, con $$.Map.Item.Index/Value), MaxConcurrency,
+             ResultSelector, ResultPath, Retry, Catch
+    Parallel Branches (cada rama en su hilo), Parameters, ResultSelector,
+             ResultPath, Retry, Catch; el resultado es la lista de salidas de
+             las ramas en orden
+    Succeed, Fail
+
+InputPath y OutputPath se aplican en todos los estados. Las rutas JSONPath
+soportadas son las de referencia ($, $.a.b, $.a[0]). Los ${Nombre} de la
+definición (DefinitionSubstitutions del template) se resuelven contra el
+dict de funciones:
+
+    machine = LocalStateMachine.from_file(
+        'src/stepfunctions/process_toll.asl.json',
+        {'CalculateTollFareFunctionArn': calculate.lambda_handler, ...}
+    )
+    execution = machine.execute({'user_data': {...}, 'toll_data': {...}})
+    execution.status, execution.final_state, execution.output
+
+Como en Lambda, el payload de cada invocación se serializa a JSON (un
+resultado no serializable falla la tarea) y el error de un handler toma el
+nombre de la clase de la excepción, que es lo que ven Retry y Catch
+(States.ALL y States.TaskFailed incluidos). Los IntervalSeconds de Retry se
+multiplican por retry_interval_scale (0 en pruebas locales).
+
+Cada ejecución guarda su historial: por estado el tiempo, los intentos y el
+tamaño en bytes del JSON de entrada y de salida (el límite de Step Functions
+es 256 KB por transición). LocalExecutor corre muchas ejecuciones en un pool
+de hilos y acumula esas métricas por estado.
+
+Las iteraciones de un Map son ejecuciones del sub-flujo (ItemProcessor) que
+corren en hasta min(map_workers, MaxConcurrency) hilos; sus estados quedan
+en el historial de la ejecución padre y, si una iteración falla, el Map
+falla con su Error y Cause (lo que ven el Retry y el Catch del Map). Las
+ramas de un Parallel funcionan igual, todas a la vez.
+
+Con invoke_latency_seconds cada invocación de una función espera ese tiempo
+antes del handler (el costo de un salto Step Functions -> Lambda), para medir
+cuántos saltos hay en el camino crítico de una ejecución.
+"""
+
+import copy
+import functools
+import json
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+LAMBDA_INVOKE = 'arn:aws:states:::lambda:invoke'
+SERVICE_INTEGRATION_PREFIX = 'arn:aws:states:::'
+PAYLOAD_LIMIT_BYTES = 256 * 1024
+SUPPORTED_TYPES = ('Task', 'Pass', 'Choice', 'Map', 'Parallel', 'Succeed', 'Fail')
+
+SUCCEEDED = 'SUCCEEDED'
+FAILED = 'FAILED'
+
+_SUBSTITUTION = re.compile(r'\$\{(\w+)\}')
+_PATH_TOKEN = re.compile(r'\.([^.\[\]]+)|\[(\d+)\]')
+
+
+class StatesError(Exception):
+    """Error de una ejecución con nombre (Error) y causa (Cause) como en Step Functions."""
+
+    def __init__(self, error: str, cause: str = ''):
+        super().__init__(f"{error}: {cause}" if cause else error)
+        self.error = error
+        self.cause = cause
+
+
+# ---------- rutas ----------
+
+@functools.lru_cache(maxsize=1024)
+def _tokens(path: str) -> Tuple[Any, ...]:
+    if path == '$':
+        return ()
+    if not path.startswith('$'):
+        raise StatesError('States.Runtime', f"Ruta inválida: {path}")
+    tokens, position = [], 1
+    for match in _PATH_TOKEN.finditer(path, 1):
+        if match.start() != position:
+            break
+        tokens.append(match.group(1) if match.group(1) is not None else int(match.group(2)))
+        position = match.end()
+    if position != len(path):
+        raise StatesError('States.Runtime', f"Ruta no soportada: {path}")
+    return tuple(tokens)
+
+
+def get_path(data: Any, path: str) -> Any:
+    """Valor en la ruta JSONPath; States.Runtime si no existe."""
+    value = data
+    for token in _tokens(path):
+        try:
+            value = value[token]
+        except (KeyError, IndexError, TypeError):
+            raise StatesError('States.Runtime', f"La ruta {path} no existe en la entrada")
+    return value
+
+
+def has_path(data: Any, path: str) -> bool:
+    try:
+        get_path(data, path)
+        return True
+    except StatesError:
+        return False
+
+
+def set_path(data: Any, path: Optional[str], value: Any) -> Any:
+    """ResultPath: retorna una copia de data con value en la ruta ($ reemplaza, None descarta)."""
+    if path is None:
+        return data
+    tokens = _tokens(path)
+    if not tokens:
+        return value
+    result = copy.copy(data) if isinstance(data, dict) else {}
+    target = result
+    for token in tokens[:-1]:
+        child = target.get(token)
+        target[token] = copy.copy(child) if isinstance(child, dict) else {}
+        target = target[token]
+    target[tokens[-1]] = value
+    return result
+
+
+def apply_template(template: Any, data: Any, context: Optional[Dict[str, Any]] = None) -> Any:
+    """
+    Parameters / ResultSelector / ItemSelector: los campos "x.$" se evalúan como
+    rutas sobre data; las rutas "$$." se evalúan sobre el objeto de contexto.
+    """
+    if isinstance(template, dict):
+        result = {}
+        for key, value in template.items():
+            if key.endswith('.$'):
+                if not isinstance(value, str) or value.startswith('States.'):
+                    raise StatesError('States.Runtime', f"Funciones intrínsecas no soportadas: {value}")
+                if value.startswith('$$'):
+                    if context is None:
+                        raise StatesError('States.Runtime', f"Objeto de contexto no disponible: {value}")
+                    result[key[:-2]] = get_path(context, value[1:])
+                else:
+                    result[key[:-2]] = get_path(data, value)
+            else:
+                result[key] = apply_template(value, data, context)
+        return result
+    if isinstance(template, list):
+        return [apply_template(value, data, context) for value in template]
+    return template
+
+
+# ---------- Choice ----------
+
+def _comparison(kind: str, operator: str) -> Callable[[Any, Any], bool]:
+    checks = {
+        'String': lambda v: isinstance(v, str),
+        'Numeric': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+        'Boolean': lambda v: isinstance(v, bool),
+        'Timestamp': lambda v: isinstance(v, str),
+    }[kind]
+    compare = {
+        'Equals': lambda a, b: a == b,
+        'LessThan': lambda a, b: a < b,
+        'GreaterThan': lambda a, b: a > b,
+        'LessThanEquals': lambda a, b: a <= b,
+        'GreaterThanEquals': lambda a, b: a >= b,
+    }[operator]
+    return lambda a, b: checks(a) and checks(b) and compare(a, b)
+
+
+_COMPARISONS = {
+    f"{kind}{operator}": _comparison(kind, operator)
+    for kind in ('String', 'Numeric', 'Timestamp') for operator in
+    ('Equals', 'LessThan', 'GreaterThan', 'LessThanEquals', 'GreaterThanEquals')
+}
+_COMPARISONS['BooleanEquals'] = _comparison('Boolean', 'Equals')
+
+_TYPE_TESTS = {
+    'IsNull': lambda v: v is None,
+    'IsString': lambda v: isinstance(v, str),
+    'IsNumeric': lambda v: isinstance(v, (int, float)) and not isinstance(v, bool),
+    'IsBoolean': lambda v: isinstance(v, bool),
+}
+
+
+def evaluate_rule(rule: Dict[str, Any], data: Any) -> bool:
+    """Evalúa una regla de Choice (con And/Or/Not anidados)."""
+    if 'And' in rule:
+        return all(evaluate_rule(child, data) for child in rule['And'])
+    if 'Or' in rule:
+        return any(evaluate_rule(child, data) for child in rule['Or'])
+    if 'Not' in rule:
+        return not evaluate_rule(rule['Not'], data)
+
+    variable = rule['Variable']
+    if 'IsPresent' in rule:
+        return has_path(data, variable) == rule['IsPresent']
+    value = get_path(data, variable)  # States.Runtime si la variable no existe, como en Step Functions
+
+    for name, test in _TYPE_TESTS.items():
+        if name in rule:
+            return test(value) == rule[name]
+    for name, compare in _COMPARISONS.items():
+        if name in rule:
+            return compare(value, rule[name])
+        if f"{name}Path" in rule:
+            other = rule[f"{name}Path"]
+            return has_path(data, other) and compare(value, get_path(data, other))
+    raise StatesError('States.Runtime', f"Regla de Choice no soportada: {sorted(rule)}")
+
+
+# ---------- ejecución ----------
+
+class StateRecord(NamedTuple):
+    name: str
+    type: str
+    seconds: float
+    attempts: int
+    input_bytes: int
+    output_bytes: int
+    error: Optional[str]
+
+
+class Execution:
+    def __init__(self, execution_id: str):
+        self.execution_id = execution_id
+        self.status = 'RUNNING'
+        self.final_state: Optional[str] = None
+        self.output: Any = None
+        self.error: Optional[str] = None
+        self.cause: Optional[str] = None
+        self.seconds = 0.0
+        self.history: List[StateRecord] = []
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'execution_id': self.execution_id,
+            'status': self.status,
+            'final_state': self.final_state,
+            'error': self.error,
+            'cause': self.cause,
+            'seconds': self.seconds,
+            'history': [record._asdict() for record in self.history]
+        }
+
+
+def _size(value: Any) -> int:
+    return len(json.dumps(value, separators=(',', ':'), default=str).encode('utf-8'))
+
+
+def _matches(error: str, names: Iterable[str]) -> bool:
+    for name in names:
+        if name == 'States.ALL' or name == error:
+            return True
+        if name == 'States.TaskFailed' and error != 'States.Timeout':
+            return True
+    return False
+
+
+class LocalStateMachine:
+    """
+    Args:
+        definition: Definición ASL (dict)
+        functions: ARN o nombre de la sustitución ${...} -> handler(event, context)
+        retry_interval_scale: Factor de los IntervalSeconds de Retry (0 = sin esperas)
+        measure_payloads: Medir el tamaño del JSON en cada transición
+        map_workers: Hilos por estado Map (1 = iteraciones en serie)
+        invoke_latency_seconds: Espera simulada por invocación de una función
+    """
+
+    def __init__(self, definition: Dict[str, Any], functions: Dict[str, Callable[[Any, Any], Any]],
+                 retry_interval_scale: float = 1.0, measure_payloads: bool = True,
+                 max_transitions: int = 1000, map_workers: int = 1, invoke_latency_seconds: float = 0.0):
+        self.definition = definition
+        self.functions = dict(functions)
+        self.retry_interval_scale = retry_interval_scale
+        self.measure_payloads = measure_payloads
+        self.max_transitions = max_transitions
+        self.map_workers = map_workers
+        self.invoke_latency_seconds = invoke_latency_seconds
+        self._processors: Dict[str, 'LocalStateMachine'] = {}
+        self._branches: Dict[str, List['LocalStateMachine']] = {}
+        self._validate(definition)
+
+    @classmethod
+    def from_file(cls, path: str, functions: Dict[str, Callable[[Any, Any], Any]],
+                  **kwargs: Any) -> 'LocalStateMachine':
+        """Carga la definición; los ${Nombre} quedan como nombres de función a resolver."""
+        with open(path, encoding='utf-8') as f:
+            text = f.read()
+        return cls(json.loads(_SUBSTITUTION.sub(lambda m: m.group(1), text)), functions, **kwargs)
+
+    def _validate(self, definition: Dict[str, Any]) -> None:
+        states = definition['States']
+        if definition['StartAt'] not in states:
+            raise ValueError(f"StartAt desconocido: {definition['StartAt']}")
+        for name, state in states.items():
+            if state['Type'] not in SUPPORTED_TYPES:
+                raise ValueError(f"Estado {name}: tipo no soportado {state['Type']}")
+            if state['Type'] == 'Task' and state['Resource'] != LAMBDA_INVOKE and \
+                    state['Resource'].startswith(SERVICE_INTEGRATION_PREFIX):
+                raise ValueError(f"Estado {name}: recurso no soportado {state['Resource']}")
+            if state['Type'] == 'Map':
+                processor = state.get('ItemProcessor', state.get('Iterator'))
+                if processor is None:
+                    raise ValueError(f"Estado {name}: Map sin ItemProcessor")
+                mode = processor.get('ProcessorConfig', {}).get('Mode', 'INLINE')
+                if mode != 'INLINE':
+                    raise ValueError(f"Estado {name}: Map en modo {mode} no soportado")
+                self._processors[name] = self._child(name, processor, set(states))
+            if state['Type'] == 'Parallel':
+                if not state.get('Branches'):
+                    raise ValueError(f"Estado {name}: Parallel sin Branches")
+                used = set(states)
+                self._branches[name] = []
+                for branch in state['Branches']:
+                    child = self._child(name, branch, used)
+                    used |= set(child.state_names())
+                    self._branches[name].append(child)
+            targets = [state.get('Next'), state.get('Default')]
+            targets += [choice['Next'] for choice in state.get('Choices', [])]
+            targets += [catcher['Next'] for catcher in state.get('Catch', [])]
+            for target in targets:
+                if target is not None and target not in states:
+                    raise ValueError(f"Estado {name}: transición a un estado inexistente {target}")
+
+    def _child(self, name: str, definition: Dict[str, Any], used: set) -> 'LocalStateMachine':
+        """Sub-flujo de un Map o rama de un Parallel (sus nombres no pueden repetir los ya usados)."""
+        duplicated = set(definition['States']) & used
+        if duplicated:
+            raise ValueError(f"Estado {name}: estados repetidos en el sub-flujo {sorted(duplicated)}")
+        return LocalStateMachine(
+            definition, self.functions, self.retry_interval_scale, self.measure_payloads,
+            self.max_transitions, self.map_workers, self.invoke_latency_seconds
+        )
+
+    # ---------- API ----------
+
+    def state_names(self) -> List[str]:
+        """Nombres de los estados, incluidos los de los ItemProcessor de los Map y las ramas de los Parallel."""
+        names = []
+        for name in self.definition['States']:
+            names.append(name)
+            if name in self._processors:
+                names.extend(self._processors[name].state_names())
+            for branch in self._branches.get(name, []):
+                names.extend(branch.state_names())
+        return names
+
+    def execute(self, execution_input: Any, execution_id: Optional[str] = None) -> Execution:
+        """Corre una ejecución completa en el hilo actual."""
+        execution = Execution(execution_id or str(uuid.uuid4()))
+        started = time.perf_counter()
+        states = self.definition['States']
+        name, data = self.definition['StartAt'], execution_input
+        # La entrada de cada estado es la salida del anterior: se mide una vez
+        input_bytes = _size(data) if self.measure_payloads else 0
+
+        try:
+            for _ in range(self.max_transitions):
+                state = states[name]
+                record_start = time.perf_counter()
+                attempts, error, state_input = 0, None, data
+                try:
+                    next_name, data, attempts = self._run_state(name, state, data, execution.history)
+                except _CaughtError as caught:
+                    next_name, data, attempts, error = caught.next_name, caught.output, caught.attempts, caught.error
+                except StatesError as e:
+                    execution.history.append(StateRecord(
+                        name, state['Type'], time.perf_counter() - record_start, getattr(e, 'attempts', 0),
+                        input_bytes, 0, e.error
+                    ))
+                    raise
+                if not self.measure_payloads:
+                    output_bytes = 0
+                elif data is state_input:  # Choice/Succeed sin OutputPath: la misma entrada
+                    output_bytes = input_bytes
+                else:
+                    output_bytes = _size(data)
+                execution.history.append(StateRecord(
+                    name, state['Type'], time.perf_counter() - record_start, attempts,
+                    input_bytes, output_bytes, error
+                ))
+                input_bytes = output_bytes
+                if self.measure_payloads and output_bytes > PAYLOAD_LIMIT_BYTES:
+                    raise StatesError('States.DataLimitExceeded',
+                                      f"La salida de {name} ({output_bytes} bytes) excede {PAYLOAD_LIMIT_BYTES}")
+                if next_name is None:
+                    execution.final_state = name
+                    if state['Type'] == 'Fail':
+                        execution.status = FAILED
+                        execution.error = state.get('Error')
+                        execution.cause = state.get('Cause')
+                    else:
+                        execution.status = SUCCEEDED
+                        execution.output = data
+                    break
+                name = next_name
+            else:
+                raise StatesError('States.Runtime', f"Más de {self.max_transitions} transiciones")
+        except StatesError as e:
+            execution.status = FAILED
+            execution.final_state = name
+            execution.error, execution.cause = e.error, e.cause
+
+        execution.seconds = time.perf_counter() - started
+        return execution
+
+    # ---------- estados ----------
+
+    def _run_state(self, name: str, state: Dict[str, Any], data: Any, history: List[StateRecord]):
+        state_type = state['Type']
+        effective = get_path(data, state['InputPath']) if state.get('InputPath') else data
+
+        if state_type == 'Succeed':
+            return None, self._output(state, effective), 0
+        if state_type == 'Fail':
+            return None, data, 0
+        if state_type == 'Choice':
+            for rule in state.get('Choices', []):
+                if evaluate_rule(rule, effective):
+                    return rule['Next'], self._output(state, effective), 0
+            if 'Default' not in state:
+                raise StatesError('States.NoChoiceMatched', f"Ningún Choice coincidió en {name}")
+            return state['Default'], self._output(state, effective), 0
+        if state_type == 'Pass':
+            if 'Parameters' in state:
+                result = apply_template(state['Parameters'], effective)
+            else:
+                result = state.get('Result', effective)
+            return self._next(state), self._output(state, set_path(data, state.get('ResultPath', '$'), result)), 0
+
+        if state_type == 'Map':
+            result, attempts = self._with_retry(state, lambda: self._run_map(name, state, effective, history), data)
+        elif state_type == 'Parallel':
+            branch_input = apply_template(state['Parameters'], effective) if 'Parameters' in state else effective
+            result, attempts = self._with_retry(
+                state, lambda: self._run_parallel(name, branch_input, history), data
+            )
+        elif state['Resource'] == LAMBDA_INVOKE:
+            parameters = apply_template(state.get('Parameters', {}), effective)
+            result, attempts = self._with_retry(state, lambda: self._invoke(parameters), data)
+        else:
+            # Resource = ARN de la función: el resultado es directamente lo que retorna el handler
+            payload = apply_template(state['Parameters'], effective) if 'Parameters' in state else effective
+            parameters = {'FunctionName': state['Resource'], 'Payload': payload}
+            result, attempts = self._with_retry(state, lambda: self._invoke(parameters)['Payload'], data)
+        if 'ResultSelector' in state:
+            result = apply_template(state['ResultSelector'], result)
+        return self._next(state), self._output(state, set_path(data, state.get('ResultPath', '$'), result)), attempts
+
+    def _with_retry(self, state: Dict[str, Any], call: Callable[[], Any], data: Any):
+        """Corre call() aplicando el Retry y el Catch del estado; retorna (resultado, intentos)."""
+        retriers = state.get('Retry', [])
+        retries_used = [0] * len(retriers)
+        attempts = 0
+        while True:
+            attempts += 1
+            try:
+                return call(), attempts
+            except StatesError as e:
+                retry_index = next((i for i, retrier in enumerate(retriers)
+                                    if _matches(e.error, retrier['ErrorEquals'])), None)
+                if retry_index is not None:
+                    retrier = retriers[retry_index]
+                    max_attempts = retrier.get('MaxAttempts', 3)
+                    if retries_used[retry_index] < max_attempts:
+                        interval = retrier.get('IntervalSeconds', 1) * retrier.get('BackoffRate', 2.0) ** retries_used[retry_index]
+                        retries_used[retry_index] += 1
+                        if self.retry_interval_scale:
+                            time.sleep(interval * self.retry_interval_scale)
+                        continue
+                for catcher in state.get('Catch', []):
+                    if _matches(e.error, catcher['ErrorEquals']):
+                        output = set_path(data, catcher.get('ResultPath', '$'), {'Error': e.error, 'Cause': e.cause})
+                        raise _CaughtError(catcher['Next'], output, attempts, e.error)
+                e.attempts = attempts
+                raise
+
+    def _run_map(self, name: str, state: Dict[str, Any], effective: Any,
+                 history: List[StateRecord]) -> List[Any]:
+        """Una ejecución del ItemProcessor por item; el resultado es la lista de salidas en orden."""
+        items = get_path(effective, state.get('ItemsPath', '$'))
+        if not isinstance(items, list):
+            raise StatesError('States.Runtime', f"ItemsPath de {name} no es una lista")
+        selector = state.get('ItemSelector', state.get('Parameters'))
+        if selector is not None:
+            items = [apply_template(selector, effective, {'Map': {'Item': {'Index': index, 'Value': item}}})
+                     for index, item in enumerate(items)]
+
+        processor = self._processors[name]
+        # MaxConcurrency 0 (o ausente) = sin límite
+        workers = min(self.map_workers, state.get('MaxConcurrency') or len(items), len(items))
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                iterations = list(pool.map(processor.execute, items))
+        else:
+            iterations = [processor.execute(item) for item in items]
+
+        return self._collect(iterations, history)
+
+    def _run_parallel(self, name: str, branch_input: Any, history: List[StateRecord]) -> List[Any]:
+        """Todas las ramas a la vez sobre la misma entrada; el resultado es la lista de salidas en orden."""
+        first, *others = self._branches[name]
+        if others:
+            # La primera rama corre en este hilo y las demás en el pool
+            with ThreadPoolExecutor(max_workers=len(others)) as pool:
+                futures = [pool.submit(branch.execute, branch_input) for branch in others]
+                runs = [first.execute(branch_input)] + [future.result() for future in futures]
+        else:
+            runs = [first.execute(branch_input)]
+        return self._collect(runs, history)
+
+    @staticmethod
+    def _collect(executions: List[Execution], history: List[StateRecord]) -> List[Any]:
+        """Historial de los sub-flujos en el del padre; si uno falló, el estado falla con su error."""
+        for execution in executions:
+            history.extend(execution.history)
+        failed = next((execution for execution in executions if execution.status == FAILED), None)
+        if failed is not None:
+            raise StatesError(failed.error or 'States.TaskFailed', failed.cause or '')
+        return [execution.output for execution in executions]
+
+    def _invoke(self, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        function_name = parameters.get('FunctionName')
+        handler = self.functions.get(function_name)
+        if handler is None:
+            raise StatesError('Lambda.ResourceNotFoundException', f"Función no registrada: {function_name}")
+        payload = json.loads(json.dumps(parameters.get('Payload', {}), default=str))
+        if self.invoke_latency_seconds:
+            time.sleep(self.invoke_latency_seconds)
+        try:
+            result = handler(payload, None)
+        except StatesError:
+            raise  # Errores con nombre propio (p. ej. Lambda.ServiceException simulado)
+        except Exception as e:
+            raise StatesError(type(e).__name__, json.dumps({
+                'errorMessage': str(e), 'errorType': type(e).__name__
+            }, ensure_ascii=False))
+        try:
+            result = json.loads(json.dumps(result))
+        except (TypeError, ValueError) as e:
+            raise StatesError('Runtime.MarshalError', str(e))
+        return {'ExecutedVersion': '$LATEST', 'StatusCode': 200, 'Payload': result}
+
+    @staticmethod
+    def _next(state: Dict[str, Any]) -> Optional[str]:
+        return None if state.get('End') else state['Next']
+
+    @staticmethod
+    def _output(state: Dict[str, Any], data: Any) -> Any:
+        return get_path(data, state['OutputPath']) if state.get('OutputPath') else data
+
+
+class _CaughtError(Exception):
+    """Error atrapado por un Catch: la ejecución sigue en next_name."""
+
+    def __init__(self, next_name: str, output: Any, attempts: int, error: str):
+        super().__init__(error)
+        self.next_name = next_name
+        self.output = output
+        self.attempts = attempts
+        self.error = error
+
+
+class LocalExecutor:
+    """Corre ejecuciones de una LocalStateMachine en un pool de hilos y acumula métricas por estado."""
+
+    def __init__(self, machine: LocalStateMachine, workers: int = 8):
+        self.machine = machine
+        self.workers = workers
+        self.state_seconds: Dict[str, List[float]] = {}
+        self.state_output_bytes: Dict[str, List[int]] = {}
+        self.final_states: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.executions = 0
+        self._lock = threading.Lock()
+
+    def run(self, inputs: Iterable[Any]) -> List[Execution]:
+        """Corre una ejecución por input (en paralelo) y las retorna en el mismo orden."""
+        with ThreadPoolExecutor(max_workers=self.workers) as pool:
+            return list(pool.map(self.execute, inputs))
+
+    def execute(self, execution_input: Any) -> Execution:
+        execution = self.machine.execute(execution_input)
+        self.record(execution)
+        return execution
+
+    def record(self, execution: Execution) -> None:
+        with self._lock:
+            self.executions += 1
+            self.final_states[execution.final_state] = self.final_states.get(execution.final_state, 0) + 1
+            for record in execution.history:
+                self.state_seconds.setdefault(record.name, []).append(record.seconds)
+                self.state_output_bytes.setdefault(record.name, []).append(record.output_bytes)
+                if record.error:
+                    self.errors[f"{record.name}:{record.error}"] = self.errors.get(f"{record.name}:{record.error}", 0) + 1
+            if execution.error and not (execution.history and execution.history[-1].error):
+                key = f"{execution.final_state}:{execution.error}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Any]:
+        """Por estado: visitas, percentiles de tiempo (ms) y tamaño de salida (bytes)."""
+        with self._lock:
+            states = {}
+            for name in self.machine.state_names():
+                seconds = sorted(self.state_seconds.get(name, []))
+                sizes = sorted(self.state_output_bytes.get(name, []))
+                if not seconds:
+                    continue
+                states[name] = {
+                    'count': len(seconds),
+                    'p50_ms': round(_rank(seconds, 50) * 1000, 3),
+                    'p95_ms': round(_rank(seconds, 95) * 1000, 3),
+                    'p99_ms': round(_rank(seconds, 99) * 1000, 3),
+                    'total_seconds': round(sum(seconds), 3),
+                    'output_bytes_p50': _rank(sizes, 50),
+                    'output_bytes_max': sizes[-1]
+                }
+            return {
+                'executions': self.executions,
+                'final_states': dict(sorted(self.final_states.items())),
+                'errors': dict(sorted(self.errors.items())),
+                'states': states
+            }
+
+
+def _rank(ordered: List[Any], percentile: float) -> Any:
+    index = max(0, min(len(ordered) - 1, -(-len(ordered) * percentile // 100) - 1))
+    return ordered[int(index)]
@@ -0,0 +1,507 @@
+"""
+Stand-in local de DynamoDB (en memoria, thread-safe)
+
+Imita la interfaz del resource de boto3 (dynamodb.Table) para correr los
+módulos de src/ en pruebas de carga sin AWS: get_item, put_item, update_item,
+delete_item, query, scan, batch_get_item y batch_write_item/batch_writer con
+expresiones, ReturnValues y errores ClientError con los mismos códigos que
+DynamoDB.
+LocalDynamoDB (el meta.client de sus tablas) tiene además transact_write_items,
+atómico entre tablas, con CancellationReasons como TransactionCanceledException.
+
+Cada operación es atómica (lock por tabla) y puede tener una latencia
+simulada, que se aplica fuera del lock para que las operaciones de distintos
+hilos se intercalen como en la red real. Con write_capacity (unidades/s) la
+tabla rechaza las escrituras que excedan la capacidad, como el throttling de
+DynamoDB; throttled_counts cuenta las unidades rechazadas por operación.
+
+    db = LocalDynamoDB(latency_seconds=0.001)
+    users = db.create_table('GuatepassUsers', 'placa', indexes={'TagIndex': ('tag_id', None)})
+    users.put_item(Item={'placa': 'P-123ABC', 'saldo_cents': 10000})
+"""
+
+import contextlib
+import copy
+import threading
+import time
+import types
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from boto3.dynamodb.table import BatchWriter
+from boto3.dynamodb.types import TypeSerializer
+from botocore.exceptions import ClientError
+
+from .expressions import (MISSING, ExpressionError, apply_update, evaluate_condition, get_path,
+                          normalize, parse_condition, parse_projection, parse_update)
+
+_serializer = TypeSerializer()
+
+
+class ConditionalCheckFailedException(ClientError):
+    pass
+
+
+class TransactionCanceledException(ClientError):
+    pass
+
+
+# table.meta.client.exceptions como en boto3
+_EXCEPTIONS = types.SimpleNamespace(ClientError=ClientError,
+                                    ConditionalCheckFailedException=ConditionalCheckFailedException,
+                                    TransactionCanceledException=TransactionCanceledException)
+
+
+def _client_error(code: str, message: str, operation: str, item: Optional[Dict[str, Any]] = None) -> ClientError:
+    response: Dict[str, Any] = {
+        'Error': {'Code': code, 'Message': message},
+        'ResponseMetadata': {'HTTPStatusCode': 400}
+    }
+    if item is not None:
+        response['Item'] = {k: _serializer.serialize(v) for k, v in item.items()}
+    cls = ConditionalCheckFailedException if code == 'ConditionalCheckFailedException' else ClientError
+    return cls(response, operation)
+
+
+def _validation_error(error: Exception, operation: str) -> ClientError:
+    return _client_error('ValidationException', str(error), operation)
+
+
+def _resolve_condition(condition: Any, names: Optional[Dict[str, str]], values: Optional[Dict[str, Any]],
+                       is_key_condition: bool = False) -> Tuple[str, Dict[str, str], Dict[str, Any]]:
+    """Acepta expresiones en texto o construidas con boto3.dynamodb.conditions (Key/Attr)."""
+    names = dict(names or {})
+    values = dict(values or {})
+    if isinstance(condition, ConditionBase):
+        built = ConditionExpressionBuilder().build_expression(condition, is_key_condition=is_key_condition)
+        names.update(built.attribute_name_placeholders)
+        values.update(built.attribute_value_placeholders)
+        return built.condition_expression, names, values
+    return condition, names, values
+
+
+class LocalTable:
+    """Tabla en memoria con la interfaz del resource Table de boto3."""
+
+    exceptions = _EXCEPTIONS
+
+    def __init__(self, name: str, hash_key: str, range_key: Optional[str] = None,
+                 indexes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+                 latency_seconds: float = 0.0, page_size: int = 1000,
+                 write_capacity: Optional[float] = None, burst_seconds: float = 1.0):
+        self.name = name
+        self.table_name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes or {}
+        self.latency_seconds = latency_seconds
+        self.page_size = page_size
+        self._items: Dict[tuple, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+        self.operation_counts: Dict[str, int] = {}
+        # Capacidad de escritura (unidades/s, 1 por item): lo que exceda se
+        # rechaza con ProvisionedThroughputExceededException / UnprocessedItems
+        self.write_capacity = write_capacity
+        self.burst_seconds = burst_seconds
+        self._write_tokens = (write_capacity or 0) * burst_seconds
+        self._tokens_at = time.monotonic()
+        self.throttled_counts: Dict[str, int] = {}
+        # table.meta.client.batch_write_item(...) como en boto3
+        self.meta = types.SimpleNamespace(client=self)
+
+    # ---------- utilidades ----------
+
+    def _key_of(self, data: Dict[str, Any], operation: str) -> tuple:
+        names = (self.hash_key,) if self.range_key is None else (self.hash_key, self.range_key)
+        try:
+            return tuple(normalize(data[name]) for name in names)
+        except KeyError as e:
+            raise _client_error('ValidationException', f"Falta el atributo llave {e}", operation)
+
+    def _enter(self, operation: str) -> None:
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+        with self._lock:
+            self.operation_counts[operation] = self.operation_counts.get(operation, 0) + 1
+
+    def _grant_writes(self, units: int, operation: str) -> int:
+        """Unidades de escritura disponibles para esta llamada (todas si no hay límite)."""
+        if self.write_capacity is None:
+            return units
+        with self._lock:
+            now = time.monotonic()
+            self._write_tokens = min(self.write_capacity * self.burst_seconds,
+                                     self._write_tokens + (now - self._tokens_at) * self.write_capacity)
+            self._tokens_at = now
+            granted = min(units, int(self._write_tokens))
+            self._write_tokens -= granted
+            if granted < units:
+                self.throttled_counts[operation] = self.throttled_counts.get(operation, 0) + units - granted
+            return granted
+
+    def _throttle_write(self, operation: str) -> None:
+        if self._grant_writes(1, operation) == 0:
+            raise _client_error('ProvisionedThroughputExceededException',
+                                'The level of configured provisioned throughput for the table was exceeded',
+                                operation)
+
+    def _check(self, condition: Any, names, values, item: Optional[Dict[str, Any]],
+               operation: str, return_on_failure: Optional[str]) -> None:
+        if not condition:
+            return
+        expression, names, values = _resolve_condition(condition, names, values)
+        try:
+            passed = evaluate_condition(parse_condition(expression, names, values), item or {})
+        except ExpressionError as e:
+            raise _validation_error(e, operation)
+        if not passed:
+            old = copy.deepcopy(item) if item is not None and return_on_failure == 'ALL_OLD' else None
+            raise _client_error('ConditionalCheckFailedException', 'The conditional request failed', operation, old)
+
+    @staticmethod
+    def _project(item: Dict[str, Any], projection: Optional[str], names: Optional[Dict[str, str]]) -> Dict[str, Any]:
+        if not projection:
+            return copy.deepcopy(item)
+        result: Dict[str, Any] = {}
+        for path in parse_projection(projection, names):
+            value = get_path(item, path[:1])
+            if value is not MISSING:
+                result[path[0]] = copy.deepcopy(value)
+        return result
+
+    # ---------- operaciones de items ----------
+
+    def get_item(self, Key: Dict[str, Any], ProjectionExpression: Optional[str] = None,
+                 ExpressionAttributeNames: Optional[Dict[str, str]] = None, **_: Any) -> Dict[str, Any]:
+        self._enter('GetItem')
+        with self._lock:
+            item = self._items.get(self._key_of(Key, 'GetItem'))
+            if item is None:
+                return {}
+            return {'Item': self._project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def put_item(self, Item: Dict[str, Any], ConditionExpression: Any = None,
+                 ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                 ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+                 ReturnValues: str = 'NONE', ReturnValuesOnConditionCheckFailure: Optional[str] = None,
+                 **_: Any) -> Dict[str, Any]:
+        self._enter('PutItem')
+        self._throttle_write('PutItem')
+        new_item = normalize(copy.deepcopy(Item))
+        with self._lock:
+            key = self._key_of(new_item, 'PutItem')
+            old = self._items.get(key)
+            self._check(ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                        old, 'PutItem', ReturnValuesOnConditionCheckFailure)
+            self._items[key] = new_item
+            if ReturnValues == 'ALL_OLD' and old is not None:
+                return {'Attributes': copy.deepcopy(old)}
+            return {}
+
+    def update_item(self, Key: Dict[str, Any], UpdateExpression: str, ConditionExpression: Any = None,
+                    ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                    ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+                    ReturnValues: str = 'NONE', ReturnValuesOnConditionCheckFailure: Optional[str] = None,
+                    **_: Any) -> Dict[str, Any]:
+        self._enter('UpdateItem')
+        self._throttle_write('UpdateItem')
+        with self._lock:
+            key = self._key_of(Key, 'UpdateItem')
+            old = self._items.get(key)
+            self._check(ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                        old, 'UpdateItem', ReturnValuesOnConditionCheckFailure)
+
+            item = copy.deepcopy(old) if old is not None else normalize(dict(Key))
+            try:
+                actions = parse_update(UpdateExpression, ExpressionAttributeNames, ExpressionAttributeValues)
+                updated = apply_update(actions, item)
+            except ExpressionError as e:
+                raise _validation_error(e, 'UpdateItem')
+            self._items[key] = item
+
+            if ReturnValues == 'ALL_NEW':
+                return {'Attributes': copy.deepcopy(item)}
+            if ReturnValues == 'ALL_OLD':
+                return {'Attributes': copy.deepcopy(old)} if old is not None else {}
+            if ReturnValues == 'UPDATED_NEW':
+                return {'Attributes': {k: copy.deepcopy(item[k]) for k in updated if k in item}}
+            if ReturnValues == 'UPDATED_OLD':
+                source = old or {}
+                return {'Attributes': {k: copy.deepcopy(source[k]) for k in updated if k in source}}
+            return {}
+
+    def delete_item(self, Key: Dict[str, Any], ConditionExpression: Any = None,
+                    ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+                    ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+                    ReturnValues: str = 'NONE', ReturnValuesOnConditionCheckFailure: Optional[str] = None,
+                    **_: Any) -> Dict[str, Any]:
+        self._enter('DeleteItem')
+        self._throttle_write('DeleteItem')
+        with self._lock:
+            key = self._key_of(Key, 'DeleteItem')
+            old = self._items.get(key)
+            self._check(ConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues,
+                        old, 'DeleteItem', ReturnValuesOnConditionCheckFailure)
+            self._items.pop(key, None)
+            if ReturnValues == 'ALL_OLD' and old is not None:
+                return {'Attributes': old}
+            return {}
+
+    # ---------- escrituras por lotes ----------
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]], **_: Any) -> Dict[str, Any]:
+        """
+        BatchWriteItem sobre esta tabla (máximo 25 solicitudes, como DynamoDB).
+        Sin capacidad para ningún item lanza ProvisionedThroughputExceededException;
+        con capacidad parcial devuelve el resto en UnprocessedItems.
+        """
+        self._enter('BatchWriteItem')
+        requests = RequestItems.get(self.name, [])
+        if len(requests) > 25:
+            raise _client_error('ValidationException', 'Too many items requested for the BatchWriteItem call',
+                                'BatchWriteItem')
+        granted = self._grant_writes(len(requests), 'BatchWriteItem')
+        if requests and granted == 0:
+            raise _client_error('ProvisionedThroughputExceededException',
+                                'The level of configured provisioned throughput for the table was exceeded',
+                                'BatchWriteItem')
+        requests, unprocessed = requests[:granted], requests[granted:]
+        with self._lock:
+            for request in requests:
+                if 'PutRequest' in request:
+                    item = normalize(copy.deepcopy(request['PutRequest']['Item']))
+                    self._items[self._key_of(item, 'BatchWriteItem')] = item
+                else:
+                    self._items.pop(self._key_of(request['DeleteRequest']['Key'], 'BatchWriteItem'), None)
+        return {'UnprocessedItems': {self.name: unprocessed} if unprocessed else {}}
+
+    def batch_writer(self, overwrite_by_pkeys: Optional[List[str]] = None) -> BatchWriter:
+        """El mismo BatchWriter de boto3, usando esta tabla como cliente."""
+        return BatchWriter(self.name, self, overwrite_by_pkeys=overwrite_by_pkeys)
+
+    # ---------- lecturas de múltiples items ----------
+
+    def batch_get_item(self, RequestItems: Dict[str, Dict[str, Any]], **_: Any) -> Dict[str, Any]:
+        """BatchGetItem sobre esta tabla (máximo 100 llaves sin repetir, como DynamoDB)."""
+        self._enter('BatchGetItem')
+        request = RequestItems.get(self.name, {})
+        keys = [self._key_of(key, 'BatchGetItem') for key in request.get('Keys', [])]
+        if len(keys) > 100:
+            raise _client_error('ValidationException', 'Too many items requested for the BatchGetItem call',
+                                'BatchGetItem')
+        if len(set(keys)) < len(keys):
+            raise _client_error('ValidationException', 'Provided list of item keys contains duplicates',
+                                'BatchGetItem')
+        projection, names = request.get('ProjectionExpression'), request.get('ExpressionAttributeNames')
+        with self._lock:
+            found = [self._items[key] for key in keys if key in self._items]
+            items = [self._project(item, projection, names) for item in found]
+        return {'Responses': {self.name: items}, 'UnprocessedKeys': {}}
+
+    def _page(self, items: List[Dict[str, Any]], key_names: Tuple[str, ...], limit: Optional[int],
+              start_key: Optional[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        if start_key:
+            marker = tuple(normalize(start_key.get(name)) for name in key_names)
+            for position, item in enumerate(items):
+                if tuple(item.get(name) for name in key_names) == marker:
+                    items = items[position + 1:]
+                    break
+        page_size = min(limit or self.page_size, self.page_size)
+        page = items[:page_size]
+        last_key = None
+        if len(items) > page_size:
+            last_key = {name: page[-1][name] for name in key_names if name in page[-1]}
+        return page, last_key
+
+    def _finish(self, page: List[Dict[str, Any]], last_key, filter_expression, names, values,
+                projection, select: Optional[str]) -> Dict[str, Any]:
+        scanned = len(page)
+        if filter_expression:
+            expression, names, values = _resolve_condition(filter_expression, names, values)
+            node = parse_condition(expression, names, values)
+            page = [item for item in page if evaluate_condition(node, item)]
+        response: Dict[str, Any] = {'Count': len(page), 'ScannedCount': scanned}
+        if select != 'COUNT':
+            response['Items'] = [self._project(item, projection, names) for item in page]
+        if last_key is not None:
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+    def query(self, KeyConditionExpression: Any, IndexName: Optional[str] = None,
+              FilterExpression: Any = None, ProjectionExpression: Optional[str] = None,
+              ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+              ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+              ScanIndexForward: bool = True, Limit: Optional[int] = None,
+              ExclusiveStartKey: Optional[Dict[str, Any]] = None, Select: Optional[str] = None,
+              **_: Any) -> Dict[str, Any]:
+        self._enter('Query')
+        hash_key, range_key = self.indexes[IndexName] if IndexName else (self.hash_key, self.range_key)
+        expression, names, values = _resolve_condition(
+            KeyConditionExpression, ExpressionAttributeNames, ExpressionAttributeValues, is_key_condition=True
+        )
+        node = parse_condition(expression, names, values)
+
+        with self._lock:
+            matches = [item for item in self._items.values()
+                       if hash_key in item and evaluate_condition(node, item)]
+            if range_key:
+                matches = [item for item in matches if range_key in item]
+                matches.sort(key=lambda item: item[range_key], reverse=not ScanIndexForward)
+
+            key_names = tuple(k for k in (hash_key, range_key, self.hash_key, self.range_key) if k)
+            key_names = tuple(dict.fromkeys(key_names))
+            page, last_key = self._page(matches, key_names, Limit, ExclusiveStartKey)
+            return self._finish(page, last_key, FilterExpression, names, values, ProjectionExpression, Select)
+
+    def scan(self, FilterExpression: Any = None, ProjectionExpression: Optional[str] = None,
+             ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+             ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+             Limit: Optional[int] = None, ExclusiveStartKey: Optional[Dict[str, Any]] = None,
+             Select: Optional[str] = None, **_: Any) -> Dict[str, Any]:
+        self._enter('Scan')
+        key_names = (self.hash_key,) if self.range_key is None else (self.hash_key, self.range_key)
+        with self._lock:
+            items = [self._items[key] for key in sorted(self._items, key=repr)]
+            page, last_key = self._page(items, key_names, Limit, ExclusiveStartKey)
+            return self._finish(page, last_key, FilterExpression, ExpressionAttributeNames,
+                                ExpressionAttributeValues, ProjectionExpression, Select)
+
+    # ---------- utilidades para pruebas ----------
+
+    def all_items(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return copy.deepcopy(list(self._items.values()))
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class LocalDynamoDB:
+    """
+    Conjunto de tablas en memoria (equivalente a boto3.resource('dynamodb')).
+    Es también el meta.client de las tablas que crea, como en boto3.
+    """
+
+    exceptions = _EXCEPTIONS
+
+    def __init__(self, latency_seconds: float = 0.0, page_size: int = 1000):
+        self.latency_seconds = latency_seconds
+        self.page_size = page_size
+        self.tables: Dict[str, LocalTable] = {}
+        self.operation_counts: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def create_table(self, name: str, hash_key: str, range_key: Optional[str] = None,
+                     indexes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+                     write_capacity: Optional[float] = None) -> LocalTable:
+        table = LocalTable(name, hash_key, range_key, indexes, self.latency_seconds, self.page_size,
+                           write_capacity=write_capacity)
+        table.meta.client = self
+        self.tables[name] = table
+        return table
+
+    def Table(self, name: str) -> LocalTable:  # noqa: N802 (misma interfaz que boto3)
+        return self.tables[name]
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict[str, Any]]], **_: Any) -> Dict[str, Any]:
+        unprocessed: Dict[str, Any] = {}
+        for name, requests in RequestItems.items():
+            response = self.tables[name].batch_write_item(RequestItems={name: requests})
+            unprocessed.update(response.get('UnprocessedItems', {}))
+        return {'UnprocessedItems': unprocessed}
+
+    def batch_get_item(self, RequestItems: Dict[str, Dict[str, Any]], **_: Any) -> Dict[str, Any]:
+        responses: Dict[str, Any] = {}
+        unprocessed: Dict[str, Any] = {}
+        for name, request in RequestItems.items():
+            response = self.tables[name].batch_get_item(RequestItems={name: request})
+            responses.update(response['Responses'])
+            unprocessed.update(response.get('UnprocessedKeys', {}))
+        return {'Responses': responses, 'UnprocessedKeys': unprocessed}
+
+    def transact_write_items(self, TransactItems: List[Dict[str, Any]], **_: Any) -> Dict[str, Any]:
+        """
+        TransactWriteItems (Put, Update, Delete, ConditionCheck; hasta 100 items).
+        Toma los locks de todas las tablas involucradas: o se aplican todas las
+        escrituras o ninguna. Si falla alguna condición lanza
+        TransactionCanceledException con un CancellationReason por item.
+        """
+        with self._lock:
+            self.operation_counts['TransactWriteItems'] = self.operation_counts.get('TransactWriteItems', 0) + 1
+        if not TransactItems or len(TransactItems) > 100:
+            raise _client_error('ValidationException', 'TransactItems debe tener entre 1 y 100 elementos',
+                                'TransactWriteItems')
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        plan = []
+        for entry in TransactItems:
+            (action, spec), = entry.items()
+            table = self.tables[spec['TableName']]
+            key = table._key_of(spec['Item'] if action == 'Put' else spec['Key'], 'TransactWriteItems')
+            plan.append((action, spec, table, key))
+        if len({(table.name, key) for _, _, table, key in plan}) < len(plan):
+            raise _client_error('ValidationException',
+                                'Transaction request cannot include multiple operations on one item',
+                                'TransactWriteItems')
+
+        tables = sorted({table.name: table for _, _, table, _ in plan}.values(), key=lambda t: t.name)
+        with contextlib.ExitStack() as stack:
+            for table in tables:
+                stack.enter_context(table._lock)
+
+            reasons = []
+            for action, spec, table, key in plan:
+                try:
+                    table._check(spec.get('ConditionExpression'), spec.get('ExpressionAttributeNames'),
+                                 spec.get('ExpressionAttributeValues'), table._items.get(key),
+                                 'TransactWriteItems', spec.get('ReturnValuesOnConditionCheckFailure'))
+                    reasons.append({'Code': 'None'})
+                except ConditionalCheckFailedException as e:
+                    reason = {'Code': 'ConditionalCheckFailed', 'Message': 'The conditional request failed'}
+                    if 'Item' in e.response:
+                        reason['Item'] = e.response['Item']
+                    reasons.append(reason)
+            if any(reason['Code'] != 'None' for reason in reasons):
+                codes = ', '.join(reason['Code'] for reason in reasons)
+                raise TransactionCanceledException({
+                    'Error': {'Code': 'TransactionCanceledException',
+                              'Message': f'Transaction cancelled, please refer cancellation reasons for specific '
+                                         f'reasons [{codes}]'},
+                    'CancellationReasons': reasons,
+                    'ResponseMetadata': {'HTTPStatusCode': 400}
+                }, 'TransactWriteItems')
+
+            # Primero se calculan todos los items nuevos y luego se aplican juntos
+            writes = []
+            for action, spec, table, key in plan:
+                if action == 'Put':
+                    writes.append((table, key, normalize(copy.deepcopy(spec['Item']))))
+                elif action == 'Delete':
+                    writes.append((table, key, None))
+                elif action == 'Update':
+                    item = copy.deepcopy(table._items.get(key)) or normalize(dict(spec['Key']))
+                    try:
+                        apply_update(parse_update(spec['UpdateExpression'], spec.get('ExpressionAttributeNames'),
+                                                  spec.get('ExpressionAttributeValues')), item)
+                    except ExpressionError as e:
+                        raise _validation_error(e, 'TransactWriteItems')
+                    writes.append((table, key, item))
+            for table, key, item in writes:
+                if item is None:
+                    table._items.pop(key, None)
+                else:
+                    table._items[key] = item
+        return {}
+
+
+def decimal_to_int(value: Any) -> Any:
+    """Convierte los Decimal enteros de un item a int (útil para imprimir resultados)."""
+    if isinstance(value, Decimal) and value == value.to_integral_value():
+        return int(value)
+    if isinstance(value, dict):
+        return {k: decimal_to_int(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [decimal_to_int(v) for v in value]
+    return value
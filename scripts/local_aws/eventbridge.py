@@ -0,0 +1,87 @@
+"""
+Stand-in local de EventBridge (en memoria, thread-safe)
+
+Imita el cliente events de boto3 en lo que usa ingest_toll: put_events con
+hasta 10 entries por llamada y la respuesta por entry (FailedEntryCount,
+ErrorCode). Cada entry aceptada se entrega, con el sobre que recibe el target
+de la regla (resolve_user), en la cola `delivered` como (monotonic de la
+publicación, evento):
+
+    events = LocalEventBridge()
+    events.put_events(Entries=[{'Source': 'guatepass.toll', 'DetailType': 'TollDetected',
+                                'Detail': '{"placa": "P-123ABC"}', 'EventBusName': 'bus'}])
+    published_at, event = events.delivered.get()
+
+Con failure_rate una fracción de las entries falla con InternalFailure, para
+ejercitar los reintentos del publicador.
+"""
+
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+MAX_ENTRIES = 10
+
+
+class LocalEventBridge:
+    """Cliente events con put_events; los eventos publicados quedan en `delivered`."""
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0,
+                 region: str = 'us-east-1', seed: Optional[int] = None):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.region = region
+        self.delivered: 'queue.Queue' = queue.Queue()
+        self.operation_counts: Dict[str, int] = {}
+        self.failed_entries = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _fails(self) -> bool:
+        if not self.failure_rate:
+            return False
+        with self._lock:
+            return self._random.random() < self.failure_rate
+
+    def put_events(self, Entries: List[Dict[str, Any]], **_: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.operation_counts['PutEvents'] = self.operation_counts.get('PutEvents', 0) + 1
+        if not Entries or len(Entries) > MAX_ENTRIES:
+            raise ClientError({'Error': {'Code': 'ValidationException',
+                                         'Message': f'Entries debe tener entre 1 y {MAX_ENTRIES} elementos'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, 'PutEvents')
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        results = []
+        failed = 0
+        for entry in Entries:
+            if self._fails():
+                failed += 1
+                results.append({'ErrorCode': 'InternalFailure', 'ErrorMessage': 'Fallo simulado'})
+                continue
+            event_id = str(uuid.uuid4())
+            self.delivered.put((time.monotonic(), {
+                'version': '0',
+                'id': event_id,
+                'detail-type': entry['DetailType'],
+                'source': entry['Source'],
+                'account': '000000000000',
+                'time': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ'),
+                'region': self.region,
+                'resources': entry.get('Resources', []),
+                'detail': json.loads(entry['Detail'])
+            }))
+            results.append({'EventId': event_id})
+
+        if failed:
+            with self._lock:
+                self.failed_entries += failed
+        return {'FailedEntryCount': failed, 'Entries': results}
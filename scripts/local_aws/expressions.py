@@ -0,0 +1,448 @@
+"""
+Intérprete de expresiones de DynamoDB para el stand-in local
+
+Soporta el subconjunto que usa GUATEPASS:
+
+- Condiciones: comparadores (=, <>, <, <=, >, >=), BETWEEN, IN, AND/OR/NOT,
+  attribute_exists, attribute_not_exists, attribute_type, begins_with,
+  contains y size.
+- Updates: SET (con +, -, if_not_exists y list_append), REMOVE (incluye
+  índices de listas), ADD y DELETE.
+- Rutas anidadas (a.b, a[0]) y placeholders #nombre / :valor.
+"""
+
+import re
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+MISSING = object()
+
+_TOKEN = re.compile(r"""
+    (?P<ws>\s+)
+  | (?P<name>\#[A-Za-z0-9_]+)
+  | (?P<value>:[A-Za-z0-9_]+)
+  | (?P<number>\d+)
+  | (?P<ident>[A-Za-z_][A-Za-z0-9_]*)
+  | (?P<op><>|<=|>=|=|<|>|\(|\)|,|\.|\[|\]|\+|-)
+""", re.VERBOSE)
+
+_KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+_CONDITION_FUNCTIONS = {'attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains'}
+
+
+class ExpressionError(ValueError):
+    """Expresión inválida (equivale a ValidationException)."""
+
+
+def normalize(value: Any) -> Any:
+    """Convierte valores de Python al modelo de boto3 (números como Decimal)."""
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, float):
+        raise TypeError("Float types are not supported. Use Decimal types instead.")
+    if isinstance(value, int):
+        return Decimal(value)
+    if isinstance(value, dict):
+        return {k: normalize(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, (set, frozenset)):
+        return {normalize(v) for v in value}
+    return value
+
+
+def _tokenize(expression: str) -> List[Tuple[str, str]]:
+    tokens = []
+    pos = 0
+    while pos < len(expression):
+        match = _TOKEN.match(expression, pos)
+        if not match:
+            raise ExpressionError(f"Token inválido en '{expression}' posición {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        if kind == 'ws':
+            continue
+        text = match.group()
+        if kind == 'ident' and text.upper() in _KEYWORDS:
+            kind, text = 'kw', text.upper()
+        tokens.append((kind, text))
+    return tokens
+
+
+class _Parser:
+    def __init__(self, expression: str, names: Optional[Dict[str, str]], values: Optional[Dict[str, Any]]):
+        self.tokens = _tokenize(expression)
+        self.pos = 0
+        self.names = names or {}
+        self.values = values or {}
+
+    # ---------- utilidades ----------
+
+    def peek(self, offset: int = 0) -> Tuple[Optional[str], Optional[str]]:
+        index = self.pos + offset
+        return self.tokens[index] if index < len(self.tokens) else (None, None)
+
+    def take(self, kind: Optional[str] = None, text: Optional[str] = None) -> str:
+        token_kind, token_text = self.peek()
+        if token_kind is None or (kind and token_kind != kind) or (text and token_text != text):
+            raise ExpressionError(f"Se esperaba {text or kind}, se encontró {token_text!r}")
+        self.pos += 1
+        return token_text
+
+    def accept(self, kind: str, text: Optional[str] = None) -> bool:
+        token_kind, token_text = self.peek()
+        if token_kind == kind and (text is None or token_text == text):
+            self.pos += 1
+            return True
+        return False
+
+    def done(self) -> bool:
+        return self.pos >= len(self.tokens)
+
+    # ---------- rutas y operandos ----------
+
+    def name(self) -> str:
+        kind, text = self.peek()
+        if kind == 'name':
+            self.pos += 1
+            if text not in self.names:
+                raise ExpressionError(f"Placeholder de nombre sin definir: {text}")
+            return self.names[text]
+        if kind in ('ident', 'kw'):
+            self.pos += 1
+            return text
+        raise ExpressionError(f"Se esperaba un nombre de atributo, se encontró {text!r}")
+
+    def path(self) -> tuple:
+        parts: List[Any] = [self.name()]
+        while True:
+            if self.accept('op', '.'):
+                parts.append(self.name())
+            elif self.accept('op', '['):
+                parts.append(int(self.take('number')))
+                self.take('op', ']')
+            else:
+                return tuple(parts)
+
+    def value(self) -> Any:
+        placeholder = self.take('value')
+        if placeholder not in self.values:
+            raise ExpressionError(f"Placeholder de valor sin definir: {placeholder}")
+        return ('value', normalize(self.values[placeholder]))
+
+    def operand(self) -> tuple:
+        kind, text = self.peek()
+        if kind == 'value':
+            return self.value()
+        if kind == 'ident' and text == 'size' and self.peek(1) == ('op', '('):
+            self.pos += 2
+            path = self.path()
+            self.take('op', ')')
+            return ('size', path)
+        return ('path', self.path())
+
+    # ---------- condiciones ----------
+
+    def condition(self) -> tuple:
+        node = self.conjunction()
+        while self.accept('kw', 'OR'):
+            node = ('or', node, self.conjunction())
+        return node
+
+    def conjunction(self) -> tuple:
+        node = self.negation()
+        while self.accept('kw', 'AND'):
+            node = ('and', node, self.negation())
+        return node
+
+    def negation(self) -> tuple:
+        if self.accept('kw', 'NOT'):
+            return ('not', self.negation())
+        return self.predicate()
+
+    def predicate(self) -> tuple:
+        if self.accept('op', '('):
+            node = self.condition()
+            self.take('op', ')')
+            return node
+
+        kind, text = self.peek()
+        if kind == 'ident' and text in _CONDITION_FUNCTIONS and self.peek(1) == ('op', '('):
+            self.pos += 2
+            args = [self.operand()]
+            while self.accept('op', ','):
+                args.append(self.operand())
+            self.take('op', ')')
+            return ('func', text, args)
+
+        left = self.operand()
+        if self.accept('kw', 'BETWEEN'):
+            low = self.operand()
+            self.take('kw', 'AND')
+            return ('between', left, low, self.operand())
+        if self.accept('kw', 'IN'):
+            self.take('op', '(')
+            options = [self.operand()]
+            while self.accept('op', ','):
+                options.append(self.operand())
+            self.take('op', ')')
+            return ('in', left, options)
+
+        comparator = self.take('op')
+        if comparator not in ('=', '<>', '<', '<=', '>', '>='):
+            raise ExpressionError(f"Comparador inválido: {comparator}")
+        return ('compare', comparator, left, self.operand())
+
+    # ---------- updates ----------
+
+    def update(self) -> List[tuple]:
+        actions = []
+        while not self.done():
+            clause = self.take('kw')
+            while True:
+                if clause == 'SET':
+                    path = self.path()
+                    self.take('op', '=')
+                    actions.append(('SET', path, self.set_value()))
+                elif clause == 'REMOVE':
+                    actions.append(('REMOVE', self.path(), None))
+                elif clause in ('ADD', 'DELETE'):
+                    path = self.path()
+                    actions.append((clause, path, self.value()))
+                else:
+                    raise ExpressionError(f"Cláusula de update inválida: {clause}")
+                if not self.accept('op', ','):
+                    break
+        return actions
+
+    def set_value(self) -> tuple:
+        left = self.set_operand()
+        if self.accept('op', '+'):
+            return ('+', left, self.set_operand())
+        if self.accept('op', '-'):
+            return ('-', left, self.set_operand())
+        return left
+
+    def set_operand(self) -> tuple:
+        kind, text = self.peek()
+        if kind == 'ident' and text in ('if_not_exists', 'list_append') and self.peek(1) == ('op', '('):
+            self.pos += 2
+            first = self.path() if text == 'if_not_exists' else self.set_operand()
+            self.take('op', ',')
+            second = self.set_value()
+            self.take('op', ')')
+            return (text, first, second)
+        if kind == 'value':
+            return self.value()
+        return ('path', self.path())
+
+
+# ========================================
+# Evaluación
+# ========================================
+
+def get_path(item: Dict[str, Any], path: tuple) -> Any:
+    current: Any = item
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(current, list) or part >= len(current):
+                return MISSING
+            current = current[part]
+        else:
+            if not isinstance(current, dict) or part not in current:
+                return MISSING
+            current = current[part]
+    return current
+
+
+def _set_path(item: Dict[str, Any], path: tuple, value: Any) -> None:
+    parent = get_path(item, path[:-1]) if len(path) > 1 else item
+    if parent is MISSING:
+        raise ExpressionError(f"La ruta padre de {path} no existe")
+    last = path[-1]
+    if isinstance(last, int):
+        if last >= len(parent):
+            parent.append(value)
+        else:
+            parent[last] = value
+    else:
+        parent[last] = value
+
+
+def _operand_value(item: Dict[str, Any], node: tuple) -> Any:
+    kind = node[0]
+    if kind == 'value':
+        return node[1]
+    if kind == 'path':
+        return get_path(item, node[1])
+    if kind == 'size':
+        target = get_path(item, node[1])
+        return MISSING if target is MISSING else Decimal(len(target))
+    raise ExpressionError(f"Operando inválido: {node}")
+
+
+def _comparable(left: Any, right: Any) -> bool:
+    if left is MISSING or right is MISSING:
+        return False
+    numeric = (Decimal, int)
+    if isinstance(left, numeric) and isinstance(right, numeric):
+        return True
+    return type(left) is type(right)
+
+
+def _compare(op: str, left: Any, right: Any) -> bool:
+    if op in ('=', '<>'):
+        equal = _comparable(left, right) and left == right
+        return equal if op == '=' else (left is not MISSING and not equal)
+    if not _comparable(left, right) or isinstance(left, (dict, list, set, bool)):
+        return False
+    return {'<': left < right, '<=': left <= right, '>': left > right, '>=': left >= right}[op]
+
+
+_TYPE_CODES = {str: 'S', Decimal: 'N', bytes: 'B', bool: 'BOOL', list: 'L', dict: 'M', type(None): 'NULL'}
+
+
+def evaluate_condition(node: tuple, item: Dict[str, Any]) -> bool:
+    kind = node[0]
+    if kind == 'and':
+        return evaluate_condition(node[1], item) and evaluate_condition(node[2], item)
+    if kind == 'or':
+        return evaluate_condition(node[1], item) or evaluate_condition(node[2], item)
+    if kind == 'not':
+        return not evaluate_condition(node[1], item)
+    if kind == 'compare':
+        return _compare(node[1], _operand_value(item, node[2]), _operand_value(item, node[3]))
+    if kind == 'between':
+        value = _operand_value(item, node[1])
+        return _compare('>=', value, _operand_value(item, node[2])) and \
+            _compare('<=', value, _operand_value(item, node[3]))
+    if kind == 'in':
+        value = _operand_value(item, node[1])
+        return any(_compare('=', value, _operand_value(item, option)) for option in node[2])
+    if kind == 'func':
+        name, args = node[1], node[2]
+        if name == 'attribute_exists':
+            return get_path(item, args[0][1]) is not MISSING
+        if name == 'attribute_not_exists':
+            return get_path(item, args[0][1]) is MISSING
+        target = _operand_value(item, args[0])
+        operand = _operand_value(item, args[1])
+        if target is MISSING:
+            return False
+        if name == 'begins_with':
+            return isinstance(target, str) and isinstance(operand, str) and target.startswith(operand)
+        if name == 'contains':
+            if isinstance(target, str):
+                return isinstance(operand, str) and operand in target
+            if isinstance(target, (list, set)):
+                return operand in target
+            return False
+        if name == 'attribute_type':
+            if isinstance(target, set):
+                sample = next(iter(target), '')
+                code = {str: 'SS', Decimal: 'NS', bytes: 'BS'}.get(type(sample), 'SS')
+            else:
+                code = _TYPE_CODES.get(type(target))
+            return code == operand
+    raise ExpressionError(f"Nodo de condición inválido: {node}")
+
+
+def _set_operand_value(item: Dict[str, Any], node: tuple) -> Any:
+    kind = node[0]
+    if kind in ('value', 'path'):
+        value = _operand_value(item, node)
+        if value is MISSING:
+            raise ExpressionError("The provided expression refers to an attribute that does not exist in the item")
+        return value
+    if kind in ('+', '-'):
+        left = _set_operand_value(item, node[1])
+        right = _set_operand_value(item, node[2])
+        if not isinstance(left, Decimal) or not isinstance(right, Decimal):
+            raise ExpressionError("Incorrect operand type for operator or function")
+        return left + right if kind == '+' else left - right
+    if kind == 'if_not_exists':
+        current = get_path(item, node[1])
+        return _set_operand_value(item, node[2]) if current is MISSING else current
+    if kind == 'list_append':
+        first = _set_operand_value(item, node[1])
+        second = _set_operand_value(item, node[2])
+        if not isinstance(first, list) or not isinstance(second, list):
+            raise ExpressionError("list_append requiere dos listas")
+        return list(first) + list(second)
+    raise ExpressionError(f"Operando de SET inválido: {node}")
+
+
+def apply_update(actions: List[tuple], item: Dict[str, Any]) -> set:
+    """
+    Aplica las acciones sobre `item` (in-place). Todos los valores se calculan
+    sobre el item original, como en DynamoDB.
+
+    Returns:
+        Nombres de los atributos de primer nivel modificados
+    """
+    original = item
+    computed = []
+    for action, path, operand in actions:
+        if action == 'SET':
+            computed.append((action, path, _set_operand_value(original, operand)))
+        else:
+            computed.append((action, path, operand[1] if operand else None))
+
+    updated = set()
+    removals: List[tuple] = []
+    for action, path, value in computed:
+        updated.add(path[0])
+        if action == 'SET':
+            _set_path(item, path, value)
+        elif action == 'REMOVE':
+            removals.append(path)
+        elif action == 'ADD':
+            current = get_path(item, path)
+            if current is MISSING:
+                _set_path(item, path, set(value) if isinstance(value, set) else value)
+            elif isinstance(current, Decimal) and isinstance(value, Decimal):
+                _set_path(item, path, current + value)
+            elif isinstance(current, set) and isinstance(value, set):
+                current |= value
+            else:
+                raise ExpressionError("ADD requiere un número o un set")
+        elif action == 'DELETE':
+            current = get_path(item, path)
+            if isinstance(current, set):
+                current -= value
+                if not current:
+                    removals.append(path)
+
+    # Los índices de REMOVE se refieren a las posiciones originales: se eliminan de mayor a menor
+    for path in sorted(removals, key=lambda p: [(-x if isinstance(x, int) else 0) for x in p]):
+        parent = get_path(item, path[:-1]) if len(path) > 1 else item
+        last = path[-1]
+        if isinstance(last, int):
+            if isinstance(parent, list) and last < len(parent):
+                del parent[last]
+        elif isinstance(parent, dict):
+            parent.pop(last, None)
+
+    return updated
+
+
+def parse_condition(expression: str, names: Optional[Dict[str, str]] = None,
+                    values: Optional[Dict[str, Any]] = None) -> tuple:
+    parser = _Parser(expression, names, values)
+    node = parser.condition()
+    if not parser.done():
+        raise ExpressionError(f"Sobran tokens en la condición: {expression}")
+    return node
+
+
+def parse_update(expression: str, names: Optional[Dict[str, str]] = None,
+                 values: Optional[Dict[str, Any]] = None) -> List[tuple]:
+    return _Parser(expression, names, values).update()
+
+
+def parse_projection(expression: str, names: Optional[Dict[str, str]] = None) -> List[tuple]:
+    parser = _Parser(expression, names, None)
+    paths = [parser.path()]
+    while parser.accept('op', ','):
+        paths.append(parser.path())
+    return paths
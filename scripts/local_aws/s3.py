@@ -0,0 +1,207 @@
+"""
+Stand-in local de S3 respaldado por un directorio
+
+Imita el cliente de boto3 en lo que usan los módulos de src/: get_object (con
+Range), head_object, put_object (con IfMatch/IfNoneMatch y Metadata),
+delete_object y list_objects_v2. La metadata de usuario (x-amz-meta-*) se
+guarda en memoria, solo la ve la instancia que escribió el objeto. El Body de get_object es un botocore StreamingBody real sobre
+el archivo, así que se lee por partes igual que en Lambda. Las escrituras
+condicionales usan un lock de archivo, así que también son atómicas entre
+procesos que comparten el mismo directorio.
+
+    s3 = LocalS3('/tmp/guatepass-s3')
+    s3.upload_file('data/clientes.csv', 'guatepass-data', 'clientes.csv')
+"""
+
+import contextlib
+import hashlib
+import os
+import shutil
+import threading
+import types
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+from botocore.response import StreamingBody
+
+try:
+    import fcntl
+except ImportError:  # Windows: solo atómico dentro del proceso
+    fcntl = None
+
+
+class NoSuchKey(ClientError):
+    pass
+
+
+def _error(code: str, message: str, operation: str, status: int) -> ClientError:
+    cls = NoSuchKey if code == 'NoSuchKey' else ClientError
+    return cls({'Error': {'Code': code, 'Message': message},
+                'ResponseMetadata': {'HTTPStatusCode': status}}, operation)
+
+
+_etag_cache: Dict[tuple, str] = {}
+
+
+def _etag(path: str) -> str:
+    stat = os.stat(path)
+    cache_key = (path, stat.st_mtime_ns, stat.st_size)
+    if cache_key not in _etag_cache:
+        digest = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        _etag_cache[cache_key] = f'"{digest.hexdigest()}"'
+    return _etag_cache[cache_key]
+
+
+class LocalS3:
+    """Cliente S3 sobre root/<bucket>/<key>."""
+
+    exceptions = types.SimpleNamespace(ClientError=ClientError, NoSuchKey=NoSuchKey)
+
+    def __init__(self, root: str):
+        self.root = root
+        self._lock = threading.Lock()
+        self.operation_counts: Dict[str, int] = {}
+        self._user_metadata: Dict[str, Dict[str, str]] = {}
+
+    def _count(self, operation: str) -> None:
+        with self._lock:
+            self.operation_counts[operation] = self.operation_counts.get(operation, 0) + 1
+
+    @contextlib.contextmanager
+    def _write_lock(self):
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            os.makedirs(self.root, exist_ok=True)
+            with open(os.path.join(self.root, '.write.lock'), 'w') as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def path(self, bucket: str, key: str) -> str:
+        return os.path.join(self.root, bucket, *key.split('/'))
+
+    def _existing(self, bucket: str, key: str, operation: str) -> str:
+        path = self.path(bucket, key)
+        if not os.path.isfile(path):
+            if operation == 'HeadObject':
+                raise _error('404', 'Not Found', operation, 404)
+            raise _error('NoSuchKey', 'The specified key does not exist.', operation, 404)
+        return path
+
+    def _metadata(self, path: str) -> Dict[str, Any]:
+        stat = os.stat(path)
+        return {
+            'ContentLength': stat.st_size,
+            'ETag': _etag(path),
+            'LastModified': datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            'Metadata': dict(self._user_metadata.get(path, {}))
+        }
+
+    def head_object(self, Bucket: str, Key: str, **_: Any) -> Dict[str, Any]:
+        self._count('HeadObject')
+        return self._metadata(self._existing(Bucket, Key, 'HeadObject'))
+
+    def get_object(self, Bucket: str, Key: str, Range: Optional[str] = None, IfMatch: Optional[str] = None,
+                   **_: Any) -> Dict[str, Any]:
+        self._count('GetObject')
+        path = self._existing(Bucket, Key, 'GetObject')
+        metadata = self._metadata(path)
+        if IfMatch is not None and metadata['ETag'] != IfMatch:
+            raise _error('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold',
+                         'GetObject', 412)
+        size = metadata['ContentLength']
+        stream = open(path, 'rb')
+
+        length = size
+        if Range:
+            first, _, last = Range.replace('bytes=', '').partition('-')
+            start = int(first)
+            end = min(int(last) if last else size - 1, size - 1)
+            if start >= size:
+                stream.close()
+                raise _error('InvalidRange', 'The requested range is not satisfiable', 'GetObject', 416)
+            stream.seek(start)
+            length = end - start + 1
+            metadata['ContentRange'] = f'bytes {start}-{end}/{size}'
+            metadata['ContentLength'] = length
+
+        return {**metadata, 'Body': StreamingBody(_Bounded(stream, length), length)}
+
+    def put_object(self, Bucket: str, Key: str, Body: Any = b'', IfMatch: Optional[str] = None,
+                   IfNoneMatch: Optional[str] = None, Metadata: Optional[Dict[str, str]] = None,
+                   **_: Any) -> Dict[str, Any]:
+        self._count('PutObject')
+        path = self.path(Bucket, Key)
+        with self._write_lock():
+            exists = os.path.isfile(path)
+            if IfNoneMatch == '*' and exists:
+                raise _error('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold',
+                             'PutObject', 412)
+            if IfMatch is not None and (not exists or _etag(path) != IfMatch):
+                raise _error('PreconditionFailed', 'At least one of the pre-conditions you specified did not hold',
+                             'PutObject', 412)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            data = Body.encode('utf-8') if isinstance(Body, str) else Body
+            tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(tmp_path, 'wb') as f:
+                if isinstance(data, (bytes, bytearray)):
+                    f.write(data)
+                else:
+                    shutil.copyfileobj(data, f)
+            os.replace(tmp_path, path)
+            self._user_metadata[path] = {k.lower(): v for k, v in (Metadata or {}).items()}
+        return {'ETag': _etag(path)}
+
+    def upload_file(self, Filename: str, Bucket: str, Key: str, ExtraArgs: Optional[Dict[str, Any]] = None,
+                    **_: Any) -> None:
+        with open(Filename, 'rb') as f:
+            self.put_object(Bucket=Bucket, Key=Key, Body=f, **(ExtraArgs or {}))
+
+    def delete_object(self, Bucket: str, Key: str, **_: Any) -> Dict[str, Any]:
+        self._count('DeleteObject')
+        path = self.path(Bucket, Key)
+        if os.path.isfile(path):
+            os.remove(path)
+        self._user_metadata.pop(path, None)
+        return {}
+
+    def list_objects_v2(self, Bucket: str, Prefix: str = '', **_: Any) -> Dict[str, Any]:
+        self._count('ListObjectsV2')
+        base = os.path.join(self.root, Bucket)
+        contents = []
+        for directory, _dirs, files in os.walk(base):
+            for name in files:
+                key = os.path.relpath(os.path.join(directory, name), base).replace(os.sep, '/')
+                if key.startswith(Prefix) and not key.endswith('.tmp'):
+                    stat = os.stat(os.path.join(directory, name))
+                    contents.append({'Key': key, 'Size': stat.st_size})
+        contents.sort(key=lambda entry: entry['Key'])
+        return {'Contents': contents, 'KeyCount': len(contents), 'IsTruncated': False}
+
+
+class _Bounded:
+    """Archivo limitado a `length` bytes desde la posición actual (para Range)."""
+
+    def __init__(self, stream, length: int):
+        self._stream = stream
+        self._remaining = length
+
+    def read(self, amt: Optional[int] = None) -> bytes:
+        if self._remaining <= 0:
+            self._stream.close()
+            return b''
+        size = self._remaining if amt is None or amt < 0 else min(amt, self._remaining)
+        data = self._stream.read(size)
+        self._remaining -= len(data)
+        return data
+
+    def close(self) -> None:
+        self._stream.close()
@@ -0,0 +1,104 @@
+"""
+Stand-in local de Step Functions (en memoria, thread-safe)
+
+Imita el cliente stepfunctions de boto3 en lo que usa resolve_user:
+start_execution y start_sync_execution. start_execution no ejecuta la máquina
+de estados: cada ejecución iniciada queda en la cola `started` como
+(monotonic del inicio, executionArn, input) para que quien corre la prueba la
+procese.
+
+Como en una máquina Standard, el nombre de la ejecución es único: repetir el
+nombre con el mismo input retorna la ejecución existente (sin encolarla de
+nuevo) y con otro input falla con ExecutionAlreadyExists.
+
+    sfn = LocalStepFunctions()
+    sfn.start_execution(stateMachineArn=arn, name='toll-1', input='{}')
+    started_at, execution_arn, execution_input = sfn.started.get()
+
+start_sync_execution (máquinas Express) sí ejecuta, en el hilo que llama, la
+máquina registrada para el ARN (cualquier objeto con execute(input), p. ej.
+asl.LocalStateMachine) y responde con status, output o error/cause:
+
+    sfn.register(batch_arn, LocalStateMachine.from_file(...))
+    response = sfn.start_sync_execution(stateMachineArn=batch_arn, input='{"items": []}')
+"""
+
+import hashlib
+import json
+import queue
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+
+class LocalStepFunctions:
+    """Cliente stepfunctions con start_execution (a la cola `started`) y start_sync_execution."""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        self.latency_seconds = latency_seconds
+        self.started: 'queue.Queue' = queue.Queue()
+        self.operation_counts: Dict[str, int] = {}
+        self.machines: Dict[str, Any] = {}
+        self._inputs: Dict[str, bytes] = {}
+        self._lock = threading.Lock()
+
+    def register(self, state_machine_arn: str, machine: Any) -> None:
+        """Máquina que corre start_sync_execution para ese ARN."""
+        self.machines[state_machine_arn] = machine
+
+    def start_execution(self, stateMachineArn: str, name: str = None, input: str = '{}',
+                        **_: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.operation_counts['StartExecution'] = self.operation_counts.get('StartExecution', 0) + 1
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        name = name or str(uuid.uuid4())
+        execution_arn = f"{stateMachineArn.replace(':stateMachine:', ':execution:')}:{name}"
+        digest = hashlib.blake2b(input.encode('utf-8'), digest_size=16).digest()
+        with self._lock:
+            previous = self._inputs.get(execution_arn)
+            if previous is None:
+                self._inputs[execution_arn] = digest
+        if previous is not None and previous != digest:
+            raise ClientError({'Error': {'Code': 'ExecutionAlreadyExists',
+                                         'Message': f'Execution Already Exists: {execution_arn}'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, 'StartExecution')
+        if previous is None:
+            self.started.put((time.monotonic(), execution_arn, json.loads(input)))
+        return {'executionArn': execution_arn, 'startDate': datetime.now(timezone.utc)}
+
+    def start_sync_execution(self, stateMachineArn: str, name: Optional[str] = None, input: str = '{}',
+                             **_: Any) -> Dict[str, Any]:
+        with self._lock:
+            self.operation_counts['StartSyncExecution'] = self.operation_counts.get('StartSyncExecution', 0) + 1
+        machine = self.machines.get(stateMachineArn)
+        if machine is None:
+            raise ClientError({'Error': {'Code': 'StateMachineDoesNotExist',
+                                         'Message': f'State Machine Does Not Exist: {stateMachineArn}'},
+                               'ResponseMetadata': {'HTTPStatusCode': 400}}, 'StartSyncExecution')
+        if self.latency_seconds:
+            time.sleep(self.latency_seconds)
+
+        name = name or str(uuid.uuid4())
+        started = datetime.now(timezone.utc)
+        execution = machine.execute(json.loads(input))
+        response = {
+            'executionArn': f"{stateMachineArn.replace(':stateMachine:', ':express:')}:{name}:{uuid.uuid4()}",
+            'stateMachineArn': stateMachineArn,
+            'name': name,
+            'startDate': started,
+            'stopDate': datetime.now(timezone.utc),
+            'status': execution.status,
+            'input': input
+        }
+        if execution.status == 'SUCCEEDED':
+            response['output'] = json.dumps(execution.output)
+        else:
+            response['error'] = execution.error or ''
+            response['cause'] = execution.cause or ''
+        return response
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+Carga el catálogo de peajes (data/peajes.json) en la tabla GuatepassTolls
+
+Escribe cada peaje y luego incrementa el item de versión ('__catalog__') para
+que los contenedores de resolve_user recarguen el catálogo en su siguiente
+revisión (TOLL_CATALOG_TTL_SECONDS).
+
+Uso:
+    python scripts/seed_tolls.py --table GuatepassTolls-dev
+    python scripts/seed_tolls.py --table GuatepassTolls-dev --file data/peajes.json
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import boto3
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+
+from money import parse_amount  # noqa: E402
+
+VERSION_ITEM_ID = '__catalog__'
+DEFAULT_FILE = os.path.join(os.path.dirname(__file__), '..', 'data', 'peajes.json')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Carga el catálogo de peajes en DynamoDB')
+    parser.add_argument('--table', required=True, help='Nombre de la tabla GuatepassTolls')
+    parser.add_argument('--file', default=DEFAULT_FILE, help='Archivo JSON con los peajes')
+    args = parser.parse_args()
+
+    with open(args.file, encoding='utf-8') as f:
+        peajes = json.load(f)
+
+    table = boto3.resource('dynamodb').Table(args.table)
+
+    with table.batch_writer() as batch:
+        for peaje in peajes:
+            # La tarifa del archivo está en quetzales; en la tabla se guarda en centavos
+            item = dict(peaje)
+            if item.get('tarifa_base') is not None:
+                item['tarifa_base_cents'] = parse_amount(item.pop('tarifa_base'))
+            batch.put_item(Item=item)
+
+    response = table.update_item(
+        Key={'peaje_id': VERSION_ITEM_ID},
+        UpdateExpression='ADD version :one',
+        ExpressionAttributeValues={':one': 1},
+        ReturnValues='UPDATED_NEW'
+    )
+
+    print(f"✅ {len(peajes)} peajes cargados en {args.table}")
+    print(f"   - Versión del catálogo: {response['Attributes']['version']}")
+
+
+if __name__ == "__main__":
+    main()
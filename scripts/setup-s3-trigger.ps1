@@ -77,23 +77,28 @@ Write-Host "Paso 2: Configurando notificacion S3..." -ForegroundColor Yellow
 
 # Crear archivo JSON temporal con la configuracion
 $TempFile = New-TemporaryFile
+# Una configuracion por sufijo (S3 acepta un solo sufijo por regla)
+$Suffixes = @(".csv", ".csv.gz", ".csv.zst", ".parquet")
 $JsonContent = @{
     LambdaFunctionConfigurations = @(
-        @{
-            LambdaFunctionArn = $FunctionArn
-            Events = @("s3:ObjectCreated:*")
-            Filter = @{
-                Key = @{
-                    FilterRules = @(
-                        @{
-                            Name = "prefix"
-                            Value = "clientes"
-                        },
-                        @{
-                            Name = "suffix"
-                            Value = ".csv"
-                        }
-                    )
+        foreach ($Suffix in $Suffixes) {
+            @{
+                Id = "import-users$($Suffix.Replace('.', '-'))"
+                LambdaFunctionArn = $FunctionArn
+                Events = @("s3:ObjectCreated:*")
+                Filter = @{
+                    Key = @{
+                        FilterRules = @(
+                            @{
+                                Name = "prefix"
+                                Value = "clientes"
+                            },
+                            @{
+                                Name = "suffix"
+                                Value = $Suffix
+                            }
+                        )
+                    }
                 }
             }
         }
@@ -122,8 +127,9 @@ Write-Host ""
 Write-Host "=====================================" -ForegroundColor Cyan
 Write-Host "Trigger S3 -> Lambda configurado exitosamente!" -ForegroundColor Green
 Write-Host ""
-Write-Host "Ahora puedes probar subiendo un CSV:" -ForegroundColor Cyan
+Write-Host "Ahora puedes probar subiendo un CSV (tambien .csv.gz, .csv.zst o .parquet):" -ForegroundColor Cyan
 Write-Host "aws s3 cp data/clientes.csv s3://$BucketName/clientes.csv" -ForegroundColor White
+Write-Host "gzip -k data/clientes.csv; aws s3 cp data/clientes.csv.gz s3://$BucketName/clientes.csv.gz" -ForegroundColor White
 Write-Host ""
 Write-Host "Ver logs:" -ForegroundColor Cyan
 Write-Host "sam logs -n ImportUsersFunction --stack-name $StackName --tail" -ForegroundColor White
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Prueba de concurrencia del débito de saldo (src/shared/balance_ledger.py)
+
+Lanza muchos cobros en paralelo contra el stand-in local de DynamoDB
+(scripts/local_aws), con varias placas compartidas por muchos hilos y
+reintentos duplicados del mismo transaction_id (como los de Step Functions).
+
+Compara dos estrategias:
+  - legacy: get_item + comparación en Python + SET saldo absoluto (el
+    update_balance anterior)
+  - ledger: balance_ledger.debit (un update_item condicional)
+
+Al final verifica, por placa, que saldo_final == saldo_inicial - suma de los
+cobros reportados como aplicados, que ningún saldo quede negativo y que ningún
+transaction_id se cobre dos veces.
+
+La deduplicación recuerda los últimos balance_ledger.MAX_TRACKED_TXNS cobros de
+cada placa: un reintento que llegue después de más cobros de la misma placa
+(p. ej. --plates 2 --workers 128) ya no se reconoce. Los reintentos reales de
+Step Functions llegan segundos después del intento original.
+
+Uso:
+    python scripts/stress_balance_ledger.py --plates 20 --passes 200 --workers 64
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'src', 'shared'))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import balance_ledger  # noqa: E402
+from local_aws import LocalDynamoDB  # noqa: E402
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, balance_cents, format_amount  # noqa: E402
+
+
+def legacy_debit(users_table, placa, amount_cents, transaction_id):
+    """Implementación anterior de update_balance: lectura, comparación y escritura absoluta."""
+    user = users_table.get_item(Key={'placa': placa}).get('Item')
+    if user is None:
+        return balance_ledger.DebitResult(balance_ledger.USER_NOT_FOUND, None, None)
+    current = balance_cents(user)
+    if current < amount_cents:
+        return balance_ledger.DebitResult(balance_ledger.INSUFFICIENT_FUNDS, current, current)
+    new_balance = current - amount_cents
+    users_table.update_item(
+        Key={'placa': placa},
+        UpdateExpression=f'SET {BALANCE_FIELD} = :new_balance REMOVE {LEGACY_BALANCE_FIELD}',
+        ExpressionAttributeValues={':new_balance': new_balance}
+    )
+    return balance_ledger.DebitResult(balance_ledger.DEBITED, current, new_balance)
+
+
+def build_workload(plates, passes, duplicate_rate, retry_distance, seed):
+    """
+    Lista de cobros (placa, monto, transaction_id). Una fracción se repite a
+    pocas posiciones del original, como un reintento de Step Functions (que
+    llega segundos después, no al final del día).
+    """
+    rnd = random.Random(seed)
+    charges = []
+    for p in range(plates):
+        placa = f"P-{p:03d}STR"
+        for n in range(passes):
+            charges.append((placa, rnd.choice((800, 1000, 1200, 1500, 1800, 2250)), f"TXN-STRESS-{placa}-{n:05d}"))
+    rnd.shuffle(charges)
+
+    workload = list(charges)
+    for position in range(len(charges) - 1, -1, -1):
+        if rnd.random() < duplicate_rate:
+            workload.insert(position + 1 + rnd.randrange(retry_distance), charges[position])
+    return workload
+
+
+def run(strategy, debit_fn, args, workload):
+    db = LocalDynamoDB(latency_seconds=args.latency_ms / 1000)
+    users = db.create_table('GuatepassUsers', 'placa')
+
+    initial = {}
+    for p in range(args.plates):
+        placa = f"P-{p:03d}STR"
+        initial[placa] = args.initial_cents
+        # La mitad de las placas conserva el saldo legado en quetzales para ejercitar la migración
+        if p % 2:
+            users.put_item(Item={'placa': placa, LEGACY_BALANCE_FIELD: Decimal(format_amount(args.initial_cents))})
+        else:
+            users.put_item(Item={'placa': placa, BALANCE_FIELD: args.initial_cents})
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(lambda charge: (charge, debit_fn(users, *charge)), workload))
+    elapsed = time.perf_counter() - start
+
+    charged = defaultdict(int)
+    debited_per_txn = defaultdict(int)
+    statuses = defaultdict(int)
+    for (placa, amount, transaction_id), result in results:
+        statuses[result.status] += 1
+        if result.status == balance_ledger.DEBITED:
+            charged[placa] += amount
+            debited_per_txn[transaction_id] += 1
+
+    lost_cents = 0
+    negative = 0
+    for item in users.all_items():
+        final = balance_cents(item)
+        expected = initial[item['placa']] - charged[item['placa']]
+        lost_cents += abs(final - expected)
+        negative += final < 0
+    double_charged = sum(1 for count in debited_per_txn.values() if count > 1)
+
+    print(f"\n📊 Estrategia: {strategy}")
+    print(f"   - Cobros enviados:        {len(workload):,} ({args.workers} hilos, "
+          f"{len(workload) / elapsed:,.0f} cobros/s)")
+    for status, count in sorted(statuses.items()):
+        print(f"   - {status:<24} {count:,}")
+    print(f"   - Round trips UpdateItem: {users.operation_counts.get('UpdateItem', 0):,}, "
+          f"GetItem: {users.operation_counts.get('GetItem', 0):,}")
+    print(f"   - Descuadre de saldos:    {format_amount(lost_cents)} GTQ")
+    print(f"   - Saldos negativos:       {negative}")
+    print(f"   - Cobros duplicados:      {double_charged}")
+
+    return lost_cents == 0 and negative == 0 and double_charged == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prueba de concurrencia del débito de saldo')
+    parser.add_argument('--plates', type=int, default=20, help='Placas distintas (default: 20)')
+    parser.add_argument('--passes', type=int, default=200, help='Pasos por placa (default: 200)')
+    parser.add_argument('--duplicate-rate', type=float, default=0.2, help='Fracción de cobros reintentados')
+    parser.add_argument('--retry-distance', type=int, default=64,
+                        help='Máxima distancia (en cobros de todas las placas) entre un cobro y su reintento')
+    parser.add_argument('--initial-cents', type=int, default=150000, help='Saldo inicial por placa en centavos')
+    parser.add_argument('--workers', type=int, default=64)
+    parser.add_argument('--latency-ms', type=float, default=1.0, help='Latencia simulada por operación')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    workload = build_workload(args.plates, args.passes, args.duplicate_rate, args.retry_distance, args.seed)
+
+    run('legacy (get_item + SET absoluto)', legacy_debit, args, workload)
+    ok = run('ledger (update_item condicional)', balance_ledger.debit, args, workload)
+
+    if not ok:
+        print("\n❌ El ledger perdió o duplicó cobros")
+        sys.exit(1)
+    print("\n✅ Ledger consistente: sin cobros perdidos, duplicados ni saldos negativos")
+
+
+if __name__ == "__main__":
+    main()
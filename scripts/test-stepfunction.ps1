@@ -92,13 +92,13 @@ function Test-TollProcessing {
                 Write-Host "`nResultado:" -ForegroundColor Cyan
                 Write-Host "  - Placa: $($output.user_data.placa)" -ForegroundColor White
                 Write-Host "  - Modalidad: $($output.user_data.modalidad)" -ForegroundColor White
-                Write-Host "  - Tarifa Base: Q$($output.fare_calculation.base_fare)" -ForegroundColor White
-                Write-Host "  - Tarifa Final: Q$($output.fare_calculation.final_fare)" -ForegroundColor White
+                Write-Host "  - Tarifa Base: Q$("{0:N2}" -f ($output.fare_calculation.base_fare_cents / 100))" -ForegroundColor White
+                Write-Host "  - Tarifa Final: Q$("{0:N2}" -f ($output.fare_calculation.final_fare_cents / 100))" -ForegroundColor White
                 Write-Host "  - Transaction ID: $($output.transaction.transaction_id)" -ForegroundColor White
                 
                 if ($output.balance_update.updated) {
-                    Write-Host "  - Balance Anterior: Q$($output.balance_update.previous_balance)" -ForegroundColor White
-                    Write-Host "  - Balance Nuevo: Q$($output.balance_update.new_balance)" -ForegroundColor White
+                    Write-Host "  - Balance Anterior: Q$("{0:N2}" -f ($output.balance_update.previous_balance_cents / 100))" -ForegroundColor White
+                    Write-Host "  - Balance Nuevo: Q$("{0:N2}" -f ($output.balance_update.new_balance_cents / 100))" -ForegroundColor White
                 } else {
                     Write-Host "  - Balance: $($output.balance_update.message)" -ForegroundColor White
                 }
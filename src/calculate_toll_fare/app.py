@@ -6,109 +6,146 @@ Modalidades:
 - Modalidad 1: Usuario NO registrado → Tarifa base + 50%
 - Modalidad 2: Usuario registrado SIN tag → Tarifa base + 20%
 - Modalidad 3: Usuario registrado CON tag → Tarifa base (sin recargo)
+
+Recibe solo modalidad y toll_data y retorna solo fare_calculation (contrato
+de estado 2, ver shared/state_contract.py).
+
+En la Step Function por lotes (process_toll_batch) recibe {"items": [...]} y
+calcula la tarifa de cada paso del lote (ver calculate_items).
 """
 
-import json
 import os
-from decimal import Decimal
+import boto3
+
+import state_contract
+from fare_engine import FareRatesLoader
+from toll_catalog import TollCatalog
+
+s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
 
-# Tarifas base por tipo de peaje (en GTQ)
-TOLL_BASE_RATES = {
-    'carretera_norte': Decimal('15.00'),
-    'carretera_sur': Decimal('12.00'),
-    'autopista_palín': Decimal('10.00'),
-    'anillo_periferico': Decimal('8.00'),
-    'default': Decimal('10.00')
-}
+# Tabla de tarifas versionada: la de la Layer (fare_rates.json) o la publicada en S3
+DATA_BUCKET_NAME = os.environ.get('DATA_BUCKET_NAME')
+FARE_RATES_KEY = os.environ.get('FARE_RATES_KEY', 'rates/fare-rates.json')
+FARE_RATES_REFRESH_SECONDS = float(os.environ.get('FARE_RATES_REFRESH_SECONDS', '60'))
+fare_rates = FareRatesLoader(s3_client, DATA_BUCKET_NAME, FARE_RATES_KEY, FARE_RATES_REFRESH_SECONDS)
 
-# Multiplicadores por modalidad
-MODALITY_MULTIPLIERS = {
-    1: Decimal('1.50'),    # No registrado: 150% (+50%)
-    2: Decimal('1.20'),    # Sin tag: 120% (+20%)
-    3: Decimal('1.00')     # Con tag: 100% (sin recargo)
-}
+# Catálogo de peajes (GuatepassTolls): solo lo usa calculate_fares_batch, que
+# recibe peaje_id sin el toll_data que resolve_user arma para cada paso
+TOLLS_TABLE_NAME = os.environ.get('TOLLS_TABLE_NAME')
+TOLL_CATALOG_TTL_SECONDS = float(os.environ.get('TOLL_CATALOG_TTL_SECONDS', '300'))
+toll_catalog = TollCatalog(
+    dynamodb.Table(TOLLS_TABLE_NAME) if TOLLS_TABLE_NAME else None, TOLL_CATALOG_TTL_SECONDS
+)
 
 
 def lambda_handler(event, context):
     """
     Handler principal del Lambda.
     
-    Input esperado:
+    Input esperado (state_contract.STAGES['calculate_fare']):
     {
+        "contract_version": 2,
         "user_data": {
-            "placa": "P123ABC",
-            "modalidad": 1,
-            "has_tag": true,
-            "is_registered": true
+            "modalidad": 1
         },
         "toll_data": {
             "peaje_id": "PEAJE001",
-            "nombre_peaje": "carretera_norte",
+            "nombre_peaje": "Carretera Norte",
+            "carretera": "carretera_norte",
+            "tarifa_base_cents": 1500,
             "timestamp": "2024-01-15T10:30:00Z",
             "lane_id": "LANE-01"
         }
     }
     
-    Output:
+    Output (la Step Function lo deja en $.fare_calculation):
     {
-        ...input,
-        "fare_calculation": {
-            "base_fare": "15.00",
-            "modality": 1,
-            "multiplier": "1.00",
-            "final_fare": "15.00",
-            "currency": "GTQ"
-        }
+        "base_fare_cents": 1500,
+        "modality": 1,
+        "multiplier": "1.00",
+        "final_fare_cents": 1500,
+        "currency": "GTQ",
+        "rate_version": "2025-11-01",
+        "time_band": "normal"
     }
+    
+    Sin contract_version (contrato 1) retorna el evento completo con
+    fare_calculation agregado.
     """
     
+    # Lote de process_toll_batch: una invocación para todos los pasos
+    if 'items' in event:
+        print(f"Lote recibido: {len(event['items'])} pasos")
+        return {**event, 'items': calculate_items(event['items'])}
+    
     try:
-        print(f"Evento recibido: {json.dumps(event)}")
+        print(f"Evento recibido: {state_contract.dumps(event)}")
         
         # Extraer datos del evento
         user_data = event.get('user_data', {})
         toll_data = event.get('toll_data', {})
         
         modalidad = user_data.get('modalidad')
-        nombre_peaje = toll_data.get('nombre_peaje', 'default')
         
         # Validar que tenemos los datos necesarios
         if not modalidad:
             raise ValueError("Falta 'modalidad' en user_data")
         
-        # Obtener tarifa base
-        base_fare = TOLL_BASE_RATES.get(
-            nombre_peaje.lower().replace(' ', '_'),
-            TOLL_BASE_RATES['default']
-        )
+        # Buscar la tarifa en la matriz precalculada (montos en centavos enteros)
+        fare_calculation = fare_rates.get().fare_calculation(modalidad, toll_data)
         
-        # Obtener multiplicador por modalidad
-        multiplier = MODALITY_MULTIPLIERS.get(modalidad, Decimal('1.50'))
-        
-        # Calcular tarifa final
-        final_fare = (base_fare * multiplier).quantize(Decimal('0.01'))
-        
-        # Preparar resultado
-        fare_calculation = {
-            'base_fare': str(base_fare),
-            'modality': modalidad,
-            'multiplier': str(multiplier),
-            'final_fare': str(final_fare),
-            'currency': 'GTQ',
-            'toll_name': nombre_peaje
-        }
-        
-        print(f"Tarifa calculada: {json.dumps(fare_calculation)}")
-        
-        # Retornar el evento enriquecido con el cálculo
-        result = {
-            **event,
-            'fare_calculation': fare_calculation
-        }
+        print(f"Tarifa calculada: {state_contract.dumps(fare_calculation)}")
         
-        return result
+        return state_contract.respond(event, 'calculate_fare', fare_calculation)
         
     except Exception as e:
         print(f"Error calculando tarifa: {str(e)}")
         raise
 
+
+def calculate_items(items):
+    """
+    Tarifa de cada paso de un lote (mismo resultado que lambda_handler por paso).
+    
+    Un paso sin modalidad no falla el lote: queda con "error" y el Map de
+    process_toll_batch lo reporta como fallido sin procesarlo.
+    
+    Args:
+        items: Pasos del lote (user_data, toll_data, ...)
+        
+    Returns:
+        Los mismos pasos con fare_calculation (o error)
+    """
+    engine = fare_rates.get()
+    result = []
+    for item in items:
+        modalidad = item.get('user_data', {}).get('modalidad')
+        if 'error' in item:
+            result.append(item)
+        elif not modalidad:
+            result.append({**item, 'error': {'Error': 'ValueError', 'Cause': "Falta 'modalidad' en user_data"}})
+        else:
+            result.append({**item, 'fare_calculation': engine.fare_calculation(modalidad, item.get('toll_data', {}))})
+    return result
+
+
+def calculate_fares_batch(peaje_ids, modalidades, epochs=None):
+    """
+    Tarifas en centavos para columnas de eventos (re-tarifado histórico o
+    simulación de tarifas). Usa la misma matriz que lambda_handler y resuelve
+    cada peaje con el catálogo de peajes (tarifa base, carretera, nombre) como
+    el toll_data que resolve_user arma para el handler, así que el resultado
+    es el de invocar el handler evento por evento.
+    
+    Args:
+        peaje_ids: Columna de peaje_id
+        modalidades: Columna de modalidades (1, 2, 3)
+        epochs: Columna de epochs del paso (para franjas horarias)
+        
+    Returns:
+        Arreglo de centavos enteros
+    """
+    engine = fare_rates.get()
+    plazas = toll_catalog.plazas() if toll_catalog.tolls_table is not None else None
+    return engine.calculate_batch(engine.encode_tolls(peaje_ids, plazas), modalidades, epochs)
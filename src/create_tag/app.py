@@ -9,9 +9,14 @@ import os
 import boto3
 from datetime import datetime
 
+from registry_filter import register_entries, tag_entry
+
 dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
 users_table_name = os.environ['USERS_TABLE_NAME']
 users_table = dynamodb.Table(users_table_name)
+DATA_BUCKET_NAME = os.environ.get('DATA_BUCKET_NAME')
+REGISTRY_FILTER_KEY = os.environ.get('REGISTRY_FILTER_KEY', 'registry/registered-users.bloom')
 
 
 def lambda_handler(event, context):
@@ -149,6 +154,10 @@ def lambda_handler(event, context):
         
         print(f"Tag {tag_id} asociado exitosamente a la placa {placa}")
         
+        # Publicar el nuevo tag en el filtro de registrados que usa resolve_user
+        if DATA_BUCKET_NAME:
+            register_entries(s3_client, users_table, DATA_BUCKET_NAME, REGISTRY_FILTER_KEY, [tag_entry(tag_id)])
+        
         return {
             'statusCode': 200,
             'headers': {'Content-Type': 'application/json'},
@@ -96,6 +96,9 @@ def lambda_handler(event, context):
         )
         
         print(f"Tag {removed_tag_id} desasociado exitosamente de la placa {placa}")
+        # El filtro de registrados (registry_filter) no se modifica: un filtro Bloom
+        # no permite eliminar llaves y el tag removido solo genera falsos positivos,
+        # que resolve_user confirma contra DynamoDB.
         
         return {
             'statusCode': 200,
@@ -0,0 +1,80 @@
+"""
+GUATEPASS - Export Users Snapshot Function
+===========================================
+Lambda function que exporta GuatepassUsers a un snapshot binario ordenado
+(ver src/shared/users_snapshot.py) y lo publica en S3.
+
+resolve_user descarga el snapshot a /tmp y lo mapea en memoria: una placa que
+está en el snapshot se lee con get_item consistente en vez de pasar por el
+filtro Bloom (el perfil siempre sale de DynamoDB).
+
+El scan se consume página por página y se ordena por tramos en /tmp, así que
+la memoria no crece con el tamaño de GuatepassUsers.
+
+Trigger: Schedule (EventBridge) y/o invocación manual después de una importación
+"""
+
+import json
+import os
+import boto3
+from typing import Dict, Any
+
+from users_snapshot import scan_users, write_snapshot
+
+# Clientes AWS
+s3_client = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+
+# Variables de entorno
+USERS_TABLE_NAME = os.environ['USERS_TABLE_NAME']
+DATA_BUCKET_NAME = os.environ['DATA_BUCKET_NAME']
+USERS_SNAPSHOT_KEY = os.environ.get('USERS_SNAPSHOT_KEY', 'snapshots/users.snap')
+LOCAL_SNAPSHOT_PATH = '/tmp/users-export.snap'
+
+users_table = dynamodb.Table(USERS_TABLE_NAME)
+
+
+def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Handler principal: scan de usuarios -> snapshot en /tmp -> upload a S3.
+    
+    Args:
+        event: Evento de Schedule o invocación manual
+        context: Contexto de ejecución Lambda
+        
+    Returns:
+        Estadísticas del snapshot generado
+    """
+    print(f"[INFO] Exportando snapshot de usuarios - Event: {json.dumps(event)}")
+    
+    try:
+        stats = write_snapshot(scan_users(users_table), LOCAL_SNAPSHOT_PATH)
+        print(f"[INFO] Usuarios leídos de DynamoDB: {stats['users']}")
+        
+        s3_client.upload_file(
+            LOCAL_SNAPSHOT_PATH, DATA_BUCKET_NAME, USERS_SNAPSHOT_KEY,
+            ExtraArgs={
+                'ContentType': 'application/octet-stream',
+                'Metadata': {'generated-at': str(stats['generated_at'])}
+            }
+        )
+        os.remove(LOCAL_SNAPSHOT_PATH)
+        
+        print(f"[SUCCESS] Snapshot publicado en s3://{DATA_BUCKET_NAME}/{USERS_SNAPSHOT_KEY}: {stats}")
+        
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Snapshot de usuarios exportado exitosamente',
+                'stats': stats
+            })
+        }
+        
+    except Exception as e:
+        print(f"[ERROR] Error exportando snapshot de usuarios: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    # Para pruebas locales
+    print("Esta función debe ejecutarse en AWS Lambda")
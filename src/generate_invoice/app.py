@@ -3,73 +3,89 @@ Lambda Function: Generate Invoice
 Genera facturas simuladas para transacciones de peaje.
 - Modalidad 1 (No Registrado): Factura con cargo premium + multa (50%)
 - Modalidad 2 (Registrado): Factura normal (ya pagada)
+
+Recibe solo los datos que van en la factura y retorna solo invoice (contrato
+de estado 2, ver shared/state_contract.py). El transaction_id sale de peaje,
+placa y hora (state_contract.transaction_id). La factura se genera después
+de UpdateBalance: si el débito falla no queda una factura "pagada" sin cobro.
+
+La factura se emite una sola vez por event_id (shared/idempotency.py): un
+reintento de la Step Function retorna la factura ya emitida en vez de crear
+otra. Si el registro de idempotencia no alcanzó a guardarse, el invoice_id
+sale del event_id y la hora del paso (invoice_ids.invoice_id_for): el
+reintento choca con el put condicional y retorna la factura existente.
 """
 
 import json
 import os
 import boto3
+from botocore.exceptions import ClientError
 from datetime import datetime
-from decimal import Decimal
+
+import idempotency
+import state_contract
+from invoice_ids import generate_invoice_id, invoice_id_for
+from money import format_amount, percentage, read_cents
 
 dynamodb = boto3.resource('dynamodb')
 invoices_table_name = os.environ['INVOICES_TABLE_NAME']
 invoices_table = dynamodb.Table(invoices_table_name)
+idempotency_table = dynamodb.Table(os.environ['IDEMPOTENCY_TABLE_NAME'])
+STAGE_RECORD_TTL_SECONDS = int(os.environ.get('STAGE_RECORD_TTL_SECONDS', '86400'))
+STAGE_LEASE_SECONDS = int(os.environ.get('STAGE_LEASE_SECONDS', '60'))
 
 
-def generate_invoice_number():
-    """Genera un número de factura único basado en timestamp"""
-    timestamp = datetime.utcnow().strftime('%Y%m%d%H%M%S')
-    return f"FAC-{timestamp}"
+def generate_invoice_number(event_id=None, pass_timestamp=None):
+    """
+    Número de factura ordenable por tiempo (ver shared/invoice_ids.py): el mismo
+    para cada intento de un paso (event_id + hora del paso) o uno nuevo si falta alguno.
+    """
+    if event_id and pass_timestamp:
+        return invoice_id_for(event_id, datetime.fromisoformat(pass_timestamp.replace('Z', '+00:00')))
+    return generate_invoice_id()
 
 
 def lambda_handler(event, context):
     """
     Handler principal del Lambda.
     
-    Input esperado:
+    Input esperado (state_contract.STAGES['generate_invoice']):
     {
+        "contract_version": 2,
+        "event_id": "evt-...",
         "user_data": {
             "placa": "P-111JKL",
             "nombre": "Ana Torres",
             "email": "ana@email.com",
-            "modalidad": 1 o 2,
-            "is_registered": true/false
+            "modalidad": 1 o 2
         },
         "toll_data": {
             "peaje_id": "PEAJE001",
             "nombre_peaje": "Carretera Norte"
         },
         "fare_calculation": {
-            "base_fare": "15.00",
-            "final_fare": "15.00"
-        },
-        "transaction": {
-            "transaction_id": "TXN-123",
-            "timestamp": "2025-11-09T10:30:00Z"
+            "final_fare_cents": 1500
         }
     }
     
-    Output:
+    Output (la Step Function lo deja en $.invoice):
     {
-        ...input,
-        "invoice": {
-            "invoice_id": "FAC-20251109103000",
-            "invoice_number": "FAC-20251109103000",
-            "placa": "P-111JKL",
-            "modalidad": 1,
-            "monto_base": "15.00",
-            "multa": "7.50",
-            "total": "22.50",
-            "estado": "pendiente",
-            "concepto": "Paso por peaje - Carretera Norte",
-            "fecha_emision": "2025-11-09T10:30:00Z",
-            "contribuyente": {...}
-        }
+        "invoice_id": "FAC-01JC7ZQ4R8M3K2T9XW5B6N0PDA",
+        "invoice_number": "FAC-01JC7ZQ4R8M3K2T9XW5B6N0PDA",
+        "placa": "P-111JKL",
+        "modalidad": 1,
+        "monto_base_cents": 1500,
+        "multa_cents": 750,
+        "total_cents": 2250,
+        "estado": "pendiente",
+        "concepto": "Paso por peaje - Carretera Norte",
+        "fecha_emision": "2025-11-09T10:30:00Z",
+        "contribuyente": {...}
     }
     """
     
     try:
-        print(f"Evento recibido: {json.dumps(event, default=str)}")
+        print(f"Evento recibido: {state_contract.dumps(event)}")
         
         user_data = event.get('user_data', {})
         toll_data = event.get('toll_data', {})
@@ -83,18 +99,17 @@ def lambda_handler(event, context):
         
         peaje_nombre = toll_data.get('nombre_peaje', toll_data.get('peaje_id', 'Peaje'))
         
-        final_fare = Decimal(str(fare_calc.get('final_fare', '0')))
-        transaction_id = transaction.get('transaction_id', 'N/A')
-        timestamp = transaction.get('timestamp', datetime.utcnow().isoformat() + 'Z')
-        
-        # Generar número de factura
-        invoice_id = generate_invoice_number()
+        final_fare = read_cents(fare_calc, 'final_fare_cents', 'final_fare')
+        transaction_id = state_contract.transaction_id(event)
+        # Hora del paso; transaction solo llega en el documento completo (contrato 1)
+        timestamp = (toll_data.get('timestamp') or transaction.get('timestamp')
+                     or datetime.utcnow().isoformat() + 'Z')
         
         # Calcular montos según modalidad
         if modalidad == 1:
             # Modalidad 1: No registrado - Cargo premium + Multa 50%
             monto_base = final_fare
-            multa = final_fare * Decimal('0.50')  # 50% de multa
+            multa = percentage(final_fare, 50)  # 50% de multa
             total = monto_base + multa
             estado = "pendiente"
             concepto = f"Paso por peaje - {peaje_nombre} (Pago pendiente + Multa por pago tardío)"
@@ -102,7 +117,7 @@ def lambda_handler(event, context):
         else:
             # Modalidad 2 o 3: Registrado - Factura normal (ya pagada)
             monto_base = final_fare
-            multa = Decimal('0')
+            multa = 0
             total = monto_base
             estado = "pagada"
             concepto = f"Paso por peaje - {peaje_nombre}"
@@ -114,39 +129,56 @@ def lambda_handler(event, context):
             'email': email if email else 'N/A'
         }
         
-        # Crear registro de factura
-        invoice = {
-            'invoice_id': invoice_id,
-            'invoice_number': invoice_id,
-            'placa': placa,
-            'modalidad': modalidad,
-            'monto_base': str(monto_base),
-            'multa': str(multa),
-            'total': str(total),
-            'estado': estado,
-            'concepto': concepto,
-            'fecha_emision': timestamp,
-            'contribuyente': contribuyente,
-            'transaction_id': transaction_id,
-            'peaje': {
-                'peaje_id': toll_data.get('peaje_id', 'N/A'),
-                'nombre': peaje_nombre
-            },
-            'created_at': datetime.utcnow().isoformat() + 'Z'
-        }
-        
-        # Guardar en DynamoDB
-        invoices_table.put_item(Item=invoice)
-        
-        print(f"Factura generada: {invoice_id} - Total: Q{total} - Estado: {estado}")
+        def issue():
+            # Número de factura del paso (el mismo en cada reintento)
+            invoice_id = generate_invoice_number(event.get('event_id'), toll_data.get('timestamp'))
+            
+            # Crear registro de factura
+            invoice = {
+                'invoice_id': invoice_id,
+                'invoice_number': invoice_id,
+                'placa': placa,
+                'modalidad': modalidad,
+                'monto_base_cents': monto_base,
+                'multa_cents': multa,
+                'total_cents': total,
+                'estado': estado,
+                'concepto': concepto,
+                'fecha_emision': timestamp,
+                'contribuyente': contribuyente,
+                'transaction_id': transaction_id,
+                'peaje': {
+                    'peaje_id': toll_data.get('peaje_id', 'N/A'),
+                    'nombre': peaje_nombre
+                },
+                'created_at': datetime.utcnow().isoformat() + 'Z'
+            }
+            
+            # Guardar en DynamoDB (nunca sobrescribir una factura existente)
+            try:
+                invoices_table.put_item(
+                    Item=invoice,
+                    ConditionExpression='attribute_not_exists(invoice_id)'
+                )
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+                # Un intento anterior del paso ya la escribió: se retorna esa
+                existing = invoices_table.get_item(Key={'invoice_id': invoice_id}, ConsistentRead=True).get('Item')
+                if existing is None or existing.get('transaction_id') != transaction_id:
+                    raise
+                print(f"Factura {invoice_id} ya emitida por un intento anterior, se retorna la existente")
+                return json.loads(state_contract.dumps(existing))
+            
+            print(f"Factura generada: {invoice_id} - Total: Q{format_amount(total)} - Estado: {estado}")
+            
+            return invoice
         
-        # Retornar evento enriquecido
-        result = {
-            **event,
-            'invoice': invoice
-        }
+        # Una factura por event_id: un reintento retorna la factura ya emitida
+        invoice, _ = idempotency.run_once(idempotency_table, event.get('event_id'), 'generate_invoice',
+                                          issue, STAGE_RECORD_TTL_SECONDS, STAGE_LEASE_SECONDS)
         
-        return result
+        return state_contract.respond(event, 'generate_invoice', invoice)
         
     except Exception as e:
         print(f"Error generando factura: {str(e)}")
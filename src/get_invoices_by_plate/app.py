@@ -12,6 +12,8 @@ from datetime import datetime
 import boto3
 from boto3.dynamodb.conditions import Key
 
+from money import read_cents, to_api_number
+
 # Cliente DynamoDB
 dynamodb = boto3.resource('dynamodb')
 INVOICES_TABLE = os.environ.get('INVOICES_TABLE_NAME', 'GuatepassInvoices-dev')
@@ -88,13 +90,13 @@ def lambda_handler(event, context):
                 }, cls=DecimalEncoder)
             }
         
-        # Calcular estadísticas
-        total_amount = sum(float(inv.get('total', 0)) for inv in invoices)
+        # Calcular estadísticas (sumas en centavos enteros)
         pending_invoices = [inv for inv in invoices if inv.get('estado') == 'pendiente']
         paid_invoices = [inv for inv in invoices if inv.get('estado') == 'pagada']
         
-        total_pending = sum(float(inv.get('total', 0)) for inv in pending_invoices)
-        total_paid = sum(float(inv.get('total', 0)) for inv in paid_invoices)
+        total_amount = sum(inv['total_cents'] for inv in invoices)
+        total_pending = sum(inv['total_cents'] for inv in pending_invoices)
+        total_paid = sum(inv['total_cents'] for inv in paid_invoices)
         
         response_data = {
             'placa': placa,
@@ -102,9 +104,9 @@ def lambda_handler(event, context):
                 'total_invoices': len(invoices),
                 'pending_invoices': len(pending_invoices),
                 'paid_invoices': len(paid_invoices),
-                'total_amount': round(total_amount, 2),
-                'total_pending': round(total_pending, 2),
-                'total_paid': round(total_paid, 2)
+                'total_amount': to_api_number(total_amount),
+                'total_pending': to_api_number(total_pending),
+                'total_paid': to_api_number(total_paid)
             },
             'invoices': invoices,
             'message': f'Historial de facturas para {placa} obtenido exitosamente'
@@ -176,13 +178,18 @@ def query_invoices_by_plate(placa, limit=20, status_filter=None):
         # Formatear facturas para respuesta
         formatted_invoices = []
         for inv in invoices:
+            # Montos en centavos; los items anteriores guardaban quetzales
+            monto_base_cents = read_cents(inv, 'monto_base_cents', 'monto_base')
+            multa_cents = read_cents(inv, 'multa_cents', 'multa')
+            total_cents = read_cents(inv, 'total_cents', 'total')
             formatted_inv = {
                 'invoice_id': inv.get('invoice_id'),
                 'placa': inv.get('placa'),
                 'modalidad': inv.get('modalidad'),
-                'monto_base': float(inv.get('monto_base', 0)),
-                'multa': float(inv.get('multa', 0)),
-                'total': float(inv.get('total', 0)),
+                'monto_base': to_api_number(monto_base_cents),
+                'multa': to_api_number(multa_cents),
+                'total': to_api_number(total_cents),
+                'total_cents': total_cents,
                 'estado': inv.get('estado'),
                 'concepto': inv.get('concepto', 'N/A'),
                 'transaction_id': inv.get('transaction_id'),
@@ -12,6 +12,8 @@ from datetime import datetime
 import boto3
 from boto3.dynamodb.conditions import Key
 
+from money import parse_amount, read_cents, to_api_number
+
 # Cliente DynamoDB
 dynamodb = boto3.resource('dynamodb')
 TRANSACTIONS_TABLE = os.environ.get('TRANSACTIONS_TABLE_NAME', 'GuatepassTransactions-dev')
@@ -91,13 +93,14 @@ def lambda_handler(event, context):
                 }, cls=DecimalEncoder)
             }
         
-        # Calcular estadísticas
-        total_amount = sum(float(t.get('amount_charged', 0)) for t in transactions)
+        # Calcular estadísticas (suma en centavos enteros)
+        total_cents = sum(t['amount_charged_cents'] for t in transactions)
         
         response_data = {
             'placa': placa,
             'total_transactions': len(transactions),
-            'total_amount': round(total_amount, 2),
+            'total_amount': to_api_number(total_cents),
+            'total_amount_cents': total_cents,
             'transactions': transactions,
             'message': f'Historial de pagos para {placa} obtenido exitosamente'
         }
@@ -183,6 +186,10 @@ def query_transactions_by_plate(placa, limit=20, from_date=None, to_date=None):
         # Formatear transacciones para respuesta
         formatted_transactions = []
         for tx in transactions:
+            # Monto cobrado en centavos; los items anteriores guardaban quetzales
+            amount_cents = read_cents(tx, 'final_fare_cents', 'final_fare',
+                                      default=parse_amount(tx.get('amount_charged')))
+            base_cents = read_cents(tx, 'base_fare_cents', 'base_fare')
             timestamp_val = tx.get('timestamp', tx.get('created_at', ''))
             formatted_tx = {
                 'transaction_id': tx.get('transaction_id'),
@@ -190,8 +197,9 @@ def query_transactions_by_plate(placa, limit=20, from_date=None, to_date=None):
                 'toll_id': tx.get('toll_id'),
                 'toll_name': tx.get('toll_name', 'N/A'),
                 'modalidad': tx.get('modalidad'),
-                'amount_charged': float(tx.get('amount_charged', 0)),
-                'base_fare': float(tx.get('base_fare', 0)),
+                'amount_charged': to_api_number(amount_cents),
+                'amount_charged_cents': amount_cents,
+                'base_fare': to_api_number(base_cents),
                 'multiplier': float(tx.get('multiplier', 1.0)),
                 'timestamp': timestamp_val,
                 'created_at': timestamp_val,
@@ -8,6 +8,8 @@ import json
 import os
 import boto3
 
+from money import balance_cents, format_amount
+
 dynamodb = boto3.resource('dynamodb')
 users_table_name = os.environ['USERS_TABLE_NAME']
 users_table = dynamodb.Table(users_table_name)
@@ -84,7 +86,7 @@ def lambda_handler(event, context):
                 'email': user.get('email'),
                 'telefono': user.get('telefono'),
                 'tipo_usuario': user.get('tipo_usuario'),
-                'saldo_disponible': str(user.get('saldo_disponible', '0.00')),
+                'saldo_disponible': format_amount(balance_cents(user)),
                 'estado': user.get('estado', 'activo')
             }
         }
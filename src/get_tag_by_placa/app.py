@@ -12,6 +12,8 @@ import boto3
 from typing import Dict, Any
 from decimal import Decimal
 
+from money import balance_cents, to_api_number
+
 # Cliente DynamoDB
 dynamodb = boto3.resource('dynamodb')
 
@@ -79,7 +81,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'nombre': user.get('nombre'),
             'email': user.get('email'),
             'telefono': user.get('telefono'),
-            'saldo_disponible': user.get('saldo_disponible', 0),
+            'saldo_disponible': to_api_number(balance_cents(user)),
             'estado': user.get('estado', 'activo')
         }
         
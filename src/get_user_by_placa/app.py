@@ -12,6 +12,9 @@ import boto3
 from typing import Dict, Any
 from decimal import Decimal
 
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, balance_cents, to_api_number
+from balance_ledger import DEBITED_TXNS_FIELD
+
 # Cliente DynamoDB
 dynamodb = boto3.resource('dynamodb')
 
@@ -62,6 +65,11 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         user = response['Item']
         
+        # El saldo se guarda en centavos; el API lo expone en quetzales
+        user[LEGACY_BALANCE_FIELD] = to_api_number(balance_cents(user))
+        user.pop(BALANCE_FIELD, None)
+        user.pop(DEBITED_TXNS_FIELD, None)
+        
         print(f"[SUCCESS] Usuario encontrado: {placa}")
         
         return success_response(200, {
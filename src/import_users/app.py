@@ -3,24 +3,102 @@ GUATEPASS - Import Users Function
 ===================================
 Lambda function que importa usuarios desde un archivo CSV en S3 a DynamoDB.
 
-Trigger: S3 ObjectCreated evento cuando se sube un archivo clientes*.csv
+Trigger: S3 ObjectCreated evento cuando se sube un archivo clientes*.csv,
+clientes*.csv.gz, clientes*.csv.zst o clientes*.parquet (ver input_formats.py)
+
+El archivo se procesa como un pipeline de generadores:
+    read_users_from_s3 (download_csv_from_s3 -> parse_csv) -> import_users_to_dynamodb
+El body de S3 se decodifica por bloques, las filas se parsean a medida que se
+consumen y cada lote de 25 se escribe mientras el resto sigue llegando; la
+memoria pico no depende del tamaño del archivo. Las llaves para el filtro de
+registrados se acumulan en un archivo temporal en /tmp, no en memoria.
+
+Archivos grandes (ver segments.py): el coordinador divide el objeto en
+segmentos de IMPORT_SEGMENT_BYTES alineados a líneas y, si hay más de uno,
+invoca esta misma función de forma asíncrona con {"import_segment": ...} por
+cada segmento pendiente. Cada segmento se escribe con un pool de
+IMPORT_WRITER_THREADS hilos de BatchWriteItem y deja un checkpoint al
+terminar; re-ejecutar el coordinador reanuda solo lo pendiente. Los archivos
+comprimidos y Parquet no se pueden dividir por bytes: se importan como un
+solo stream.
+
+Modos (IMPORT_MODE, o la metadata S3 import-mode del objeto):
+- delta (por defecto): solo escribe usuarios nuevos o cambiados y da de baja
+  los que ya no vienen en el archivo (ver delta.py); no pisa saldos existentes
+- full: reescribe todas las filas, saldo incluido (importación segmentada)
+El saldo del CSV solo reemplaza saldos existentes en modo delta con la
+metadata overwrite-balance=true (o IMPORT_OVERWRITE_BALANCE=true).
+
+Las escrituras pasan por un WriteRateController (write_rate.py) con techo de
+IMPORT_WRITE_CAPACITY_SHARE de la capacidad de la tabla, para no dejar sin
+capacidad a los cobros en vivo; el ritmo logrado se reporta en write_rate.
+
+Antes de escribir, una pasada de validación (validation.py, IMPORT_VALIDATE)
+detecta filas mal formadas, placas repetidas y tag_id en conflicto, publica
+el reporte de rechazos en IMPORT_REJECTS_PREFIX y las placas en conflicto no
+se escriben. En modo delta se valida en la misma lectura que llena los shards;
+en modo full el coordinador valida el archivo antes de despachar segmentos.
 """
 
 import json
 import csv
 import os
+import random
+import tempfile
+import time
 import boto3
-from typing import Dict, Any, List
-from decimal import Decimal
-from io import StringIO
+from botocore.exceptions import ClientError
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import islice
+from typing import Dict, Any, Callable, Iterable, Iterator, List, Optional, Tuple
+
+import delta
+import input_formats
+import segments
+import validation
+from write_rate import WriteRateController
+from segments import iter_decoded_lines
+from balance_ledger import migrate_legacy_balance
+from registry_filter import register_entries, user_entries
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, parse_amount
 
 # Clientes AWS
 s3_client = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 
 # Variables de entorno
 USERS_TABLE_NAME = os.environ['USERS_TABLE_NAME']
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+DATA_BUCKET_NAME = os.environ.get('DATA_BUCKET_NAME')
+REGISTRY_FILTER_KEY = os.environ.get('REGISTRY_FILTER_KEY', 'registry/registered-users.bloom')
+REGISTRY_FILTER_FP_RATE = float(os.environ.get('REGISTRY_FILTER_FP_RATE', '0.01'))
+CSV_CHUNK_BYTES = int(os.environ.get('IMPORT_CHUNK_BYTES', str(1024 * 1024)))
+IMPORT_SEGMENT_BYTES = int(os.environ.get('IMPORT_SEGMENT_BYTES', str(64 * 1024 * 1024)))
+IMPORT_WRITER_THREADS = int(os.environ.get('IMPORT_WRITER_THREADS', '8'))
+IMPORT_FANOUT = os.environ.get('IMPORT_FANOUT', 'lambda')  # 'lambda' o 'inline'
+IMPORT_CHECKPOINT_PREFIX = os.environ.get('IMPORT_CHECKPOINT_PREFIX', 'imports/checkpoints')
+IMPORT_MODE = os.environ.get('IMPORT_MODE', 'delta')  # 'delta' o 'full'
+IMPORT_OVERWRITE_BALANCE = os.environ.get('IMPORT_OVERWRITE_BALANCE', 'false').lower() == 'true'
+IMPORT_DELTA_PREFIX = os.environ.get('IMPORT_DELTA_PREFIX', 'imports/fingerprints')
+IMPORT_DELTA_DATASET = os.environ.get('IMPORT_DELTA_DATASET', 'registry')
+IMPORT_DELTA_SHARDS = int(os.environ.get('IMPORT_DELTA_SHARDS', '64'))
+# Capacidad de escritura de la tabla (on-demand: cuota por tabla) y fracción que
+# puede usar la importación; 0 desactiva el control de ritmo
+IMPORT_TABLE_WRITE_UNITS = float(os.environ.get('IMPORT_TABLE_WRITE_UNITS', '40000'))
+IMPORT_WRITE_CAPACITY_SHARE = float(os.environ.get('IMPORT_WRITE_CAPACITY_SHARE', '0.5'))
+IMPORT_VALIDATE = os.environ.get('IMPORT_VALIDATE', 'true').lower() == 'true'
+IMPORT_REJECTS_PREFIX = os.environ.get('IMPORT_REJECTS_PREFIX', 'imports/rejects')
+
+# DynamoDB BatchWrite maneja hasta 25 items por batch
+BATCH_SIZE = 25
+BATCH_MAX_ATTEMPTS = 8
+BACKOFF_BASE_SECONDS = 0.05
+BACKOFF_MAX_SECONDS = 5.0
+THROTTLING_ERRORS = ('ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded')
+PROGRESS_LOG_EVERY = 100000
 
 # Tabla DynamoDB
 users_table = dynamodb.Table(USERS_TABLE_NAME)
@@ -31,7 +109,8 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Handler principal de la función Lambda.
     
     Args:
-        event: Evento S3 con información del archivo subido
+        event: Evento S3 con información del archivo subido, o
+               {"import_segment": {...}} enviado por el coordinador
         context: Contexto de ejecución Lambda
         
     Returns:
@@ -41,6 +120,9 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     print(f"[INFO] Evento recibido: {json.dumps(event)}")
     
     try:
+        if 'import_segment' in event:
+            return import_segment_task(event['import_segment'])
+        
         # Extraer información del bucket y archivo
         s3_event = event['Records'][0]['s3']
         bucket_name = s3_event['bucket']['name']
@@ -48,14 +130,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         print(f"[INFO] Procesando archivo: s3://{bucket_name}/{object_key}")
         
-        # Descargar y procesar el archivo CSV
-        csv_content = download_csv_from_s3(bucket_name, object_key)
-        users = parse_csv(csv_content)
+        mode, overwrite_balance = import_options(bucket_name, object_key)
+        print(f"[INFO] Modo de importación: {mode} (sobrescribir saldos: {overwrite_balance})")
         
-        print(f"[INFO] Total de usuarios en CSV: {len(users)}")
-        
-        # Importar usuarios a DynamoDB
-        result = import_users_to_dynamodb(users)
+        if mode == 'delta':
+            result = run_delta_import(bucket_name, object_key, overwrite_balance)
+        else:
+            function_name = getattr(context, 'function_name', None) if IMPORT_FANOUT == 'lambda' else None
+            result = coordinate_import(bucket_name, object_key, function_name)
         
         print(f"[SUCCESS] Importación completada: {result}")
         
@@ -72,50 +154,85 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         raise
 
 
-def download_csv_from_s3(bucket: str, key: str) -> str:
+def read_users_from_s3(bucket: str, key: str,
+                       validator: Optional[validation.ImportValidator] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Usuarios del archivo en S3 en cualquiera de los formatos soportados.
+    
+    Args:
+        bucket: Nombre del bucket S3
+        key: Key del objeto en S3
+        validator: Si se pasa, registra cada fila (y los rechazos) para la validación
+        
+    Yields:
+        Diccionarios con información de usuarios (formato DynamoDB)
+    """
+    file_format = input_formats.detect_format(s3_client, bucket, key)
+    print(f"[INFO] Formato de entrada: {file_format}")
+    
+    if file_format == input_formats.PARQUET:
+        first_row = 1
+        for number, batch in enumerate(input_formats.iter_parquet_batches(s3_client, bucket, key)):
+            yield from input_formats.users_from_batch(batch, source=f"batch {number}, ",
+                                                      first_row=first_row, validator=validator)
+            first_row += batch.num_rows
+    else:
+        yield from parse_csv(download_csv_from_s3(bucket, key, file_format), validator=validator)
+
+
+def download_csv_from_s3(bucket: str, key: str, file_format: str = input_formats.CSV) -> Iterator[str]:
     """
-    Descarga el archivo CSV desde S3.
+    Abre el archivo CSV en S3 para leerlo en streaming.
     
     Args:
         bucket: Nombre del bucket S3
         key: Key del objeto en S3
+        file_format: csv, csv.gz o csv.zst (se descomprime por bloques)
         
     Returns:
-        Contenido del archivo CSV como string
+        Iterador de líneas de texto (se descargan a medida que se consumen)
     """
     try:
         response = s3_client.get_object(Bucket=bucket, Key=key)
-        csv_content = response['Body'].read().decode('utf-8')
-        print(f"[INFO] Archivo descargado exitosamente. Tamaño: {len(csv_content)} bytes")
-        return csv_content
+        print(f"[INFO] Archivo abierto exitosamente. Tamaño: {response.get('ContentLength', 0)} bytes")
+        return iter_decoded_lines(input_formats.iter_object_chunks(response['Body'], file_format, CSV_CHUNK_BYTES))
     except Exception as e:
         print(f"[ERROR] Error descargando archivo de S3: {str(e)}")
         raise
 
 
-def parse_csv(csv_content: str) -> List[Dict[str, Any]]:
+def parse_csv(csv_lines: Iterable[str], source: str = '',
+              validator: Optional[validation.ImportValidator] = None) -> Iterator[Dict[str, Any]]:
     """
-    Parsea el contenido CSV y convierte a lista de diccionarios.
+    Parsea las líneas del CSV y entrega un usuario a la vez.
     
     Args:
-        csv_content: Contenido del archivo CSV como string
+        csv_lines: Líneas del archivo CSV (incluyendo el header)
+        source: Prefijo para los logs (p. ej. "segmento 3, "); las filas se
+                numeran desde el inicio del archivo o del segmento
+        validator: Si se pasa, recibe cada fila válida y cada fila descartada
+                   con su motivo (reporte de rechazos)
         
-    Returns:
-        Lista de diccionarios con información de usuarios
+    Yields:
+        Diccionarios con información de usuarios
     """
-    users = []
-    csv_file = StringIO(csv_content)
-    csv_reader = csv.DictReader(csv_file)
+    csv_reader = csv.DictReader(csv_lines)
     
     for row_number, row in enumerate(csv_reader, start=2):  # Start at 2 (header is line 1)
         try:
+            if None in row or None in row.values():
+                raise validation.RowRejected(validation.BAD_COLUMNS,
+                                             f"{len(csv_reader.fieldnames)} columnas esperadas en fila {row_number}")
             user = parse_user_row(row, row_number)
-            users.append(user)
         except Exception as e:
-            print(f"[WARNING] Error parseando fila {row_number}: {str(e)}. Fila: {row}")
+            print(f"[WARNING] Error parseando {source}fila {row_number}: {str(e)}. Fila: {row}")
+            if validator is not None:
+                validator.reject_row(row_number, getattr(e, 'reason', validation.INVALID_ROW), str(e))
             continue
-    
-    return users
+        
+        if validator is not None:
+            validator.observe(row_number, user)
+        yield user
 
 
 def parse_user_row(row: Dict[str, str], row_number: int) -> Dict[str, Any]:
@@ -132,19 +249,19 @@ def parse_user_row(row: Dict[str, str], row_number: int) -> Dict[str, Any]:
     # Validar campo obligatorio: placa
     placa = row.get('placa', '').strip()
     if not placa:
-        raise ValueError(f"Placa vacía en fila {row_number}")
+        raise validation.RowRejected(validation.MISSING_PLACA, f"Placa vacía en fila {row_number}")
     
     # Convertir tiene_tag a booleano
     tiene_tag_str = row.get('tiene_tag', 'false').strip().lower()
     tiene_tag = tiene_tag_str in ['true', '1', 'yes', 'si', 'sí']
     
-    # Convertir saldo a Decimal (DynamoDB requiere Decimal para números)
+    # Convertir saldo (quetzales en el CSV) a centavos enteros
     saldo_str = row.get('saldo_disponible', '0').strip()
     try:
-        saldo_disponible = Decimal(saldo_str) if saldo_str else Decimal('0')
-    except:
-        print(f"[WARNING] Saldo inválido '{saldo_str}' en fila {row_number}, usando 0")
-        saldo_disponible = Decimal('0')
+        saldo_cents = parse_amount(saldo_str)
+    except ValueError:
+        # Con 0 una importación completa borraría el saldo del usuario
+        raise validation.RowRejected(validation.INVALID_BALANCE, f"Saldo inválido '{saldo_str}' en fila {row_number}")
     
     # Determinar tipo de usuario
     tipo_usuario = row.get('tipo_usuario', '').strip()
@@ -168,7 +285,7 @@ def parse_user_row(row: Dict[str, str], row_number: int) -> Dict[str, Any]:
         'tipo_usuario': tipo_usuario,
         'tiene_tag': tiene_tag,
         'tag_id': tag_id,
-        'saldo_disponible': saldo_disponible,
+        BALANCE_FIELD: saldo_cents,
         'estado': 'activo',  # Campo adicional para control
         'fecha_creacion': None  # Se llenará en el batch write
     }
@@ -179,45 +296,599 @@ def parse_user_row(row: Dict[str, str], row_number: int) -> Dict[str, Any]:
     return user
 
 
-def import_users_to_dynamodb(users: List[Dict[str, Any]]) -> Dict[str, int]:
+def skip_rejected(users: Iterable[Dict[str, Any]], rejected: Optional[validation.RejectedKeys],
+                  counts: Dict[str, int]) -> Iterator[Dict[str, Any]]:
+    """Deja pasar solo los usuarios cuya placa no fue rechazada (cuenta los saltados en counts)."""
+    counts.setdefault('rejected', 0)
+    if not rejected:
+        yield from users
+        return
+    for user in users:
+        if user['placa'] in rejected:
+            counts['rejected'] += 1
+            continue
+        yield user
+
+
+def validate_import(bucket: str, key: str, etag: str) -> Dict[str, Any]:
+    """
+    Pasada de validación completa del archivo (modo full), antes de escribir.
+    Si esta versión del objeto ya se validó (p. ej. al reanudar segmentos) se
+    reutiliza el resultado publicado.
+    
+    Returns:
+        Resumen de la validación (incluye report_key y rejected_keys_key)
+    """
+    report_bucket = DATA_BUCKET_NAME or bucket
+    summary = validation.load_summary(s3_client, report_bucket, IMPORT_REJECTS_PREFIX, key, etag)
+    if summary is not None:
+        print(f"[INFO] Validación reutilizada: {summary['reasons']}")
+        return summary
+    
+    start = time.monotonic()
+    with validation.ImportValidator() as validator:
+        for _ in read_users_from_s3(bucket, key, validator):
+            pass
+        validator.finish()
+        summary = validator.publish(s3_client, report_bucket, IMPORT_REJECTS_PREFIX, key, etag)
+    print(f"[INFO] Validación: {summary['rows']} filas, {summary['rejected_placas']} placas rechazadas "
+          f"{summary['reasons']} en {time.monotonic() - start:.1f}s -> s3://{report_bucket}/{summary['report_key']}")
+    return summary
+
+
+class WritePipeline:
+    """
+    Pool de hilos para escrituras a DynamoDB con como máximo 2 operaciones en
+    vuelo por hilo, así la memoria sigue acotada aunque la lectura vaya más rápido.
+    
+    Cada operación retorna (escritos, reintentos, unprocessed, fallidos) y se
+    acumula en stats; si lanza una excepción, todas sus filas cuentan como errores.
+    """
+    
+    def __init__(self, writer_threads: int, stats: Dict[str, Any]):
+        self.writer_threads = writer_threads
+        self.stats = stats
+        for field in ('success', 'errors', 'retries', 'unprocessed'):
+            stats.setdefault(field, 0)
+        self._executor = ThreadPoolExecutor(max_workers=writer_threads)
+        self._in_flight = deque()
+    
+    def submit(self, label: str, rows: int, fn: Callable[..., Tuple[int, int, int, int]], *args: Any) -> None:
+        self._in_flight.append((self._executor.submit(fn, *args), label, rows))
+        if len(self._in_flight) >= self.writer_threads * 2:
+            self._collect(self._in_flight.popleft())
+    
+    def drain(self) -> None:
+        while self._in_flight:
+            self._collect(self._in_flight.popleft())
+    
+    def _collect(self, pending: Any) -> None:
+        future, label, rows = pending
+        try:
+            written, retries, unprocessed, failed = future.result()
+            self.stats['success'] += written
+            self.stats['errors'] += failed
+            self.stats['retries'] += retries
+            self.stats['unprocessed'] += unprocessed
+        except Exception as e:
+            print(f"[ERROR] Error escribiendo {label}: {str(e)}")
+            self.stats['errors'] += rows
+    
+    def __enter__(self) -> 'WritePipeline':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        try:
+            self.drain()
+        finally:
+            self._executor.shutdown()
+
+
+def new_rate_controller(share: Optional[float] = None) -> Optional[WriteRateController]:
+    """
+    Controlador de ritmo con techo `share` de la capacidad de la tabla
+    (IMPORT_WRITE_CAPACITY_SHARE por defecto). None si el control está desactivado.
     """
-    Importa usuarios a DynamoDB usando batch write.
+    share = IMPORT_WRITE_CAPACITY_SHARE if share is None else share
+    if share <= 0:
+        return None
+    return WriteRateController(IMPORT_TABLE_WRITE_UNITS * share)
+
+
+def import_users_to_dynamodb(users: Iterable[Dict[str, Any]],
+                             writer_threads: int = IMPORT_WRITER_THREADS,
+                             rate: Optional[WriteRateController] = None) -> Dict[str, Any]:
+    """
+    Importa usuarios a DynamoDB a medida que llegan, con un pool de hilos que
+    ejecutan BatchWriteItem en paralelo (ver WritePipeline).
     
     Args:
-        users: Lista de diccionarios con información de usuarios
+        users: Iterable (normalmente un generador) de usuarios
+        writer_threads: Hilos escribiendo lotes de 25 en paralelo
+        rate: Controlador de ritmo (por defecto uno nuevo con IMPORT_WRITE_CAPACITY_SHARE)
         
     Returns:
-        Diccionario con estadísticas de la importación
+        Diccionario con estadísticas de la importación: total, success, errors,
+        retries (llamadas repetidas por throttling o UnprocessedItems),
+        unprocessed (items devueltos en UnprocessedItems), seconds,
+        rows_per_second y write_rate (métricas del controlador)
     """
-    success_count = 0
-    error_count = 0
+    rate = rate or new_rate_controller()
+    stats = {'total': 0}
+    start = time.monotonic()
+    users = iter(users)
     
-    # DynamoDB BatchWrite maneja hasta 25 items por batch
-    batch_size = 25
+    with WritePipeline(writer_threads, stats) as pipeline:
+        while True:
+            batch = list(islice(users, BATCH_SIZE))
+            if not batch:
+                break
+            stats['total'] += len(batch)
+            pipeline.submit(f"batch ({batch[0].get('placa')}...)", len(batch), write_batch, users_table, batch, rate)
+            
+            if stats['total'] % PROGRESS_LOG_EVERY < BATCH_SIZE:
+                print(f"[INFO] Progreso: {stats['total']} usuarios procesados ({time.monotonic() - start:.1f}s)")
     
-    for i in range(0, len(users), batch_size):
-        batch = users[i:i + batch_size]
+    elapsed = time.monotonic() - start
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['total'] / elapsed) if elapsed > 0 else stats['total']
+    if rate is not None:
+        stats['write_rate'] = rate.metrics()
+        print(f"[INFO] Ritmo de escritura: {stats['write_rate']}")
+    return stats
+
+
+def write_batch(table: Any, batch: List[Dict[str, Any]], rate: Optional[WriteRateController] = None) -> tuple:
+    """
+    Escribe un lote (máximo 25) con BatchWriteItem, reintentando con backoff
+    exponencial los UnprocessedItems y los errores de throttling. Con `rate`,
+    cada llamada espera su turno y el throttling baja el ritmo del controlador.
+    
+    Returns:
+        Tupla (escritos, reintentos, items no procesados vistos, fallidos)
+    """
+    # BatchWriteItem rechaza llaves repetidas en la misma llamada: gana la última fila
+    unique = {user['placa']: user for user in batch}
+    requests = [{'PutRequest': {'Item': user}} for user in unique.values()]
+    client = table.meta.client
+    retries = 0
+    unprocessed = 0
+    
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        if rate is not None:
+            rate.acquire(len(requests))
+        try:
+            response = client.batch_write_item(RequestItems={table.name: requests})
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in THROTTLING_ERRORS:
+                raise
+            if rate is not None:
+                rate.record_throttle()
+            retries += 1
+            _backoff(attempt)
+            continue
         
+        pending = response.get('UnprocessedItems', {}).get(table.name, [])
+        if rate is not None:
+            rate.record_success(len(requests) - len(pending))
+            if pending:
+                rate.record_throttle()
+        requests = pending
+        if not requests:
+            return len(batch), retries, unprocessed, 0
+        unprocessed += len(requests)
+        retries += 1
+        _backoff(attempt)
+    
+    print(f"[WARNING] {len(requests)} items sin escribir tras {BATCH_MAX_ATTEMPTS} intentos")
+    return len(batch) - len(requests), retries, unprocessed, len(requests)
+
+
+def _backoff(attempt: int) -> None:
+    delay = min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** attempt))
+    time.sleep(random.uniform(delay / 2, delay))
+
+
+def with_throttling_retries(operation: Callable[[], Any], rate: Optional[WriteRateController] = None) -> int:
+    """Ejecuta una escritura individual reintentando el throttling; retorna los reintentos."""
+    for attempt in range(BATCH_MAX_ATTEMPTS):
+        if rate is not None:
+            rate.acquire(1)
         try:
-            with users_table.batch_writer() as batch_writer:
-                for user in batch:
-                    try:
-                        batch_writer.put_item(Item=user)
-                        success_count += 1
-                    except Exception as e:
-                        print(f"[ERROR] Error insertando usuario {user.get('placa')}: {str(e)}")
-                        error_count += 1
-        except Exception as e:
-            print(f"[ERROR] Error en batch write: {str(e)}")
-            error_count += len(batch)
+            operation()
+            if rate is not None:
+                rate.record_success(1)
+            return attempt
+        except ClientError as e:
+            throttled = e.response.get('Error', {}).get('Code') in THROTTLING_ERRORS
+            if throttled and rate is not None:
+                rate.record_throttle()
+            if not throttled or attempt == BATCH_MAX_ATTEMPTS - 1:
+                raise
+            _backoff(attempt)
+    return BATCH_MAX_ATTEMPTS
+
+
+def update_user_profile(table: Any, user: Dict[str, Any], overwrite_balance: bool = False,
+                        rate: Optional[WriteRateController] = None) -> tuple:
+    """
+    Actualiza el perfil de un usuario que cambió (o reaparece) sin tocar su
+    saldo: saldo_cents solo se inicializa si no existe, salvo overwrite_balance.
+    Si el item aún tiene saldo legado (saldo_disponible) se migra primero, para
+    no inicializar saldo_cents encima de él.
     
+    Returns:
+        Tupla (escritos, reintentos, items no procesados vistos, fallidos)
+    """
+    names = {}
+    values = {':estado': 'activo', ':saldo': user[BALANCE_FIELD]}
+    sets = ['estado = :estado']
+    removes = ['fecha_baja']
+    for i, field in enumerate(delta.PROFILE_FIELDS):
+        names[f'#f{i}'] = field
+        if user.get(field) is not None:
+            sets.append(f'#f{i} = :v{i}')
+            values[f':v{i}'] = user[field]
+        else:
+            removes.append(f'#f{i}')
+    
+    params = {
+        'Key': {'placa': user['placa']},
+        'ExpressionAttributeNames': names,
+        'ExpressionAttributeValues': values
+    }
+    if overwrite_balance:
+        sets.append(f'{BALANCE_FIELD} = :saldo')
+        removes.append(LEGACY_BALANCE_FIELD)
+    else:
+        sets.append(f'{BALANCE_FIELD} = if_not_exists({BALANCE_FIELD}, :saldo)')
+        params['ConditionExpression'] = (
+            f'attribute_not_exists({LEGACY_BALANCE_FIELD}) OR attribute_exists({BALANCE_FIELD})'
+        )
+    params['UpdateExpression'] = f"SET {', '.join(sets)} REMOVE {', '.join(removes)}"
+    
+    try:
+        retries = with_throttling_retries(lambda: table.update_item(**params), rate)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        legacy = table.get_item(Key={'placa': user['placa']}).get('Item', {}).get(LEGACY_BALANCE_FIELD)
+        if legacy is not None:
+            migrate_legacy_balance(table, user['placa'], legacy)
+        retries = 1 + with_throttling_retries(lambda: table.update_item(**params), rate)
+    return 1, retries, 0, 0
+
+
+def overwrite_user_balance(table: Any, user: Dict[str, Any], rate: Optional[WriteRateController] = None) -> tuple:
+    """Reemplaza el saldo por el del CSV (solo con overwrite_balance explícito)."""
+    retries = with_throttling_retries(lambda: table.update_item(
+        Key={'placa': user['placa']},
+        UpdateExpression=f'SET {BALANCE_FIELD} = :saldo REMOVE {LEGACY_BALANCE_FIELD}',
+        ExpressionAttributeValues={':saldo': user[BALANCE_FIELD]}
+    ), rate)
+    return 1, retries, 0, 0
+
+
+def tombstone_user(table: Any, placa: str, removed_at: str, rate: Optional[WriteRateController] = None) -> tuple:
+    """Marca como eliminado a un usuario que ya no viene en el registro (conserva su saldo)."""
+    try:
+        retries = with_throttling_retries(lambda: table.update_item(
+            Key={'placa': placa},
+            UpdateExpression='SET estado = :eliminado, fecha_baja = :fecha',
+            ConditionExpression='attribute_exists(placa)',
+            ExpressionAttributeValues={':eliminado': delta.REMOVED_STATE, ':fecha': removed_at}
+        ), rate)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        retries = 0  # Ya no existe en la tabla: no hay nada que dar de baja
+    return 1, retries, 0, 0
+
+
+def import_options(bucket: str, key: str) -> Tuple[str, bool]:
+    """
+    Modo de importación y si se sobrescriben saldos, desde la metadata del objeto
+    (aws s3 cp --metadata import-mode=full,overwrite-balance=true) o el entorno.
+    """
+    metadata = s3_client.head_object(Bucket=bucket, Key=key).get('Metadata', {})
+    mode = metadata.get('import-mode', IMPORT_MODE).lower()
+    if mode not in ('delta', 'full'):
+        raise ValueError(f"import-mode inválido: {mode} (use delta o full)")
+    overwrite_balance = metadata.get('overwrite-balance', str(IMPORT_OVERWRITE_BALANCE)).lower() == 'true'
+    return mode, overwrite_balance
+
+
+def run_delta_import(bucket: str, key: str, overwrite_balance: bool = False) -> Dict[str, Any]:
+    """
+    Importación incremental: reparte las filas del CSV por shard en /tmp,
+    compara cada shard con el manifiesto de la importación anterior y escribe
+    solo las diferencias (ver delta.py).
+    
+    Args:
+        bucket: Nombre del bucket S3
+        key: Llave del archivo CSV
+        overwrite_balance: Reemplazar saldos existentes con los del CSV
+        
+    Returns:
+        Estadísticas por tipo de cambio, escrituras hechas (writes) y su
+        fracción del total de filas (write_fraction)
+    """
+    start = time.monotonic()
+    manifest = delta.FingerprintManifest(s3_client, DATA_BUCKET_NAME or bucket, IMPORT_DELTA_PREFIX,
+                                         IMPORT_DELTA_DATASET, IMPORT_DELTA_SHARDS)
+    etag = s3_client.head_object(Bucket=bucket, Key=key)['ETag']
+    generation = delta.new_generation(etag)
+    removed_at = datetime.utcnow().isoformat() + 'Z'
+    rate = new_rate_controller()
+    validator = validation.ImportValidator() if IMPORT_VALIDATE else None
+    rejected = None
+    
+    stats = {'mode': 'delta', 'overwrite_balance': overwrite_balance, 'total': 0}
+    for kind in (delta.NEW, delta.CHANGED, delta.REACTIVATED, delta.UNCHANGED,
+                 delta.BALANCE_ONLY, delta.REMOVED, delta.DUPLICATE, delta.REJECTED):
+        stats[kind] = 0
+    
+    try:
+        if manifest.previous_generation is None:
+            seeded = manifest.seed_from_table(users_table)
+            print(f"[INFO] Sin manifiesto previo: sembrado desde la tabla con {seeded} usuarios")
+        else:
+            print(f"[INFO] Manifiesto previo: generación {manifest.previous_generation}")
+        
+        with delta.ShardSpool(manifest.shards) as spool, RegistryEntrySpool() as registry_entries:
+            for user in read_users_from_s3(bucket, key, validator):
+                spool.add(user)
+                stats['total'] += 1
+            print(f"[INFO] {stats['total']} filas repartidas en {manifest.shards} shards "
+                  f"({time.monotonic() - start:.1f}s)")
+            
+            if validator is not None:
+                # Los rechazos se conocen antes de la primera escritura
+                rejected = validator.finish()
+                stats['validation'] = validator.publish(s3_client, DATA_BUCKET_NAME or bucket,
+                                                        IMPORT_REJECTS_PREFIX, key, etag)
+                print(f"[INFO] Validación: {len(rejected)} placas rechazadas {stats['validation']['reasons']}")
+            
+            with WritePipeline(IMPORT_WRITER_THREADS, stats) as pipeline:
+                for shard in range(manifest.shards):
+                    current: delta.ShardEntries = {}
+                    new_users = []
+                    changes = delta.diff_shard(manifest.previous_shard(shard), spool.rows(shard),
+                                               current, overwrite_balance, rejected)
+                    for kind, user in changes:
+                        stats[kind] += 1
+                        if kind == delta.NEW:
+                            new_users.append(user)
+                            if len(new_users) == BATCH_SIZE:
+                                pipeline.submit('batch de nuevos', len(new_users), write_batch, users_table, new_users, rate)
+                                new_users = []
+                        elif kind in (delta.CHANGED, delta.REACTIVATED):
+                            pipeline.submit(user['placa'], 1, update_user_profile, users_table, user,
+                                            overwrite_balance, rate)
+                        elif kind == delta.BALANCE_ONLY:
+                            pipeline.submit(user['placa'], 1, overwrite_user_balance, users_table, user, rate)
+                        elif kind == delta.REMOVED:
+                            pipeline.submit(user['placa'], 1, tombstone_user, users_table, user['placa'], removed_at, rate)
+                        elif kind == delta.DUPLICATE:
+                            print(f"[WARNING] Placa repetida en el archivo, se conserva la primera fila: {user['placa']}")
+                        
+                        if kind in (delta.NEW, delta.CHANGED, delta.REACTIVATED):
+                            registry_entries.track_user(user)
+                    
+                    if new_users:
+                        pipeline.submit('batch de nuevos', len(new_users), write_batch, users_table, new_users, rate)
+                    manifest.save_shard(generation, shard, current)
+            
+            if len(registry_entries):
+                update_registry_filter(registry_entries, DATA_BUCKET_NAME or bucket)
+    finally:
+        manifest.close()
+        if validator is not None:
+            validator.close()
+    
+    writes = sum(stats[kind] for kind in (delta.NEW, delta.CHANGED, delta.REACTIVATED,
+                                          delta.BALANCE_ONLY, delta.REMOVED))
+    elapsed = time.monotonic() - start
+    stats['writes'] = writes
+    stats['write_fraction'] = round(writes / stats['total'], 4) if stats['total'] else 0
+    stats['seconds'] = round(elapsed, 3)
+    stats['rows_per_second'] = round(stats['total'] / elapsed) if elapsed > 0 else stats['total']
+    if rate is not None:
+        stats['write_rate'] = rate.metrics()
+    
+    if stats['errors']:
+        # La generación nueva queda sin publicar: la próxima corrida recalcula el delta
+        print(f"[WARNING] {stats['errors']} escrituras fallidas: el manifiesto no avanza")
+    else:
+        manifest.commit(generation, f"s3://{bucket}/{key}", stats)
+        print(f"[INFO] Manifiesto publicado: generación {generation} ({writes} escrituras, "
+              f"{stats['write_fraction']:.2%} de las filas)")
+    return stats
+
+
+def coordinate_import(bucket: str, key: str, function_name: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Planifica (o retoma) la importación de un objeto y procesa sus segmentos
+    pendientes: en paralelo con invocaciones asíncronas de `function_name`, o
+    aquí mismo uno tras otro si no hay función o queda un solo segmento.
+    
+    Returns:
+        Estadísticas por segmento procesado (o los segmentos despachados)
+    """
+    checkpoint_bucket = DATA_BUCKET_NAME or bucket
+    checks = None
+    if IMPORT_VALIDATE:
+        checks = validate_import(bucket, key, s3_client.head_object(Bucket=bucket, Key=key)['ETag'])
+    rejected_keys_key = checks['rejected_keys_key'] if checks else None
+    
+    file_format = input_formats.detect_format(s3_client, bucket, key)
+    if file_format != input_formats.CSV:
+        return {**import_single_stream(bucket, key, rejected_keys_key), 'validation': checks}
+    
+    manifest = segments.prepare_manifest(s3_client, checkpoint_bucket, bucket, key,
+                                         IMPORT_SEGMENT_BYTES, IMPORT_CHECKPOINT_PREFIX)
+    pending = segments.pending_segments(s3_client, checkpoint_bucket, manifest, IMPORT_CHECKPOINT_PREFIX)
+    print(f"[INFO] {len(manifest['segments'])} segmentos, {len(pending)} pendientes")
+    
+    task_base = {
+        'checkpoint_bucket': checkpoint_bucket,
+        'manifest_key': segments.manifest_key(manifest, IMPORT_CHECKPOINT_PREFIX),
+        'rejected_keys_key': rejected_keys_key
+    }
+    
+    if function_name and len(pending) > 1:
+        # Los segmentos corren a la vez: se reparten el techo de capacidad
+        task_base['write_share'] = IMPORT_WRITE_CAPACITY_SHARE / len(pending)
+        for index in pending:
+            lambda_client.invoke(
+                FunctionName=function_name,
+                InvocationType='Event',
+                Payload=json.dumps({'import_segment': {**task_base, 'segment': index}}).encode('utf-8')
+            )
+        print(f"[INFO] {len(pending)} segmentos despachados a {function_name}")
+        return {'segments': len(manifest['segments']), 'pending': len(pending), 'dispatched': len(pending),
+                'validation': checks}
+    
+    rejected = load_rejected_keys(checkpoint_bucket, rejected_keys_key)
+    results = [run_segment(manifest, index, checkpoint_bucket, rejected=rejected) for index in pending]
+    return {**summarize_segments(len(manifest['segments']), results), 'validation': checks}
+
+
+def load_rejected_keys(bucket: str, rejected_keys_key: Optional[str]) -> Optional[validation.RejectedKeys]:
+    """Placas rechazadas por la validación (None si la importación no se validó)."""
+    if not rejected_keys_key:
+        return None
+    return validation.load_rejected_keys(s3_client, bucket, rejected_keys_key)
+
+
+def import_single_stream(bucket: str, key: str, rejected_keys_key: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Importación completa de un archivo que no se puede segmentar por bytes
+    (comprimido o Parquet): un solo stream con el pool de escritores.
+    """
+    skipped: Dict[str, int] = {}
+    with RegistryEntrySpool() as registry_entries:
+        rejected = load_rejected_keys(DATA_BUCKET_NAME or bucket, rejected_keys_key)
+        users = skip_rejected(read_users_from_s3(bucket, key), rejected, skipped)
+        stats = import_users_to_dynamodb(registry_entries.track(users))
+        update_registry_filter(registry_entries, DATA_BUCKET_NAME or bucket)
+    stats.update(skipped)
+    return stats
+
+
+def import_segment_task(task: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Worker de un segmento (invocación asíncrona del coordinador). Falla si
+    quedaron filas sin escribir para que Lambda reintente el segmento.
+    """
+    manifest = segments.load_manifest(s3_client, task['checkpoint_bucket'], task['manifest_key'])
+    if manifest is None:
+        raise ValueError(f"Manifiesto no encontrado: {task['manifest_key']}")
+    
+    stats = run_segment(manifest, task['segment'], task['checkpoint_bucket'], task.get('write_share'),
+                        load_rejected_keys(task['checkpoint_bucket'], task.get('rejected_keys_key')))
+    if stats['errors']:
+        raise RuntimeError(f"Segmento {task['segment']}: {stats['errors']} usuarios sin escribir")
     return {
-        'total': len(users),
-        'success': success_count,
-        'errors': error_count
+        'statusCode': 200,
+        'body': json.dumps({'message': 'Segmento importado', 'stats': stats})
     }
 
 
+def run_segment(manifest: Dict[str, Any], index: int, checkpoint_bucket: str,
+                write_share: Optional[float] = None,
+                rejected: Optional[validation.RejectedKeys] = None) -> Dict[str, Any]:
+    """
+    Importa un segmento en streaming y guarda su checkpoint si no hubo errores.
+    `write_share` es la fracción de la capacidad de la tabla para este segmento;
+    las placas en `rejected` (validación del archivo completo) no se escriben.
+    """
+    lines = segments.iter_segment_lines(s3_client, manifest, index, CSV_CHUNK_BYTES)
+    skipped: Dict[str, int] = {}
+    with RegistryEntrySpool() as registry_entries:
+        users = skip_rejected(parse_csv(lines, source=f"segmento {index}, "), rejected, skipped)
+        stats = import_users_to_dynamodb(registry_entries.track(users), rate=new_rate_controller(write_share))
+        update_registry_filter(registry_entries, DATA_BUCKET_NAME or manifest['bucket'])
+    
+    stats.update(skipped)
+    stats['segment'] = index
+    print(f"[INFO] Segmento {index}: {stats}")
+    if stats['errors'] == 0:
+        segments.save_checkpoint(s3_client, checkpoint_bucket, manifest, IMPORT_CHECKPOINT_PREFIX, index, stats)
+    else:
+        print(f"[WARNING] Segmento {index} con {stats['errors']} errores: sin checkpoint, se reintentará")
+    return stats
+
+
+def summarize_segments(total_segments: int, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Totales de los segmentos procesados, conservando el detalle por segmento."""
+    summary = {'segments': total_segments, 'processed': len(results)}
+    for field in ('total', 'success', 'errors', 'retries', 'unprocessed', 'rejected'):
+        summary[field] = sum(result.get(field, 0) for result in results)
+    seconds = sum(result['seconds'] for result in results)
+    summary['rows_per_second'] = round(summary['total'] / seconds) if seconds > 0 else summary['total']
+    summary['per_segment'] = [
+        {
+            **{field: result[field] for field in ('segment', 'total', 'rows_per_second', 'retries', 'unprocessed', 'errors')},
+            'achieved_write_rate': result.get('write_rate', {}).get('achieved_rate')
+        }
+        for result in results
+    ]
+    return summary
+
+
+class RegistryEntrySpool:
+    """
+    Llaves del filtro de registrados (placa/tag) acumuladas en /tmp.
+    
+    track() las extrae mientras los usuarios pasan hacia DynamoDB; después se
+    puede iterar el spool las veces que haga falta (register_entries reintenta
+    ante escrituras concurrentes) sin tenerlas todas en memoria.
+    """
+    
+    def __init__(self):
+        self._file = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        self.count = 0
+    
+    def track(self, users: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        for user in users:
+            self.track_user(user)
+            yield user
+    
+    def track_user(self, user: Dict[str, Any]) -> None:
+        for entry in user_entries(user):
+            self._file.write(entry + '\n')
+            self.count += 1
+    
+    def __iter__(self) -> Iterator[str]:
+        self._file.flush()
+        self._file.seek(0)
+        for line in self._file:
+            yield line.rstrip('\n')
+    
+    def __len__(self) -> int:
+        return self.count
+    
+    def __enter__(self) -> 'RegistryEntrySpool':
+        return self
+    
+    def __exit__(self, *exc_info) -> None:
+        self._file.close()
+
+
+def update_registry_filter(entries: Iterable[str], bucket: str) -> None:
+    """
+    Agrega los usuarios importados al filtro Bloom que usa resolve_user
+    (o lo regenera desde la tabla si no existe o ya está saturado).
+    
+    Args:
+        entries: Llaves (placa/tag) de los usuarios importados
+        bucket: Bucket S3 donde se publica el filtro
+    """
+    register_entries(s3_client, users_table, bucket, REGISTRY_FILTER_KEY, entries, REGISTRY_FILTER_FP_RATE)
+    print(f"[INFO] Filtro de registrados actualizado: {len(entries)} llaves en s3://{bucket}/{REGISTRY_FILTER_KEY}")
+
+
 if __name__ == "__main__":
     # Para pruebas locales
     print("Esta función debe ejecutarse en AWS Lambda")
@@ -0,0 +1,242 @@
+"""
+GUATEPASS - Importación incremental (delta)
+============================================
+Compara cada fila del CSV con la huella (fingerprint) que dejó la importación
+anterior y solo escribe lo que cambió:
+
+    nuevo        placa nunca importada            -> BatchWriteItem (con saldo del CSV)
+    cambiado     huella distinta                  -> UpdateItem del perfil (sin tocar el saldo)
+    reactivado   placa dada de baja que reaparece -> UpdateItem del perfil, estado activo
+    sin cambios  misma huella                     -> nada
+    eliminado    placa activa que ya no viene     -> UpdateItem estado='eliminado' (tombstone)
+    rechazado    placa en conflicto (validation)  -> nada; conserva su entrada anterior
+
+La huella cubre solo los campos de perfil (PROFILE_FIELDS); el saldo del CSV
+nunca se escribe sobre un usuario existente salvo que la importación lo pida
+explícitamente (overwrite_balance), y en ese caso se escribe en todas las filas.
+
+Manifiesto en S3, dividido en shards por crc32(placa) para no cargarlo completo:
+
+    <prefix>/<dataset>/current.json                       -> {"generation": ..., "shards": N}
+    <prefix>/<dataset>/<generation>/shard-00017.tsv.gz    -> placa \\t huella \\t A|R
+
+Una generación nueva solo se publica en current.json si todas las escrituras
+terminaron sin errores; si no, la siguiente corrida vuelve a calcular el delta
+contra la generación anterior (las escrituras son idempotentes). Si no existe
+manifiesto, se siembra con un scan de la tabla, así la primera corrida delta
+después de una importación completa tampoco reescribe todo.
+"""
+
+import gzip
+import hashlib
+import json
+import tempfile
+import zlib
+from datetime import datetime
+from typing import Any, Container, Dict, Iterable, Iterator, Optional, Tuple
+
+PROFILE_FIELDS = ('nombre', 'email', 'telefono', 'tipo_usuario', 'tiene_tag', 'tag_id')
+
+# Estado de un usuario dado de baja por una importación delta
+REMOVED_STATE = 'eliminado'
+
+NEW = 'new'
+CHANGED = 'changed'
+REACTIVATED = 'reactivated'
+UNCHANGED = 'unchanged'
+BALANCE_ONLY = 'balance_only'
+REMOVED = 'removed'
+DUPLICATE = 'duplicate'
+REJECTED = 'rejected'
+
+ACTIVE_FLAG = 'A'
+REMOVED_FLAG = 'R'
+
+# placa -> (huella, A|R)
+ShardEntries = Dict[str, Tuple[str, str]]
+
+
+def fingerprint(user: Dict[str, Any]) -> str:
+    """Huella de los campos de perfil (no incluye saldo ni estado)."""
+    canonical = json.dumps([user.get(field) for field in PROFILE_FIELDS], separators=(',', ':'),
+                           ensure_ascii=False, default=str)
+    return hashlib.blake2b(canonical.encode('utf-8'), digest_size=8).hexdigest()
+
+
+def shard_of(placa: str, shards: int) -> int:
+    return zlib.crc32(placa.encode('utf-8')) % shards
+
+
+class ShardSpool:
+    """Filas del CSV repartidas por shard en archivos temporales de /tmp."""
+
+    def __init__(self, shards: int):
+        self.shards = shards
+        self._files = [tempfile.TemporaryFile(mode='w+', encoding='utf-8') for _ in range(shards)]
+
+    def add(self, user: Dict[str, Any]) -> None:
+        self._files[shard_of(user['placa'], self.shards)].write(
+            json.dumps(user, separators=(',', ':'), ensure_ascii=False, default=str) + '\n'
+        )
+
+    def rows(self, shard: int) -> Iterator[Dict[str, Any]]:
+        spool = self._files[shard]
+        spool.flush()
+        spool.seek(0)
+        for line in spool:
+            yield json.loads(line)
+
+    def close(self) -> None:
+        for spool in self._files:
+            spool.close()
+
+    def __enter__(self) -> 'ShardSpool':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def diff_shard(previous: ShardEntries, rows: Iterable[Dict[str, Any]], current: ShardEntries,
+               overwrite_balance: bool = False,
+               rejected: Optional[Container[str]] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Operaciones de un shard: (tipo, usuario). Llena `current` con las entradas
+    del manifiesto nuevo (incluidas las bajas, que se conservan como 'R' para
+    que una placa que reaparece no se trate como nueva y pise su saldo).
+    Las placas en `rejected` no se escriben ni se dan de baja: conservan la
+    entrada anterior, así la próxima corrida las vuelve a comparar.
+    """
+    for user in rows:
+        placa = user['placa']
+        if rejected and placa in rejected:
+            if placa in previous:
+                current[placa] = previous[placa]
+            yield REJECTED, user
+            continue
+        if placa in current:
+            yield DUPLICATE, user
+            continue
+
+        new_digest = fingerprint(user)
+        current[placa] = (new_digest, ACTIVE_FLAG)
+        old = previous.get(placa)
+
+        if old is None:
+            yield NEW, user
+        elif old[1] == REMOVED_FLAG:
+            yield REACTIVATED, user
+        elif old[0] != new_digest:
+            yield CHANGED, user
+        elif overwrite_balance:
+            yield BALANCE_ONLY, user
+        else:
+            yield UNCHANGED, user
+
+    for placa, (old_digest, flag) in previous.items():
+        if placa in current:
+            continue
+        current[placa] = (old_digest, REMOVED_FLAG)
+        if flag == ACTIVE_FLAG:
+            yield REMOVED, {'placa': placa}
+
+
+class FingerprintManifest:
+    """Lectura y publicación de las generaciones del manifiesto en S3."""
+
+    def __init__(self, s3_client: Any, bucket: str, prefix: str, dataset: str, shards: int):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.base = f"{prefix.rstrip('/')}/{dataset}"
+        self.shards = shards
+        self.previous_generation: Optional[str] = None
+        self._seed: Optional[ShardSpool] = None
+
+        pointer = self._get_json(f"{self.base}/current.json")
+        if pointer is not None:
+            self.previous_generation = pointer['generation']
+            # El número de shards de un manifiesto existente no cambia
+            self.shards = pointer['shards']
+
+    def _get_json(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        return json.loads(response['Body'].read())
+
+    def _shard_key(self, generation: str, shard: int) -> str:
+        return f"{self.base}/{generation}/shard-{shard:05d}.tsv.gz"
+
+    def seed_from_table(self, users_table: Any) -> int:
+        """
+        Sin manifiesto previo: toma como 'anterior' lo que ya hay en la tabla
+        (scan de los campos de perfil). Retorna los usuarios sembrados.
+        """
+        self._seed = ShardSpool(self.shards)
+        names = {f'#f{i}': field for i, field in enumerate(('placa', 'estado') + PROFILE_FIELDS)}
+        scan_params = {
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+        seeded = 0
+        while True:
+            response = users_table.scan(**scan_params)
+            for item in response.get('Items', []):
+                self._seed.add(item)
+                seeded += 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        return seeded
+
+    def previous_shard(self, shard: int) -> ShardEntries:
+        entries: ShardEntries = {}
+        if self._seed is not None:
+            for item in self._seed.rows(shard):
+                flag = REMOVED_FLAG if item.get('estado') == REMOVED_STATE else ACTIVE_FLAG
+                entries[item['placa']] = (fingerprint(item), flag)
+            return entries
+        if self.previous_generation is None:
+            return entries
+
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=self._shard_key(self.previous_generation, shard))
+        for line in gzip.decompress(response['Body'].read()).decode('utf-8').splitlines():
+            placa, digest, flag = line.split('\t')
+            entries[placa] = (digest, flag)
+        return entries
+
+    def save_shard(self, generation: str, shard: int, entries: ShardEntries) -> None:
+        lines = ''.join(f"{placa}\t{digest}\t{flag}\n" for placa, (digest, flag) in sorted(entries.items()))
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._shard_key(generation, shard),
+            Body=gzip.compress(lines.encode('utf-8')),
+            ContentType='text/tab-separated-values'
+        )
+
+    def commit(self, generation: str, source: str, stats: Dict[str, Any]) -> None:
+        """Publica la generación nueva como la vigente."""
+        pointer = {
+            'generation': generation,
+            'previous_generation': self.previous_generation,
+            'shards': self.shards,
+            'source': source,
+            'stats': stats,
+            'created_at': datetime.utcnow().isoformat() + 'Z'
+        }
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.base}/current.json",
+            Body=json.dumps(pointer).encode('utf-8'),
+            ContentType='application/json'
+        )
+
+    def close(self) -> None:
+        if self._seed is not None:
+            self._seed.close()
+
+
+def new_generation(etag: str) -> str:
+    version = etag.strip('"')[:12]
+    return f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S')}-{version}"
@@ -0,0 +1,296 @@
+"""
+GUATEPASS - Formatos de entrada de la importación de usuarios
+==============================================================
+Además del CSV plano, la importación acepta:
+
+    clientes*.csv.gz    CSV comprimido con gzip (incluye varios miembros concatenados)
+    clientes*.csv.zst   CSV comprimido con zstd (paquete zstandard)
+    clientes*.parquet   Parquet (paquete pyarrow)
+
+El formato se toma del sufijo de la llave y, si no es conocido, de los
+primeros bytes del objeto (gzip 1f8b, zstd 28b52ffd, Parquet PAR1).
+
+Los CSV comprimidos se descomprimen por bloques mientras se leen del stream de
+S3 y siguen el mismo camino que el CSV plano (parse_csv). Parquet se lee por
+row groups con lecturas Range (el footer está al final del archivo) y se
+procesa en record batches: la normalización de cada columna (mayúsculas,
+trim, saldo a centavos, tipo de usuario...) es vectorizada con pyarrow.compute
+y solo al final se arman los items para DynamoDB.
+
+zstandard y pyarrow son opcionales: sin ellos solo fallan los archivos que los
+necesitan (en Lambda se agregan como dependencias de la función o en una layer).
+"""
+
+import io
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from botocore.exceptions import ClientError
+
+import validation
+from money import BALANCE_FIELD, parse_amount
+
+try:
+    import zstandard
+except ImportError:  # Solo necesario para .csv.zst
+    zstandard = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Solo necesario para .parquet
+    pa = pc = pq = None
+
+CSV = 'csv'
+CSV_GZIP = 'csv.gz'
+CSV_ZSTD = 'csv.zst'
+PARQUET = 'parquet'
+
+SUFFIXES = (
+    ('.csv.gz', CSV_GZIP), ('.gz', CSV_GZIP),
+    ('.csv.zst', CSV_ZSTD), ('.zst', CSV_ZSTD),
+    ('.parquet', PARQUET), ('.pq', PARQUET),
+    ('.csv', CSV),
+)
+MAGIC_BYTES = (
+    (b'\x1f\x8b', CSV_GZIP),
+    (b'\x28\xb5\x2f\xfd', CSV_ZSTD),
+    (b'PAR1', PARQUET),
+)
+
+PARQUET_BATCH_ROWS = 65536
+PARQUET_READAHEAD_BYTES = 8 * 1024 * 1024
+
+TAG_TRUE_VALUES = ['true', '1', 'yes', 'si', 'sí']
+
+
+def detect_format(s3_client: Any, bucket: str, key: str) -> str:
+    """Formato del objeto por sufijo de la llave o, si no se reconoce, por sus primeros bytes."""
+    lowered = key.lower()
+    for suffix, fmt in SUFFIXES:
+        if lowered.endswith(suffix):
+            return fmt
+
+    try:
+        head = s3_client.get_object(Bucket=bucket, Key=key, Range='bytes=0-3')['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'InvalidRange':  # Objeto vacío
+            raise
+        head = b''
+    for magic, fmt in MAGIC_BYTES:
+        if head.startswith(magic):
+            return fmt
+    return CSV
+
+
+def iter_object_chunks(body: Any, fmt: str, chunk_size: int) -> Iterator[bytes]:
+    """Bloques de bytes del CSV (descomprimidos si corresponde) leídos del StreamingBody."""
+    if fmt == CSV:
+        yield from body.iter_chunks(chunk_size)
+    elif fmt == CSV_GZIP:
+        yield from _gunzip_chunks(body.iter_chunks(chunk_size))
+    elif fmt == CSV_ZSTD:
+        if zstandard is None:
+            raise RuntimeError("Se necesita el paquete zstandard para importar archivos .zst")
+        reader = zstandard.ZstdDecompressor().stream_reader(body, read_size=chunk_size, read_across_frames=True)
+        yield from iter(lambda: reader.read(chunk_size), b'')
+    else:
+        raise ValueError(f"Formato sin representación en texto: {fmt}")
+
+
+def _gunzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        while chunk:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+            # Un .gz puede tener varios miembros concatenados (p. ej. cat a.gz b.gz)
+            chunk = decompressor.unused_data if decompressor.eof else b''
+            if decompressor.eof:
+                decompressor = zlib.decompressobj(wbits=zlib.MAX_WBITS | 16)
+    tail = decompressor.flush()
+    if tail:
+        yield tail
+
+
+class S3RangeFile(io.RawIOBase):
+    """
+    Archivo de solo lectura sobre un objeto S3 con lecturas Range y un buffer
+    de lectura anticipada; pyarrow lo usa para saltar al footer y a cada row group.
+    """
+
+    def __init__(self, s3_client: Any, bucket: str, key: str, size: int, etag: Optional[str] = None,
+                 readahead: int = PARQUET_READAHEAD_BYTES):
+        super().__init__()
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.etag = etag
+        self.readahead = readahead
+        self.requests = 0
+        self._position = 0
+        self._buffer = b''
+        self._buffer_start = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self._position, io.SEEK_END: self.size}[whence]
+        self._position = max(0, base + offset)
+        return self._position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.size - self._position
+        end = min(self._position + size, self.size)
+        if end <= self._position:
+            return b''
+        buffer_end = self._buffer_start + len(self._buffer)
+        if not (self._buffer_start <= self._position and end <= buffer_end):
+            fetch_end = min(self.size, max(end, self._position + self.readahead))
+            params = {'Bucket': self.bucket, 'Key': self.key, 'Range': f'bytes={self._position}-{fetch_end - 1}'}
+            if self.etag:
+                params['IfMatch'] = self.etag
+            self._buffer = self.s3_client.get_object(**params)['Body'].read()
+            self._buffer_start = self._position
+            self.requests += 1
+        offset = self._position - self._buffer_start
+        data = self._buffer[offset:offset + (end - self._position)]
+        self._position += len(data)
+        return data
+
+    def readinto(self, buffer: Any) -> int:
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def iter_parquet_batches(s3_client: Any, bucket: str, key: str,
+                         batch_rows: int = PARQUET_BATCH_ROWS) -> Iterator[Any]:
+    """Record batches de un Parquet en S3, un row group a la vez (memoria acotada)."""
+    if pq is None:
+        raise RuntimeError("Se necesita el paquete pyarrow para importar archivos Parquet")
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    source = S3RangeFile(s3_client, bucket, key, head['ContentLength'], head.get('ETag'))
+    parquet_file = pq.ParquetFile(source)
+    print(f"[INFO] Parquet: {parquet_file.metadata.num_rows} filas en "
+          f"{parquet_file.metadata.num_row_groups} row groups")
+    yield from parquet_file.iter_batches(batch_size=batch_rows)
+
+
+def _text_column(batch: Any, name: str) -> Any:
+    """Columna como texto sin espacios al borde; vacíos y faltantes como null."""
+    index = batch.schema.get_field_index(name)
+    if index < 0:
+        return pa.nulls(batch.num_rows, pa.string())
+    column = batch.column(index)
+    if not pa.types.is_string(column.type):
+        column = pc.cast(column, pa.string())
+    column = pc.utf8_trim_whitespace(column)
+    return pc.if_else(pc.equal(column, ''), pa.scalar(None, pa.string()), column)
+
+
+def _tag_column(batch: Any) -> Any:
+    index = batch.schema.get_field_index('tiene_tag')
+    if index < 0:
+        return pa.repeat(False, batch.num_rows)
+    column = batch.column(index)
+    if pa.types.is_boolean(column.type):
+        return pc.fill_null(column, False)
+    if pa.types.is_integer(column.type):
+        return pc.fill_null(pc.not_equal(column, 0), False)
+    return pc.is_in(pc.utf8_lower(_text_column(batch, 'tiene_tag')), value_set=pa.array(TAG_TRUE_VALUES))
+
+
+def _balance_column(batch: Any) -> Any:
+    """
+    saldo_disponible (quetzales) a centavos enteros, redondeo half-even como
+    parse_amount. En columnas de texto los montos inválidos quedan null.
+    """
+    index = batch.schema.get_field_index('saldo_disponible')
+    if index < 0:
+        return pa.repeat(0, batch.num_rows)
+    column = batch.column(index)
+    if pa.types.is_decimal(column.type) or pa.types.is_floating(column.type) or pa.types.is_integer(column.type):
+        if pa.types.is_integer(column.type):
+            column = pc.cast(column, pa.float64())
+        cents = pc.round(pc.multiply(column, 100), ndigits=0, round_mode='half_to_even')
+        return pc.fill_null(pc.cast(cents, pa.int64()), 0)
+
+    # Texto: mismas reglas que el CSV (fallback por valor)
+    values = []
+    for value in _text_column(batch, 'saldo_disponible').to_pylist():
+        try:
+            values.append(parse_amount(value))
+        except ValueError:
+            values.append(None)
+    return pa.array(values, pa.int64())
+
+
+def users_from_batch(batch: Any, source: str = '', first_row: int = 1,
+                     validator: Optional[validation.ImportValidator] = None) -> List[Dict[str, Any]]:
+    """
+    Normaliza un record batch con las mismas reglas que parse_user_row, columna
+    por columna, y retorna los items listos para DynamoDB (sin atributos nulos).
+    Las filas sin placa o con saldo inválido se descartan. `first_row` es el
+    número (desde 1) de la primera fila del batch en el archivo, para el
+    reporte del validador.
+    """
+    placa = pc.utf8_upper(_text_column(batch, 'placa'))
+    email = _text_column(batch, 'email')
+    telefono = _text_column(batch, 'telefono')
+    inferred_type = pc.if_else(
+        pc.or_(pc.is_valid(email), pc.is_valid(telefono)), 'registrado', 'no_registrado'
+    )
+    columns = {
+        'placa': placa,
+        'nombre': pc.fill_null(_text_column(batch, 'nombre'), 'Sin Nombre'),
+        'email': email,
+        'telefono': telefono,
+        'tipo_usuario': pc.coalesce(_text_column(batch, 'tipo_usuario'), inferred_type),
+        'tiene_tag': _tag_column(batch),
+        'tag_id': _text_column(batch, 'tag_id'),
+        BALANCE_FIELD: _balance_column(batch),
+        'estado': pa.repeat('activo', batch.num_rows),
+    }
+    table = pa.table(columns)
+
+    valid = pc.and_(pc.is_valid(placa), pc.is_valid(columns[BALANCE_FIELD]))
+    skipped = batch.num_rows - pc.sum(valid).as_py() if batch.num_rows else 0
+    if skipped:
+        print(f"[WARNING] {skipped} filas sin placa o con saldo inválido descartadas en {source}batch")
+        if validator is not None:
+            _reject_rows(batch, placa, pc.indices_nonzero(pc.invert(valid)).to_pylist(), first_row, validator)
+        table = table.filter(valid)
+
+    names = table.column_names
+    values = [table.column(name).to_pylist() for name in names]
+    users = [{k: v for k, v in zip(names, row) if v is not None} for row in zip(*values)]
+
+    if validator is not None:
+        offsets = pc.indices_nonzero(valid).to_pylist() if skipped else range(len(users))
+        for offset, user in zip(offsets, users):
+            validator.observe(first_row + offset, user)
+    return users
+
+
+def _reject_rows(batch: Any, placa: Any, offsets: List[int], first_row: int,
+                 validator: validation.ImportValidator) -> None:
+    raw_balance = _text_column(batch, 'saldo_disponible')
+    for offset in offsets:
+        row_number = first_row + offset
+        if not placa[offset].is_valid:
+            validator.reject_row(row_number, validation.MISSING_PLACA, f"Placa vacía en fila {row_number}")
+        else:
+            validator.reject_row(row_number, validation.INVALID_BALANCE,
+                                 f"Saldo inválido '{raw_balance[offset].as_py()}' en fila {row_number}")
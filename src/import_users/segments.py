@@ -0,0 +1,204 @@
+"""
+GUATEPASS - Importación segmentada y reanudable
+================================================
+Divide un CSV grande de S3 en segmentos de bytes alineados a inicio de línea
+para importarlos en paralelo (varias invocaciones Lambda o procesos locales).
+
+El coordinador guarda un manifiesto en S3 con los rangos y el header:
+
+    <prefix>/<key>/<etag>/manifest.json
+    <prefix>/<key>/<etag>/segment-00003.json   (checkpoint de un segmento terminado)
+
+Cada segmento terminado sin errores escribe su checkpoint con sus estadísticas.
+Si la importación se corta (timeout, throttling, error), volver a ejecutar el
+coordinador con el mismo objeto solo procesa los segmentos sin checkpoint. El
+ETag forma parte de la ruta: si el archivo se vuelve a subir con otro
+contenido, la importación empieza de cero.
+
+Los límites se buscan con lecturas pequeñas (Range) después de cada corte
+nominal; asume que ningún campo del CSV contiene saltos de línea, como en los
+archivos del registro.
+"""
+
+import codecs
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+PROBE_BYTES = 64 * 1024
+
+
+def iter_text_lines(body: Any, chunk_size: int) -> Iterator[str]:
+    """Decodifica un StreamingBody por bloques y entrega líneas completas."""
+    return iter_decoded_lines(body.iter_chunks(chunk_size))
+
+
+def iter_decoded_lines(chunks: Iterable[bytes]) -> Iterator[str]:
+    """
+    Decodifica bloques de bytes UTF-8 y entrega líneas completas.
+
+    El decodificador incremental maneja caracteres UTF-8 partidos entre bloques
+    (y el BOM de archivos exportados desde Excel). Las líneas conservan su '\\n'
+    para que csv respete los campos entre comillas con saltos de línea.
+    """
+    decoder = codecs.getincrementaldecoder('utf-8-sig')()
+    pending = ''
+    for chunk in chunks:
+        lines = (pending + decoder.decode(chunk)).split('\n')
+        pending = lines.pop()
+        for line in lines:
+            yield line + '\n'
+    pending += decoder.decode(b'', final=True)
+    if pending:
+        yield pending
+
+
+def _read_range(s3_client: Any, bucket: str, key: str, start: int, end: int) -> bytes:
+    response = s3_client.get_object(Bucket=bucket, Key=key, Range=f'bytes={start}-{end}')
+    return response['Body'].read()
+
+
+def _next_line_start(s3_client: Any, bucket: str, key: str, position: int, size: int) -> int:
+    """Primer byte después del siguiente '\\n' a partir de `position` (o size si no hay más)."""
+    probe = PROBE_BYTES
+    while position < size:
+        data = _read_range(s3_client, bucket, key, position, min(position + probe, size) - 1)
+        newline = data.find(b'\n')
+        if newline >= 0:
+            return position + newline + 1
+        position += len(data)
+    return size
+
+
+def plan_segments(s3_client: Any, bucket: str, key: str, segment_bytes: int) -> Dict[str, Any]:
+    """
+    Calcula los segmentos de un objeto CSV.
+
+    Returns:
+        Manifiesto con header, tamaño, ETag y segmentos [{index, start, end}]
+        (end inclusivo, como en los rangos HTTP)
+    """
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    size = head['ContentLength']
+
+    header_end = _next_line_start(s3_client, bucket, key, 0, size)
+    header = _read_range(s3_client, bucket, key, 0, header_end - 1).decode('utf-8-sig') if size else ''
+
+    boundaries = [header_end]
+    while boundaries[-1] + segment_bytes < size:
+        boundary = _next_line_start(s3_client, bucket, key, boundaries[-1] + segment_bytes, size)
+        if boundary >= size:
+            break
+        boundaries.append(boundary)
+    boundaries.append(size)
+
+    segments = [
+        {'index': index, 'start': start, 'end': end - 1}
+        for index, (start, end) in enumerate(zip(boundaries, boundaries[1:]))
+        if end > start
+    ]
+
+    return {
+        'bucket': bucket,
+        'key': key,
+        'etag': head['ETag'],
+        'size': size,
+        'header': header if header.endswith('\n') else header + '\n',
+        'segment_bytes': segment_bytes,
+        'segments': segments,
+        'created_at': datetime.utcnow().isoformat() + 'Z'
+    }
+
+
+def checkpoint_prefix(prefix: str, key: str, etag: str) -> str:
+    version = etag.strip('"')
+    return f"{prefix.rstrip('/')}/{key}/{version}"
+
+
+def manifest_key(manifest: Dict[str, Any], prefix: str) -> str:
+    return f"{checkpoint_prefix(prefix, manifest['key'], manifest['etag'])}/manifest.json"
+
+
+def segment_checkpoint_key(manifest: Dict[str, Any], prefix: str, index: int) -> str:
+    return f"{checkpoint_prefix(prefix, manifest['key'], manifest['etag'])}/segment-{index:05d}.json"
+
+
+def load_manifest(s3_client: Any, checkpoint_bucket: str, key: str) -> Optional[Dict[str, Any]]:
+    try:
+        response = s3_client.get_object(Bucket=checkpoint_bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+def prepare_manifest(s3_client: Any, checkpoint_bucket: str, bucket: str, key: str,
+                     segment_bytes: int, prefix: str) -> Dict[str, Any]:
+    """
+    Manifiesto de la importación: el existente si ya se planificó este mismo
+    objeto (misma versión), o uno nuevo guardado en S3.
+    """
+    head = s3_client.head_object(Bucket=bucket, Key=key)
+    existing_key = f"{checkpoint_prefix(prefix, key, head['ETag'])}/manifest.json"
+    manifest = load_manifest(s3_client, checkpoint_bucket, existing_key)
+    if manifest is not None:
+        print(f"[INFO] Reanudando importación con manifiesto existente s3://{checkpoint_bucket}/{existing_key}")
+        return manifest
+
+    manifest = plan_segments(s3_client, bucket, key, segment_bytes)
+    s3_client.put_object(
+        Bucket=checkpoint_bucket,
+        Key=manifest_key(manifest, prefix),
+        Body=json.dumps(manifest).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"[INFO] Manifiesto creado: {len(manifest['segments'])} segmentos de ~{segment_bytes} bytes")
+    return manifest
+
+
+def completed_segments(s3_client: Any, checkpoint_bucket: str, manifest: Dict[str, Any],
+                       prefix: str) -> Dict[int, Dict[str, Any]]:
+    """Checkpoints de los segmentos terminados, por índice."""
+    base = checkpoint_prefix(prefix, manifest['key'], manifest['etag']) + '/segment-'
+    completed = {}
+    params = {'Bucket': checkpoint_bucket, 'Prefix': base}
+    while True:
+        response = s3_client.list_objects_v2(**params)
+        for entry in response.get('Contents', []):
+            body = s3_client.get_object(Bucket=checkpoint_bucket, Key=entry['Key'])['Body'].read()
+            checkpoint = json.loads(body)
+            completed[checkpoint['segment']] = checkpoint
+        if not response.get('IsTruncated'):
+            break
+        params['ContinuationToken'] = response['NextContinuationToken']
+    return completed
+
+
+def pending_segments(s3_client: Any, checkpoint_bucket: str, manifest: Dict[str, Any],
+                     prefix: str) -> List[int]:
+    done = completed_segments(s3_client, checkpoint_bucket, manifest, prefix)
+    return [segment['index'] for segment in manifest['segments'] if segment['index'] not in done]
+
+
+def save_checkpoint(s3_client: Any, checkpoint_bucket: str, manifest: Dict[str, Any], prefix: str,
+                    index: int, stats: Dict[str, Any]) -> None:
+    checkpoint = {**stats, 'segment': index, 'finished_at': datetime.utcnow().isoformat() + 'Z'}
+    s3_client.put_object(
+        Bucket=checkpoint_bucket,
+        Key=segment_checkpoint_key(manifest, prefix, index),
+        Body=json.dumps(checkpoint).encode('utf-8'),
+        ContentType='application/json'
+    )
+
+
+def iter_segment_lines(s3_client: Any, manifest: Dict[str, Any], index: int,
+                       chunk_size: int) -> Iterator[str]:
+    """Header del archivo seguido de las líneas del segmento (leídas en streaming con Range)."""
+    segment = manifest['segments'][index]
+    response = s3_client.get_object(
+        Bucket=manifest['bucket'],
+        Key=manifest['key'],
+        Range=f"bytes={segment['start']}-{segment['end']}",
+        IfMatch=manifest['etag']
+    )
+    yield manifest['header']
+    yield from iter_text_lines(response['Body'], chunk_size)
@@ -0,0 +1,256 @@
+"""
+GUATEPASS - Validación del archivo de usuarios antes de escribir
+=================================================================
+Una sola pasada sobre el archivo detecta, antes de gastar capacidad de
+escritura en DynamoDB:
+
+    placa_vacia          fila sin placa
+    columnas_invalidas   fila con más o menos columnas que el header
+    saldo_invalido       saldo_disponible que no es un monto
+    placa_duplicada      la misma placa en dos o más filas
+    tag_id_en_conflicto  el mismo tag_id en filas de placas distintas
+
+Las filas mal formadas se descartan al parsearlas. En los conflictos no hay
+una fila "correcta" (en DynamoDB ganaría la última escrita), así que se
+rechazan todas las filas de las placas involucradas.
+
+Para detectar conflictos no se guardan las placas: cada placa y tag_id se
+reduce a una huella de 64 bits (blake2b) que se acumula, con su número de
+fila, en arrays particionados por el primer byte de la huella (12 bytes por
+fila, 20 más si tiene tag). Al terminar el archivo cada partición se resuelve
+con un dict, así que todo es O(n) y la memoria pico es la de los arrays más
+un dict de 1/256 del archivo.
+
+El resultado se publica en S3 junto al reporte de rechazos:
+
+    <prefix>/<key>/<etag>/rejects.csv          fila, motivo, detalle
+    <prefix>/<key>/<etag>/rejected-keys.bin    huellas de las placas rechazadas
+    <prefix>/<key>/<etag>/summary.json         conteos por motivo
+
+Los escritores (segmentos incluidos) cargan rejected-keys.bin y saltan esas
+placas. El ETag forma parte de la ruta, como en los checkpoints de segments.py.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import tempfile
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+from typing import Any, Dict, Optional, Set, Tuple
+
+MISSING_PLACA = 'placa_vacia'
+BAD_COLUMNS = 'columnas_invalidas'
+INVALID_BALANCE = 'saldo_invalido'
+INVALID_ROW = 'fila_invalida'
+DUPLICATE_PLACA = 'placa_duplicada'
+TAG_CONFLICT = 'tag_id_en_conflicto'
+
+PARTITIONS = 256
+REPORT_FIELDS = ('fila', 'motivo', 'detalle')
+
+
+class RowRejected(ValueError):
+    """Fila mal formada; `reason` es uno de los motivos del reporte."""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def key_digest(value: str) -> bytes:
+    """Huella de 64 bits de una placa o tag_id (estable entre procesos)."""
+    return hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+
+
+def _as_int(digest: bytes) -> int:
+    return memoryview(digest).cast('q')[0]
+
+
+class RejectedKeys:
+    """Placas rechazadas como huellas ordenadas: `placa in rejected`."""
+
+    def __init__(self, keys: Optional[array] = None):
+        self._keys = keys if keys is not None else array('q')
+
+    def __contains__(self, placa: str) -> bool:
+        if not self._keys:
+            return False
+        key = _as_int(key_digest(placa))
+        index = bisect_left(self._keys, key)
+        return index < len(self._keys) and self._keys[index] == key
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def to_bytes(self) -> bytes:
+        return self._keys.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> 'RejectedKeys':
+        keys = array('q')
+        keys.frombytes(data)
+        return cls(keys)
+
+
+class ImportValidator:
+    """
+    Acumula las filas de un archivo (observe / reject_row) y al final
+    resuelve los conflictos (finish). El reporte se escribe en /tmp.
+    """
+
+    def __init__(self):
+        self._placas = [bytearray() for _ in range(PARTITIONS)]
+        self._placa_rows = [array('I') for _ in range(PARTITIONS)]
+        self._tags = [bytearray() for _ in range(PARTITIONS)]
+        self._tag_owners = [bytearray() for _ in range(PARTITIONS)]
+        self._tag_rows = [array('I') for _ in range(PARTITIONS)]
+        self._report_file = tempfile.TemporaryFile()
+        self._report = io.TextIOWrapper(self._report_file, encoding='utf-8', newline='')
+        self._writer = csv.writer(self._report)
+        self._writer.writerow(REPORT_FIELDS)
+        self.rows = 0
+        self.report_entries = 0
+        self.reasons: Dict[str, int] = {}
+        self.rejected: Optional[RejectedKeys] = None
+
+    def observe(self, row_number: int, user: Dict[str, Any]) -> None:
+        """Registra una fila válida (placa y tag_id ya normalizados)."""
+        self.rows += 1
+        placa = key_digest(user['placa'])
+        partition = placa[0]
+        self._placas[partition] += placa
+        self._placa_rows[partition].append(row_number)
+
+        tag_id = user.get('tag_id')
+        if tag_id:
+            tag = key_digest(tag_id)
+            partition = tag[0]
+            self._tags[partition] += tag
+            self._tag_owners[partition] += placa
+            self._tag_rows[partition].append(row_number)
+
+    def reject_row(self, row_number: int, reason: str, detail: str) -> None:
+        """Fila mal formada: va al reporte y no se escribe."""
+        self.rows += 1
+        self._record(row_number, reason, detail)
+
+    def _record(self, row_number: int, reason: str, detail: str) -> None:
+        self._writer.writerow((row_number, reason, detail))
+        self.report_entries += 1
+        self.reasons[reason] = self.reasons.get(reason, 0) + 1
+
+    def finish(self) -> RejectedKeys:
+        """Resuelve los conflictos partición por partición y retorna las placas rechazadas."""
+        rejected: Set[int] = set()
+
+        for partition in range(PARTITIONS):
+            first_rows: Dict[int, int] = {}
+            reported: Set[int] = set()
+            for key, row in zip(memoryview(self._placas[partition]).cast('q'), self._placa_rows[partition]):
+                first = first_rows.setdefault(key, row)
+                if first == row:
+                    continue
+                if key not in reported:
+                    reported.add(key)
+                    self._record(first, DUPLICATE_PLACA, f"misma placa que la fila {row}")
+                self._record(row, DUPLICATE_PLACA, f"misma placa que la fila {first}")
+                rejected.add(key)
+            self._placas[partition] = bytearray()
+            self._placa_rows[partition] = array('I')
+
+        for partition in range(PARTITIONS):
+            owners: Dict[int, Tuple[int, int]] = {}
+            reported = set()
+            tags = zip(memoryview(self._tags[partition]).cast('q'),
+                       memoryview(self._tag_owners[partition]).cast('q'),
+                       self._tag_rows[partition])
+            for key, owner, row in tags:
+                first_owner, first_row = owners.setdefault(key, (owner, row))
+                if first_owner == owner:
+                    continue
+                if key not in reported:
+                    reported.add(key)
+                    self._record(first_row, TAG_CONFLICT, f"mismo tag_id que la fila {row} (otra placa)")
+                    rejected.add(first_owner)
+                self._record(row, TAG_CONFLICT, f"mismo tag_id que la fila {first_row} (otra placa)")
+                rejected.add(owner)
+            self._tags[partition] = bytearray()
+            self._tag_owners[partition] = bytearray()
+            self._tag_rows[partition] = array('I')
+
+        self.rejected = RejectedKeys(array('q', sorted(rejected)))
+        return self.rejected
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            'rows': self.rows,
+            'report_entries': self.report_entries,
+            'rejected_placas': len(self.rejected) if self.rejected is not None else 0,
+            'reasons': dict(sorted(self.reasons.items()))
+        }
+
+    def publish(self, s3_client: Any, bucket: str, prefix: str, key: str, etag: str) -> Dict[str, Any]:
+        """Sube el reporte, las placas rechazadas y el resumen; retorna el resumen."""
+        if self.rejected is None:
+            self.finish()
+        base = rejects_prefix(prefix, key, etag)
+        summary = {
+            **self.summary(),
+            'source': f"s3://{bucket}/{key}",
+            'report_key': f"{base}/rejects.csv",
+            'rejected_keys_key': f"{base}/rejected-keys.bin",
+            'created_at': datetime.utcnow().isoformat() + 'Z'
+        }
+
+        self._report.flush()
+        self._report_file.seek(0)
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=summary['report_key'],
+            Body=self._report_file,
+            ContentType='text/csv'
+        )
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=summary['rejected_keys_key'],
+            Body=self.rejected.to_bytes(),
+            ContentType='application/octet-stream'
+        )
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=f"{base}/summary.json",
+            Body=json.dumps(summary).encode('utf-8'),
+            ContentType='application/json'
+        )
+        return summary
+
+    def close(self) -> None:
+        self._report.close()
+
+    def __enter__(self) -> 'ImportValidator':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def rejects_prefix(prefix: str, key: str, etag: str) -> str:
+    version = etag.strip('"')
+    return f"{prefix.rstrip('/')}/{key}/{version}"
+
+
+def load_summary(s3_client: Any, bucket: str, prefix: str, key: str, etag: str) -> Optional[Dict[str, Any]]:
+    """Resumen de una validación ya hecha para esta versión del objeto (o None)."""
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=f"{rejects_prefix(prefix, key, etag)}/summary.json")
+    except s3_client.exceptions.NoSuchKey:
+        return None
+    return json.loads(response['Body'].read())
+
+
+def load_rejected_keys(s3_client: Any, bucket: str, rejected_keys_key: str) -> RejectedKeys:
+    response = s3_client.get_object(Bucket=bucket, Key=rejected_keys_key)
+    return RejectedKeys.from_bytes(response['Body'].read())
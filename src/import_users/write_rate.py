@@ -0,0 +1,123 @@
+"""
+GUATEPASS - Control de ritmo de escritura para cargas masivas
+==============================================================
+La importación comparte GuatepassUsers con el procesamiento de peajes (Step
+Functions). Sin control, los hilos escritores consumen toda la capacidad de
+la tabla y los cobros en vivo también reciben throttling.
+
+WriteRateController es un token bucket cuyo ritmo se ajusta con AIMD:
+
+    - arranque: el ritmo crece x1.5 por intervalo hasta el primer throttling
+    - throttling (excepción o UnprocessedItems): ritmo x0.5, como máximo una
+      vez por intervalo (varios hilos ven el mismo episodio)
+    - intervalo sin throttling: +5% del techo
+    - techo: IMPORT_WRITE_CAPACITY_SHARE x IMPORT_TABLE_WRITE_UNITS
+
+Así la carga corre tan rápido como la tabla lo permite pero deja el resto de
+la capacidad (y la que libera al retroceder) para el tráfico en vivo. Una
+unidad es un item escrito de hasta 1 KB (los usuarios del CSV lo son).
+"""
+
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+SLOW_START_FACTOR = 1.5
+DECREASE_FACTOR = 0.5
+INCREASE_SHARE = 0.05
+ADJUST_INTERVAL_SECONDS = 1.0
+BURST_SECONDS = 0.5
+MIN_RATE = 5.0
+
+
+class WriteRateController:
+    """Token bucket con ritmo AIMD (unidades de escritura por segundo). Thread-safe."""
+
+    def __init__(self, ceiling: float, initial_rate: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.ceiling = max(float(ceiling), MIN_RATE)
+        self.rate = min(self.ceiling, max(MIN_RATE, initial_rate or self.ceiling / 4))
+        self._clock = clock
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._slow_start = True
+        self._throttled_in_interval = False
+        self._tokens = 0.0
+
+        now = clock()
+        self._started_at = now
+        self._refilled_at = now
+        self._interval_started_at = now
+        self._last_decrease_at = now - ADJUST_INTERVAL_SECONDS
+
+        self.written_units = 0
+        self.throttle_events = 0
+        self.decreases = 0
+        self.wait_seconds = 0.0
+        self.rate_min = self.rate
+        self.rate_max = self.rate
+
+    def acquire(self, units: int) -> None:
+        """Bloquea hasta que haya capacidad para `units` escrituras (reserva el turno)."""
+        with self._lock:
+            now = self._clock()
+            self._adjust(now)
+            self._tokens = min(self.rate * BURST_SECONDS,
+                               self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            self._tokens -= units
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.wait_seconds += wait
+        if wait > 0:
+            self._sleep(wait)
+
+    def record_success(self, units: int) -> None:
+        with self._lock:
+            self.written_units += units
+            self._adjust(self._clock())
+
+    def record_throttle(self) -> None:
+        """Throttling o UnprocessedItems: baja el ritmo (una vez por intervalo)."""
+        with self._lock:
+            now = self._clock()
+            self.throttle_events += 1
+            self._throttled_in_interval = True
+            self._slow_start = False
+            if now - self._last_decrease_at >= ADJUST_INTERVAL_SECONDS:
+                self._set_rate(self.rate * DECREASE_FACTOR)
+                self.decreases += 1
+                self._last_decrease_at = now
+                # Descarta la ráfaga acumulada al ritmo anterior
+                self._tokens = min(self._tokens, 0.0)
+
+    def _adjust(self, now: float) -> None:
+        if now - self._interval_started_at < ADJUST_INTERVAL_SECONDS:
+            return
+        if not self._throttled_in_interval:
+            if self._slow_start:
+                self._set_rate(self.rate * SLOW_START_FACTOR)
+            else:
+                self._set_rate(self.rate + self.ceiling * INCREASE_SHARE)
+        self._throttled_in_interval = False
+        self._interval_started_at = now
+
+    def _set_rate(self, rate: float) -> None:
+        self.rate = min(self.ceiling, max(MIN_RATE, rate))
+        self.rate_min = min(self.rate_min, self.rate)
+        self.rate_max = max(self.rate_max, self.rate)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Ritmo logrado y ajustes del controlador (unidades de escritura por segundo)."""
+        with self._lock:
+            elapsed = self._clock() - self._started_at
+            return {
+                'ceiling': round(self.ceiling, 1),
+                'achieved_rate': round(self.written_units / elapsed, 1) if elapsed > 0 else 0.0,
+                'final_rate': round(self.rate, 1),
+                'min_rate': round(self.rate_min, 1),
+                'max_rate': round(self.rate_max, 1),
+                'written_units': self.written_units,
+                'throttle_events': self.throttle_events,
+                'decreases': self.decreases,
+                'wait_seconds': round(self.wait_seconds, 3)
+            }
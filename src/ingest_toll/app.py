@@ -3,22 +3,45 @@ GUATEPASS - Ingest Toll Function
 =================================
 Lambda function que recibe eventos de paso por peaje desde el sistema de cámaras.
 
-Endpoint: POST /webhook/toll
+Endpoints:
+- POST /webhook/toll        (un evento por request)
+- POST /webhook/toll/batch  (lote de eventos de una garita)
 """
 
 import json
 import os
+import time
 import boto3
-from typing import Dict, Any
+from typing import Dict, Any, List, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import uuid
 
-# Cliente EventBridge
+from dedup import DedupWindow, detection_epoch, claim_detection, release_detection
+
+# Clientes AWS
 eventbridge = boto3.client('events')
+dynamodb = boto3.resource('dynamodb')
 
 # Variables de entorno
 EVENT_BUS_NAME = os.environ['EVENT_BUS_NAME']
 ENVIRONMENT = os.environ.get('ENVIRONMENT', 'dev')
+MAX_BATCH_SIZE = int(os.environ.get('MAX_BATCH_SIZE', '500'))
+PUBLISH_MAX_ATTEMPTS = int(os.environ.get('PUBLISH_MAX_ATTEMPTS', '3'))
+
+# EventBridge acepta máximo 10 entries por llamada a put_events
+EVENTBRIDGE_MAX_ENTRIES = 10
+BATCH_RESOURCE = '/webhook/toll/batch'
+
+# Supresión de duplicados: ventana en memoria + registro compartido en DynamoDB
+DEDUP_WINDOW_SECONDS = int(os.environ.get('DEDUP_WINDOW_SECONDS', '10'))
+DEDUP_MAX_ENTRIES = int(os.environ.get('DEDUP_MAX_ENTRIES', '50000'))
+DEDUP_RECORD_TTL_SECONDS = int(os.environ.get('DEDUP_RECORD_TTL_SECONDS', '3600'))
+IDEMPOTENCY_TABLE_NAME = os.environ.get('IDEMPOTENCY_TABLE_NAME')
+idempotency_table = dynamodb.Table(IDEMPOTENCY_TABLE_NAME) if IDEMPOTENCY_TABLE_NAME else None
+
+# La ventana vive a nivel de módulo para sobrevivir entre invocaciones "warm"
+dedup_window = DedupWindow(DEDUP_WINDOW_SECONDS, DEDUP_MAX_ENTRIES)
 
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
@@ -40,14 +63,14 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns:
         Response HTTP 200 (aceptado) o 400 (error de validación)
     """
+    if is_batch_request(event):
+        return batch_handler(event, context)
+    
     print(f"[INFO] POST /webhook/toll - Event: {json.dumps(event)}")
     
     try:
         # Parsear body del request
-        if 'body' in event:
-            body = json.loads(event['body']) if isinstance(event['body'], str) else event['body']
-        else:
-            body = event  # Para pruebas directas
+        body = parse_body(event)
         
         # Validar campos requeridos
         validation_error = validate_toll_event(body)
@@ -59,8 +82,22 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         print(f"[INFO] Evento validado y enriquecido: {json.dumps(enriched_event)}")
         
-        # Publicar evento a EventBridge
-        publish_to_eventbridge(enriched_event)
+        # Descartar detecciones repetidas de la misma cámara/carril
+        if is_duplicate_detection(enriched_event):
+            print(f"[INFO] Detección duplicada descartada: placa={enriched_event['placa']}, peaje={enriched_event['peaje_id']}")
+            return success_response(200, {
+                'message': 'Evento duplicado, ya fue recibido',
+                'duplicate': True,
+                'placa': enriched_event['placa'],
+                'peaje_id': enriched_event['peaje_id']
+            })
+        
+        # Publicar evento a EventBridge (si falla, se libera el registro de duplicados)
+        try:
+            publish_to_eventbridge(enriched_event)
+        except Exception:
+            release_detections([enriched_event])
+            raise
         
         print(f"[SUCCESS] Evento de peaje procesado: placa={enriched_event['placa']}, peaje={enriched_event['peaje_id']}")
         
@@ -80,6 +117,115 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return error_response(500, f"Error interno: {str(e)}")
 
 
+def batch_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Handler para lotes de eventos de peaje enviados por las garitas.
+    
+    Payload esperado:
+    {
+        "events": [
+            {"placa": "P-123ABC", "peaje_id": "PEAJE_ZONA10", "tag_id": null, "timestamp": "..."},
+            ...
+        ]
+    }
+    
+    Cada evento se valida de forma independiente; los válidos se publican a
+    EventBridge en bloques de 10 entries y solo se reintentan los que fallan.
+    
+    Returns:
+        Response HTTP 200 (todos aceptados), 207 (aceptación parcial) o 400
+    """
+    try:
+        body = parse_body(event)
+        toll_events = body.get('events') if isinstance(body, dict) else body
+        
+        if not isinstance(toll_events, list) or not toll_events:
+            return error_response(400, "Se requiere una lista no vacía en 'events'")
+        
+        if len(toll_events) > MAX_BATCH_SIZE:
+            return error_response(400, f"El lote excede el máximo de {MAX_BATCH_SIZE} eventos")
+        
+        print(f"[INFO] POST {BATCH_RESOURCE} - Eventos recibidos: {len(toll_events)}")
+        
+        # Validar y enriquecer todo el lote en una sola pasada
+        results: List[Dict[str, Any]] = []
+        enriched_events: List[Dict[str, Any]] = []
+        
+        for index, raw_event in enumerate(toll_events):
+            if not isinstance(raw_event, dict):
+                results.append({'index': index, 'status': 'rejected', 'error': 'Evento con formato inválido'})
+                continue
+            
+            validation_error = validate_toll_event(raw_event)
+            if validation_error:
+                results.append({'index': index, 'status': 'rejected', 'error': validation_error})
+                continue
+            
+            enriched_event = enrich_toll_event(raw_event)
+            enriched_events.append(enriched_event)
+            results.append({
+                'index': index,
+                'status': 'accepted',
+                'event_id': enriched_event['event_id'],
+                'placa': enriched_event['placa'],
+                'peaje_id': enriched_event['peaje_id']
+            })
+        
+        # Descartar duplicados antes de publicar
+        duplicate_ids = find_duplicate_detections(enriched_events)
+        for result in results:
+            if result.get('event_id') in duplicate_ids:
+                result['status'] = 'duplicate'
+        enriched_events = [e for e in enriched_events if e['event_id'] not in duplicate_ids]
+        
+        # Publicar los válidos y marcar los que no se pudieron publicar
+        publish_errors = publish_batch_to_eventbridge(enriched_events)
+        release_detections([e for e in enriched_events if e['event_id'] in publish_errors])
+        for result in results:
+            error = publish_errors.get(result.get('event_id'))
+            if error:
+                result['status'] = 'failed'
+                result['error'] = error
+        
+        accepted = sum(1 for r in results if r['status'] == 'accepted')
+        rejected = sum(1 for r in results if r['status'] == 'rejected')
+        failed = sum(1 for r in results if r['status'] == 'failed')
+        duplicates = len(duplicate_ids)
+        
+        print(f"[SUCCESS] Lote procesado: accepted={accepted}, duplicates={duplicates}, rejected={rejected}, failed={failed}")
+        
+        return success_response(200 if accepted + duplicates == len(results) else 207, {
+            'message': 'Lote de eventos procesado',
+            'total': len(results),
+            'accepted': accepted,
+            'duplicates': duplicates,
+            'rejected': rejected,
+            'failed': failed,
+            'results': results
+        })
+        
+    except json.JSONDecodeError as e:
+        print(f"[ERROR] JSON inválido: {str(e)}")
+        return error_response(400, f"JSON inválido: {str(e)}")
+    
+    except Exception as e:
+        print(f"[ERROR] Error procesando lote: {str(e)}")
+        return error_response(500, f"Error interno: {str(e)}")
+
+
+def is_batch_request(event: Dict[str, Any]) -> bool:
+    """Indica si el request llegó por el endpoint de lotes."""
+    resource = event.get('resource') or event.get('path') or ''
+    return resource.endswith(BATCH_RESOURCE)
+
+
+def parse_body(event: Dict[str, Any]) -> Any:
+    """Extrae el body del evento de API Gateway (o el evento mismo en pruebas directas)."""
+    if 'body' in event:
+        return json.loads(event['body']) if isinstance(event['body'], str) else event['body']
+    return event
+
+
 def validate_toll_event(body: Dict[str, Any]) -> str:
     """
     Valida que el evento tenga todos los campos requeridos.
@@ -96,6 +242,8 @@ def validate_toll_event(body: Dict[str, Any]) -> str:
     for field in required_fields:
         if field not in body or not body[field]:
             return f"Campo requerido faltante: {field}"
+        if not isinstance(body[field], str):
+            return f"Formato de {field} inválido: {body[field]!r}"
     
     # Validar formato de placa (básico)
     placa = body['placa'].strip()
@@ -140,6 +288,91 @@ def enrich_toll_event(body: Dict[str, Any]) -> Dict[str, Any]:
     }
 
 
+def is_duplicate_detection(toll_event: Dict[str, Any]) -> bool:
+    """
+    Indica si la detección repite una placa ya vista en el mismo peaje
+    dentro de DEDUP_WINDOW_SECONDS.
+    
+    Primero consulta la ventana en memoria del contenedor; si no es duplicado
+    ahí, intenta el registro condicional en la tabla de idempotencia compartida.
+    Si la tabla no está disponible el evento se acepta (fail-open).
+    """
+    detected_at = detection_epoch(toll_event['timestamp'])
+    
+    if dedup_window.is_duplicate(toll_event['placa'], toll_event['peaje_id'], detected_at):
+        return True
+    
+    if idempotency_table is None:
+        return False
+    
+    try:
+        return not claim_detection(
+            idempotency_table, toll_event, detected_at,
+            DEDUP_WINDOW_SECONDS, DEDUP_RECORD_TTL_SECONDS
+        )
+    except Exception as e:
+        print(f"[WARNING] No se pudo verificar duplicado en DynamoDB, se acepta el evento: {str(e)}")
+        return False
+
+
+def find_duplicate_detections(toll_events: List[Dict[str, Any]]) -> Set[str]:
+    """
+    Devuelve los event_id del lote que son duplicados.
+    
+    La ventana en memoria se evalúa en orden (no es thread-safe); los registros
+    condicionales en DynamoDB de los eventos restantes se hacen en paralelo.
+    """
+    duplicates: Set[str] = set()
+    candidates = []
+    
+    for toll_event in toll_events:
+        detected_at = detection_epoch(toll_event['timestamp'])
+        if dedup_window.is_duplicate(toll_event['placa'], toll_event['peaje_id'], detected_at):
+            duplicates.add(toll_event['event_id'])
+        else:
+            candidates.append((toll_event, detected_at))
+    
+    if idempotency_table is None or not candidates:
+        return duplicates
+    
+    def claim(candidate):
+        toll_event, detected_at = candidate
+        try:
+            return claim_detection(
+                idempotency_table, toll_event, detected_at,
+                DEDUP_WINDOW_SECONDS, DEDUP_RECORD_TTL_SECONDS
+            )
+        except Exception as e:
+            print(f"[WARNING] No se pudo verificar duplicado en DynamoDB, se acepta el evento: {str(e)}")
+            return True
+    
+    with ThreadPoolExecutor(max_workers=min(16, len(candidates))) as executor:
+        for (toll_event, _), is_new in zip(candidates, executor.map(claim, candidates)):
+            if not is_new:
+                duplicates.add(toll_event['event_id'])
+    
+    return duplicates
+
+
+def release_detections(toll_events: List[Dict[str, Any]]) -> None:
+    """
+    Libera el registro de duplicados de eventos que no se pudieron publicar
+    (ventana en memoria y registro en DynamoDB), para que el reintento de la
+    cámara se acepte en vez de descartarse como duplicado.
+    """
+    for toll_event in toll_events:
+        detected_at = detection_epoch(toll_event['timestamp'])
+        dedup_window.forget(toll_event['placa'], toll_event['peaje_id'], detected_at)
+        
+        if idempotency_table is None:
+            continue
+        
+        try:
+            release_detection(idempotency_table, toll_event, detected_at, DEDUP_WINDOW_SECONDS)
+        except Exception as e:
+            print(f"[WARNING] No se pudo liberar el registro de duplicados de {toll_event['event_id']}: {str(e)}")
+
+
 def publish_to_eventbridge(toll_event: Dict[str, Any]) -> None:
     """
     Publica el evento a EventBridge para procesamiento asíncrono.
@@ -149,14 +382,7 @@ def publish_to_eventbridge(toll_event: Dict[str, Any]) -> None:
     """
     try:
         response = eventbridge.put_events(
-            Entries=[
-                {
-                    'Source': 'guatepass.toll',
-                    'DetailType': 'TollDetected',
-                    'Detail': json.dumps(toll_event),
-                    'EventBusName': EVENT_BUS_NAME
-                }
-            ]
+            Entries=[build_eventbridge_entry(toll_event)]
         )
         
         if response['FailedEntryCount'] > 0:
@@ -169,6 +395,83 @@ def publish_to_eventbridge(toll_event: Dict[str, Any]) -> None:
         raise
 
 
+def publish_batch_to_eventbridge(toll_events: List[Dict[str, Any]]) -> Dict[str, str]:
+    """
+    Publica un lote de eventos a EventBridge en bloques de 10 entries.
+    
+    Solo las entries que EventBridge reporta con error se reintentan
+    (con backoff exponencial), hasta PUBLISH_MAX_ATTEMPTS intentos.
+    
+    Args:
+        toll_events: Eventos enriquecidos de peaje
+        
+    Returns:
+        Diccionario event_id -> mensaje de error de los eventos no publicados
+    """
+    errors: Dict[str, str] = {}
+    
+    for start in range(0, len(toll_events), EVENTBRIDGE_MAX_ENTRIES):
+        pending = toll_events[start:start + EVENTBRIDGE_MAX_ENTRIES]
+        
+        for attempt in range(PUBLISH_MAX_ATTEMPTS):
+            if attempt > 0:
+                time.sleep(0.1 * (2 ** (attempt - 1)))
+            
+            pending, last_errors = put_events_chunk(pending)
+            if not pending:
+                break
+            
+            print(f"[WARNING] {len(pending)} entries fallidas en intento {attempt + 1}/{PUBLISH_MAX_ATTEMPTS}")
+        
+        for toll_event in pending:
+            errors[toll_event['event_id']] = last_errors.get(toll_event['event_id'], 'Error publicando a EventBridge')
+    
+    published = len(toll_events) - len(errors)
+    print(f"[INFO] Eventos publicados a EventBridge: {published}/{len(toll_events)}")
+    
+    return errors
+
+
+def put_events_chunk(toll_events: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, str]]:
+    """
+    Envía un bloque (máx. 10) de eventos en una sola llamada a put_events.
+    
+    Returns:
+        Tupla (eventos fallidos, event_id -> mensaje de error)
+    """
+    try:
+        response = eventbridge.put_events(
+            Entries=[build_eventbridge_entry(toll_event) for toll_event in toll_events]
+        )
+    except Exception as e:
+        # Error de la llamada completa (ej. throttling): se reintenta todo el bloque
+        print(f"[ERROR] Error publicando bloque a EventBridge: {str(e)}")
+        return toll_events, {toll_event['event_id']: str(e) for toll_event in toll_events}
+    
+    if response.get('FailedEntryCount', 0) == 0:
+        return [], {}
+    
+    # Las entries de la respuesta vienen en el mismo orden que las enviadas
+    failed = []
+    errors = {}
+    for toll_event, entry in zip(toll_events, response['Entries']):
+        if entry.get('ErrorCode'):
+            failed.append(toll_event)
+            errors[toll_event['event_id']] = f"{entry['ErrorCode']}: {entry.get('ErrorMessage', '')}"
+    
+    return failed, errors
+
+
+def build_eventbridge_entry(toll_event: Dict[str, Any]) -> Dict[str, Any]:
+    """Construye la entry de EventBridge para un evento de peaje."""
+    return {
+        'Source': 'guatepass.toll',
+        'DetailType': 'TollDetected',
+        'Detail': json.dumps(toll_event),
+        'EventBusName': EVENT_BUS_NAME
+    }
+
+
 def success_response(status_code: int, data: Dict[str, Any]) -> Dict[str, Any]:
     """Genera respuesta exitosa HTTP."""
     return {
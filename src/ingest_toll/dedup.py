@@ -0,0 +1,199 @@
+"""
+GUATEPASS - Supresión de detecciones duplicadas
+================================================
+Las cámaras de un mismo carril suelen reportar la misma placa dos o tres veces
+en pocos segundos. Este módulo decide si una detección es un duplicado antes de
+publicarla a EventBridge, usando dos niveles:
+
+1. Ventana en memoria (por contenedor Lambda): acotada en tamaño y con expiración
+   por TTL. Resuelve los duplicados que llegan al mismo contenedor.
+2. Registro de idempotencia en DynamoDB (compartido): un registro por
+   (placa, peaje_id, bucket de tiempo de window_seconds) con el detected_at de
+   la detección aceptada. Resuelve los duplicados que llegan a contenedores
+   distintos.
+
+Dos detecciones a menos de window_seconds caen en el mismo bucket o en buckets
+vecinos, así que claim_detection escribe su bucket y, en la misma
+TransactWriteItems, verifica los dos vecinos: cada bucket tiene a lo sumo una
+detección aceptada y se compara contra su detected_at, igual que la ventana en
+memoria (abs(diferencia) < window_seconds).
+
+El reclamo se hace antes de publicar a EventBridge para que dos contenedores
+no publiquen el mismo paso; si la publicación falla, release_detection borra el
+registro (y DedupWindow.forget la entrada en memoria) para que el reintento de
+la cámara no se descarte como duplicado.
+"""
+
+import time
+from collections import OrderedDict
+from datetime import datetime
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+# Intentos de la transacción si choca con otra sobre los mismos buckets (TransactionConflict)
+CLAIM_MAX_ATTEMPTS = 3
+
+
+class DedupWindow:
+    """
+    Ventana en memoria de detecciones recientes por (placa, peaje_id).
+
+    Guarda el timestamp de la última detección aceptada de cada llave. Las
+    entradas expiran después de ttl_seconds (tiempo de pared del contenedor) y,
+    si se supera max_entries, se descartan las más antiguas primero.
+    """
+
+    def __init__(self, window_seconds: int, max_entries: int, ttl_seconds: Optional[int] = None):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds if ttl_seconds is not None else window_seconds * 6
+        self._entries: 'OrderedDict[Tuple[str, str], Tuple[float, float]]' = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def is_duplicate(self, placa: str, peaje_id: str, detected_at: float) -> bool:
+        """
+        Indica si la detección cae dentro de la ventana de una detección previa.
+        Si no es duplicado, la registra como la última detección de la llave.
+        """
+        now = time.monotonic()
+        self._evict(now)
+
+        key = (placa, peaje_id)
+        previous = self._entries.get(key)
+        if previous is not None and abs(detected_at - previous[0]) < self.window_seconds:
+            return True
+
+        self._entries[key] = (detected_at, now)
+        self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        return False
+
+    def forget(self, placa: str, peaje_id: str, detected_at: float) -> None:
+        """Quita la detección de la ventana (si sigue siendo la última de la llave)."""
+        key = (placa, peaje_id)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == detected_at:
+            del self._entries[key]
+
+    def _evict(self, now: float) -> None:
+        """Elimina las entradas cuyo TTL ya expiró (las más antiguas están al inicio)."""
+        while self._entries:
+            _, (_, inserted_at) = next(iter(self._entries.items()))
+            if now - inserted_at < self.ttl_seconds:
+                break
+            self._entries.popitem(last=False)
+
+
+def detection_epoch(timestamp: str) -> float:
+    """Convierte el timestamp ISO 8601 de la cámara a epoch en segundos."""
+    return datetime.fromisoformat(timestamp.replace('Z', '+00:00')).timestamp()
+
+
+def dedup_bucket(detected_at: float, window_seconds: int) -> int:
+    """Bucket de tiempo de la detección."""
+    return int(detected_at // window_seconds)
+
+
+def dedup_key(placa: str, peaje_id: str, bucket: int) -> str:
+    """Llave del registro compartido: placa, peaje y bucket de tiempo."""
+    return f"dedup#{placa}#{peaje_id}#{bucket}"
+
+
+def claim_items(table_name: str, toll_event: Dict[str, Any], detected_at: float,
+                window_seconds: int, record_ttl_seconds: int) -> List[Dict[str, Any]]:
+    """
+    TransactItems del reclamo: Put del bucket de la detección y ConditionCheck
+    de los buckets vecinos (sin detección aceptada a menos de window_seconds).
+    Un registro sin detected_at (escrito antes de guardarlo) no bloquea.
+    """
+    placa, peaje_id = toll_event['placa'], toll_event['peaje_id']
+    bucket = dedup_bucket(detected_at, window_seconds)
+    neighbor_condition = (
+        'attribute_not_exists(idempotency_key) OR attribute_not_exists(detected_at) '
+        'OR detected_at <= :earliest OR detected_at >= :latest'
+    )
+    neighbor_values = {
+        ':earliest': Decimal(str(detected_at - window_seconds)),
+        ':latest': Decimal(str(detected_at + window_seconds))
+    }
+    return [
+        {'Put': {
+            'TableName': table_name,
+            'Item': {
+                'idempotency_key': dedup_key(placa, peaje_id, bucket),
+                'event_id': toll_event['event_id'],
+                'detected_at': Decimal(str(detected_at)),
+                'expires_at': int(time.time()) + record_ttl_seconds
+            },
+            'ConditionExpression': 'attribute_not_exists(idempotency_key)'
+        }},
+        {'ConditionCheck': {
+            'TableName': table_name,
+            'Key': {'idempotency_key': dedup_key(placa, peaje_id, bucket - 1)},
+            'ConditionExpression': neighbor_condition,
+            'ExpressionAttributeValues': neighbor_values
+        }},
+        {'ConditionCheck': {
+            'TableName': table_name,
+            'Key': {'idempotency_key': dedup_key(placa, peaje_id, bucket + 1)},
+            'ConditionExpression': neighbor_condition,
+            'ExpressionAttributeValues': neighbor_values
+        }}
+    ]
+
+
+def claim_detection(table: Any, toll_event: Dict[str, Any], detected_at: float,
+                    window_seconds: int, record_ttl_seconds: int) -> bool:
+    """
+    Intenta registrar la detección en la tabla de idempotencia.
+
+    Args:
+        table: Tabla DynamoDB de idempotencia
+        toll_event: Evento enriquecido de peaje
+        detected_at: Timestamp de la detección en epoch
+        window_seconds: Tamaño del bucket de tiempo (y de la ventana de duplicados)
+        record_ttl_seconds: Tiempo de vida del registro (atributo TTL expires_at)
+
+    Returns:
+        True si la detección es nueva, False si otro contenedor ya registró una
+        detección a menos de window_seconds
+    """
+    items = claim_items(table.name, toll_event, detected_at, window_seconds, record_ttl_seconds)
+    for attempt in range(CLAIM_MAX_ATTEMPTS):
+        try:
+            table.meta.client.transact_write_items(TransactItems=items)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                raise
+            codes = [reason.get('Code') for reason in e.response.get('CancellationReasons') or []]
+            if 'ConditionalCheckFailed' in codes:
+                return False
+            # TransactionConflict: otra detección de la misma placa se está registrando a la vez
+            if attempt + 1 == CLAIM_MAX_ATTEMPTS:
+                raise
+            time.sleep(0.01 * (2 ** attempt))
+    return True
+
+
+def release_detection(table: Any, toll_event: Dict[str, Any], detected_at: float, window_seconds: int) -> None:
+    """
+    Borra el registro de una detección que no se pudo publicar (solo si sigue
+    siendo de este event_id), para que el reintento no sea un duplicado.
+    """
+    key = dedup_key(toll_event['placa'], toll_event['peaje_id'], dedup_bucket(detected_at, window_seconds))
+    try:
+        table.delete_item(
+            Key={'idempotency_key': key},
+            ConditionExpression='event_id = :event_id',
+            ExpressionAttributeValues={':event_id': toll_event['event_id']}
+        )
+    except table.meta.client.exceptions.ConditionalCheckFailedException:
+        pass
@@ -3,16 +3,19 @@ Lambda Function: Notify User
 Envía notificaciones por email según la modalidad del usuario.
 - Modalidad 1 (No Registrado): Invitación para registrarse en GuatePass
 - Modalidad 2 (Registrado): Notificación de cobro realizado
+
+Recibe solo los datos que van en el mensaje y retorna solo notification
+(contrato de estado 2, ver shared/state_contract.py).
 """
 
-import json
 import os
 from datetime import datetime
 
+import state_contract
+from money import format_amount, format_currency, read_cents
 
-def format_currency(amount):
-    """Formatea un monto a formato de moneda guatemalteca"""
-    return f"Q{float(amount):.2f}"
+# Umbral de alerta de saldo bajo (Q50.00)
+LOW_BALANCE_CENTS = 5000
 
 
 def format_datetime(iso_datetime):
@@ -41,10 +44,10 @@ Número de factura: {invoice.get('invoice_number', 'N/A')}
 Fecha: {format_datetime(invoice.get('fecha_emision', ''))}
 Peaje: {toll_data.get('nombre_peaje', 'N/A')}
 
-Cargo base:        {format_currency(invoice.get('monto_base', '0'))}
-Multa (50%):       {format_currency(invoice.get('multa', '0'))}
+Cargo base:        {format_currency(read_cents(invoice, 'monto_base_cents', 'monto_base'))}
+Multa (50%):       {format_currency(read_cents(invoice, 'multa_cents', 'multa'))}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-TOTAL A PAGAR:     {format_currency(invoice.get('total', '0'))}
+TOTAL A PAGAR:     {format_currency(read_cents(invoice, 'total_cents', 'total'))}
 Estado: PENDIENTE
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -83,7 +86,8 @@ def get_charge_notification_template(user_data, toll_data, fare_calc, balance_up
     """
     subject = "✅ Cobro por peaje realizado - GuatePass"
     
-    new_balance = balance_update.get('new_balance', '0.00') if balance_update else '0.00'
+    balance_update = balance_update or {}
+    new_balance = read_cents(balance_update, 'new_balance_cents', 'new_balance')
     
     body = f"""
 Hola {user_data.get('nombre', 'Usuario')},
@@ -99,8 +103,8 @@ Fecha y hora:      {format_datetime(invoice.get('fecha_emision', ''))}
 
 💰 INFORMACIÓN DE COBRO
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-Monto cobrado:     {format_currency(invoice.get('total', '0'))}
-Saldo anterior:    {format_currency(balance_update.get('previous_balance', '0'))}
+Monto cobrado:     {format_currency(read_cents(invoice, 'total_cents', 'total'))}
+Saldo anterior:    {format_currency(read_cents(balance_update, 'previous_balance_cents', 'previous_balance'))}
 Saldo actual:      {format_currency(new_balance)}
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
@@ -113,7 +117,7 @@ Concepto:          {invoice.get('concepto', 'Paso por peaje')}
 """
 
     # Advertencia si el saldo está bajo
-    if float(new_balance) < 50.0:
+    if new_balance < LOW_BALANCE_CENTS:
         body += f"""
 ⚠️ ALERTA DE SALDO BAJO
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
@@ -187,7 +191,7 @@ def get_invitation_sms_template(placa, invoice):
     
 FACTURA PENDIENTE:
 No. {invoice.get('invoice_number', 'N/A')}
-Total: Q{invoice.get('total', '0')} (incluye multa 50%)
+Total: Q{format_amount(read_cents(invoice, 'total_cents', 'total'))} (incluye multa 50%)
 Estado: PENDIENTE
 
 REGISTRATE y AHORRA:
@@ -206,35 +210,31 @@ def lambda_handler(event, context):
     """
     Handler principal del Lambda.
     
-    Input esperado:
+    Input esperado (state_contract.STAGES['notify_user']):
     {
+        "contract_version": 2,
         "user_data": {
             "placa": "P-111JKL",
             "nombre": "Ana Torres",
             "email": "ana@email.com",
-            "modalidad": 1 o 2,
-            "is_registered": true/false
+            "modalidad": 1 o 2
         },
         "toll_data": {...},
-        "fare_calculation": {...},
         "balance_update": {...},
-        "invoice": {...}
+        "invoice": {"invoice_number": "...", "total_cents": 2250, ...}
     }
     
-    Output:
+    Output (la Step Function lo deja en $.notification):
     {
-        ...input,
-        "notification": {
-            "sent": true/false,
-            "email": "ana@email.com",
-            "type": "invitation" o "charge_notification",
-            "timestamp": "2025-11-09T10:30:00Z"
-        }
+        "sent": true/false,
+        "email": "ana@email.com",
+        "type": "invitation" o "charge_notification",
+        "timestamp": "2025-11-09T10:30:00Z"
     }
     """
     
     try:
-        print(f"Evento recibido: {json.dumps(event, default=str)}")
+        print(f"Evento recibido: {state_contract.dumps(event)}")
         
         user_data = event.get('user_data', {})
         toll_data = event.get('toll_data', {})
@@ -328,23 +328,14 @@ def lambda_handler(event, context):
             notification_result['message'] = f'Modalidad {modalidad} - No se envía notificación'
             print(f"ℹ️ Modalidad {modalidad} - No se envía notificación")
         
-        # Retornar evento enriquecido
-        result = {
-            **event,
-            'notification': notification_result
-        }
-        
-        return result
+        return state_contract.respond(event, 'notify_user', notification_result)
         
     except Exception as e:
         print(f"❌ Error enviando notificación: {str(e)}")
         # No fallar la transacción por error en notificación
-        return {
-            **event,
-            'notification': {
-                'sent': False,
-                'error': str(e),
-                'timestamp': datetime.utcnow().isoformat() + 'Z'
-            }
-        }
+        return state_contract.respond(event, 'notify_user', {
+            'sent': False,
+            'error': str(e),
+            'timestamp': datetime.utcnow().isoformat() + 'Z'
+        })
 
@@ -1,95 +1,207 @@
 """
 Lambda Function: Record Transaction
 Registra la transacción de peaje en la tabla de transacciones.
+
+Recibe solo los campos de user_data, toll_data y fare_calculation que guarda
+y retorna solo transaction (contrato de estado 2, ver shared/state_contract.py).
+El registro corre una sola vez por event_id (shared/idempotency.py): un
+reintento de la Step Function retorna la transacción ya registrada.
+
+En la Step Function por lotes (process_toll_batch) recibe {"items": [...]} y
+registra todo el lote (ver record_items).
+
+Cada transacción se escribe con un put condicional
+(attribute_not_exists(transaction_id)): una reentrega del mensaje de SQS o un
+reintento del Map no vuelve a escribir una transacción ya registrada ni
+reinicia su payment_status y created_at.
 """
 
-import json
 import os
 import boto3
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from decimal import Decimal
+
+import idempotency
+import state_contract
+from balance_ledger import deserialize
+from express_pass import build_transaction_id
+from money import CURRENCY, read_cents
 
 dynamodb = boto3.resource('dynamodb')
 transactions_table_name = os.environ['TRANSACTIONS_TABLE_NAME']
 transactions_table = dynamodb.Table(transactions_table_name)
+idempotency_table = dynamodb.Table(os.environ['IDEMPOTENCY_TABLE_NAME'])
+STAGE_RECORD_TTL_SECONDS = int(os.environ.get('STAGE_RECORD_TTL_SECONDS', '86400'))
+STAGE_LEASE_SECONDS = int(os.environ.get('STAGE_LEASE_SECONDS', '60'))
 
 
 def lambda_handler(event, context):
     """
     Handler principal del Lambda.
     
-    Input esperado:
+    Input esperado (state_contract.STAGES['record_transaction']):
     {
-        "user_data": {...},
+        "contract_version": 2,
+        "event_id": "evt-...",
+        "user_data": {"placa": "P123ABC", "is_registered": true, "has_tag": true},
         "toll_data": {...},
         "fare_calculation": {
-            "final_fare": "15.00",
-            "modality": 1,
-            ...
+            "modality": 3,
+            "base_fare_cents": 1500,
+            "final_fare_cents": 1500,
+            "currency": "GTQ"
         }
     }
     
-    Output:
+    Output (la Step Function lo deja en $.transaction):
     {
-        ...input,
-        "transaction": {
-            "transaction_id": "TXN-...",
-            "status": "recorded"
-        }
+        "transaction_id": "TXN-...",
+        "status": "recorded",
+        "payment_status": "pending"
     }
     """
     
+    # Lote de process_toll_batch: una invocación para todos los pasos
+    if 'items' in event:
+        print(f"Lote recibido: {len(event['items'])} pasos")
+        return {**event, 'items': record_items(event['items'])}
+    
     try:
-        print(f"Evento recibido: {json.dumps(event)}")
+        print(f"Evento recibido: {state_contract.dumps(event)}")
         
-        # Extraer datos
-        user_data = event.get('user_data', {})
-        toll_data = event.get('toll_data', {})
-        fare_calc = event.get('fare_calculation', {})
+        def record():
+            # Preparar item para DynamoDB (transaction_id único por peaje, placa y hora)
+            transaction_item = put_transaction(build_transaction_item(event))
+            transaction_id = transaction_item['transaction_id']
+            
+            print(f"Transacción registrada: {transaction_id}")
+            
+            return {
+                'transaction_id': transaction_id,
+                'status': 'recorded',
+                'payment_status': transaction_item.get('payment_status', 'pending')
+            }
         
-        placa = user_data.get('placa', 'UNKNOWN')
-        peaje_id = toll_data.get('peaje_id')
-        timestamp = toll_data.get('timestamp', datetime.utcnow().isoformat())
+        transaction, _ = idempotency.run_once(idempotency_table, event.get('event_id'), 'record_transaction',
+                                              record, STAGE_RECORD_TTL_SECONDS, STAGE_LEASE_SECONDS)
         
-        # Generar transaction_id único
-        transaction_id = f"TXN-{peaje_id}-{placa}-{timestamp.replace(':', '').replace('-', '')}"
+        return state_contract.respond(event, 'record_transaction', transaction)
         
-        # Preparar item para DynamoDB
-        transaction_item = {
-            'transaction_id': transaction_id,
-            'placa': placa,
-            'peaje_id': peaje_id,
-            'nombre_peaje': toll_data.get('nombre_peaje', ''),
-            'lane_id': toll_data.get('lane_id', ''),
-            'timestamp': timestamp,
-            'modalidad': fare_calc.get('modality'),
-            'base_fare': Decimal(fare_calc.get('base_fare', '0')),
-            'final_fare': Decimal(fare_calc.get('final_fare', '0')),
-            'currency': fare_calc.get('currency', 'GTQ'),
-            'tag_id': toll_data.get('tag_id'),
-            'is_registered': user_data.get('is_registered', False),
-            'has_tag': user_data.get('has_tag', False),
-            'payment_status': 'pending',  # pending, completed, failed
-            'created_at': datetime.utcnow().isoformat()
-        }
+    except Exception as e:
+        print(f"Error registrando transacción: {str(e)}")
+        raise
+
+
+def build_transaction_item(event):
+    """
+    Item de GuatepassTransactions para un paso (payment_status = pending).
+    
+    Args:
+        event: Paso con user_data, toll_data y fare_calculation
         
-        # Guardar en DynamoDB
-        transactions_table.put_item(Item=transaction_item)
+    Returns:
+        Item listo para put_transaction
+    """
+    user_data = event.get('user_data', {})
+    toll_data = event.get('toll_data', {})
+    fare_calc = event.get('fare_calculation', {})
+    
+    placa = user_data.get('placa', 'UNKNOWN')
+    peaje_id = toll_data.get('peaje_id')
+    timestamp = toll_data.get('timestamp', datetime.utcnow().isoformat())
+    
+    return {
+        'transaction_id': build_transaction_id(peaje_id, placa, timestamp),
+        'placa': placa,
+        'peaje_id': peaje_id,
+        'nombre_peaje': toll_data.get('nombre_peaje', ''),
+        'lane_id': toll_data.get('lane_id', ''),
+        'timestamp': timestamp,
+        'modalidad': fare_calc.get('modality'),
+        'base_fare_cents': read_cents(fare_calc, 'base_fare_cents', 'base_fare'),
+        'final_fare_cents': read_cents(fare_calc, 'final_fare_cents', 'final_fare'),
+        'currency': fare_calc.get('currency', CURRENCY),
+        'tag_id': toll_data.get('tag_id'),
+        'is_registered': user_data.get('is_registered', False),
+        'has_tag': user_data.get('has_tag', False),
+        'payment_status': 'pending',  # pending, completed, failed
+        'created_at': datetime.utcnow().isoformat()
+    }
+
+
+def put_transaction(transaction_item):
+    """
+    Guarda la transacción si su transaction_id no está registrado.
+    
+    Args:
+        transaction_item: Item de build_transaction_item
         
-        print(f"Transacción registrada: {transaction_id}")
+    Returns:
+        El item guardado, o el ya registrado si un intento anterior lo escribió
+    """
+    try:
+        transactions_table.put_item(
+            Item=transaction_item,
+            ConditionExpression='attribute_not_exists(transaction_id)',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        return transaction_item
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+            raise
+        # Ya registrada (reentrega o reintento): se conserva como está
+        existing = e.response.get('Item')
+        print(f"Transacción {transaction_item['transaction_id']} ya registrada")
+        return deserialize(existing) if existing else transaction_item
+
+
+def record_items(items):
+    """
+    Registra las transacciones de un lote con puts condicionales en paralelo
+    (BatchWriteItem no acepta condiciones y sobrescribiría las ya registradas).
+    
+    Los pasos con "error" (p. ej. sin tarifa) no se registran; el Map de
+    process_toll_batch los reporta como fallidos. Un mismo transaction_id
+    repetido en el lote se escribe una sola vez.
+    
+    Args:
+        items: Pasos del lote con fare_calculation
         
-        # Retornar evento enriquecido
-        result = {
-            **event,
+    Returns:
+        Los mismos pasos con transaction (como lambda_handler)
+    """
+    transaction_ids = []
+    pending = {}
+    for item in items:
+        if 'error' in item:
+            transaction_ids.append(None)
+            continue
+        transaction_item = build_transaction_item(item)
+        transaction_ids.append(transaction_item['transaction_id'])
+        pending.setdefault(transaction_item['transaction_id'], transaction_item)
+    
+    recorded = {}
+    if pending:
+        with ThreadPoolExecutor(max_workers=min(16, len(pending))) as executor:
+            for transaction_item in executor.map(put_transaction, pending.values()):
+                recorded[transaction_item['transaction_id']] = transaction_item
+    
+    result = []
+    for item, transaction_id in zip(items, transaction_ids):
+        if transaction_id is None:
+            result.append(item)
+            continue
+        transaction_item = recorded[transaction_id]
+        result.append({
+            **item,
             'transaction': {
-                'transaction_id': transaction_id,
+                'transaction_id': transaction_item['transaction_id'],
                 'status': 'recorded',
-                'payment_status': 'pending'
+                'payment_status': transaction_item.get('payment_status', 'pending')
             }
-        }
-        
-        return result
-        
-    except Exception as e:
-        print(f"Error registrando transacción: {str(e)}")
-        raise
+        })
+    
+    recorded_count = sum(1 for item in result if 'transaction' in item)
+    print(f"Transacciones registradas: {recorded_count} de {len(items)} pasos del lote")
+    return result
@@ -3,23 +3,96 @@ GUATEPASS - Resolve User Profile Function
 ==========================================
 Lambda function que determina la modalidad del usuario al pasar por peaje.
 
-Trigger: EventBridge rule (guatepass.toll.detected)
+Los pasos con tag y saldo suficiente (modalidad 3) se cobran aquí mismo con
+el camino express (shared/express_pass.py, EXPRESS_PASS_ENABLED); el resto, o
+si el camino express no aplica, sigue por la Step Function.
+
+En modo por lotes (TollProcessingMode = batch) los eventos llegan agrupados
+desde una cola SQS a batch_handler: los usuarios del lote se leen con
+BatchGetItem y cada lote corre en una ejecución síncrona de la Step Function
+Express process_toll_batch (un Map sobre los pasos).
+
+Trigger: EventBridge rule (guatepass.toll.detected) o cola SQS (modo por lotes)
 """
 
 import json
 import os
+import time
 import boto3
-from typing import Dict, Any, Optional
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from user_cache import UserProfileCache, placa_key, tag_key
+from registry_filter import RegistryFilterLoader, placa_entry, tag_entry
+from users_snapshot import SnapshotLoader
+from toll_catalog import TollCatalog
+from fare_engine import FareRatesLoader
+from express_pass import ExpressPass
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, balance_cents
 
 # Clientes AWS
 dynamodb = boto3.resource('dynamodb')
 stepfunctions = boto3.client('stepfunctions')
+s3_client = boto3.client('s3')
 
 # Variables de entorno
 USERS_TABLE_NAME = os.environ['USERS_TABLE_NAME']
 STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN')
 users_table = dynamodb.Table(USERS_TABLE_NAME)
 
+# Cache de perfiles entre invocaciones "warm" (el saldo nunca se guarda en cache)
+USER_CACHE_MAX_SIZE = int(os.environ.get('USER_CACHE_MAX_SIZE', '10000'))
+USER_CACHE_TTL_SECONDS = float(os.environ.get('USER_CACHE_TTL_SECONDS', '120'))
+user_cache = UserProfileCache(USER_CACHE_MAX_SIZE, USER_CACHE_TTL_SECONDS)
+
+# Filtro Bloom de placas/tags registrados: un "no" definitivo evita leer DynamoDB
+DATA_BUCKET_NAME = os.environ.get('DATA_BUCKET_NAME')
+REGISTRY_FILTER_KEY = os.environ.get('REGISTRY_FILTER_KEY', 'registry/registered-users.bloom')
+REGISTRY_FILTER_REFRESH_SECONDS = float(os.environ.get('REGISTRY_FILTER_REFRESH_SECONDS', '60'))
+# Un "no" del filtro se confirma con head_object a lo más cada REGISTRY_FILTER_RECHECK_SECONDS
+REGISTRY_FILTER_RECHECK_SECONDS = float(os.environ.get('REGISTRY_FILTER_RECHECK_SECONDS', '1'))
+registry_filter = RegistryFilterLoader(
+    s3_client, DATA_BUCKET_NAME, REGISTRY_FILTER_KEY, REGISTRY_FILTER_REFRESH_SECONDS,
+    REGISTRY_FILTER_RECHECK_SECONDS
+)
+
+# Snapshot local de usuarios (mmap en /tmp): una placa que está ahí se lee con
+# get_item consistente, sin pasar por el filtro Bloom (el perfil nunca sale del snapshot)
+USERS_SNAPSHOT_KEY = os.environ.get('USERS_SNAPSHOT_KEY', 'snapshots/users.snap')
+USERS_SNAPSHOT_MAX_AGE_SECONDS = float(os.environ.get('USERS_SNAPSHOT_MAX_AGE_SECONDS', '600'))
+snapshot_loader = SnapshotLoader(
+    s3_client, DATA_BUCKET_NAME, USERS_SNAPSHOT_KEY, '/tmp/users.snap', USERS_SNAPSHOT_MAX_AGE_SECONDS
+)
+
+# Catálogo de peajes (GuatepassTolls) cargado una vez por contenedor
+TOLLS_TABLE_NAME = os.environ.get('TOLLS_TABLE_NAME')
+TOLL_CATALOG_TTL_SECONDS = float(os.environ.get('TOLL_CATALOG_TTL_SECONDS', '300'))
+toll_catalog = TollCatalog(
+    dynamodb.Table(TOLLS_TABLE_NAME) if TOLLS_TABLE_NAME else None, TOLL_CATALOG_TTL_SECONDS
+)
+
+# Camino express (modalidad 3): tarifa, transacción, débito y factura en una TransactWriteItems
+TRANSACTIONS_TABLE_NAME = os.environ.get('TRANSACTIONS_TABLE_NAME')
+INVOICES_TABLE_NAME = os.environ.get('INVOICES_TABLE_NAME')
+EXPRESS_PASS_ENABLED = (os.environ.get('EXPRESS_PASS_ENABLED', 'false').lower() == 'true'
+                        and bool(TRANSACTIONS_TABLE_NAME) and bool(INVOICES_TABLE_NAME))
+FARE_RATES_KEY = os.environ.get('FARE_RATES_KEY', 'rates/fare-rates.json')
+FARE_RATES_REFRESH_SECONDS = float(os.environ.get('FARE_RATES_REFRESH_SECONDS', '60'))
+express_pass = ExpressPass(
+    users_table,
+    dynamodb.Table(TRANSACTIONS_TABLE_NAME) if EXPRESS_PASS_ENABLED else None,
+    dynamodb.Table(INVOICES_TABLE_NAME) if EXPRESS_PASS_ENABLED else None,
+    FareRatesLoader(s3_client, DATA_BUCKET_NAME, FARE_RATES_KEY, FARE_RATES_REFRESH_SECONDS)
+)
+
+# Modo por lotes: Step Function Express y tamaño máximo de cada ejecución
+BATCH_STATE_MACHINE_ARN = os.environ.get('BATCH_STATE_MACHINE_ARN')
+BATCH_MAX_ITEMS = int(os.environ.get('BATCH_MAX_ITEMS', '100'))
+BATCH_MAX_INPUT_BYTES = int(os.environ.get('BATCH_MAX_INPUT_BYTES', '131072'))
+BATCH_GET_MAX_KEYS = 100
+BATCH_GET_MAX_ATTEMPTS = 5
+BATCH_GET_BACKOFF_SECONDS = 0.05
+
 
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
@@ -45,8 +118,6 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         
         placa = detail.get('placa')
         tag_id = detail.get('tag_id')
-        peaje_id = detail.get('peaje_id')
-        peaje_nombre = detail.get('peaje_nombre', 'Desconocido')
         event_id = detail.get('event_id')
         
         if not placa:
@@ -55,42 +126,32 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         print(f"[INFO] Resolviendo perfil para placa: {placa}, tag_id: {tag_id}")
         
         # Buscar usuario en DynamoDB
-        user_data = find_user(placa, tag_id)
-        
-        # Determinar modalidad
-        modalidad_info = determine_modality(user_data, tag_id)
-        
-        # Construir perfil completo del usuario
-        user_profile = {
-            'placa': placa,
-            'modalidad': modalidad_info['modalidad'],
-            'is_registered': user_data is not None,
-            'has_tag': modalidad_info['modalidad'] == 3,
-            'tag_id': user_data.get('tag_id') if user_data else None,
-            'nombre': user_data.get('nombre') if user_data else None,
-            'email': user_data.get('email') if user_data else None,
-            'tipo_cobro': modalidad_info['tipo_cobro'],
-            'descripcion': modalidad_info['descripcion']
-        }
-        
-        # Construir información del peaje
-        peaje_info = {
-            'peaje_id': peaje_id,
-            'nombre_peaje': peaje_nombre,
-            'lane_id': detail.get('lane_id', 'LANE-01'),
-            'tag_id': tag_id,
-            'timestamp': detail.get('timestamp')
-        }
+        user_data = find_user(placa, tag_id, received_epoch(detail))
         
         # Payload para Step Function (formato esperado por los Lambdas siguientes)
-        step_function_input = {
-            'event_id': event_id,
-            'user_data': user_profile,
-            'toll_data': peaje_info,
-            'original_event': detail
-        }
+        step_function_input = build_step_function_input(detail, user_data)
+        user_profile = step_function_input['user_data']
+        peaje_info = step_function_input['toll_data']
+        modalidad = user_profile['modalidad']
+        
+        print(f"[SUCCESS] Modalidad determinada: {modalidad} para placa {placa}")
+        print(f"[INFO] Cache de usuarios: {json.dumps(user_cache.stats())}")
+        
+        # Camino express: pasos con tag y saldo suficiente se cobran sin la Step Function
+        if EXPRESS_PASS_ENABLED and modalidad == 3:
+            express_result = express_pass.process(user_profile, peaje_info, user_data)
+            if express_result is not None:
+                return {
+                    'statusCode': 200,
+                    'pipeline': express_result['pipeline'],
+                    'event_id': event_id,
+                    'placa': placa,
+                    'modalidad': modalidad,
+                    'transaction_id': express_result['transaction']['transaction_id'],
+                    'invoice_id': express_result['invoice']['invoice_id'],
+                    'amount_charged_cents': express_result['balance_update']['amount_charged_cents']
+                }
         
-        print(f"[SUCCESS] Modalidad determinada: {modalidad_info['modalidad']} para placa {placa}")
         print(f"[INFO] Iniciando Step Function con input: {json.dumps(step_function_input)}")
         
         # Iniciar ejecución de Step Function
@@ -111,7 +172,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'execution_arn': execution_arn,
                 'event_id': event_id,
                 'placa': placa,
-                'modalidad': modalidad_info['modalidad']
+                'modalidad': modalidad
             }
         else:
             print("[WARNING] STATE_MACHINE_ARN no configurado, solo se resolvió el perfil")
@@ -122,48 +183,239 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         raise
 
 
-def find_user(placa: str, tag_id: Optional[str]) -> Optional[Dict[str, Any]]:
+def batch_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Handler del modo por lotes: procesa los eventos TollDetected que la cola
+    SQS entrega agrupados (hasta BatchSize o MaximumBatchingWindowInSeconds).
+    
+    Los usuarios del lote se resuelven juntos (find_users) y los pasos se
+    procesan en ejecuciones síncronas de la Step Function Express
+    process_toll_batch de hasta BATCH_MAX_ITEMS pasos. Los mensajes cuyo paso
+    falló (la ejecución completa o su iteración del Map) se reportan en
+    batchItemFailures para que SQS los reintente; el resto se borra de la cola.
+    
+    Args:
+        event: Evento de SQS (Records con el evento de EventBridge en el body)
+        context: Contexto de ejecución Lambda
+        
+    Returns:
+        {"batchItemFailures": [{"itemIdentifier": messageId}, ...]}
+    """
+    records = event.get('Records', [])
+    print(f"[INFO] ResolveUserProfile (lote) - {len(records)} mensajes")
+    
+    if not BATCH_STATE_MACHINE_ARN:
+        raise ValueError("BATCH_STATE_MACHINE_ARN no configurado")
+    
+    failed: Set[str] = set()
+    passes: List[Tuple[str, Dict[str, Any]]] = []
+    # EventBridge entrega al menos una vez: un event_id repetido en el lote se
+    # procesa una sola vez y su mensaje corre la suerte del primero
+    duplicates: Dict[str, str] = {}
+    first_by_event: Dict[str, str] = {}
+    for record in records:
+        message_id = record['messageId']
+        try:
+            detail = json.loads(record['body']).get('detail', {})
+        except (ValueError, AttributeError) as e:
+            print(f"[ERROR] Mensaje {message_id} inválido: {str(e)}")
+            failed.add(message_id)
+            continue
+        if not detail.get('placa'):
+            print(f"[ERROR] Mensaje {message_id} sin placa")
+            failed.add(message_id)
+            continue
+        event_id = detail.get('event_id')
+        if event_id and event_id in first_by_event:
+            duplicates[message_id] = first_by_event[event_id]
+            continue
+        if event_id:
+            first_by_event[event_id] = message_id
+        passes.append((message_id, detail))
+    
+    users = find_users([(detail['placa'], detail.get('tag_id')) for _, detail in passes],
+                       max((received_epoch(detail) for _, detail in passes), default=0.0))
+    items = []
+    for message_id, detail in passes:
+        step_function_input = build_step_function_input(detail, users.get(detail['placa']))
+        # El evento original no lo usa ningún paso de la Step Function: fuera del payload del lote
+        step_function_input.pop('original_event')
+        items.append({'message_id': message_id, **step_function_input})
+    
+    print(f"[INFO] Cache de usuarios: {json.dumps(user_cache.stats())}")
+    
+    for chunk in chunk_items(items):
+        failed.update(process_batch(chunk))
+    
+    failed.update(message_id for message_id, first in duplicates.items() if first in failed)
+    print(f"[SUCCESS] Lote procesado: {len(records) - len(failed)} pasos, {len(failed)} para reintentar")
+    return {'batchItemFailures': [{'itemIdentifier': message_id} for message_id in sorted(failed)]}
+
+
+def chunk_items(items: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    """Parte el lote en ejecuciones de hasta BATCH_MAX_ITEMS pasos y BATCH_MAX_INPUT_BYTES de input."""
+    chunks: List[List[Dict[str, Any]]] = []
+    current: List[Dict[str, Any]] = []
+    current_bytes = 0
+    for item in items:
+        size = len(json.dumps(item).encode('utf-8'))
+        if current and (len(current) >= BATCH_MAX_ITEMS or current_bytes + size > BATCH_MAX_INPUT_BYTES):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(item)
+        current_bytes += size
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def process_batch(items: List[Dict[str, Any]]) -> Set[str]:
     """
-    Busca al usuario en DynamoDB por placa o tag_id.
+    Corre una ejecución síncrona de process_toll_batch.
+    
+    Args:
+        items: Pasos de la ejecución (con message_id)
+        
+    Returns:
+        message_id de los pasos que hay que reintentar
+    """
+    message_ids = {item['message_id'] for item in items}
+    try:
+        response = stepfunctions.start_sync_execution(
+            stateMachineArn=BATCH_STATE_MACHINE_ARN,
+            input=json.dumps({'items': items})
+        )
+    except Exception as e:
+        print(f"[ERROR] No se pudo ejecutar el lote de {len(items)} pasos: {str(e)}")
+        return message_ids
+    
+    if response['status'] != 'SUCCEEDED':
+        print(f"[ERROR] Lote {response.get('executionArn')} terminó {response['status']}: "
+              f"{response.get('error')} {response.get('cause')}")
+        return message_ids
+    
+    failed = set()
+    for result in json.loads(response['output'])['results']:
+        if result['status'] == 'failed':
+            print(f"[WARNING] Paso {result.get('event_id')} ({result.get('placa')}) falló: {json.dumps(result.get('error'))}")
+            failed.add(result['message_id'])
+    print(f"[SUCCESS] Lote {response.get('executionArn')}: {len(items) - len(failed)} de {len(items)} pasos")
+    return failed
+
+
+def build_step_function_input(detail: Dict[str, Any], user_data: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Payload de la Step Function para un paso: perfil con la modalidad y datos
+    del peaje enriquecidos con el catálogo.
+    
+    Args:
+        detail: detail del evento TollDetected
+        user_data: Usuario como lo resolvió find_user / find_users (o None)
+        
+    Returns:
+        Diccionario con event_id, user_data, toll_data y original_event
+    """
+    placa = detail.get('placa')
+    tag_id = detail.get('tag_id')
+    peaje_id = detail.get('peaje_id')
+    
+    # Usuarios dados de baja por la importación delta se cobran como no registrados
+    if user_data is not None and user_data.get('estado') == 'eliminado':
+        print(f"[WARNING] Usuario {placa} dado de baja ({user_data.get('fecha_baja')}), se trata como no registrado")
+        user_data = None
+    
+    # Determinar modalidad
+    modalidad_info = determine_modality(user_data, tag_id)
+    
+    # Construir perfil completo del usuario
+    user_profile = {
+        'placa': placa,
+        'modalidad': modalidad_info['modalidad'],
+        'is_registered': user_data is not None,
+        'has_tag': modalidad_info['modalidad'] == 3,
+        'tag_id': user_data.get('tag_id') if user_data else None,
+        'nombre': user_data.get('nombre') if user_data else None,
+        'email': user_data.get('email') if user_data else None,
+        'tipo_cobro': modalidad_info['tipo_cobro'],
+        'descripcion': modalidad_info['descripcion']
+    }
+    
+    # Construir información del peaje (enriquecida con el catálogo si el peaje existe)
+    peaje_info = {
+        'peaje_id': peaje_id,
+        'nombre_peaje': detail.get('peaje_nombre', 'Desconocido'),
+        'lane_id': detail.get('lane_id', 'LANE-01'),
+        'tag_id': tag_id,
+        'timestamp': detail.get('timestamp')
+    }
+    
+    plaza = toll_catalog.get(peaje_id)
+    if plaza is not None:
+        peaje_info['nombre_peaje'] = plaza.nombre
+        peaje_info['carretera'] = plaza.carretera
+        if plaza.tarifa_base_cents is not None:
+            peaje_info['tarifa_base_cents'] = plaza.tarifa_base_cents
+    else:
+        print(f"[WARNING] Peaje no encontrado en el catálogo: {peaje_id}")
+    
+    return {
+        'event_id': detail.get('event_id'),
+        'user_data': user_profile,
+        'toll_data': peaje_info,
+        'original_event': detail
+    }
+
+
+def received_epoch(detail: Dict[str, Any]) -> float:
+    """received_at del paso como epoch; sin él (evento de otra fuente) se toma la hora actual."""
+    received_at = detail.get('received_at')
+    if not received_at:
+        return time.time()
+    return datetime.fromisoformat(received_at.replace('Z', '+00:00')).timestamp()
+
+
+def find_user(placa: str, tag_id: Optional[str], received_at: float) -> Optional[Dict[str, Any]]:
+    """
+    Busca al usuario por placa o tag_id.
+    
+    Primero el cache del contenedor y luego DynamoDB. Si la placa está en el
+    snapshot local se lee con get_item consistente (el snapshot puede tener
+    hasta USERS_SNAPSHOT_MAX_AGE_SECONDS: estado y tag_id salen de la tabla);
+    si no, las llaves que el filtro Bloom descarta no se consultan (solo con
+    un filtro revisado después de received_at: un usuario registrado antes del
+    paso nunca queda fuera). El tag_id no se resuelve con el snapshot.
     
     Args:
         placa: Placa del vehículo
         tag_id: ID del Tag (puede ser None)
+        received_at: Epoch en que ingest_toll recibió el paso
         
     Returns:
         Diccionario con información del usuario o None si no existe
     """
     try:
         # Primero buscar por placa
-        response = users_table.get_item(Key={'placa': placa})
+        user = user_cache.get(placa_key(placa))
+        if user is not None:
+            return user
+        
+        if in_snapshot(placa):
+            response = users_table.get_item(Key={'placa': placa}, ConsistentRead=True)
+        elif registry_filter.excludes(placa_entry(placa), received_at):
+            response = {}  # Placa no registrada (respuesta definitiva del filtro)
+        else:
+            response = users_table.get_item(Key={'placa': placa})
         
         if 'Item' in response:
             user = response['Item']
             print(f"[INFO] Usuario encontrado por placa: {placa}")
-            
-            # Convertir Decimal a float para JSON
-            if 'saldo_disponible' in user:
-                user['saldo_disponible'] = float(user['saldo_disponible'])
-            
-            return user
+            cache_user(user)
+            return normalize_balance(user)
         
         # Si no se encontró por placa y hay tag_id, buscar por tag
-        if tag_id:
-            response = users_table.query(
-                IndexName='TagIndex',
-                KeyConditionExpression='tag_id = :tid',
-                ExpressionAttributeValues={':tid': tag_id}
-            )
-            
-            if response['Items']:
-                user = response['Items'][0]
-                print(f"[INFO] Usuario encontrado por tag_id: {tag_id}")
-                
-                # Convertir Decimal a float
-                if 'saldo_disponible' in user:
-                    user['saldo_disponible'] = float(user['saldo_disponible'])
-                
-                return user
+        user = find_user_by_tag(tag_id, received_at) if tag_id else None
+        if user is not None:
+            return user
         
         print(f"[INFO] Usuario no encontrado: placa={placa}, tag_id={tag_id}")
         return None
@@ -173,6 +425,119 @@ def find_user(placa: str, tag_id: Optional[str]) -> Optional[Dict[str, Any]]:
         raise
 
 
+def in_snapshot(placa: str) -> bool:
+    """Indica si la placa estaba registrada cuando se generó el snapshot vigente."""
+    snapshot = snapshot_loader.get()
+    return snapshot is not None and snapshot.get_by_placa(placa) is not None
+
+
+def find_user_by_tag(tag_id: str, received_at: float) -> Optional[Dict[str, Any]]:
+    """Busca al usuario por tag_id (cache y luego TagIndex) si el filtro Bloom no lo descarta."""
+    if registry_filter.excludes(tag_entry(tag_id), received_at):
+        return None
+    
+    user = user_cache.get(tag_key(tag_id))
+    if user is not None:
+        return user
+    
+    response = users_table.query(
+        IndexName='TagIndex',
+        KeyConditionExpression='tag_id = :tid',
+        ExpressionAttributeValues={':tid': tag_id}
+    )
+    
+    if response['Items']:
+        user = response['Items'][0]
+        print(f"[INFO] Usuario encontrado por tag_id: {tag_id}")
+        cache_user(user)
+        return normalize_balance(user)
+    return None
+
+
+def find_users(lookups: List[Tuple[str, Optional[str]]], received_at: float) -> Dict[str, Optional[Dict[str, Any]]]:
+    """
+    find_user para todos los pasos de un lote: mismo orden (cache, snapshot,
+    filtro Bloom), pero las placas que hay que leer de DynamoDB se piden juntas
+    con BatchGetItem en vez de un get_item por paso (consistente para las que
+    están en el snapshot).
+    
+    Args:
+        lookups: Pares (placa, tag_id) de los pasos del lote
+        received_at: received_at más reciente del lote (una revisión del filtro cubre a todos)
+        
+    Returns:
+        Diccionario placa -> usuario (None si no existe)
+    """
+    users: Dict[str, Optional[Dict[str, Any]]] = {}
+    confirmed = []
+    pending = []
+    for placa, tag_id in lookups:
+        if placa in users:
+            continue
+        user = user_cache.get(placa_key(placa))
+        if user is None:
+            if in_snapshot(placa):
+                confirmed.append(placa)
+            elif not registry_filter.excludes(placa_entry(placa), received_at):
+                pending.append(placa)
+        users[placa] = user
+    
+    for user in batch_get_users(confirmed, consistent=True) + batch_get_users(pending):
+        cache_user(user)
+        users[user['placa']] = normalize_balance(user)
+    
+    # Placas que no están en la tabla: como en find_user, se intenta por tag
+    for placa, tag_id in lookups:
+        if users[placa] is None and tag_id:
+            users[placa] = find_user_by_tag(tag_id, received_at)
+    
+    print(f"[INFO] {len(users)} placas resueltas, {len(confirmed) + len(pending)} leídas con BatchGetItem")
+    return users
+
+
+def batch_get_users(placas: List[str], consistent: bool = False) -> List[Dict[str, Any]]:
+    """
+    Lee usuarios por placa con BatchGetItem (BATCH_GET_MAX_KEYS llaves por
+    llamada); las UnprocessedKeys se reintentan con backoff exponencial.
+    
+    Args:
+        placas: Placas sin repetir
+        consistent: Lectura consistente (ConsistentRead)
+        
+    Returns:
+        Items encontrados (las placas inexistentes no aparecen)
+    """
+    users = []
+    for start in range(0, len(placas), BATCH_GET_MAX_KEYS):
+        request = {USERS_TABLE_NAME: {'Keys': [{'placa': placa} for placa in placas[start:start + BATCH_GET_MAX_KEYS]],
+                                      'ConsistentRead': consistent}}
+        for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            users.extend(response.get('Responses', {}).get(USERS_TABLE_NAME, []))
+            request = response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(BATCH_GET_BACKOFF_SECONDS * 2 ** attempt)
+        if request:
+            raise RuntimeError(f"BatchGetItem dejó {len(request[USERS_TABLE_NAME]['Keys'])} placas sin leer")
+    return users
+
+
+def normalize_balance(user: Dict[str, Any]) -> Dict[str, Any]:
+    """Saldo como centavos enteros (acepta el saldo_disponible legado)."""
+    user[BALANCE_FIELD] = balance_cents(user)
+    user.pop(LEGACY_BALANCE_FIELD, None)
+    return user
+
+
+def cache_user(user: Dict[str, Any]) -> None:
+    """Guarda el perfil en cache bajo su placa y, si tiene, bajo su tag_id."""
+    keys = [placa_key(user['placa'])]
+    if user.get('tag_id'):
+        keys.append(tag_key(user['tag_id']))
+    user_cache.put(keys, user)
+
+
 def determine_modality(user_profile: Optional[Dict[str, Any]], tag_id: Optional[str]) -> Dict[str, Any]:
     """
     Determina la modalidad de cobro según el perfil del usuario.
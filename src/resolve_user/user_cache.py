@@ -0,0 +1,98 @@
+"""
+GUATEPASS - Cache de perfiles de usuario
+=========================================
+Cache en memoria (LRU + TTL) de los perfiles resueltos por resolve_user.
+
+Vive a nivel de módulo, por lo que sobrevive entre invocaciones "warm" del
+mismo contenedor Lambda. Los perfiles se indexan por placa y por tag_id.
+
+Los campos sensibles al saldo no se guardan: el saldo cambia con cada cobro y
+siempre se lee de DynamoDB en update_balance.
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+# Campos que nunca se guardan en cache (saldo y cobros recientes de balance_ledger)
+BALANCE_FIELDS = ('saldo_cents', 'saldo_disponible', 'debited_txns')
+
+
+def placa_key(placa: str) -> str:
+    return f"placa#{placa}"
+
+
+def tag_key(tag_id: str) -> str:
+    return f"tag#{tag_id}"
+
+
+class UserProfileCache:
+    """
+    Cache LRU con expiración por TTL.
+
+    Args:
+        max_size: Número máximo de llaves en cache (0 deshabilita el cache)
+        ttl_seconds: Tiempo de vida de cada entrada
+    """
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries: 'OrderedDict[str, tuple]' = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Retorna una copia del perfil en cache o None si no existe o expiró."""
+        entry = self._entries.get(key)
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        expires_at, profile = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[key]
+            self.expirations += 1
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return dict(profile)
+
+    def put(self, keys: Iterable[str], user: Dict[str, Any]) -> None:
+        """Guarda el perfil (sin campos de saldo) bajo todas las llaves indicadas."""
+        if self.max_size <= 0:
+            return
+
+        profile = {k: v for k, v in user.items() if k not in BALANCE_FIELDS}
+        expires_at = time.monotonic() + self.ttl_seconds
+
+        for key in keys:
+            self._entries[key] = (expires_at, profile)
+            self._entries.move_to_end(key)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Contadores de uso del cache para logs/métricas."""
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions,
+            'expirations': self.expirations
+        }
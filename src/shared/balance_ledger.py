@@ -0,0 +1,197 @@
+"""
+GUATEPASS - Débito atómico de saldo
+====================================
+Descuenta el saldo de un usuario con un único update_item condicional:
+
+    SET saldo_cents = saldo_cents - :amount,
+        debited_txns = list_append(if_not_exists(debited_txns, :empty), :txn_list)
+    CONDITION attribute_exists(placa)
+              AND saldo_cents >= :amount
+              AND NOT contains(debited_txns, :txn)
+
+El decremento lo hace DynamoDB, así que dos pasos simultáneos de la misma placa
+no se pisan. La lista debited_txns guarda los últimos transaction_id cobrados:
+un reintento de la Step Function con el mismo transaction_id no vuelve a
+descontar. El nuevo saldo se obtiene de ReturnValues (sin get_item previo).
+
+Si la condición falla, el item actual viene en la excepción
+(ReturnValuesOnConditionCheckFailure=ALL_OLD) y se distingue entre usuario
+inexistente, reintento ya cobrado, saldo legado sin migrar y saldo insuficiente.
+"""
+
+from typing import Any, Dict, NamedTuple, Optional
+
+from boto3.dynamodb.types import TypeDeserializer
+from botocore.exceptions import ClientError
+
+from money import BALANCE_FIELD, LEGACY_BALANCE_FIELD, parse_amount
+
+DEBITED_TXNS_FIELD = 'debited_txns'
+
+# Cobros recordados por placa para detectar reintentos; al pasar de
+# MAX_TRACKED_TXNS + PRUNE_BATCH se eliminan los PRUNE_BATCH más antiguos
+MAX_TRACKED_TXNS = 50
+PRUNE_BATCH = 10
+
+_TYPE_DESCRIPTORS = {'S', 'N', 'B', 'SS', 'NS', 'BS', 'M', 'L', 'NULL', 'BOOL'}
+_deserializer = TypeDeserializer()
+
+DEBITED = 'debited'
+ALREADY_DEBITED = 'already_debited'
+INSUFFICIENT_FUNDS = 'insufficient_funds'
+USER_NOT_FOUND = 'user_not_found'
+LEGACY_BALANCE = 'legacy_balance'
+
+
+class DebitResult(NamedTuple):
+    status: str
+    previous_balance_cents: Optional[int]
+    new_balance_cents: Optional[int]
+
+    @property
+    def charged(self) -> bool:
+        """True si el monto quedó descontado (en esta llamada o en un intento anterior)."""
+        return self.status in (DEBITED, ALREADY_DEBITED)
+
+
+def _condition_failed(error: ClientError) -> bool:
+    return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def debit_request(placa: str, amount_cents: int, transaction_id: str) -> Dict[str, Any]:
+    """
+    Key, UpdateExpression, ConditionExpression y valores del débito. Se usa
+    tal cual en update_item y como elemento Update de TransactWriteItems.
+    """
+    return {
+        'Key': {'placa': placa},
+        'UpdateExpression': (
+            f'SET {BALANCE_FIELD} = {BALANCE_FIELD} - :amount, '
+            f'{DEBITED_TXNS_FIELD} = list_append(if_not_exists({DEBITED_TXNS_FIELD}, :empty), :txn_list)'
+        ),
+        'ConditionExpression': (
+            f'attribute_exists(placa) AND {BALANCE_FIELD} >= :amount '
+            f'AND NOT contains({DEBITED_TXNS_FIELD}, :txn)'
+        ),
+        'ExpressionAttributeValues': {
+            ':amount': amount_cents,
+            ':empty': [],
+            ':txn_list': [transaction_id],
+            ':txn': transaction_id
+        }
+    }
+
+
+def failure_status(item: Optional[Dict[str, Any]], transaction_id: str) -> str:
+    """
+    Por qué falló la condición del débito, a partir del item actual
+    (ReturnValuesOnConditionCheckFailure=ALL_OLD, ya deserializado).
+    """
+    if item is None:
+        return USER_NOT_FOUND
+    if transaction_id in item.get(DEBITED_TXNS_FIELD, []):
+        return ALREADY_DEBITED
+    if BALANCE_FIELD not in item and LEGACY_BALANCE_FIELD in item:
+        return LEGACY_BALANCE
+    return INSUFFICIENT_FUNDS
+
+
+def debit(users_table: Any, placa: str, amount_cents: int, transaction_id: str,
+          max_attempts: int = 3) -> DebitResult:
+    """
+    Descuenta `amount_cents` del saldo de `placa` una sola vez por `transaction_id`.
+
+    Args:
+        users_table: Tabla DynamoDB GuatepassUsers
+        placa: Placa del usuario
+        amount_cents: Monto a descontar en centavos
+        transaction_id: Llave de idempotencia del cobro
+        max_attempts: Intentos si hubo que migrar el saldo legado
+
+    Returns:
+        DebitResult con el estado y los saldos anterior/nuevo en centavos
+    """
+    for _ in range(max_attempts):
+        try:
+            response = users_table.update_item(
+                **debit_request(placa, amount_cents, transaction_id),
+                ReturnValues='UPDATED_NEW',
+                ReturnValuesOnConditionCheckFailure='ALL_OLD'
+            )
+        except ClientError as e:
+            if not _condition_failed(e):
+                raise
+            item = e.response.get('Item')
+            item = deserialize(item) if item is not None else None
+            status = failure_status(item, transaction_id)
+
+            if status == ALREADY_DEBITED:
+                balance = int(item.get(BALANCE_FIELD, 0))
+                return DebitResult(ALREADY_DEBITED, balance + amount_cents, balance)
+            if status == LEGACY_BALANCE:
+                migrate_legacy_balance(users_table, placa, item[LEGACY_BALANCE_FIELD])
+                continue
+            if status == USER_NOT_FOUND:
+                return DebitResult(USER_NOT_FOUND, None, None)
+
+            balance = int(item.get(BALANCE_FIELD, 0))
+            return DebitResult(INSUFFICIENT_FUNDS, balance, balance)
+
+        attributes = response['Attributes']
+        new_balance = int(attributes[BALANCE_FIELD])
+        tracked = attributes.get(DEBITED_TXNS_FIELD, [])
+        if len(tracked) > MAX_TRACKED_TXNS + PRUNE_BATCH:
+            prune_tracked_txns(users_table, placa, tracked[0])
+        return DebitResult(DEBITED, new_balance + amount_cents, new_balance)
+
+    raise RuntimeError(f"No se pudo descontar el saldo de {placa} tras {max_attempts} intentos")
+
+
+def migrate_legacy_balance(users_table: Any, placa: str, legacy_balance: Any) -> None:
+    """
+    Convierte el saldo_disponible legado (quetzales) a saldo_cents. Es condicional
+    para no pisar una migración o un cobro concurrente.
+    """
+    try:
+        users_table.update_item(
+            Key={'placa': placa},
+            UpdateExpression=f'SET {BALANCE_FIELD} = :cents REMOVE {LEGACY_BALANCE_FIELD}',
+            ConditionExpression=f'attribute_not_exists({BALANCE_FIELD}) AND {LEGACY_BALANCE_FIELD} = :legacy',
+            ExpressionAttributeValues={
+                ':cents': parse_amount(legacy_balance),
+                ':legacy': legacy_balance
+            }
+        )
+        print(f"[INFO] Saldo legado migrado a centavos para {placa}")
+    except ClientError as e:
+        if not _condition_failed(e):
+            raise
+
+
+def prune_tracked_txns(users_table: Any, placa: str, oldest_txn: str) -> None:
+    """
+    Elimina los PRUNE_BATCH cobros más antiguos de debited_txns. La condición
+    sobre el primer elemento evita recortar dos veces si hay otro recorte en curso.
+    """
+    removals = ', '.join(f'{DEBITED_TXNS_FIELD}[{i}]' for i in range(PRUNE_BATCH))
+    try:
+        users_table.update_item(
+            Key={'placa': placa},
+            UpdateExpression=f'REMOVE {removals}',
+            ConditionExpression=f'{DEBITED_TXNS_FIELD}[0] = :oldest',
+            ExpressionAttributeValues={':oldest': oldest_txn}
+        )
+    except ClientError as e:
+        if not _condition_failed(e):
+            raise
+
+
+def deserialize(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    El item de ReturnValuesOnConditionCheckFailure llega en formato de bajo nivel
+    ({'S': ...}, {'N': ...}) incluso usando el resource de boto3.
+    """
+    if not all(isinstance(v, dict) and len(v) == 1 and next(iter(v)) in _TYPE_DESCRIPTORS
+               for v in item.values()):
+        return item
+    return {k: _deserializer.deserialize(v) for k, v in item.items()}
@@ -0,0 +1,255 @@
+"""
+GUATEPASS - Camino express para pasos con tag
+==============================================
+Procesa en el mismo proceso de resolve_user el caso más común: usuario
+registrado con tag (modalidad 3) y saldo suficiente. Tarifa, transacción,
+débito y factura se resuelven sin la Step Function y se escriben con una sola
+TransactWriteItems:
+
+    Update GuatepassUsers         débito de balance_ledger.debit_request
+                                  (+ debited_txns acotado, ver abajo)
+    Put    GuatepassTransactions  payment_status = completed
+    Put    GuatepassInvoices      factura pagada (attribute_not_exists)
+
+O se aplican las tres escrituras o ninguna, así que cualquier otro caso
+(saldo insuficiente, usuario inexistente, saldo legado sin migrar, conflicto
+con otra escritura) puede caer en la Step Function completa sin dejar nada a
+medias. Modalidad 3 no recibe notificación (notify_user), por eso no hace
+falta NotifyUser.
+
+El transaction_id es el mismo que arma record_transaction y queda en
+debited_txns: si la Lambda se reintenta después del commit, la condición del
+débito falla con el transaction_id ya cobrado y se retorna el resultado
+original (idempotent_replay) en vez de caer a la Step Function.
+
+TransactWriteItems no retorna el item actualizado, así que debited_txns no se
+puede recortar después del cobro como en balance_ledger.debit: la condición
+exige que tenga a lo sumo MAX_TRACKED_TXNS + PRUNE_BATCH elementos y, si no,
+se recorta y se reintenta una vez.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from botocore.exceptions import ClientError
+
+import balance_ledger
+from balance_ledger import DEBITED_TXNS_FIELD, MAX_TRACKED_TXNS, PRUNE_BATCH
+from invoice_ids import generate_invoice_id
+from money import BALANCE_FIELD
+
+EXPRESS_MODALITY = 3
+PIPELINE = 'express'
+MAX_ATTEMPTS = 2
+
+
+def build_transaction_id(peaje_id: Optional[str], placa: str, timestamp: str) -> str:
+    """transaction_id de un paso (mismo formato en record_transaction y en el camino express)."""
+    return f"TXN-{peaje_id}-{placa}-{timestamp.replace(':', '').replace('-', '')}"
+
+
+class ExpressPass:
+    """
+    Cobro de un paso con tag en una sola TransactWriteItems.
+
+    Args:
+        users_table: Tabla GuatepassUsers (su meta.client hace la transacción)
+        transactions_table: Tabla GuatepassTransactions
+        invoices_table: Tabla GuatepassInvoices
+        fare_rates: FareRatesLoader con la tabla de tarifas vigente
+    """
+
+    def __init__(self, users_table: Any, transactions_table: Any, invoices_table: Any, fare_rates: Any):
+        self.users_table = users_table
+        self.transactions_table = transactions_table
+        self.invoices_table = invoices_table
+        self.fare_rates = fare_rates
+
+    def process(self, user_profile: Dict[str, Any], toll_data: Dict[str, Any],
+                user: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Cobra el paso si aplica el camino express.
+
+        Args:
+            user_profile: user_data del payload de la Step Function
+            toll_data: toll_data del payload de la Step Function
+            user: Item del usuario como lo resolvió find_user
+
+        Returns:
+            Payload equivalente al de la Step Function al terminar (fare_calculation,
+            transaction, balance_update, invoice) o None si el paso debe seguir por
+            la Step Function
+        """
+        placa = user_profile['placa']
+        timestamp = toll_data.get('timestamp')
+        if user_profile.get('modalidad') != EXPRESS_MODALITY or not user_profile.get('is_registered') or not timestamp:
+            return None
+
+        fare_calculation = self.fare_rates.get().fare_calculation(EXPRESS_MODALITY, toll_data)
+        amount = fare_calculation['final_fare_cents']
+
+        # Un saldo conocido que no alcanza ni se intenta (si viene de un snapshot
+        # desactualizado, la Step Function lee el saldo real)
+        known_balance = user.get(BALANCE_FIELD)
+        if known_balance is not None and int(known_balance) < amount:
+            print(f"[INFO] Saldo conocido insuficiente para express ({placa}), se usa la Step Function")
+            return None
+
+        transaction_id = build_transaction_id(toll_data.get('peaje_id'), placa, timestamp)
+        now = datetime.utcnow().isoformat()
+        invoice = self._invoice(user_profile, toll_data, amount, transaction_id, now)
+        transaction = self._transaction_item(user_profile, toll_data, fare_calculation, transaction_id,
+                                             invoice['invoice_id'], now)
+
+        client = self.users_table.meta.client
+        for _ in range(MAX_ATTEMPTS):
+            try:
+                client.transact_write_items(TransactItems=self._transact_items(placa, amount, transaction, invoice))
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') != 'TransactionCanceledException':
+                    raise
+                reasons = e.response.get('CancellationReasons') or [{}]
+                debit_reason = reasons[0]
+                if debit_reason.get('Code') != 'ConditionalCheckFailed':
+                    codes = [reason.get('Code') for reason in reasons]
+                    print(f"[WARNING] Transacción express cancelada para {placa} ({codes}), se usa la Step Function")
+                    return None
+
+                item = debit_reason.get('Item')
+                item = balance_ledger.deserialize(item) if item is not None else None
+                status = balance_ledger.failure_status(item, transaction_id)
+                if status == balance_ledger.ALREADY_DEBITED:
+                    print(f"[INFO] Paso express {transaction_id} ya cobrado, se retorna el resultado original")
+                    return self._replay(user_profile, toll_data, fare_calculation, transaction_id)
+
+                tracked = item.get(DEBITED_TXNS_FIELD, []) if item is not None else []
+                if status == balance_ledger.INSUFFICIENT_FUNDS and len(tracked) > MAX_TRACKED_TXNS + PRUNE_BATCH:
+                    balance_ledger.prune_tracked_txns(self.users_table, placa, tracked[0])
+                    continue
+
+                print(f"[INFO] Paso express no aplica para {placa} ({status}), se usa la Step Function")
+                return None
+
+            print(f"[SUCCESS] Paso express {transaction_id}: {amount} centavos, factura {invoice['invoice_id']}")
+            return {
+                'user_data': user_profile,
+                'toll_data': toll_data,
+                'fare_calculation': fare_calculation,
+                'transaction': {
+                    'transaction_id': transaction_id,
+                    'status': 'recorded',
+                    'payment_status': 'completed'
+                },
+                'balance_update': {
+                    'updated': True,
+                    'amount_charged_cents': amount,
+                    'message': 'Balance actualizado exitosamente'
+                },
+                'invoice': invoice,
+                'pipeline': PIPELINE
+            }
+
+        return None
+
+    def _transact_items(self, placa: str, amount: int, transaction: Dict[str, Any],
+                        invoice: Dict[str, Any]) -> List[Dict[str, Any]]:
+        debit = balance_ledger.debit_request(placa, amount, transaction['transaction_id'])
+        debit['TableName'] = self.users_table.name
+        debit['ConditionExpression'] += (
+            f' AND (attribute_not_exists({DEBITED_TXNS_FIELD}) OR size({DEBITED_TXNS_FIELD}) <= :max_tracked)'
+        )
+        debit['ExpressionAttributeValues'][':max_tracked'] = MAX_TRACKED_TXNS + PRUNE_BATCH
+        debit['ReturnValuesOnConditionCheckFailure'] = 'ALL_OLD'
+        return [
+            {'Update': debit},
+            {'Put': {
+                'TableName': self.transactions_table.name,
+                'Item': transaction,
+                'ConditionExpression': 'attribute_not_exists(transaction_id)'
+            }},
+            {'Put': {
+                'TableName': self.invoices_table.name,
+                'Item': invoice,
+                'ConditionExpression': 'attribute_not_exists(invoice_id)'
+            }}
+        ]
+
+    @staticmethod
+    def _transaction_item(user_profile: Dict[str, Any], toll_data: Dict[str, Any],
+                          fare_calculation: Dict[str, Any], transaction_id: str,
+                          invoice_id: str, now: str) -> Dict[str, Any]:
+        """Mismo item que record_transaction, ya cobrado y con su factura."""
+        return {
+            'transaction_id': transaction_id,
+            'placa': user_profile['placa'],
+            'peaje_id': toll_data.get('peaje_id'),
+            'nombre_peaje': toll_data.get('nombre_peaje', ''),
+            'lane_id': toll_data.get('lane_id', ''),
+            'timestamp': toll_data['timestamp'],
+            'modalidad': EXPRESS_MODALITY,
+            'base_fare_cents': fare_calculation['base_fare_cents'],
+            'final_fare_cents': fare_calculation['final_fare_cents'],
+            'currency': fare_calculation['currency'],
+            'tag_id': toll_data.get('tag_id'),
+            'is_registered': True,
+            'has_tag': True,
+            'payment_status': 'completed',
+            'invoice_id': invoice_id,
+            'pipeline': PIPELINE,
+            'created_at': now
+        }
+
+    @staticmethod
+    def _invoice(user_profile: Dict[str, Any], toll_data: Dict[str, Any], amount: int,
+                 transaction_id: str, now: str) -> Dict[str, Any]:
+        """Misma factura que generate_invoice para un usuario registrado (pagada, sin multa)."""
+        invoice_id = generate_invoice_id()
+        peaje_nombre = toll_data.get('nombre_peaje', toll_data.get('peaje_id', 'Peaje'))
+        email = user_profile.get('email')
+        return {
+            'invoice_id': invoice_id,
+            'invoice_number': invoice_id,
+            'placa': user_profile['placa'],
+            'modalidad': EXPRESS_MODALITY,
+            'monto_base_cents': amount,
+            'multa_cents': 0,
+            'total_cents': amount,
+            'estado': 'pagada',
+            'concepto': f"Paso por peaje - {peaje_nombre}",
+            'fecha_emision': now + 'Z',
+            'contribuyente': {
+                'nombre': user_profile.get('nombre') or 'Usuario Desconocido',
+                'placa': user_profile['placa'],
+                'email': email if email else 'N/A'
+            },
+            'transaction_id': transaction_id,
+            'peaje': {
+                'peaje_id': toll_data.get('peaje_id', 'N/A'),
+                'nombre': peaje_nombre
+            },
+            'created_at': now + 'Z'
+        }
+
+    def _replay(self, user_profile: Dict[str, Any], toll_data: Dict[str, Any],
+                fare_calculation: Dict[str, Any], transaction_id: str) -> Dict[str, Any]:
+        """Resultado de un paso express ya cobrado (reintento de la Lambda tras el commit)."""
+        response = self.transactions_table.get_item(Key={'transaction_id': transaction_id}, ConsistentRead=True)
+        recorded = response.get('Item', {})
+        return {
+            'user_data': user_profile,
+            'toll_data': toll_data,
+            'fare_calculation': fare_calculation,
+            'transaction': {
+                'transaction_id': transaction_id,
+                'status': 'recorded',
+                'payment_status': recorded.get('payment_status', 'completed')
+            },
+            'balance_update': {
+                'updated': True,
+                'amount_charged_cents': int(recorded.get('final_fare_cents', fare_calculation['final_fare_cents'])),
+                'message': 'Balance actualizado exitosamente',
+                'idempotent_replay': True
+            },
+            'invoice': {'invoice_id': recorded.get('invoice_id')},
+            'pipeline': PIPELINE
+        }
@@ -0,0 +1,367 @@
+"""
+GUATEPASS - Motor de tarifas
+=============================
+Calcula tarifas de peaje con una matriz precalculada de centavos enteros.
+
+Al cargar una tabla de tarifas se calcula, una sola vez, la tarifa final de
+cada combinación (fila de peaje, modalidad, franja horaria) con Decimal y
+quantize (mismo redondeo que el cálculo original). Cada consulta posterior es
+un índice en un arreglo plano:
+
+    cells[(fila * n_modalidades + modalidad) * n_franjas + franja]
+
+La fila 0 es la tarifa por defecto y la modalidad 0 el multiplicador por
+defecto (modalidad desconocida).
+
+Formato de la tabla de tarifas (JSON, versionado):
+
+    {
+      "format_version": 1,
+      "version": "2025-11-01",
+      "currency": "GTQ",
+      "utc_offset_hours": -6,
+      "default_base": "10.00",
+      "default_multiplier": "1.50",
+      "modalities": {"1": "1.50", "2": "1.20", "3": "1.00"},
+      "time_bands": [{"name": "hora_pico", "multiplier": "1.25", "hours": [6, 7, 17, 18]}],
+      "tolls": [{"peaje_id": "PEAJE001", "names": ["carretera_norte"], "base": "15.00"}]
+    }
+
+Las horas que no pertenecen a ninguna franja usan la franja 'normal' (x1.00).
+La tabla por defecto (fare_rates.json) viaja en la Layer; se puede publicar
+otra versión en S3 sin redesplegar (FareRatesLoader).
+
+Para re-tarifar tráfico histórico o simular cambios de tarifa, calculate_batch
+recibe columnas (filas de peaje, modalidades, epochs) y usa los mismos índices
+sobre la matriz de forma vectorizada con NumPy, si está instalado, o con un
+ciclo en Python puro.
+"""
+
+import json
+import os
+import time
+from array import array
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Dict, List, Mapping, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional: solo acelera calculate_batch
+    np = None
+
+SUPPORTED_FORMAT_VERSION = 1
+DEFAULT_RATES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fare_rates.json')
+
+CENT = Decimal('0.01')
+DEFAULT_ROW = 0
+DEFAULT_SLOT = 0
+NORMAL_BAND = 'normal'
+
+
+def normalize_name(name: str) -> str:
+    """Misma normalización que usaba calculate_toll_fare para el nombre del peaje."""
+    return name.lower().replace(' ', '_')
+
+
+def timestamp_to_epoch(timestamp: Optional[str]) -> Optional[float]:
+    """Epoch de un timestamp ISO 8601 (sin zona horaria se asume UTC); None si es inválido."""
+    if not timestamp:
+        return None
+    try:
+        parsed = datetime.fromisoformat(timestamp.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+class FareQuote(NamedTuple):
+    final_cents: int
+    base_cents: int
+    multiplier: Decimal
+    time_band: str
+    time_band_multiplier: Decimal
+
+
+class FareEngine:
+    """
+    Matriz de tarifas construida a partir de una tabla de tarifas.
+
+    Args:
+        rates: Tabla de tarifas (ver formato en el docstring del módulo)
+    """
+
+    def __init__(self, rates: Dict[str, Any]):
+        if rates.get('format_version') != SUPPORTED_FORMAT_VERSION:
+            raise ValueError(f"Formato de tarifas no soportado: {rates.get('format_version')}")
+        if not rates.get('version'):
+            raise ValueError("La tabla de tarifas no tiene 'version'")
+
+        self.version = str(rates['version'])
+        self.currency = rates.get('currency', 'GTQ')
+        self.utc_offset_seconds = int(float(rates.get('utc_offset_hours', 0)) * 3600)
+
+        # Filas: 0 = default, luego un peaje por entrada de la tabla
+        self.bases: List[Decimal] = [Decimal(str(rates['default_base']))]
+        self.toll_index: Dict[str, int] = {}
+        self.name_index: Dict[str, int] = {}
+        for toll in rates.get('tolls', []):
+            row = len(self.bases)
+            self.bases.append(Decimal(str(toll['base'])))
+            if toll.get('peaje_id'):
+                self.toll_index[toll['peaje_id']] = row
+            for name in toll.get('names', []):
+                self.name_index[normalize_name(name)] = row
+
+        # Modalidades: slot 0 = multiplicador por defecto
+        self.multipliers: List[Decimal] = [Decimal(str(rates['default_multiplier']))]
+        self.modality_slots: Dict[int, int] = {}
+        for modalidad, multiplier in sorted(rates.get('modalities', {}).items(), key=lambda kv: int(kv[0])):
+            self.modality_slots[int(modalidad)] = len(self.multipliers)
+            self.multipliers.append(Decimal(str(multiplier)))
+
+        # Franjas horarias: 0 = normal; hour_bands asigna una franja a cada hora local
+        self.band_names: List[str] = [NORMAL_BAND]
+        self.band_multipliers: List[Decimal] = [Decimal('1.00')]
+        self.hour_bands: List[int] = [0] * 24
+        for band in rates.get('time_bands', []):
+            index = len(self.band_names)
+            self.band_names.append(band['name'])
+            self.band_multipliers.append(Decimal(str(band['multiplier'])))
+            for hour in band['hours']:
+                self.hour_bands[int(hour)] = index
+
+        self.n_slots = len(self.multipliers)
+        self.n_bands = len(self.band_names)
+        self.cells = array('q')
+        for base in self.bases:
+            self._append_row(base)
+
+        # Filas adicionales para tarifas base del catálogo que no están en la tabla
+        self._base_rows: Dict[str, int] = {}
+
+    def _append_row(self, base: Decimal) -> None:
+        for multiplier in self.multipliers:
+            for band_multiplier in self.band_multipliers:
+                final = (base * multiplier * band_multiplier).quantize(CENT)
+                self.cells.append(int(final * 100))
+
+    def row_for_base(self, base: Decimal) -> int:
+        """Fila para una tarifa base arbitraria (se calcula una vez por valor)."""
+        key = str(base)
+        row = self._base_rows.get(key)
+        if row is None:
+            row = len(self.bases)
+            self.bases.append(base)
+            self._append_row(base)
+            self._base_rows[key] = row
+        return row
+
+    def resolve_row(self, peaje_id: Optional[str] = None, tarifa_base_cents: Optional[int] = None,
+                    names: tuple = ()) -> int:
+        """
+        Fila de la matriz para un peaje. Prioridad: peaje_id en la tabla de
+        tarifas, tarifa base del catálogo de peajes, nombres (carretera o nombre
+        del peaje) y por último la tarifa por defecto.
+        """
+        if peaje_id and peaje_id in self.toll_index:
+            return self.toll_index[peaje_id]
+        if tarifa_base_cents is not None:
+            return self.row_for_base(Decimal(int(tarifa_base_cents)).scaleb(-2))
+        for name in names:
+            if name:
+                row = self.name_index.get(normalize_name(name))
+                if row is not None:
+                    return row
+        return DEFAULT_ROW
+
+    def band_for_epoch(self, epoch_seconds: float) -> int:
+        if self.n_bands == 1:
+            return 0
+        return self.hour_bands[int((epoch_seconds + self.utc_offset_seconds) // 3600) % 24]
+
+    def band_for_timestamp(self, timestamp: Optional[str]) -> int:
+        """Franja horaria de un timestamp ISO 8601 (sin timestamp válido se usa la hora actual)."""
+        if self.n_bands == 1:
+            return 0
+        epoch = timestamp_to_epoch(timestamp)
+        if epoch is None:
+            print(f"[WARNING] Timestamp inválido para franja horaria: {timestamp}")
+            epoch = time.time()
+        return self.band_for_epoch(epoch)
+
+    def fare_cents(self, row: int, modalidad: Any, band: int = 0) -> int:
+        slot = self.modality_slots.get(modalidad, DEFAULT_SLOT)
+        return self.cells[(row * self.n_slots + slot) * self.n_bands + band]
+
+    def quote(self, row: int, modalidad: Any, band: int = 0) -> FareQuote:
+        slot = self.modality_slots.get(modalidad, DEFAULT_SLOT)
+        return FareQuote(
+            final_cents=self.cells[(row * self.n_slots + slot) * self.n_bands + band],
+            base_cents=int(self.bases[row].quantize(CENT) * 100),
+            multiplier=self.multipliers[slot],
+            time_band=self.band_names[band],
+            time_band_multiplier=self.band_multipliers[band]
+        )
+
+    def fare_calculation(self, modalidad: Any, toll_data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Bloque fare_calculation del payload de la Step Function para un paso
+        (toll_data como lo arma resolve_user). Lo usan calculate_toll_fare y el
+        camino express de resolve_user, así que ambos cobran lo mismo.
+        """
+        nombre_peaje = toll_data.get('nombre_peaje', 'default')
+        row = self.resolve_row(
+            toll_data.get('peaje_id'),
+            toll_data.get('tarifa_base_cents'),
+            (toll_data.get('carretera'), nombre_peaje)
+        )
+        quote = self.quote(row, modalidad, self.band_for_timestamp(toll_data.get('timestamp')))
+
+        fare_calculation = {
+            'base_fare_cents': quote.base_cents,
+            'modality': modalidad,
+            'multiplier': str(quote.multiplier),
+            'final_fare_cents': quote.final_cents,
+            'currency': self.currency,
+            'toll_name': nombre_peaje,
+            'rate_version': self.version,
+            'time_band': quote.time_band
+        }
+        if quote.time_band_multiplier != 1:
+            fare_calculation['time_band_multiplier'] = str(quote.time_band_multiplier)
+        return fare_calculation
+
+    # ========================================
+    # Cálculo por lotes
+    # ========================================
+
+    def encode_tolls(self, peaje_ids: Sequence[Optional[str]], plazas: Optional[Mapping[str, Any]] = None) -> Any:
+        """
+        Convierte una columna de peaje_id en filas de la matriz.
+
+        Cada peaje_id distinto se resuelve una vez con resolve_row y los mismos
+        datos que fare_calculation recibe en toll_data: tarifa base, carretera y
+        nombre de la plaza en `plazas` (TollCatalog.plazas()). Sin plaza ni
+        peaje_id en la tabla de tarifas se usa la fila por defecto.
+        """
+        plazas = plazas or {}
+        rows: Dict[Optional[str], int] = {}
+
+        def row_of(peaje_id: Optional[str]) -> int:
+            row = rows.get(peaje_id)
+            if row is None:
+                plaza = plazas.get(peaje_id)
+                if plaza is None:
+                    row = self.resolve_row(peaje_id)
+                else:
+                    row = self.resolve_row(peaje_id, plaza.tarifa_base_cents, (plaza.carretera, plaza.nombre))
+                rows[peaje_id] = row
+            return row
+
+        if np is not None:
+            return np.fromiter((row_of(peaje_id) for peaje_id in peaje_ids), dtype=np.int64, count=len(peaje_ids))
+        return array('q', (row_of(peaje_id) for peaje_id in peaje_ids))
+
+    def calculate_batch(self, rows: Sequence[int], modalities: Sequence[int],
+                        epochs: Optional[Sequence[float]] = None) -> Any:
+        """
+        Tarifas en centavos para columnas de eventos.
+
+        Args:
+            rows: Filas de la matriz (encode_tolls o resolve_row)
+            modalities: Modalidad de cada evento
+            epochs: Epoch de cada paso (solo se usa si hay franjas horarias)
+
+        Returns:
+            Arreglo de centavos (numpy.ndarray int64 si NumPy está disponible, si no array('q'))
+        """
+        if np is not None:
+            return self._calculate_batch_numpy(rows, modalities, epochs)
+        return self._calculate_batch_python(rows, modalities, epochs)
+
+    def _calculate_batch_python(self, rows, modalities, epochs):
+        cells, n_slots, n_bands = self.cells, self.n_slots, self.n_bands
+        slots = self.modality_slots
+        if n_bands == 1 or epochs is None:
+            return array('q', (cells[(row * n_slots + slots.get(modalidad, DEFAULT_SLOT)) * n_bands]
+                               for row, modalidad in zip(rows, modalities)))
+        return array('q', (cells[(row * n_slots + slots.get(modalidad, DEFAULT_SLOT)) * n_bands
+                                 + self.band_for_epoch(epoch)]
+                           for row, modalidad, epoch in zip(rows, modalities, epochs)))
+
+    def _calculate_batch_numpy(self, rows, modalities, epochs):
+        cells = np.asarray(self.cells, dtype=np.int64)
+        rows = np.asarray(rows, dtype=np.int64)
+
+        # Tabla modalidad -> slot; modalidades fuera de rango usan el slot por defecto
+        slot_table = np.zeros(max(self.modality_slots, default=0) + 1, dtype=np.int64)
+        for modalidad, slot in self.modality_slots.items():
+            if modalidad >= 0:
+                slot_table[modalidad] = slot
+        modalities = np.asarray(modalities, dtype=np.int64)
+        in_range = (modalities >= 0) & (modalities < len(slot_table))
+        slots = np.where(in_range, slot_table[np.clip(modalities, 0, len(slot_table) - 1)], DEFAULT_SLOT)
+
+        index = (rows * self.n_slots + slots) * self.n_bands
+        if self.n_bands > 1 and epochs is not None:
+            hours = ((np.asarray(epochs, dtype=np.int64) + self.utc_offset_seconds) // 3600) % 24
+            index += np.asarray(self.hour_bands, dtype=np.int64)[hours]
+        return cells[index]
+
+
+def load_default_rates() -> Dict[str, Any]:
+    with open(DEFAULT_RATES_PATH, encoding='utf-8') as f:
+        return json.load(f)
+
+
+class FareRatesLoader:
+    """
+    Mantiene en memoria el FareEngine de la tabla de tarifas vigente.
+
+    Usa la tabla publicada en S3 si existe; si no, la tabla por defecto de la
+    Layer. Cada `refresh_seconds` compara el ETag del objeto y solo reconstruye
+    la matriz si cambió. Una tabla inválida se ignora y se conserva la anterior.
+    """
+
+    def __init__(self, s3_client: Any, bucket: Optional[str], key: str, refresh_seconds: float,
+                 default_rates: Optional[Dict[str, Any]] = None):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.refresh_seconds = refresh_seconds
+        self._engine = FareEngine(default_rates or load_default_rates())
+        self._etag: Optional[str] = None
+        self._checked_at: Optional[float] = None
+
+    def get(self) -> FareEngine:
+        if not self.bucket:
+            return self._engine
+
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            self._refresh()
+        return self._engine
+
+    def _refresh(self) -> None:
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)
+            if head['ETag'] == self._etag:
+                return
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=self.key)
+            engine = FareEngine(json.loads(response['Body'].read()))
+        except self.s3_client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('404', 'NoSuchKey'):
+                print(f"[WARNING] No se pudo leer la tabla de tarifas: {str(e)}")
+            return
+        except Exception as e:
+            print(f"[ERROR] Tabla de tarifas inválida en s3://{self.bucket}/{self.key}: {str(e)}")
+            return
+
+        self._engine = engine
+        self._etag = response['ETag']
+        print(f"[INFO] Tabla de tarifas cargada: versión {engine.version}, "
+              f"{len(engine.bases)} filas, {len(engine.cells)} celdas")
@@ -0,0 +1,190 @@
+"""
+GUATEPASS - Idempotencia de las tareas de process_toll
+=======================================================
+Cada Task de la Step Function se reintenta (Retry) y un timeout no dice si el
+intento anterior alcanzó a escribir. Las tareas con efectos (registrar la
+transacción, cobrar, facturar) corren su efecto con run_once, que guarda un
+registro por (event_id, tarea) en la tabla de idempotencia (la misma que usa
+ingest_toll para la deduplicación, con otro prefijo de llave):
+
+1. Reclamo: put condicional {status: in_progress, lease_expires_at}. Solo pasa
+   si no hay registro, si el registro ya venció (expires_at, el TTL de DynamoDB
+   borra con atraso) o si el intento que lo reclamó dejó vencer su lease
+   (el contenedor murió a media tarea).
+2. Efecto: la función de la tarea. Si falla, se borra el reclamo para que el
+   reintento corra de nuevo.
+3. Resultado: put {status: completed, result} con el JSON del resultado
+   (con reintentos, COMPLETE_MAX_ATTEMPTS).
+
+Un reintento que encuentra el registro completed retorna el resultado guardado
+sin repetir el efecto; si lo encuentra in_progress (el intento anterior sigue
+corriendo después de un timeout de la Step Function) falla con
+StageInProgressError y la Step Function vuelve a intentar más tarde.
+
+El registro evita repetir el efecto en el caso normal, pero no lo garantiza:
+si el contenedor muere después del efecto o el resultado no se puede guardar,
+el reclamo queda in_progress y al vencer el lease otro intento corre el efecto
+de nuevo (se registra con [WARNING] al retomarlo). Por eso cada efecto es
+idempotente por sí mismo: transaction_id por peaje, placa y hora, débito
+condicional por transaction_id (balance_ledger) e invoice_id derivado del
+event_id con put condicional.
+
+El lease debe ser mayor que el timeout de la Lambda: hasta entonces el intento
+original todavía puede escribir.
+"""
+
+import json
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from botocore.exceptions import ClientError
+
+from balance_ledger import deserialize
+from state_contract import dumps
+
+KEY_PREFIX = 'stage'
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETED = 'completed'
+
+# Intentos para guardar el resultado (backoff exponencial desde COMPLETE_BACKOFF_SECONDS)
+COMPLETE_MAX_ATTEMPTS = 3
+COMPLETE_BACKOFF_SECONDS = 0.1
+
+
+class StageInProgressError(Exception):
+    """Otro intento de la misma tarea tiene el reclamo vigente (la Step Function reintenta)."""
+
+
+def stage_key(event_id: str, stage: str) -> str:
+    """Llave del registro: event_id del paso y nombre de la tarea en state_contract.STAGES."""
+    return f"{KEY_PREFIX}#{event_id}#{stage}"
+
+
+def _condition_failed(error: ClientError) -> bool:
+    return error.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException'
+
+
+def claim(table: Any, key: str, record_ttl_seconds: int, lease_seconds: int) -> Optional[Dict[str, Any]]:
+    """
+    Reclama la tarea con un put condicional.
+
+    Returns:
+        None si el reclamo quedó registrado (hay que correr el efecto), o el
+        registro actual (deserializado) si otro intento ya lo tiene
+    """
+    now = int(time.time())
+    try:
+        response = table.put_item(
+            Item={
+                'idempotency_key': key,
+                'status': STATUS_IN_PROGRESS,
+                'lease_expires_at': now + lease_seconds,
+                'expires_at': now + record_ttl_seconds
+            },
+            ConditionExpression=(
+                'attribute_not_exists(idempotency_key) OR expires_at < :now '
+                'OR (#status = :in_progress AND lease_expires_at < :now)'
+            ),
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':now': now, ':in_progress': STATUS_IN_PROGRESS},
+            ReturnValues='ALL_OLD',
+            ReturnValuesOnConditionCheckFailure='ALL_OLD'
+        )
+        previous = response.get('Attributes') or {}
+        if previous.get('status') == STATUS_IN_PROGRESS and previous.get('expires_at', now) >= now:
+            print(f"[WARNING] {key}: se retoma un reclamo con el lease vencido "
+                  f"({previous.get('lease_expires_at')}); el intento anterior pudo aplicar el efecto")
+        return None
+    except ClientError as e:
+        if not _condition_failed(e):
+            raise
+        item = e.response.get('Item')
+        return deserialize(item) if item is not None else {}
+
+
+def release(table: Any, key: str) -> None:
+    """Borra el reclamo de un intento que falló (si sigue in_progress)."""
+    try:
+        table.delete_item(
+            Key={'idempotency_key': key},
+            ConditionExpression='#status = :in_progress',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':in_progress': STATUS_IN_PROGRESS}
+        )
+    except ClientError as e:
+        # Sin reclamo que borrar: el lease ya venció y otro intento lo tomó o lo completó
+        if not _condition_failed(e):
+            print(f"[WARNING] No se pudo liberar {key}: {str(e)}")
+
+
+def complete(table: Any, key: str, result: Any, record_ttl_seconds: int) -> bool:
+    """
+    Guarda el resultado de la tarea (el JSON que retornan los reintentos).
+
+    Returns:
+        False si no se pudo guardar después de COMPLETE_MAX_ATTEMPTS intentos
+    """
+    item = {
+        'idempotency_key': key,
+        'status': STATUS_COMPLETED,
+        'result': dumps(result),
+        'expires_at': int(time.time()) + record_ttl_seconds
+    }
+    for attempt in range(COMPLETE_MAX_ATTEMPTS):
+        try:
+            table.put_item(Item=item)
+            return True
+        except ClientError as e:
+            print(f"[WARNING] No se pudo guardar el resultado de {key} "
+                  f"({attempt + 1}/{COMPLETE_MAX_ATTEMPTS}): {str(e)}")
+            if attempt + 1 < COMPLETE_MAX_ATTEMPTS:
+                time.sleep(COMPLETE_BACKOFF_SECONDS * 2 ** attempt)
+    return False
+
+
+def run_once(table: Any, event_id: Optional[str], stage: str, action: Callable[[], Any],
+             record_ttl_seconds: int, lease_seconds: int) -> Tuple[Any, bool]:
+    """
+    Corre el efecto de una tarea una sola vez por (event_id, stage).
+
+    Args:
+        table: Tabla DynamoDB de idempotencia (GuatepassIdempotency)
+        event_id: event_id del paso (sin event_id no hay registro y el efecto corre directo)
+        stage: Nombre de la tarea en state_contract.STAGES
+        action: Efecto de la tarea; retorna el resultado (serializable a JSON)
+        record_ttl_seconds: Tiempo de vida del registro (atributo TTL expires_at)
+        lease_seconds: Tiempo que otro intento espera antes de retomar un reclamo
+            (mayor que el timeout de la Lambda)
+
+    Returns:
+        (resultado, True si es el resultado guardado de un intento anterior)
+
+    Raises:
+        StageInProgressError: Otro intento de la tarea tiene el reclamo vigente
+    """
+    if not event_id:
+        print(f"[WARNING] {stage} sin event_id: se ejecuta sin registro de idempotencia")
+        return action(), False
+
+    key = stage_key(event_id, stage)
+    current = claim(table, key, record_ttl_seconds, lease_seconds)
+    if current is not None:
+        if current.get('status') == STATUS_COMPLETED:
+            print(f"[INFO] {stage} ya completada para {event_id}, se retorna el resultado guardado")
+            return json.loads(current['result']), True
+        raise StageInProgressError(f"{stage} de {event_id} en curso en otro intento "
+                                   f"(lease hasta {current.get('lease_expires_at')})")
+
+    try:
+        result = action()
+    except Exception:
+        release(table, key)
+        raise
+
+    # El efecto ya corrió: aunque no se guarde el resultado, la tarea responde
+    # con él. El reclamo queda in_progress hasta que venza el lease y el
+    # reintento que lo retome repite un efecto idempotente.
+    if not complete(table, key, result, record_ttl_seconds):
+        print(f"[ERROR] {key} quedó in_progress sin resultado guardado: el lease vence a los "
+              f"{lease_seconds}s y un reintento repetirá el efecto (idempotente)")
+    return result, False
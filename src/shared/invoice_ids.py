@@ -0,0 +1,119 @@
+"""
+GUATEPASS - Números de factura
+===============================
+Genera invoice_id únicos y ordenables por tiempo, sin coordinación entre
+contenedores:
+
+    FAC-<26 caracteres Crockford base32>
+
+    128 bits = 48 bits de milisegundos UTC
+             | 56 bits de nodo (aleatorio por proceso)
+             | 24 bits de secuencia dentro del milisegundo
+
+Cada proceso (contenedor Lambda, worker de multiprocessing) elige su nodo al
+iniciar y al hacer fork, así que dos contenedores no comparten secuencia. Dentro
+del proceso un lock protege (milisegundo, secuencia): hasta 16.7M IDs por
+milisegundo; si la secuencia se agota o el reloj retrocede, se sigue con el
+milisegundo lógico siguiente, nunca con un ID repetido.
+
+generate_invoice usa invoice_id_for: mismo formato, pero nodo y secuencia salen
+de un hash del event_id y el instante es la hora del paso, así el reintento de
+un paso obtiene el mismo invoice_id y el put condicional no emite otra factura.
+
+invoice_id es la llave HASH de GuatepassInvoices: DynamoDB distribuye por hash,
+así que IDs consecutivos no concentran escrituras en una partición (no hay
+contador central ni item caliente).
+"""
+
+import hashlib
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+INVOICE_PREFIX = 'FAC-'
+
+_ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+_DECODE = {c: i for i, c in enumerate(_ALPHABET)}
+# Pares de caracteres por cada 10 bits: 13 búsquedas por ID en vez de 26 divmod
+_PAIRS = [a + b for a in _ALPHABET for b in _ALPHABET]
+_ENCODED_LENGTH = 26
+
+_NODE_BITS = 56
+_SEQUENCE_BITS = 24
+_MAX_SEQUENCE = (1 << _SEQUENCE_BITS) - 1
+
+
+class InvoiceIdGenerator:
+    """Generador monotónico por proceso, seguro entre hilos."""
+
+    def __init__(self, node: int = None, clock=time.time_ns):
+        self._lock = threading.Lock()
+        self._clock = clock
+        self._node = node if node is not None else _random_node()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def reseed(self) -> None:
+        """Nuevo nodo aleatorio (se llama en el proceso hijo tras un fork)."""
+        self._lock = threading.Lock()
+        self._node = _random_node()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self) -> str:
+        now_ms = self._clock() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms = now_ms
+                self._sequence = 0
+            elif self._sequence < _MAX_SEQUENCE:
+                self._sequence += 1
+            else:
+                # Secuencia agotada (o reloj atrasado): avanzar el milisegundo lógico
+                self._last_ms += 1
+                self._sequence = 0
+            value = (((self._last_ms << _NODE_BITS) | self._node) << _SEQUENCE_BITS) | self._sequence
+        return INVOICE_PREFIX + _encode(value)
+
+
+def _random_node() -> int:
+    return int.from_bytes(os.urandom(_NODE_BITS // 8), 'big')
+
+
+def _encode(value: int) -> str:
+    pairs = _PAIRS
+    return ''.join([pairs[(value >> shift) & 0x3FF] for shift in range(120, -10, -10)])
+
+
+def invoice_id_for(key: str, at: datetime) -> str:
+    """
+    invoice_id determinístico: el mismo `key` (event_id del paso) y el mismo
+    instante dan siempre el mismo ID, ordenable por `at` como los del generador.
+    Los 80 bits de nodo y secuencia son un hash de `key`.
+    """
+    millis = int(at.timestamp() * 1000)
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=(_NODE_BITS + _SEQUENCE_BITS) // 8).digest()
+    return INVOICE_PREFIX + _encode((millis << (_NODE_BITS + _SEQUENCE_BITS)) | int.from_bytes(digest, 'big'))
+
+
+def invoice_timestamp(invoice_id: str) -> datetime:
+    """Instante (UTC, precisión de milisegundos) embebido en un invoice_id."""
+    if not invoice_id.startswith(INVOICE_PREFIX) or len(invoice_id) != len(INVOICE_PREFIX) + _ENCODED_LENGTH:
+        raise ValueError(f"invoice_id inválido: {invoice_id!r}")
+    value = 0
+    for char in invoice_id[len(INVOICE_PREFIX):]:
+        value = value * 32 + _DECODE[char]
+    millis = value >> (_NODE_BITS + _SEQUENCE_BITS)
+    return datetime.fromtimestamp(millis / 1000, tz=timezone.utc)
+
+
+_generator = InvoiceIdGenerator()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_generator.reseed)
+
+
+def generate_invoice_id() -> str:
+    """Siguiente invoice_id del proceso."""
+    return _generator.next_id()
@@ -0,0 +1,95 @@
+"""
+GUATEPASS - Montos en centavos
+===============================
+Representación única de dinero en todo el pipeline: enteros en centavos de
+quetzal (Q15.00 = 1500).
+
+Saldos, tarifas, multas y totales se guardan en DynamoDB y viajan entre los
+pasos de la Step Function como int. La conversión a texto o número decimal se
+hace solo en los bordes (respuestas del API, CSV de entrada, emails).
+
+Atributos en DynamoDB:
+    GuatepassUsers         saldo_cents
+    GuatepassTransactions  base_fare_cents, final_fare_cents
+    GuatepassInvoices      monto_base_cents, multa_cents, total_cents
+
+Los items escritos antes de este cambio tienen el monto en quetzales
+(saldo_disponible, final_fare, total, ...); read_cents los acepta como
+respaldo y update_balance migra el saldo al escribirlo.
+"""
+
+from decimal import Decimal, InvalidOperation, ROUND_HALF_EVEN
+from typing import Any, Mapping, Optional
+
+Cents = int
+
+CENTS_PER_QUETZAL = 100
+CURRENCY = 'GTQ'
+
+BALANCE_FIELD = 'saldo_cents'
+LEGACY_BALANCE_FIELD = 'saldo_disponible'
+
+_CENT = Decimal('0.01')
+
+
+def parse_amount(value: Any) -> Cents:
+    """
+    Convierte un monto en quetzales (str, Decimal, int o float) a centavos.
+    Se usa solo en los bordes; redondea al centavo igual que quantize.
+    """
+    if value is None or value == '':
+        return 0
+    try:
+        amount = Decimal(str(value).strip())
+        # Infinity/NaN y exponentes fuera de la precisión no tienen centavos
+        if not amount.is_finite():
+            raise InvalidOperation
+        return int(amount.quantize(_CENT, rounding=ROUND_HALF_EVEN) * CENTS_PER_QUETZAL)
+    except InvalidOperation:
+        raise ValueError(f"Monto inválido: {value!r}")
+
+
+def format_amount(cents: Cents) -> str:
+    """Centavos a texto con dos decimales: 1500 -> '15.00'."""
+    sign = '-' if cents < 0 else ''
+    units, rest = divmod(abs(int(cents)), CENTS_PER_QUETZAL)
+    return f"{sign}{units}.{rest:02d}"
+
+
+def format_currency(cents: Cents) -> str:
+    """Centavos a texto para mostrar al usuario: 1500 -> 'Q15.00'."""
+    return f"Q{format_amount(cents)}"
+
+
+def to_api_number(cents: Cents) -> float:
+    """Centavos a número JSON para las respuestas del API (solo en el borde)."""
+    return int(cents) / CENTS_PER_QUETZAL
+
+
+def read_cents(item: Mapping[str, Any], field: str, legacy_field: Optional[str] = None,
+               default: Cents = 0) -> Cents:
+    """
+    Lee un monto de un item de DynamoDB o de un payload.
+
+    Usa el atributo en centavos si existe; si no, el atributo legado en
+    quetzales (items anteriores a la migración).
+    """
+    value = item.get(field)
+    if value is not None:
+        return int(value)
+    if legacy_field is not None and item.get(legacy_field) is not None:
+        return parse_amount(item[legacy_field])
+    return default
+
+
+def balance_cents(user: Mapping[str, Any]) -> Cents:
+    """Saldo del usuario en centavos (saldo_cents o el saldo_disponible legado)."""
+    return read_cents(user, BALANCE_FIELD, LEGACY_BALANCE_FIELD)
+
+
+def percentage(cents: Cents, percent: int) -> Cents:
+    """Porcentaje entero de un monto, redondeado al centavo (half-even)."""
+    quotient, remainder = divmod(cents * percent, 100)
+    if remainder * 2 > 100 or (remainder * 2 == 100 and quotient % 2):
+        quotient += 1
+    return quotient
@@ -0,0 +1,310 @@
+"""
+GUATEPASS - Filtro Bloom de usuarios registrados
+=================================================
+Filtro probabilístico con las placas y tag_ids registrados en GuatepassUsers.
+
+Si el filtro indica que una llave NO existe, la respuesta es definitiva y
+resolve_user puede omitir la lectura a DynamoDB (modalidad 1). Si indica que
+SÍ existe, puede ser un falso positivo y se consulta DynamoDB como siempre.
+
+El "no" solo es definitivo para la versión del filtro publicada: la copia en
+memoria de resolve_user puede ser anterior a un registro reciente. Por eso
+RegistryFilterLoader.excludes() solo descarta una llave con un filtro revisado
+(ETag) después de que se recibió el paso; si no, se consulta DynamoDB.
+
+El filtro se guarda como un blob binario en S3:
+
+    header (24 bytes): magic 'GPBF', versión, num_hashes, num_bits, capacity, count
+    bits:              num_bits / 8 bytes
+
+Lo regeneran import_users (rebuild completo o incremental) y los handlers de
+tags (solo agregan llaves; un filtro Bloom no permite eliminar y una llave
+eliminada solo produce falsos positivos, que terminan en DynamoDB).
+"""
+
+import hashlib
+import math
+import struct
+import time
+from typing import Any, Iterable, Optional, Tuple
+
+MAGIC = b'GPBF'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBHQII')
+
+DEFAULT_FP_RATE = 0.01
+MIN_CAPACITY = 10000
+
+
+def placa_entry(placa: str) -> str:
+    return f"placa#{placa}"
+
+
+def tag_entry(tag_id: str) -> str:
+    return f"tag#{tag_id}"
+
+
+def user_entries(user: dict) -> Tuple[str, ...]:
+    """Llaves del filtro para un usuario: su placa y, si tiene, su tag_id."""
+    if user.get('tag_id'):
+        return placa_entry(user['placa']), tag_entry(user['tag_id'])
+    return (placa_entry(user['placa']),)
+
+
+class BloomFilter:
+    """
+    Filtro Bloom con doble hashing (Kirsch-Mitzenmacher) sobre blake2b.
+
+    Args:
+        num_bits: Tamaño del arreglo de bits (múltiplo de 8)
+        num_hashes: Número de funciones hash
+        capacity: Número de llaves para el que se dimensionó el filtro
+    """
+
+    def __init__(self, num_bits: int, num_hashes: int, capacity: int,
+                 bits: Optional[bytearray] = None, count: int = 0):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.capacity = capacity
+        self.bits = bits if bits is not None else bytearray(num_bits // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, fp_rate: float = DEFAULT_FP_RATE) -> 'BloomFilter':
+        """Dimensiona el filtro para `capacity` llaves con la tasa de falsos positivos indicada."""
+        capacity = max(capacity, 1)
+        num_bits = math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        num_bits = max(64, (num_bits + 7) // 8 * 8)
+        num_hashes = max(1, round(num_bits / capacity * math.log(2)))
+        return cls(num_bits, num_hashes, capacity)
+
+    def _positions(self, key: str):
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str) -> None:
+        for pos in self._positions(key):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        for pos in self._positions(key):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def is_saturated(self) -> bool:
+        """True si ya tiene más llaves de las previstas (la tasa de FP empieza a crecer)."""
+        return self.count > self.capacity
+
+    def to_bytes(self) -> bytes:
+        header = HEADER.pack(MAGIC, FORMAT_VERSION, self.num_hashes, 0,
+                             self.num_bits, self.capacity, self.count)
+        return header + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'BloomFilter':
+        magic, version, num_hashes, _, num_bits, capacity, count = HEADER.unpack_from(blob)
+        if magic != MAGIC or version != FORMAT_VERSION:
+            raise ValueError(f"Blob de filtro inválido: magic={magic!r}, version={version}")
+        bits = bytearray(blob[HEADER.size:HEADER.size + num_bits // 8])
+        return cls(num_bits, num_hashes, capacity, bits, count)
+
+
+# ========================================
+# Persistencia en S3
+# ========================================
+
+def load_filter(s3_client: Any, bucket: str, key: str) -> Tuple[Optional[BloomFilter], Optional[str]]:
+    """
+    Descarga el filtro desde S3.
+
+    Returns:
+        Tupla (filtro, ETag), o (None, None) si el objeto no existe
+    """
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=key)
+    except s3_client.exceptions.NoSuchKey:
+        return None, None
+    return BloomFilter.from_bytes(response['Body'].read()), response['ETag']
+
+
+def save_filter(s3_client: Any, bucket: str, key: str, bloom: BloomFilter,
+                if_match: Optional[str] = None) -> None:
+    """Sube el filtro a S3; con if_match la escritura falla si otro proceso lo modificó."""
+    params = {
+        'Bucket': bucket,
+        'Key': key,
+        'Body': bloom.to_bytes(),
+        'ContentType': 'application/octet-stream'
+    }
+    if if_match:
+        params['IfMatch'] = if_match
+    s3_client.put_object(**params)
+
+
+def build_from_table(users_table: Any, fp_rate: float = DEFAULT_FP_RATE) -> BloomFilter:
+    """
+    Regenera el filtro completo con un scan de la tabla de usuarios.
+    Se dimensiona al doble de los usuarios actuales para absorber crecimiento.
+    """
+    entries = []
+    scan_params = {
+        'ProjectionExpression': 'placa, tag_id'
+    }
+
+    while True:
+        response = users_table.scan(**scan_params)
+        for user in response.get('Items', []):
+            entries.extend(user_entries(user))
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    bloom = BloomFilter.for_capacity(max(MIN_CAPACITY, len(entries) * 2), fp_rate)
+    for entry in entries:
+        bloom.add(entry)
+    return bloom
+
+
+def add_entries(s3_client: Any, bucket: str, key: str, entries: Iterable[str],
+                max_attempts: int = 5) -> bool:
+    """
+    Agrega llaves al filtro guardado en S3 (read-modify-write con escritura condicional).
+
+    Returns:
+        True si se actualizó; False si no existe filtro o está saturado
+        (en ese caso debe regenerarse con build_from_table).
+    """
+    # Un iterador de un solo uso se materializa; una colección re-iterable
+    # (p. ej. el spool en /tmp de import_users) se recorre en cada intento
+    if iter(entries) is entries:
+        entries = list(entries)
+
+    for attempt in range(max_attempts):
+        bloom, etag = load_filter(s3_client, bucket, key)
+        if bloom is None:
+            return False
+
+        for entry in entries:
+            bloom.add(entry)
+        if bloom.is_saturated():
+            return False
+
+        try:
+            save_filter(s3_client, bucket, key, bloom, if_match=etag)
+            return True
+        except s3_client.exceptions.ClientError as e:
+            if e.response.get('Error', {}).get('Code') not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                raise
+            print(f"[WARNING] Filtro modificado concurrentemente, reintentando ({attempt + 1}/{max_attempts})")
+            time.sleep(0.05 * (2 ** attempt))
+
+    raise RuntimeError(f"No se pudo actualizar el filtro s3://{bucket}/{key} tras {max_attempts} intentos")
+
+
+def register_entries(s3_client: Any, users_table: Any, bucket: str, key: str,
+                     entries: Iterable[str], fp_rate: float = DEFAULT_FP_RATE) -> None:
+    """
+    Asegura que las llaves queden en el filtro publicado.
+
+    Intenta agregarlas de forma incremental; si no existe filtro o está saturado,
+    lo regenera completo desde la tabla. Si todo falla, elimina el objeto para que
+    resolve_user vuelva a consultar DynamoDB (nunca debe quedar un falso negativo).
+    """
+    try:
+        if add_entries(s3_client, bucket, key, entries):
+            return
+
+        bloom = build_from_table(users_table, fp_rate)
+        save_filter(s3_client, bucket, key, bloom)
+        print(f"[INFO] Filtro de registrados regenerado: {bloom.count} llaves, capacidad {bloom.capacity}")
+
+    except Exception as e:
+        print(f"[ERROR] No se pudo actualizar el filtro de registrados, se invalida: {str(e)}")
+        s3_client.delete_object(Bucket=bucket, Key=key)
+
+
+class RegistryFilterLoader:
+    """
+    Mantiene en memoria el filtro publicado en S3.
+
+    Se carga en el cold start y se revisa cada `refresh_seconds` (head_object);
+    solo se vuelve a descargar si cambió el ETag. Si el objeto no existe o falla
+    la descarga, get() retorna None y el llamador debe consultar DynamoDB.
+
+    Un registro (tags, import_users) publica el filtro nuevo al terminar, pero
+    esta copia puede tardar hasta `refresh_seconds` en verlo: para descartar una
+    llave se usa excludes(), que exige un filtro revisado después del paso.
+    """
+
+    def __init__(self, s3_client: Any, bucket: Optional[str], key: str, refresh_seconds: float,
+                 recheck_seconds: float = 1.0):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.refresh_seconds = refresh_seconds
+        self.recheck_seconds = recheck_seconds
+        self._bloom: Optional[BloomFilter] = None
+        self._etag: Optional[str] = None
+        self._checked_at: Optional[float] = None
+        # Hora (epoch) de la última revisión del ETag que confirmó la copia en memoria
+        self._validated_at: Optional[float] = None
+
+    def get(self) -> Optional[BloomFilter]:
+        if not self.bucket:
+            return None
+
+        if self._checked_at is not None and time.monotonic() - self._checked_at < self.refresh_seconds:
+            return self._bloom
+        return self._refresh()
+
+    def excludes(self, entry: str, as_of: float) -> bool:
+        """
+        True si el filtro descarta la llave para un paso recibido en `as_of`.
+
+        Con una copia revisada antes de `as_of`, un "no" puede ser un registro
+        publicado después: se revisa el ETag antes de confiar en él (a lo más una
+        vez cada `recheck_seconds`; entre revisiones se responde False y el
+        llamador consulta DynamoDB).
+
+        Args:
+            entry: Llave del filtro (placa_entry / tag_entry)
+            as_of: Epoch en que se recibió el paso (received_at de ingest_toll)
+        """
+        bloom = self.get()
+        if bloom is None or entry in bloom:
+            return False
+        if self._validated_at is not None and self._validated_at >= as_of:
+            return True
+        if time.monotonic() - self._checked_at < self.recheck_seconds:
+            return False
+
+        bloom = self._refresh()
+        return bloom is not None and entry not in bloom and self._validated_at >= as_of
+
+    def _refresh(self) -> Optional[BloomFilter]:
+        self._checked_at = time.monotonic()
+        validated_at = time.time()
+
+        try:
+            if self._bloom is not None:
+                head = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)
+                if head['ETag'] == self._etag:
+                    self._validated_at = validated_at
+                    return self._bloom
+
+            self._bloom, self._etag = load_filter(self.s3_client, self.bucket, self.key)
+            self._validated_at = validated_at
+            if self._bloom is not None:
+                print(f"[INFO] Filtro de registrados cargado: {self._bloom.count} llaves, "
+                      f"{len(self._bloom.bits)} bytes")
+        except Exception as e:
+            print(f"[WARNING] No se pudo cargar el filtro de registrados: {str(e)}")
+            self._bloom, self._etag, self._validated_at = None, None, None
+
+        return self._bloom
@@ -0,0 +1,252 @@
+"""
+GUATEPASS - Contrato de estado de process_toll
+===============================================
+Qué recibe y qué retorna cada tarea de la Step Function.
+
+Contrato 1 (documento acumulado): cada Lambda recibía el documento completo
+(user_data, toll_data, fare_calculation, ...) y lo retornaba entero con su
+resultado agregado; un Pass Merge*Result por tarea volvía a armar el
+documento para la siguiente.
+
+Contrato 2 (este módulo): el documento de la ejecución vive solo en Step
+Functions. Cada tarea recibe en Parameters únicamente los campos que declara
+STAGES, con contract_version = 2, y retorna solo su resultado (el delta). El
+ResultPath de la tarea lo deja en su slot del documento ($.fare_calculation,
+$.transaction, ...), sin estados Pass intermedios:
+
+    "CalculateTollFare": {
+        "Type": "Task",
+        "Resource": "${CalculateTollFareFunctionArn}",
+        "Parameters": {                              <- parameters('calculate_fare')
+            "contract_version": 2,
+            "user_data": {"modalidad.$": "$.user_data.modalidad"},
+            "toll_data.$": "$.toll_data"
+        },
+        "ResultPath": "$.fare_calculation",
+        ...
+    }
+
+Con el ARN de la función como Resource (en vez de arn:aws:states:::lambda:invoke)
+el resultado de la tarea es directamente lo que retorna el handler, sin el
+sobre {StatusCode, Payload}.
+
+Los handlers responden con respond(event, stage, delta): con un evento del
+contrato 2 retornan el delta y con un evento sin contract_version (ejecuciones
+iniciadas antes del despliegue, o los items de process_toll_batch armados por
+calculate_items / record_items) retornan el documento con el delta agregado,
+como antes.
+
+Los slots que siempre tienen los mismos campos se recortan campo a campo; los
+que cambian de forma según el caso (toll_data con o sin catálogo,
+balance_update) viajan completos. scripts/check_state_payloads.py verifica que
+las definiciones ASL coincidan con STAGES y que cada transición quede dentro
+del presupuesto de bytes.
+
+STAGES es también el grafo de dependencias del flujo: una tarea depende de las
+tareas cuyo output lee y de las que declara en `after`. levels() agrupa las que
+pueden correr a la vez y scripts/generate_state_machine.py arma
+process_toll.asl.json a partir de eso (un Parallel por nivel con más de una
+tarea). UpdateBalance y GenerateInvoice no leen transaction (el transaction_id
+es determinístico, transaction_id()), pero UpdateBalance va después de
+RecordTransaction y GenerateInvoice después de UpdateBalance: si una tarea
+agota sus reintentos las siguientes no corren, así que nunca queda un cobro
+sin su transacción registrada ni una factura sin su débito.
+
+Las tareas con efectos (RecordTransaction, UpdateBalance, GenerateInvoice)
+leen también event_id: es la llave de su registro de idempotencia
+(shared/idempotency.py), así un reintento de la tarea retorna el resultado
+del intento anterior sin repetir la escritura.
+"""
+
+import json
+from decimal import Decimal
+from typing import Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from express_pass import build_transaction_id
+
+CONTRACT_VERSION = 2
+VERSION_FIELD = 'contract_version'
+
+
+class Stage(NamedTuple):
+    """
+    Una tarea de process_toll.
+
+    Args:
+        state: Nombre del estado Task en la definición ASL
+        inputs: Slot del documento -> campos que lee la tarea (None = el slot completo)
+        output: Slot del documento donde queda el resultado de la tarea
+        after: Tareas que deben terminar antes aunque no se lea su resultado
+    """
+    state: str
+    inputs: Dict[str, Optional[Tuple[str, ...]]]
+    output: str
+    after: Tuple[str, ...] = ()
+
+
+STAGES: Dict[str, Stage] = {
+    'calculate_fare': Stage(
+        state='CalculateTollFare',
+        inputs={
+            'user_data': ('modalidad',),
+            'toll_data': None
+        },
+        output='fare_calculation'
+    ),
+    'record_transaction': Stage(
+        state='RecordTransaction',
+        inputs={
+            'event_id': None,
+            'user_data': ('placa', 'is_registered', 'has_tag'),
+            'toll_data': None,
+            'fare_calculation': ('modality', 'base_fare_cents', 'final_fare_cents', 'currency')
+        },
+        output='transaction'
+    ),
+    'update_balance': Stage(
+        state='UpdateBalance',
+        inputs={
+            'event_id': None,
+            'user_data': ('placa', 'modalidad', 'is_registered'),
+            'toll_data': ('peaje_id', 'timestamp'),
+            'fare_calculation': ('final_fare_cents',)
+        },
+        output='balance_update',
+        after=('record_transaction',)
+    ),
+    'generate_invoice': Stage(
+        state='GenerateInvoice',
+        inputs={
+            'event_id': None,
+            'user_data': ('placa', 'modalidad', 'nombre', 'email'),
+            'toll_data': None,
+            'fare_calculation': ('final_fare_cents',)
+        },
+        output='invoice',
+        after=('update_balance',)
+    ),
+    'notify_user': Stage(
+        state='NotifyUser',
+        inputs={
+            'user_data': ('placa', 'modalidad', 'nombre', 'email'),
+            'toll_data': None,
+            'balance_update': None,
+            'invoice': ('invoice_number', 'fecha_emision', 'monto_base_cents', 'multa_cents',
+                        'total_cents', 'concepto')
+        },
+        output='notification'
+    ),
+}
+
+
+def dependencies() -> Dict[str, Set[str]]:
+    """
+    Tarea -> tareas que deben terminar antes: las que producen un slot de sus
+    inputs y las de `after`.
+    """
+    producers = {spec.output: stage for stage, spec in STAGES.items()}
+    return {
+        stage: {producers[slot] for slot in spec.inputs if slot in producers} | set(spec.after)
+        for stage, spec in STAGES.items()
+    }
+
+
+def levels() -> List[List[str]]:
+    """
+    Tareas agrupadas por nivel: las de un nivel solo dependen de niveles
+    anteriores, así que pueden correr a la vez (en el orden de STAGES).
+    """
+    pending = dependencies()
+    done: Set[str] = set()
+    result = []
+    while pending:
+        ready = [stage for stage, needs in pending.items() if needs <= done]
+        if not ready:
+            raise ValueError(f"Dependencias circulares entre {sorted(pending)}")
+        result.append(ready)
+        done.update(ready)
+        for stage in ready:
+            del pending[stage]
+    return result
+
+
+def parameters(stage: str) -> Dict[str, Any]:
+    """Parameters de la tarea en la definición ASL (entrada recortada según STAGES)."""
+    spec = STAGES[stage]
+    result: Dict[str, Any] = {VERSION_FIELD: CONTRACT_VERSION}
+    for slot, fields in spec.inputs.items():
+        if fields is None:
+            result[f"{slot}.$"] = f"$.{slot}"
+        else:
+            result[slot] = {f"{field}.$": f"$.{slot}.{field}" for field in fields}
+    return result
+
+
+def task_input(stage: str, document: Dict[str, Any]) -> Dict[str, Any]:
+    """Entrada de la tarea a partir del documento de la ejecución (lo mismo que hace Parameters)."""
+    spec = STAGES[stage]
+    result: Dict[str, Any] = {VERSION_FIELD: CONTRACT_VERSION}
+    for slot, fields in spec.inputs.items():
+        value = document[slot]
+        result[slot] = value if fields is None else {field: value[field] for field in fields}
+    return result
+
+
+def transaction_id(event: Dict[str, Any]) -> str:
+    """
+    transaction_id del paso: el de transaction si viene en el evento (contrato 1,
+    items de process_toll_batch) o el mismo que arma record_transaction con
+    peaje, placa y hora. Así UpdateBalance y GenerateInvoice no esperan a
+    RecordTransaction.
+    """
+    recorded = event.get('transaction', {}).get('transaction_id')
+    if recorded:
+        return recorded
+    toll_data = event.get('toll_data', {})
+    if not toll_data.get('timestamp'):
+        raise ValueError("Falta 'timestamp' en toll_data (necesario para el transaction_id)")
+    return build_transaction_id(toll_data.get('peaje_id'), event.get('user_data', {}).get('placa', 'UNKNOWN'),
+                                toll_data['timestamp'])
+
+
+def is_slim(event: Dict[str, Any]) -> bool:
+    """True si el evento viene con el contrato 2 (entrada recortada, se responde solo el delta)."""
+    version = event.get(VERSION_FIELD)
+    if version is None:
+        return False
+    if version != CONTRACT_VERSION:
+        raise ValueError(f"contract_version no soportada: {version} (se esperaba {CONTRACT_VERSION})")
+    return True
+
+
+def respond(event: Dict[str, Any], stage: str, delta: Any) -> Any:
+    """
+    Respuesta de una tarea.
+
+    Args:
+        event: Evento que recibió el handler
+        stage: Nombre de la tarea en STAGES
+        delta: Resultado de la tarea
+
+    Returns:
+        El delta (contrato 2) o el documento con el delta en su slot (contrato 1)
+    """
+    if is_slim(event):
+        return delta
+    return {**event, STAGES[stage].output: delta}
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    return str(value)
+
+
+def dumps(value: Any) -> str:
+    """JSON compacto (Decimal de DynamoDB como número, fechas y demás como texto)."""
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False, default=_default)
+
+
+def payload_bytes(value: Any) -> int:
+    """Tamaño en bytes del JSON que viaja entre estados (el límite de Step Functions es 256 KB)."""
+    return len(dumps(value).encode('utf-8'))
@@ -0,0 +1,95 @@
+"""
+GUATEPASS - Catálogo de peajes
+===============================
+Catálogo en memoria de la tabla GuatepassTolls (PK: peaje_id).
+
+La tabla completa se carga una vez por contenedor en un mapa inmutable. Al
+vencer el TTL solo se lee el item de versión (peaje_id = '__catalog__'); la
+tabla se vuelve a leer completa únicamente si la versión cambió. Así no se
+agrega ninguna lectura por evento.
+
+Item de peaje:
+    {"peaje_id": "PEAJE001", "nombre": "Carretera Norte",
+     "carretera": "carretera_norte", "tarifa_base_cents": 1500}
+
+Item de versión (se incrementa al modificar el catálogo):
+    {"peaje_id": "__catalog__", "version": 3}
+"""
+
+import time
+from types import MappingProxyType
+from typing import Any, Mapping, NamedTuple, Optional
+
+from money import read_cents
+
+VERSION_ITEM_ID = '__catalog__'
+
+
+class TollPlaza(NamedTuple):
+    peaje_id: str
+    nombre: str
+    carretera: Optional[str]
+    tarifa_base_cents: Optional[int]
+
+
+class TollCatalog:
+    """
+    Args:
+        tolls_table: Tabla DynamoDB GuatepassTolls (o None para deshabilitar el catálogo)
+        ttl_seconds: Cada cuánto se revisa la versión del catálogo
+    """
+
+    def __init__(self, tolls_table: Any, ttl_seconds: float):
+        self.tolls_table = tolls_table
+        self.ttl_seconds = ttl_seconds
+        self._plazas: Mapping[str, TollPlaza] = MappingProxyType({})
+        self._version: Any = None
+        self._checked_at: Optional[float] = None
+
+    def get(self, peaje_id: Optional[str]) -> Optional[TollPlaza]:
+        """Retorna la plaza de peaje o None si no está en el catálogo."""
+        if not peaje_id or self.tolls_table is None:
+            return None
+        return self.plazas().get(peaje_id)
+
+    def plazas(self) -> Mapping[str, TollPlaza]:
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.ttl_seconds:
+            self._checked_at = now
+            self._refresh()
+        return self._plazas
+
+    def _refresh(self) -> None:
+        try:
+            version_item = self.tolls_table.get_item(Key={'peaje_id': VERSION_ITEM_ID}).get('Item', {})
+            version = version_item.get('version')
+            if self._plazas and version is not None and version == self._version:
+                return
+
+            self._plazas = self._load_all()
+            self._version = version
+            print(f"[INFO] Catálogo de peajes cargado: {len(self._plazas)} plazas, versión {version}")
+        except Exception as e:
+            # Se conserva el catálogo anterior (si existe) hasta el siguiente intento
+            print(f"[WARNING] No se pudo cargar el catálogo de peajes: {str(e)}")
+
+    def _load_all(self) -> Mapping[str, TollPlaza]:
+        plazas = {}
+        scan_params = {}
+
+        while True:
+            response = self.tolls_table.scan(**scan_params)
+            for item in response.get('Items', []):
+                if item['peaje_id'] == VERSION_ITEM_ID:
+                    continue
+                plazas[item['peaje_id']] = TollPlaza(
+                    peaje_id=item['peaje_id'],
+                    nombre=item.get('nombre', item['peaje_id']),
+                    carretera=item.get('carretera'),
+                    tarifa_base_cents=read_cents(item, 'tarifa_base_cents', 'tarifa_base', default=None)
+                )
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        return MappingProxyType(plazas)
@@ -0,0 +1,326 @@
+"""
+GUATEPASS - Snapshot local de usuarios
+=======================================
+Archivo binario, ordenado y mapeable en memoria (mmap) con los datos de
+GuatepassUsers que se necesitan para resolver un paso por peaje. Permite
+responder búsquedas por placa o tag_id con búsqueda binaria sobre /tmp, sin
+llamadas de red.
+
+El saldo NO se incluye: cambia con cada cobro y siempre se lee de DynamoDB.
+
+Formato (little-endian):
+
+    header       magic 'GPSNAP', versión, ancho de placa, ancho de tag_id,
+                 generated_at, n_users, n_tags y offsets de cada sección
+    users index  n_users entradas ordenadas: placa (ancho fijo) + offset + largo
+    tags index   n_tags entradas ordenadas: tag_id (ancho fijo) + posición en users index
+    records      registros UTF-8 con campos separados por \\x1f
+
+Lo genera la función export_users_snapshot (ordenamiento externo: tramos
+ordenados en /tmp que se mezclan al escribir, sin toda la tabla en memoria) y
+lo consume resolve_user, solo para saber qué placas estaban registradas: el
+perfil (estado, tag_id) se lee de DynamoDB con get_item consistente, porque el
+snapshot puede tener hasta USERS_SNAPSHOT_MAX_AGE_SECONDS. get_tag y
+get_user_by_placa no lo usan: una lectura en DynamoDB les haría falta igual.
+"""
+
+import heapq
+import json
+import mmap
+import os
+import shutil
+import struct
+import tempfile
+import time
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+MAGIC = b'GPSNAP'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<6sHHHQIIQQQ')
+USER_ENTRY_VALUE = struct.Struct('<II')
+TAG_ENTRY_VALUE = struct.Struct('<I')
+
+FIELD_SEPARATOR = '\x1f'
+RECORD_FIELDS = ('nombre', 'email', 'telefono', 'tipo_usuario', 'tiene_tag', 'tag_id', 'tag_status', 'estado')
+
+# Atributos a proyectar en el scan del exportador
+PROJECTION_FIELDS = ('placa',) + RECORD_FIELDS
+
+# Filas por tramo ordenado en /tmp al generar el snapshot
+SORT_RUN_ROWS = 50000
+
+
+def _encode_record(user: Dict[str, Any]) -> bytes:
+    values = []
+    for field in RECORD_FIELDS:
+        value = user.get(field)
+        if field == 'tiene_tag':
+            values.append('1' if value else '0')
+        else:
+            values.append('' if value is None else str(value).replace(FIELD_SEPARATOR, ' '))
+    return FIELD_SEPARATOR.join(values).encode('utf-8')
+
+
+def _decode_record(placa: str, raw: bytes) -> Dict[str, Any]:
+    values = raw.decode('utf-8').split(FIELD_SEPARATOR)
+    user = {'placa': placa}
+    for field, value in zip(RECORD_FIELDS, values):
+        if field == 'tiene_tag':
+            user[field] = value == '1'
+        elif value:
+            user[field] = value
+    return user
+
+
+class SortedRuns:
+    """
+    Ordenamiento externo en /tmp: las filas se ordenan en tramos de hasta
+    `run_rows` que se guardan en archivos temporales, y merged() las entrega
+    en orden mezclando los tramos (en memoria queda un tramo a la vez).
+    """
+
+    def __init__(self, run_rows: int, key: Any = None):
+        self.run_rows = run_rows
+        self.key = key
+        self._rows: List[List[Any]] = []
+        self._files: List[Any] = []
+
+    def add(self, row: List[Any]) -> None:
+        self._rows.append(row)
+        if len(self._rows) >= self.run_rows:
+            self._flush()
+
+    def _flush(self) -> None:
+        if not self._rows:
+            return
+        self._rows.sort(key=self.key)
+        run = tempfile.TemporaryFile(mode='w+', encoding='utf-8')
+        for row in self._rows:
+            run.write(json.dumps(row, separators=(',', ':'), ensure_ascii=False) + '\n')
+        run.seek(0)
+        self._files.append(run)
+        self._rows = []
+
+    def merged(self) -> Iterator[List[Any]]:
+        self._flush()
+        return heapq.merge(*(map(json.loads, run) for run in self._files), key=self.key)
+
+    def close(self) -> None:
+        for run in self._files:
+            run.close()
+
+    def __enter__(self) -> 'SortedRuns':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def write_snapshot(users: Iterable[Dict[str, Any]], path: str, generated_at: Optional[int] = None,
+                   run_rows: int = SORT_RUN_ROWS) -> Dict[str, int]:
+    """
+    Escribe el snapshot de usuarios en `path` (escritura atómica vía archivo temporal).
+
+    `users` se recorre una sola vez: las filas se ordenan por placa en tramos
+    en /tmp (SortedRuns) y se mezclan al escribir el índice; los registros y
+    las entradas de tags también pasan por /tmp.
+
+    Args:
+        users: Items de GuatepassUsers (al menos placa y los RECORD_FIELDS); puede ser un generador
+        path: Ruta de salida
+        generated_at: Epoch de generación (default: ahora)
+        run_rows: Filas por tramo ordenado en memoria
+
+    Returns:
+        Estadísticas del archivo generado
+    """
+    generated_at = generated_at if generated_at is not None else int(time.time())
+
+    with SortedRuns(run_rows, key=itemgetter(0)) as user_runs, SortedRuns(run_rows) as tag_runs, \
+            tempfile.TemporaryFile() as records:
+        n_users = n_tags = 0
+        key_width = tag_width = 1
+        for user in users:
+            placa = user['placa']
+            tag_id = user.get('tag_id')
+            user_runs.add([placa, _encode_record(user).decode('utf-8'), tag_id])
+            n_users += 1
+            key_width = max(key_width, len(placa.encode('utf-8')))
+            if tag_id:
+                n_tags += 1
+                tag_width = max(tag_width, len(tag_id.encode('utf-8')))
+
+        users_index_offset = HEADER.size
+        tags_index_offset = users_index_offset + n_users * (key_width + USER_ENTRY_VALUE.size)
+        records_offset = tags_index_offset + n_tags * (tag_width + TAG_ENTRY_VALUE.size)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, FORMAT_VERSION, key_width, tag_width, generated_at,
+                                n_users, n_tags, users_index_offset, tags_index_offset, records_offset))
+
+            offset = 0
+            for position, (placa, record, tag_id) in enumerate(user_runs.merged()):
+                record = record.encode('utf-8')
+                f.write(placa.encode('utf-8').ljust(key_width, b'\0'))
+                f.write(USER_ENTRY_VALUE.pack(offset, len(record)))
+                records.write(record)
+                offset += len(record)
+                if tag_id:
+                    tag_runs.add([tag_id, position])
+
+            for tag_id, position in tag_runs.merged():
+                f.write(tag_id.encode('utf-8').ljust(tag_width, b'\0'))
+                f.write(TAG_ENTRY_VALUE.pack(position))
+
+            records.seek(0)
+            shutil.copyfileobj(records, f)
+
+        os.replace(tmp_path, path)
+
+    return {
+        'users': n_users,
+        'tags': n_tags,
+        'bytes': records_offset + offset,
+        'generated_at': generated_at
+    }
+
+
+class UsersSnapshot:
+    """Lector del snapshot mapeado en memoria."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        (magic, version, self.key_width, self.tag_width, self.generated_at, self.n_users,
+         self.n_tags, self._users_offset, self._tags_offset, self._records_offset) = HEADER.unpack_from(self._mm)
+
+        if magic != MAGIC or version != FORMAT_VERSION:
+            self.close()
+            raise ValueError(f"Snapshot inválido: magic={magic!r}, version={version}")
+
+        self._user_entry_size = self.key_width + USER_ENTRY_VALUE.size
+        self._tag_entry_size = self.tag_width + TAG_ENTRY_VALUE.size
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+    def age_seconds(self) -> float:
+        return time.time() - self.generated_at
+
+    def _search(self, base: int, entry_size: int, width: int, count: int, key: str) -> int:
+        """Búsqueda binaria; retorna la posición de la entrada o -1."""
+        target = key.encode('utf-8')
+        if len(target) > width:
+            return -1
+        target = target.ljust(width, b'\0')
+
+        mm = self._mm
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = base + mid * entry_size
+            current = mm[start:start + width]
+            if current < target:
+                lo = mid + 1
+            elif current > target:
+                hi = mid
+            else:
+                return mid
+        return -1
+
+    def _user_at(self, position: int) -> Dict[str, Any]:
+        start = self._users_offset + position * self._user_entry_size
+        placa = self._mm[start:start + self.key_width].rstrip(b'\0').decode('utf-8')
+        offset, length = USER_ENTRY_VALUE.unpack_from(self._mm, start + self.key_width)
+        record_start = self._records_offset + offset
+        return _decode_record(placa, self._mm[record_start:record_start + length])
+
+    def get_by_placa(self, placa: str) -> Optional[Dict[str, Any]]:
+        position = self._search(self._users_offset, self._user_entry_size, self.key_width, self.n_users, placa)
+        return self._user_at(position) if position >= 0 else None
+
+    def get_by_tag(self, tag_id: str) -> Optional[Dict[str, Any]]:
+        position = self._search(self._tags_offset, self._tag_entry_size, self.tag_width, self.n_tags, tag_id)
+        if position < 0:
+            return None
+        start = self._tags_offset + position * self._tag_entry_size + self.tag_width
+        (user_position,) = TAG_ENTRY_VALUE.unpack_from(self._mm, start)
+        return self._user_at(user_position)
+
+
+class SnapshotLoader:
+    """
+    Mantiene el snapshot publicado en S3 descargado en /tmp y mapeado en memoria.
+
+    Cada `refresh_seconds` compara el ETag del objeto (head_object) y solo lo
+    vuelve a descargar si cambió. get() retorna None si no hay snapshot o si es
+    más viejo que `max_age_seconds`: en ese caso el llamador consulta DynamoDB.
+    """
+
+    def __init__(self, s3_client: Any, bucket: Optional[str], key: str, local_path: str,
+                 max_age_seconds: float, refresh_seconds: float = 60):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.local_path = local_path
+        self.max_age_seconds = max_age_seconds
+        self.refresh_seconds = refresh_seconds
+        self._snapshot: Optional[UsersSnapshot] = None
+        self._etag: Optional[str] = None
+        self._checked_at: Optional[float] = None
+
+    def get(self) -> Optional[UsersSnapshot]:
+        if not self.bucket:
+            return None
+
+        now = time.monotonic()
+        if self._checked_at is None or now - self._checked_at >= self.refresh_seconds:
+            self._checked_at = now
+            self._refresh()
+
+        if self._snapshot is None or self._snapshot.age_seconds() > self.max_age_seconds:
+            return None
+        return self._snapshot
+
+    def _refresh(self) -> None:
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=self.key)
+            if head['ETag'] == self._etag and self._snapshot is not None:
+                return
+
+            download_path = f"{self.local_path}.download"
+            self.s3_client.download_file(self.bucket, self.key, download_path)
+            os.replace(download_path, self.local_path)
+
+            # El mmap anterior sigue siendo válido hasta cerrarlo (el inode reemplazado no se borra)
+            previous = self._snapshot
+            self._snapshot = UsersSnapshot(self.local_path)
+            self._etag = head['ETag']
+            if previous is not None:
+                previous.close()
+
+            print(f"[INFO] Snapshot de usuarios cargado: {self._snapshot.n_users} usuarios, "
+                  f"{self._snapshot.n_tags} tags, edad {self._snapshot.age_seconds():.0f}s")
+        except Exception as e:
+            print(f"[WARNING] No se pudo cargar el snapshot de usuarios: {str(e)}")
+
+
+def scan_users(users_table: Any) -> Iterator[Dict[str, Any]]:
+    """Lee de GuatepassUsers solo los atributos que van en el snapshot (página por página)."""
+    names = {f"#f{i}": field for i, field in enumerate(PROJECTION_FIELDS)}
+    scan_params = {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+
+    while True:
+        response = users_table.scan(**scan_params)
+        yield from response.get('Items', [])
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_params['ExclusiveStartKey'] = response['LastEvaluatedKey']
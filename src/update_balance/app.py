@@ -3,60 +3,75 @@ Lambda Function: Update Balance
 Actualiza el balance del usuario registrado (si aplica).
 Para usuarios registrados (modalidad 2 o 3), se descuenta del saldo prepago.
 Para usuarios no registrados (modalidad 1), no se actualiza balance.
+
+El descuento es un único update_item condicional (balance_ledger.debit),
+idempotente por transaction_id ante reintentos de la Step Function. Además el
+cobro corre una sola vez por event_id (shared/idempotency.py): un reintento
+retorna el balance_update del primer intento, con los mismos saldos.
+
+Recibe solo placa, modalidad, tarifa, peaje y hora y retorna solo
+balance_update (contrato de estado 2, ver shared/state_contract.py). El
+transaction_id es el mismo que arma record_transaction, así el cobro no
+necesita leer el resultado de RecordTransaction.
 """
 
-import json
 import os
 import boto3
-from decimal import Decimal
+
+import balance_ledger
+import idempotency
+import state_contract
+from money import format_amount, read_cents
 
 dynamodb = boto3.resource('dynamodb')
 users_table_name = os.environ['USERS_TABLE_NAME']
 users_table = dynamodb.Table(users_table_name)
+idempotency_table = dynamodb.Table(os.environ['IDEMPOTENCY_TABLE_NAME'])
+STAGE_RECORD_TTL_SECONDS = int(os.environ.get('STAGE_RECORD_TTL_SECONDS', '86400'))
+STAGE_LEASE_SECONDS = int(os.environ.get('STAGE_LEASE_SECONDS', '60'))
 
 
 def lambda_handler(event, context):
     """
     Handler principal del Lambda.
     
-    Input esperado:
+    Input esperado (state_contract.STAGES['update_balance']):
     {
+        "contract_version": 2,
+        "event_id": "evt-...",
         "user_data": {
             "placa": "P123ABC",
             "modalidad": 1,
             "is_registered": true
         },
-        "fare_calculation": {
-            "final_fare": "15.00"
+        "toll_data": {
+            "peaje_id": "PEAJE001",
+            "timestamp": "2025-11-09T10:30:00Z"
         },
-        "transaction": {
-            "transaction_id": "TXN-..."
+        "fare_calculation": {
+            "final_fare_cents": 1500
         }
     }
     
-    Output:
+    Output (la Step Function lo deja en $.balance_update):
     {
-        ...input,
-        "balance_update": {
-            "updated": true/false,
-            "previous_balance": "100.00",
-            "new_balance": "85.00",
-            "message": "..."
-        }
+        "updated": true/false,
+        "previous_balance_cents": 10000,
+        "new_balance_cents": 8500,
+        "message": "..."
     }
     """
     
     try:
-        print(f"Evento recibido: {json.dumps(event)}")
+        print(f"Evento recibido: {state_contract.dumps(event)}")
         
         user_data = event.get('user_data', {})
         fare_calc = event.get('fare_calculation', {})
-        transaction = event.get('transaction', {})
         
         placa = user_data.get('placa')
         modalidad = user_data.get('modalidad')
         is_registered = user_data.get('is_registered', False)
-        final_fare = Decimal(fare_calc.get('final_fare', '0'))
+        final_fare = read_cents(fare_calc, 'final_fare_cents', 'final_fare')
         
         balance_update = {
             'updated': False,
@@ -66,60 +81,70 @@ def lambda_handler(event, context):
         # Solo actualizar balance si es usuario registrado (modalidad 2 o 3)
         if is_registered and modalidad in [2, 3]:
             
-            # Obtener usuario actual
-            response = users_table.get_item(Key={'placa': placa})
-            
-            if 'Item' in response:
-                user = response['Item']
-                current_balance = Decimal(str(user.get('saldo_disponible', 0)))
-                
-                # Verificar si tiene saldo suficiente
-                if current_balance >= final_fare:
-                    new_balance = current_balance - final_fare
-                    
-                    # Actualizar saldo en DynamoDB
-                    users_table.update_item(
-                        Key={'placa': placa},
-                        UpdateExpression='SET saldo_disponible = :new_balance',
-                        ExpressionAttributeValues={
-                            ':new_balance': new_balance
-                        }
-                    )
-                    
-                    balance_update = {
-                        'updated': True,
-                        'previous_balance': str(current_balance),
-                        'new_balance': str(new_balance),
-                        'amount_charged': str(final_fare),
-                        'message': 'Balance actualizado exitosamente'
-                    }
-                    
-                    print(f"Balance actualizado para {placa}: {current_balance} -> {new_balance}")
-                    
-                else:
-                    balance_update = {
-                        'updated': False,
-                        'previous_balance': str(current_balance),
-                        'amount_required': str(final_fare),
-                        'message': 'Saldo insuficiente',
-                        'warning': 'Se requiere recarga'
-                    }
-                    
-                    print(f"Saldo insuficiente para {placa}: {current_balance} < {final_fare}")
-            else:
-                balance_update['message'] = 'Usuario no encontrado en base de datos'
+            # Un cobro por event_id: un reintento retorna el balance_update del primer intento
+            balance_update, replayed = idempotency.run_once(
+                idempotency_table, event.get('event_id'), 'update_balance',
+                lambda: charge(event, placa, final_fare), STAGE_RECORD_TTL_SECONDS, STAGE_LEASE_SECONDS
+            )
+            if replayed:
+                balance_update['idempotent_replay'] = True
                 
         elif modalidad == 1:
             balance_update['message'] = 'Usuario no registrado - Pago en efectivo'
         
-        # Retornar evento enriquecido
-        result = {
-            **event,
-            'balance_update': balance_update
-        }
-        
-        return result
+        return state_contract.respond(event, 'update_balance', balance_update)
         
     except Exception as e:
         print(f"Error actualizando balance: {str(e)}")
         raise
+
+
+def charge(event, placa, final_fare):
+    """
+    Descuenta la tarifa del saldo del usuario registrado.
+    
+    Returns:
+        balance_update del cobro (descontado, saldo insuficiente o usuario no encontrado)
+    """
+    balance_update = {
+        'updated': False,
+        'message': 'No se actualizó balance'
+    }
+    
+    # Llave de idempotencia del cobro (ValueError si falta la hora del paso)
+    transaction_id = state_contract.transaction_id(event)
+    
+    # Descuento atómico: condición de saldo + decremento en DynamoDB
+    debit = balance_ledger.debit(users_table, placa, final_fare, transaction_id)
+    
+    if debit.charged:
+        balance_update = {
+            'updated': True,
+            'previous_balance_cents': debit.previous_balance_cents,
+            'new_balance_cents': debit.new_balance_cents,
+            'amount_charged_cents': final_fare,
+            'message': 'Balance actualizado exitosamente'
+        }
+        
+        if debit.status == balance_ledger.ALREADY_DEBITED:
+            balance_update['idempotent_replay'] = True
+            print(f"Cobro {transaction_id} ya aplicado para {placa}, no se descuenta de nuevo")
+        else:
+            print(f"Balance actualizado para {placa}: {format_amount(debit.previous_balance_cents)} "
+                  f"-> {format_amount(debit.new_balance_cents)}")
+        
+    elif debit.status == balance_ledger.INSUFFICIENT_FUNDS:
+        balance_update = {
+            'updated': False,
+            'previous_balance_cents': debit.previous_balance_cents,
+            'amount_required_cents': final_fare,
+            'message': 'Saldo insuficiente',
+            'warning': 'Se requiere recarga'
+        }
+        
+        print(f"Saldo insuficiente para {placa}: {format_amount(debit.previous_balance_cents)} "
+              f"< {format_amount(final_fare)}")
+    else:
+        balance_update['message'] = 'Usuario no encontrado en base de datos'
+    
+    return balance_update
@@ -9,9 +9,14 @@ import os
 import boto3
 from datetime import datetime
 
+from registry_filter import register_entries, tag_entry
+
 dynamodb = boto3.resource('dynamodb')
+s3_client = boto3.client('s3')
 users_table_name = os.environ['USERS_TABLE_NAME']
 users_table = dynamodb.Table(users_table_name)
+DATA_BUCKET_NAME = os.environ.get('DATA_BUCKET_NAME')
+REGISTRY_FILTER_KEY = os.environ.get('REGISTRY_FILTER_KEY', 'registry/registered-users.bloom')
 
 
 def lambda_handler(event, context):
@@ -169,6 +174,10 @@ def lambda_handler(event, context):
         
         print(f"Tag actualizado para la placa {placa}: {old_tag_id} -> {new_tag_id or old_tag_id}")
         
+        # Publicar el nuevo tag en el filtro de registrados que usa resolve_user
+        if new_tag_id and DATA_BUCKET_NAME:
+            register_entries(s3_client, users_table, DATA_BUCKET_NAME, REGISTRY_FILTER_KEY, [tag_entry(new_tag_id)])
+        
         response_data = {
             'message': 'Tag actualizado exitosamente',
             'placa': placa,